@@ -244,7 +244,10 @@ if ! [ -x "$(command -v pip3)" ]; then
   echo "pip3 not installed. This script requires pip3. Exiting."
   exit 1
 else
-    pip3 install --quiet -r ../requirements.txt --target .
+    # zstandard has a compiled extension, so install the wheels built for the Lambda runtime
+    # rather than for the machine running this script.
+    pip3 install --quiet -r ../requirements.txt --target . \
+        --platform manylinux2014_x86_64 --implementation cp --python-version 3.11 --only-binary=:all:
 fi
 zip -q -r9 ../dist/esconsumer.zip .
 popd || exit 1
@@ -256,6 +259,33 @@ cp "./dist/esconsumer.zip" "$regional_dist_dir/esconsumer.zip"
 rm -rf dist
 rm -rf package
 
+echo "------------------------------------------------------------------------------"
+echo "Search service Function"
+echo "------------------------------------------------------------------------------"
+
+echo "Building Search service function"
+cd "$source_dir/search" || exit 1
+
+[ -e dist ] && rm -rf dist
+mkdir -p dist
+[ -e package ] && rm -rf package
+mkdir -p package
+echo "preparing packages from requirements.txt"
+pushd package || exit 1
+touch ./setup.cfg
+echo "[install]" > ./setup.cfg
+echo "prefix= " >> ./setup.cfg
+pip3 install --quiet -r ../requirements.txt --target .
+zip -q -r9 ../dist/searchservice.zip .
+popd || exit 1
+
+zip -q -g dist/searchservice.zip ./*.py
+cp "./dist/searchservice.zip" "$regional_dist_dir/searchservice.zip"
+
+# Clean up the build directories
+rm -rf dist
+rm -rf package
+
 echo "------------------------------------------------------------------------------"
 echo "Build vue website"
 echo "------------------------------------------------------------------------------"
@@ -0,0 +1,240 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Precomputed analysis bundles in the dataplane bucket.
+#
+# With AnalysisBundles set to true, the consumer writes a compact, gzip compressed JSON bundle
+# for each asset and operator when the operator's result is indexed:
+#
+#   private/assets/{asset}/analysis/{operator}.json
+#
+#   {
+#     "Version": 1,
+#     "AssetId": "...",
+#     "Operator": "labeldetection",
+#     "Markers": [[start, end, name, confidence], ...],
+#     "Boxes": [[start, name, left, top, width, height], ...],
+#     "Summary": [[name, count, highest confidence], ...]
+#   }
+#
+# Times are in milliseconds and end is null for detections at one point in time. Summary is
+# sorted by count, most frequent first. The object is stored with Content-Encoding gzip and
+# Cache-Control no-cache, so a browser decompresses it and revalidates its copy with the ETag
+# instead of downloading it again. The Analysis page can load these files instead of running a
+# large search for each tab.
+#
+# A bundle is only written when its content changed. It does not name the workflow that
+# produced it, so running a workflow again on the same media does not rewrite it. The SHA-256
+# of the stored bytes is kept in the object's metadata and compared with a HEAD request. The
+# ETag cannot be used for this, because it is not the MD5 of the content when the bucket is
+# encrypted with SSE-KMS.
+#
+# Face detections have no name, so each is marked and listed as a "Face".
+
+import gzip
+import hashlib
+import json
+import os
+
+from botocore.exceptions import ClientError
+
+import pointer_cache
+import structured_logger
+
+BUNDLE_KEY = 'private/assets/{asset}/analysis/{operator}.json'
+BUNDLE_VERSION = 1
+NAME_FIELDS = ('Name', 'DetectedText', 'EntityText', 'PhraseText', 'content')
+START_FIELDS = ('Timestamp', 'StartTimestamp', 'start_time')
+END_FIELDS = ('EndTimestamp', 'end_time')
+CONFIDENCE_FIELDS = ('Confidence', 'confidence')
+BOX_FIELDS = ('BoundingBox', 'FaceBoundingBox')
+# Name of the documents of operators whose documents have none.
+FACE = "Face"
+UNNAMED_OPERATORS = {
+    "facedetection": FACE,
+}
+# User metadata of the bundle objects with the SHA-256 of their content.
+HASH_METADATA = 'content-sha256'
+# Operators whose documents have nothing to mark or list.
+SKIPPED_OPERATORS = {
+    "mediainfo",
+    "translate",
+    "genericdatalookup",
+}
+
+logger = structured_logger.get_logger()
+
+
+def bundles_enabled():
+    return os.environ.get('AnalysisBundles', 'false').lower() == 'true'
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _first(document, fields):
+    for field in fields:
+        if document.get(field) not in (None, ''):
+            return document[field]
+    return None
+
+
+def _box(start, name, box):
+    if not isinstance(box, dict):
+        return None
+    values = [_number(box.get(field)) for field in ('Left', 'Top', 'Width', 'Height')]
+    if None in values:
+        return None
+    return [start, name] + values
+
+
+class BundleStore:
+    """Reads and writes the bundles in the dataplane bucket."""
+
+    def __init__(self, s3_client, bucket):
+        self.s3_client = s3_client
+        self.bucket = bucket
+
+    @staticmethod
+    def key(asset_id, operator):
+        return BUNDLE_KEY.format(asset=asset_id, operator=operator)
+
+    def load(self, asset_id, operator):
+        """Return the stored bundle, or None if there is none."""
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket, Key=self.key(asset_id, operator))
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey':
+                return None
+            raise
+        bundle = json.loads(gzip.decompress(obj['Body'].read()))
+        return bundle if bundle.get("Version") == BUNDLE_VERSION else None
+
+    def save(self, asset_id, operator, bundle):
+        """Write a bundle unless the stored one has the same content. Returns True if it was written."""
+        # Without a timestamp in the gzip header, the same bundle always compresses to the same bytes.
+        body = gzip.compress(json.dumps(bundle, separators=(',', ':')).encode('utf-8'), mtime=0)
+        digest = hashlib.sha256(body).hexdigest()
+        key = self.key(asset_id, operator)
+        try:
+            if self.s3_client.head_object(Bucket=self.bucket, Key=key).get('Metadata', {}).get(HASH_METADATA) == digest:
+                return False
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=body,
+            ContentType='application/json',
+            ContentEncoding='gzip',
+            CacheControl='no-cache',
+            Metadata={HASH_METADATA: digest}
+        )
+        return True
+
+
+class AnalysisBundle:
+    """Markers, boxes and summary of the documents written for one result."""
+
+    # Bundles are written to S3 rather than to an index.
+    index = None
+    mappings = None
+
+    def __init__(self, operator, store):
+        self.operator = operator
+        self.store = store
+        self.markers = []
+        self.boxes = []
+
+    def add(self, es_index, document):
+        if self.operator in SKIPPED_OPERATORS:
+            return
+        if "WebCaptions" in document:
+            for caption in document["WebCaptions"]:
+                start, end = _number(caption.get("start")), _number(caption.get("end"))
+                if start is not None and caption.get("caption"):
+                    self.markers.append([start * 1000, end * 1000 if end is not None else None, caption["caption"], None])
+            return
+        name = _first(document, NAME_FIELDS)
+        if name is None:
+            name = UNNAMED_OPERATORS.get(self.operator)
+        if not isinstance(name, str) or document.get("Type") == "WORD":
+            return
+        start = _number(_first(document, START_FIELDS))
+        end = _number(_first(document, END_FIELDS))
+        self.markers.append([start, end, name, _number(_first(document, CONFIDENCE_FIELDS))])
+        boxes = [document.get(field) for field in BOX_FIELDS]
+        if isinstance(document.get("Instances"), list):
+            boxes.extend(instance.get("BoundingBox") for instance in document["Instances"] if isinstance(instance, dict))
+        for box in boxes:
+            box = _box(start, name, box)
+            if box is not None:
+                self.boxes.append(box)
+
+    def empty(self):
+        return AnalysisBundle(self.operator, self.store)
+
+    def state(self):
+        return [self.markers, self.boxes]
+
+    def merge(self, state):
+        markers, boxes = state
+        self.markers.extend(markers)
+        self.boxes.extend(boxes)
+
+    def clear_query(self, asset_id, resume=False):
+        return None
+
+    def updates_sent(self, asset_id, failed_ids):
+        pass
+
+    def make_bundle(self, asset_id, markers, boxes):
+        summary = {}
+        for _start, _end, name, confidence in markers:
+            count, highest = summary.get(name, (0, None))
+            if confidence is not None and (highest is None or confidence > highest):
+                highest = confidence
+            summary[name] = (count + 1, highest)
+        return {
+            "Version": BUNDLE_VERSION,
+            "AssetId": asset_id,
+            "Operator": self.operator,
+            "Markers": sorted(markers, key=lambda marker: (marker[0] is None, marker[0] or 0)),
+            "Boxes": sorted(boxes, key=lambda box: (box[0] is None, box[0] or 0)),
+            "Summary": [[name, count, highest] for name, (count, highest) in
+                        sorted(summary.items(), key=lambda item: (-item[1][0], item[0]))],
+        }
+
+    def make_updates(self, asset_id, workflow, status, resume=False):
+        """Write the bundle of the result. Bundles are not in an index, so there are no updates."""
+        if self.operator in SKIPPED_OPERATORS:
+            return []
+        markers, boxes = self.markers, self.boxes
+        try:
+            if resume:
+                previous = self.store.load(asset_id, self.operator)
+                if previous is not None:
+                    markers, boxes = previous["Markers"] + markers, previous["Boxes"] + boxes
+            written = self.store.save(asset_id, self.operator, self.make_bundle(asset_id, markers, boxes))
+        except Exception as e:
+            logger.error("analysis_bundles", "Unable to write the analysis bundle", error=e)
+            pointer_cache.record_failure()
+        else:
+            logger.info("analysis_bundles", "Wrote the analysis bundle" if written else "Analysis bundle is unchanged",
+                        markers=len(markers), boxes=len(boxes))
+        return []
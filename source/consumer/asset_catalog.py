@@ -0,0 +1,208 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Asset catalog for collection search.
+#
+# With AssetCatalog set to true, the consumer keeps one document per asset in the hidden
+# mieassetcatalog index, with the asset id as its document id. It has the filename and
+# creation time of the asset and the distinct terms its results produced:
+#
+#   {
+#     "AssetId": "...",
+#     "Filename": "video.mp4",
+#     "Created": "...",
+#     "Labels": ["Car", "Person"],
+#     "Celebrities": ["..."],
+#     "Entities": ["Boulder"],
+#     "KeyPhrases": ["a show"],
+#     "Text": ["EXIT"],
+#     "CaptionLanguages": ["en", "es"]
+#   }
+#
+# A collection search is a query over these documents instead of a search over every detection
+# followed by an aggregation on AssetId. When a result is indexed again, the terms of its field
+# are replaced. Only the MAX_TERMS most frequent terms of a result are kept.
+#
+# With SimilarAssets set to true, the catalog also keeps the MinHash signatures and LSH bands of
+# the asset's terms, see minhash.py.
+
+import collections
+
+import derived_index
+import minhash
+
+INDEX = derived_index.ASSET_CATALOG_INDEX
+TERM_MAPPING = {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+# Operator to the catalog field and the document field its terms are read from.
+OPERATOR_FIELDS = {
+    "labeldetection": ("Labels", "Name"),
+    "celebrityrecognition": ("Celebrities", "Name"),
+    "entities": ("Entities", "EntityText"),
+    "key_phrases": ("KeyPhrases", "PhraseText"),
+    "textdetection": ("Text", "DetectedText"),
+}
+MAPPINGS = {
+    "properties": dict(
+        {
+            "AssetId": {"type": "keyword"},
+            "Filename": TERM_MAPPING,
+            "CaptionLanguages": {"type": "keyword"},
+            "Signatures": {"type": "object", "enabled": False},
+            "Bands": {"type": "keyword"},
+        },
+        **{field: TERM_MAPPING for field, _source in OPERATOR_FIELDS.values()}
+    )
+}
+MAX_TERMS = 1000
+
+# Replaces the fields in params.fields, or adds to them when a deferred result is resumed, and
+# adds params.languages to the caption languages. The signatures in params.signatures replace
+# the ones of their field, or are merged with them when resumed, and the bands of the asset are
+# computed again from the signatures of all its fields.
+UPDATE_SCRIPT = """
+ctx._source.AssetId = params.asset_id;
+for (entry in params.fields.entrySet()) {
+  if (params.resume && ctx._source[entry.getKey()] != null) {
+    Set terms = new TreeSet(ctx._source[entry.getKey()]);
+    terms.addAll(entry.getValue());
+    ctx._source[entry.getKey()] = new ArrayList(terms);
+  } else {
+    ctx._source[entry.getKey()] = entry.getValue();
+  }
+}
+if (!params.languages.isEmpty()) {
+  Set languages = new TreeSet(ctx._source.CaptionLanguages ?: []);
+  languages.addAll(params.languages);
+  ctx._source.CaptionLanguages = new ArrayList(languages);
+}
+if (!params.signatures.isEmpty()) {
+  Map signatures = ctx._source.Signatures ?: new HashMap();
+  for (entry in params.signatures.entrySet()) {
+    List signature = entry.getValue();
+    List previous = signatures[entry.getKey()];
+    if (signature == null) {
+      if (!params.resume) {
+        signatures.remove(entry.getKey());
+      }
+    } else if (params.resume && previous != null) {
+      List merged = new ArrayList();
+      for (int i = 0; i < signature.size(); i++) {
+        merged.add(Math.min(((Number) previous[i]).longValue(), ((Number) signature[i]).longValue()));
+      }
+      signatures[entry.getKey()] = merged;
+    } else {
+      signatures[entry.getKey()] = signature;
+    }
+  }
+  ctx._source.Signatures = signatures;
+  long[] combined = null;
+  for (List signature : signatures.values()) {
+    if (combined == null) {
+      combined = new long[signature.size()];
+      for (int i = 0; i < combined.length; i++) {
+        combined[i] = ((Number) signature[i]).longValue();
+      }
+    }
+    for (int i = 0; i < combined.length; i++) {
+      combined[i] = Math.min(combined[i], ((Number) signature[i]).longValue());
+    }
+  }
+  List bands = new ArrayList();
+  if (combined != null) {
+    for (int band = 0; band < params.bands; band++) {
+      String rows = '';
+      for (int row = 0; row < params.rows; row++) {
+        rows += combined[band * params.rows + row] + '.';
+      }
+      bands.add(band + '-' + Integer.toHexString(rows.hashCode()));
+    }
+  }
+  ctx._source.Bands = bands;
+}
+"""
+
+
+def catalog_enabled():
+    return derived_index.index_enabled(INDEX)
+
+
+class CatalogTerms:
+    """Distinct terms of the documents written for one result."""
+
+    index = INDEX
+    mappings = MAPPINGS
+
+    def __init__(self, operator, languages=()):
+        self.operator = operator
+        self.languages = tuple(languages)
+        self.field, self.source = OPERATOR_FIELDS.get(operator, (None, None))
+        self.terms = collections.Counter()
+
+    def add(self, es_index, document):
+        if self.field is None:
+            return
+        # Lines of detected text are enough, their words are in them.
+        if document.get("Type") == "WORD":
+            return
+        term = document.get(self.source)
+        if isinstance(term, str) and term.strip():
+            self.terms[term.strip()] += 1
+
+    def empty(self):
+        return CatalogTerms(self.operator, self.languages)
+
+    def state(self):
+        return dict(self.terms)
+
+    def merge(self, state):
+        self.terms.update(state)
+
+    def clear_query(self, asset_id, resume=False):
+        return None
+
+    def updates_sent(self, asset_id, failed_ids):
+        pass
+
+    def make_updates(self, asset_id, workflow, status, resume=False):
+        """Return the scripted upsert that records these terms in the catalog, or nothing for other operators."""
+        if self.field is None and not self.languages:
+            return []
+        fields = {}
+        signatures = {}
+        if self.field is not None:
+            fields[self.field] = sorted(term for term, _count in self.terms.most_common(MAX_TERMS))
+            if minhash.similarity_enabled() and self.field in minhash.FIELDS:
+                signatures[self.field] = minhash.signature(self.field, fields[self.field])
+        body = {
+            "scripted_upsert": True,
+            "script": {
+                "lang": "painless",
+                "source": UPDATE_SCRIPT,
+                "params": {
+                    "asset_id": asset_id,
+                    "fields": fields,
+                    "languages": list(self.languages),
+                    "signatures": signatures,
+                    "bands": minhash.BANDS,
+                    "rows": minhash.ROWS,
+                    "resume": resume,
+                }
+            },
+            "upsert": {}
+        }
+        return [(asset_id, body)]
+
+
+def make_initialization_update(asset_id, filename, created):
+    """Return the upsert that records the filename and creation time of an asset."""
+    return [(asset_id, {"doc": {"AssetId": asset_id, "Filename": filename, "Created": created}, "doc_as_upsert": True})]
@@ -0,0 +1,84 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Generation of each asset's search results.
+#
+# With SearchGenerations set to true, the consumer writes a small object to the dataplane bucket
+# after every record it processes for an asset:
+#
+#   private/assets/{asset}/search/generation
+#
+# Its content is random, so its ETag changes on every write. The search service caches its
+# responses for an asset under that ETag. A HEAD request tells it whether the cached response is
+# still current, so repeated views of an asset are served without a search on the domain.
+#
+# The consumer then also writes a DocumentKey into every document it indexes. The search service
+# sorts the hits of an asset on it after their time, so search_after pages through hits with the
+# same time without repeating or skipping any. The domain has no point-in-time API, and sorting
+# on _id needs fielddata on _id. Documents indexed before the setting was turned on get a key
+# from backfill_document_keys, which `backfill.py --document-keys` runs.
+
+import os
+import uuid
+
+import structured_logger
+
+GENERATION_KEY = 'private/assets/{asset}/search/generation'
+DOCUMENT_KEY = "DocumentKey"
+# Documents without a key get their _id, which is unique within the index.
+DOCUMENT_KEY_SCRIPT = "ctx._source." + DOCUMENT_KEY + " = ctx._id"
+
+logger = structured_logger.get_logger()
+
+
+def generations_enabled():
+    return os.environ.get('SearchGenerations', 'false').lower() == 'true'
+
+
+class GenerationStore:
+    """Writes the generation of each asset to the dataplane bucket."""
+
+    def __init__(self, s3_client, bucket):
+        self.s3_client = s3_client
+        self.bucket = bucket
+
+    @staticmethod
+    def key(asset_id):
+        return GENERATION_KEY.format(asset=asset_id)
+
+    def bump(self, asset_id):
+        """Start a new generation for the asset. Returns True if it was written."""
+        try:
+            self.s3_client.put_object(Bucket=self.bucket, Key=self.key(asset_id), Body=uuid.uuid4().hex.encode('utf-8'),
+                                      ContentType='text/plain', CacheControl='no-cache')
+        except Exception as e:
+            # Cached responses for the asset stay in use until its next write.
+            logger.error("asset_generation", "Unable to write the generation of the asset", asset_id=asset_id,
+                         error=e)
+            return False
+        return True
+
+
+def backfill_document_keys(es_object, index='mie*'):
+    """Give the documents of `index` that have no DocumentKey one. Returns the number updated.
+
+    The hidden derived indices do not match the default pattern; the search service does not
+    page through them.
+    """
+    body = {
+        "query": {"bool": {"must_not": {"exists": {"field": DOCUMENT_KEY}}}},
+        "script": {"source": DOCUMENT_KEY_SCRIPT, "lang": "painless"},
+    }
+    response = es_object.update_by_query(index=index, body=body, conflicts='proceed', slices='auto',
+                                         request_timeout=3600)
+    return response.get("updated", 0)
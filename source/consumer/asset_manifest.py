@@ -0,0 +1,228 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Per-asset manifest documents.
+#
+# With AssetManifest set to true, the consumer keeps one document per asset in the hidden
+# mieassetmanifest index, with the asset id as its document id. Each time an operator result
+# is indexed, the documents written for it are summarized and the operator's entry of the
+# manifest is replaced with a scripted upsert, so the UI gets an overview of the asset with
+# one request instead of a search per operator:
+#
+#   GET mieassetmanifest/_doc/{asset}
+#
+#   {
+#     "AssetId": "...",
+#     "Languages": ["en", "es"],
+#     "IndexedAt": "2024-05-01T12:00:00.000000+00:00",
+#     "Operators": {
+#       "labeldetection": {
+#         "Status": "Indexed",
+#         "Workflow": "...",
+#         "Documents": 1520,
+#         "Indices": {"mielabels": 1520},
+#         "MinConfidence": 50.1,
+#         "MaxConfidence": 99.9,
+#         "StartTime": 0,
+#         "EndTime": 59960,
+#         "Languages": [],
+#         "IndexedAt": "2024-05-01T12:00:00.000000+00:00"
+#       }
+#     }
+#   }
+#
+# Times are in milliseconds. Status is "Indexed", "Incomplete" when some documents could not
+# be written, or "Deferred" while the rest of a large result waits in the overflow queue. The
+# slice that resumes it adds its documents to the entry instead of replacing it.
+
+import collections
+import datetime
+
+import derived_index
+
+INDEX = derived_index.ASSET_MANIFEST_INDEX
+MAPPINGS = {
+    "dynamic_templates": [
+        {
+            # A confidence or time first seen as a whole number must not map the field as long.
+            "operator_numbers": {
+                "path_match": "Operators.*",
+                "match_pattern": "regex",
+                "match": "^(MinConfidence|MaxConfidence|StartTime|EndTime)$",
+                "mapping": {"type": "double"}
+            }
+        },
+        {
+            "operator_strings": {
+                "path_match": "Operators.*",
+                "match_mapping_type": "string",
+                "mapping": {"type": "keyword"}
+            }
+        }
+    ],
+    "properties": {
+        "AssetId": {"type": "keyword"},
+        "Languages": {"type": "keyword"},
+        "IndexedAt": {"type": "date"}
+    }
+}
+
+CONFIDENCE_FIELDS = ('Confidence', 'confidence')
+START_FIELDS = ('Timestamp', 'StartTimestamp', 'start_time')
+END_FIELDS = ('Timestamp', 'EndTimestamp', 'end_time')
+LANGUAGE_FIELDS = ('LanguageCode', 'language_code', 'SourceLanguageCode', 'TargetLanguageCode')
+MIN_FIELDS = ('MinConfidence', 'StartTime')
+MAX_FIELDS = ('MaxConfidence', 'EndTime')
+
+# Replaces the entry of params.operator, or adds to it when a deferred result is resumed, and
+# recomputes the languages of the asset from all of its operators.
+UPDATE_SCRIPT = """
+if (ctx._source.Operators == null) {
+  ctx._source.AssetId = params.asset_id;
+  ctx._source.Operators = [:];
+}
+Map summary = params.summary;
+Map previous = ctx._source.Operators[params.operator];
+if (params.resume && previous != null) {
+  summary.Documents += previous.Documents;
+  for (entry in previous.Indices.entrySet()) {
+    summary.Indices[entry.getKey()] = summary.Indices.getOrDefault(entry.getKey(), 0) + entry.getValue();
+  }
+  for (field in params.min_fields) {
+    if (previous[field] != null && (summary[field] == null || previous[field] < summary[field])) {
+      summary[field] = previous[field];
+    }
+  }
+  for (field in params.max_fields) {
+    if (previous[field] != null && (summary[field] == null || previous[field] > summary[field])) {
+      summary[field] = previous[field];
+    }
+  }
+  Set operatorLanguages = new TreeSet(summary.Languages);
+  operatorLanguages.addAll(previous.Languages);
+  summary.Languages = new ArrayList(operatorLanguages);
+}
+ctx._source.Operators[params.operator] = summary;
+Set languages = new TreeSet();
+for (operator in ctx._source.Operators.values()) {
+  languages.addAll(operator.Languages);
+}
+ctx._source.Languages = new ArrayList(languages);
+ctx._source.IndexedAt = summary.IndexedAt;
+"""
+
+
+def manifest_enabled():
+    return derived_index.index_enabled(INDEX)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class OperatorSummary:
+    """Counts, confidence range, time coverage and languages of the documents written for one result."""
+
+    index = INDEX
+    mappings = MAPPINGS
+
+    def __init__(self, operator, languages=()):
+        self.operator = operator
+        self.operator_languages = tuple(languages)
+        self.documents = collections.Counter()
+        self.languages = set(languages)
+        self.minimums = dict.fromkeys(MIN_FIELDS)
+        self.maximums = dict.fromkeys(MAX_FIELDS)
+
+    def _extend(self, field, value):
+        if value is None:
+            return
+        if field in self.minimums:
+            current = self.minimums[field]
+            self.minimums[field] = value if current is None else min(current, value)
+        else:
+            current = self.maximums[field]
+            self.maximums[field] = value if current is None else max(current, value)
+
+    def add(self, es_index, document):
+        self.documents[es_index] += 1
+        for field in CONFIDENCE_FIELDS:
+            confidence = _number(document.get(field))
+            self._extend('MinConfidence', confidence)
+            self._extend('MaxConfidence', confidence)
+        for field in START_FIELDS:
+            self._extend('StartTime', _number(document.get(field)))
+        for field in END_FIELDS:
+            self._extend('EndTime', _number(document.get(field)))
+        for field in LANGUAGE_FIELDS:
+            language = document.get(field)
+            if isinstance(language, str) and language:
+                self.languages.add(language)
+
+    def empty(self):
+        return OperatorSummary(self.operator, self.operator_languages)
+
+    def state(self):
+        """Return what was summarized, to be merged into a summary in another process."""
+        return {"Documents": dict(self.documents), "Languages": sorted(self.languages),
+                "Minimums": self.minimums, "Maximums": self.maximums}
+
+    def merge(self, state):
+        self.documents.update(state["Documents"])
+        self.languages.update(state["Languages"])
+        for field, value in list(state["Minimums"].items()) + list(state["Maximums"].items()):
+            self._extend(field, value)
+
+    def entry(self, workflow, status, indexed_at):
+        """Return the entry of the operator in the manifest."""
+        entry = {
+            "Status": status,
+            "Workflow": workflow,
+            "Documents": sum(self.documents.values()),
+            "Indices": dict(self.documents),
+            "Languages": sorted(self.languages),
+            "IndexedAt": indexed_at,
+        }
+        entry.update(self.minimums)
+        entry.update(self.maximums)
+        return entry
+
+    def clear_query(self, asset_id, resume=False):
+        return None
+
+    def updates_sent(self, asset_id, failed_ids):
+        pass
+
+    def make_updates(self, asset_id, workflow, status, resume=False):
+        """Return the scripted upsert that records this summary in the manifest of the asset."""
+        indexed_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        body = {
+            "scripted_upsert": True,
+            "script": {
+                "lang": "painless",
+                "source": UPDATE_SCRIPT,
+                "params": {
+                    "asset_id": asset_id,
+                    "operator": self.operator,
+                    "summary": self.entry(workflow, status, indexed_at),
+                    "resume": resume,
+                    "min_fields": list(MIN_FIELDS),
+                    "max_fields": list(MAX_FIELDS),
+                }
+            },
+            "upsert": {}
+        }
+        return [(asset_id, body)]
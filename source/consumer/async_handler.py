@@ -0,0 +1,333 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Asyncio entry point for the consumer: async_handler.lambda_handler.
+#
+# The records of a batch are processed concurrently on one event loop that lives as long as the
+# Lambda container, so its S3 and OpenSearch connections are reused between invocations. S3
+# objects are read with aiobotocore and requests are sent with AsyncElasticsearch over a SigV4
+# signed aiohttp connection. The transforms are the ones in lambda_handler. They run in worker
+# threads and get a client that sends their requests on the event loop, so the sync clients are
+# never shared between threads.
+#
+# Kinesis only orders records with the same partition key, so the records of one asset are
+# processed in order and different assets are processed concurrently. AsyncConcurrency sets how
+# many assets are processed at a time (default 8).
+#
+# With an overflow queue, each asset stops at the Lambda deadline like the sync handler does and
+# sends its remaining records to the queue, see overflow.py.
+#
+# A record that fails stops the records of its asset after it, and the batch is raised once the
+# other assets are done, so Kinesis retries it like it does for the sync handler. The state the
+# transforms share in a container, such as the alias and pointer caches, is locked, and the
+# memory of records that overlap is not reported, see memory_tracker.py.
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from aiobotocore.session import get_session
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from elasticsearch import AsyncElasticsearch, AIOHttpConnection
+
+import compression
+import json_stream
+import lambda_handler as consumer
+import memory_tracker
+import overflow
+import pointer_cache
+import profiler
+import structured_logger
+
+ASYNC_CONCURRENCY = int(os.environ.get('AsyncConcurrency', 8))
+
+logger = structured_logger.get_logger()
+
+_loop = None
+_clients = None
+
+
+class SignedAIOHttpConnection(AIOHttpConnection):
+    """aiohttp connection that signs every request with SigV4 for Amazon OpenSearch Service."""
+
+    def __init__(self, *args, aws_credentials=None, aws_region=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.aws_credentials = aws_credentials
+        self.aws_region = aws_region
+
+    def sign(self, method, url, params, body):
+        port = '' if (self.scheme, self.port) in (('https', 443), ('http', 80)) else ':{}'.format(self.port)
+        full_url = '{scheme}://{host}{port}{path}'.format(
+            scheme=self.scheme, host=self.hostname, port=port, path=self.url_prefix + url)
+        request = AWSRequest(method=method, url=full_url, params=params or {}, data=body or b'')
+        SigV4Auth(self.aws_credentials.get_frozen_credentials(), 'es', self.aws_region).add_auth(request)
+        return dict(request.headers)
+
+    async def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        # Sign exactly the bytes that are sent. HEAD requests are sent as GET by the base class.
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        signed_headers = self.sign('GET' if method == 'HEAD' else method, url, params, body)
+        return await super().perform_request(method, url, params=params, body=body, timeout=timeout, ignore=ignore,
+                                             headers={**(headers or {}), **signed_headers})
+
+
+class BlockingClient:
+    """Calls an async client from a worker thread by running each call on the event loop that owns the client."""
+
+    def __init__(self, target, loop):
+        self._target = target
+        self._loop = loop
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            # Namespaces such as es.indices
+            return BlockingClient(attribute, self._loop)
+
+        async def run(args, kwargs):
+            return await attribute(*args, **kwargs)
+
+        def call(*args, **kwargs):
+            return asyncio.run_coroutine_threadsafe(run(args, kwargs), self._loop).result()
+
+        return call
+
+
+class BlockingStream:
+    """File-like reader over an async S3 body, for parsing a large result in a worker thread."""
+
+    def __init__(self, body, loop):
+        self._body = body
+        self._loop = loop
+
+    def read(self, size=-1):
+        amount = size if size is not None and size >= 0 else None
+        return asyncio.run_coroutine_threadsafe(self._body.read(amount), self._loop).result()
+
+
+def connect_async_es(endpoint):
+    session = boto3.Session()
+    return AsyncElasticsearch(
+        hosts=[{'host': endpoint, 'port': 443}],
+        use_ssl=True,
+        verify_certs=True,
+        connection_class=SignedAIOHttpConnection,
+        aws_credentials=session.get_credentials(),
+        aws_region=session.region_name,
+        maxsize=ASYNC_CONCURRENCY)
+
+
+async def open_clients(stack):
+    s3_client = await stack.enter_async_context(get_session().create_client('s3', config=consumer.config))
+    return s3_client, connect_async_es(consumer.es_endpoint)
+
+
+async def read_json_from_s3(s3_client, key, streamable=False):
+    """Async version of lambda_handler.read_json_from_s3."""
+    try:
+        obj = await s3_client.get_object(
+            Bucket=consumer.dataplane_bucket,
+            Key=key
+        )
+    except Exception as e:
+        return {"Status": "Error", "Error": e}
+    content_length = obj.get('ContentLength', 0)
+    content_encoding = obj.get('ContentEncoding')
+    # Without the body, compression can only be detected from the headers and the key here.
+    encoding = compression.detect_encoding(key, content_encoding)
+    if streamable and compression.estimated_size(content_length, encoding) > consumer.STREAMING_THRESHOLD_BYTES:
+        logger.info("streaming", "Object size exceeds threshold, parsing in streaming mode",
+                    object_size=content_length, threshold=consumer.STREAMING_THRESHOLD_BYTES)
+
+        # The pages are read from the worker thread that runs the transform.
+        def read_pages(body):
+            stream, _encoding = compression.open_stream(body, key, content_encoding)
+            yield from json_stream.iter_json_array_batches(stream, consumer.STREAMING_BATCH_BYTES)
+
+        pages = read_pages(BlockingStream(obj['Body'], asyncio.get_running_loop()))
+        return {"Status": "Success", "Pages": pages, "ContentLength": content_length, "Body": obj['Body'],
+                "ETag": obj.get('ETag')}
+    loop = asyncio.get_running_loop()
+    async with obj['Body'] as body:
+        # Decompress as the body is read, in a worker thread, instead of holding the compressed
+        # body and the decompressed result at once.
+        def read_results():
+            stream, _encoding = compression.open_stream(BlockingStream(body, loop), key, content_encoding)
+            return stream.read().decode('utf-8')
+
+        try:
+            results = await loop.run_in_executor(None, read_results)
+        except Exception as e:
+            return {"Status": "Error", "Error": e}
+    return {"Status": "Success", "Results": results, "ContentLength": content_length, "ETag": obj.get('ETag')}
+
+
+async def is_indexed(s3_client, pointer):
+    """Async version of PointerCache.is_indexed for lambda_handler.indexed_pointers."""
+    indexed_pointers = consumer.indexed_pointers
+    if not indexed_pointers.enabled or indexed_pointers.get(pointer) is None:
+        return False
+    try:
+        head = await s3_client.head_object(Bucket=consumer.dataplane_bucket, Key=pointer)
+    except Exception as e:
+        logger.warning("pointer_cache", "Unable to check the ETag of a cached pointer", error=e)
+        return False
+    return indexed_pointers.confirm(pointer, head.get('ETag'))
+
+
+def process_modify_metadata(asset_id, workflow, operator, metadata, cursor):
+    """Run lambda_handler.process_modify_metadata and return the number of requests that failed.
+
+    It is profiled and its memory is tracked like lambda_handler.handle_modify does, except for
+    the read of the S3 object, which was done on the event loop.
+    """
+    with profiler.profile_invocation(asset_id, operator, s3_client=consumer.s3, bucket=consumer.dataplane_bucket), \
+            memory_tracker.track_memory(asset_id, operator) as memory_usage:
+        memory_usage["ObjectSize"] = metadata["ContentLength"]
+        memory_usage["Streaming"] = "Pages" in metadata
+        with pointer_cache.track_failures() as failures:
+            consumer.process_modify_metadata(asset_id, workflow, operator, metadata, cursor)
+    return failures["Failures"]
+
+
+class AsyncConsumer:
+    """Processes a batch of Kinesis records with async clients and a pool of transform threads."""
+
+    def __init__(self, s3_client, es_client, concurrency=ASYNC_CONCURRENCY, queue=None):
+        self.s3_client = s3_client
+        self.es_client = es_client
+        self.concurrency = concurrency
+        self.queue = queue
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def run_transform(self, function, *args):
+        # Run in a worker thread with a copy of this task's context, so the log context and the
+        # client override apply to the transform.
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        context.run(consumer.es_client_override.set, BlockingClient(self.es_client, loop))
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, function, *args))
+
+    async def handle_modify(self, asset_id, payload, cursor=0):
+        try:
+            operator = payload['Operator']
+            s3_pointer = payload['Pointer']
+            workflow = payload['Workflow']
+        except KeyError as e:
+            logger.error("payload", "Missing required keys in kinesis payload", error=e)
+            return
+        if await is_indexed(self.s3_client, s3_pointer):
+            logger.info("pointer_cache", "Skipping {operator} result, it was already indexed".format(operator=operator),
+                        asset_id=asset_id, pointer=s3_pointer)
+            return
+        with structured_logger.log_context(operator=operator):
+            metadata = await read_json_from_s3(
+                self.s3_client, s3_pointer, streamable=operator.lower() in consumer.STREAMABLE_OPERATORS)
+            if metadata["Status"] != "Success":
+                logger.error("read_s3", "Unable to read metadata from s3", error=metadata["Error"])
+                return
+            try:
+                failures = await self.run_transform(process_modify_metadata, asset_id, workflow, operator, metadata,
+                                                    cursor)
+            finally:
+                if "Body" in metadata:
+                    metadata["Body"].close()
+            # Remember results that were indexed without errors so redeliveries can be skipped.
+            if not failures:
+                consumer.indexed_pointers.put(s3_pointer, asset_id, metadata["ETag"])
+
+    async def handle_record(self, asset_id, payload, action, cursor=0):
+        with structured_logger.log_context(asset_id=asset_id):
+            if action == "MODIFY":
+                try:
+                    await self.handle_modify(asset_id, payload, cursor)
+                finally:
+                    # dispatch_record does this for the other actions.
+                    await self.run_transform(consumer.bump_generation, asset_id)
+            else:
+                await self.run_transform(consumer.dispatch_record, asset_id, payload, action)
+
+    async def defer(self, records):
+        # The queue client is blocking, keep it off the event loop.
+        await asyncio.get_running_loop().run_in_executor(self.executor, overflow.defer, self.queue, records)
+
+    async def handle_asset(self, semaphore, records, deadline):
+        """Process the (asset_id, payload, action, cursor) records of an asset in order."""
+        async with semaphore:
+            # Transforms run with a copy of this context, so they check the same deadline.
+            token = overflow.current_deadline.set(deadline if self.queue is not None else None)
+            try:
+                for position, (asset_id, payload, action, cursor) in enumerate(records):
+                    if self.queue is not None and deadline.expired():
+                        await self.defer(records[position:])
+                        return
+                    try:
+                        await self.handle_record(asset_id, payload, action, cursor)
+                    except overflow.DeadlineExceeded as e:
+                        logger.warning("overflow", "Deadline reached, deferring the rest of the asset's records",
+                                       asset_id=asset_id, cursor=e.cursor)
+                        await self.defer([(asset_id, payload, action, e.cursor)] + records[position + 1:])
+                        return
+                    except Exception as e:
+                        # The later records of the asset must not be applied before this one.
+                        logger.error("async_handler", "Unable to process record", asset_id=asset_id, action=action,
+                                     error=e)
+                        raise
+            finally:
+                overflow.current_deadline.reset(token)
+
+    async def handle_batch(self, event, deadline=None):
+        deadline = deadline or overflow.Deadline(None)
+        decoded_records = [consumer.decode_record(record) for record in event['Records']]
+        records_by_asset = {}
+        for asset_id, payload, action in consumer.coalesce_records(event['Records'], decoded_records):
+            records_by_asset.setdefault(asset_id, []).append((asset_id, payload, action, 0))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*(self.handle_asset(semaphore, records, deadline)
+                                         for records in records_by_asset.values()), return_exceptions=True)
+        # Kinesis retries the whole batch, like it does when the sync handler raises.
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+
+async def get_consumer():
+    global _clients
+    if _clients is None:
+        stack = contextlib.AsyncExitStack()
+        s3_client, es_client = await open_clients(stack)
+        _clients = (stack, AsyncConsumer(s3_client, es_client, queue=consumer.overflow_queue))
+    return _clients[1]
+
+
+def get_loop():
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop
+
+
+async def handle_event(event, context):
+    async_consumer = await get_consumer()
+    await async_consumer.handle_batch(event, overflow.Deadline(context))
+
+
+def lambda_handler(event, context):
+    logger.debug("event", "Received event", event=event)
+    get_loop().run_until_complete(handle_event(event, context))
@@ -0,0 +1,420 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Rebuild the mie* search indices from the operator results stored in the dataplane bucket.
+#
+# The dataplane stores each asset under private/assets/{asset_id}/. The uploaded media is in
+# input/ and every operator result is in workflows/{workflow_id}/{operator}.json. This script
+# walks those prefixes and sends each result through the same process_* transform the consumer
+# uses for MODIFY records, so nothing has to be re-run through Rekognition or Transcribe. When
+# an asset was processed by more than one workflow, the most recent result of each operator is
+# indexed.
+#
+# Assets are split across a pool of worker processes. Within a worker, bulk requests are sent
+# from a small thread pool while the next operator result is read and transformed. Every
+# finished asset is appended to a checkpoint file, and a rerun with the same checkpoint skips
+# the assets that were already indexed. Existing documents of an asset are deleted before it is
+# indexed, those of the hidden derived indices included, so resuming after an interruption does
+# not create duplicates. An asset is only recorded as done when every request for it, the
+# updates of the derived indices included, succeeded.
+#
+# Usage:
+#   python3 backfill.py --bucket <dataplane bucket> --endpoint <search domain endpoint> \
+#       [--workers 8] [--senders 4] [--checkpoint backfill-checkpoint.jsonl] [--asset <asset_id> ...]
+#
+# With --document-keys, the script only gives the documents that have no DocumentKey one, see
+# asset_generation.py, and does not read the dataplane bucket.
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import derived_index
+
+ASSETS_PREFIX = 'private/assets/'
+DEFAULT_CHECKPOINT = 'backfill-checkpoint.jsonl'
+DEFAULT_SENDERS = 4
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+THROTTLED_STATUS = 429
+PROGRESS_INTERVAL = 100
+RESULT_EXTENSIONS = ('.json', '.json.gz', '.json.gzip', '.json.zst', '.json.zstd')
+
+
+def list_assets(s3_client, bucket, prefix=ASSETS_PREFIX):
+    """Yield the id of every asset in the dataplane bucket."""
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+        for common_prefix in page.get('CommonPrefixes', []):
+            yield common_prefix['Prefix'][len(prefix):].rstrip('/')
+
+
+def list_asset_objects(s3_client, bucket, asset_prefix):
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=asset_prefix):
+        yield from page.get('Contents', [])
+
+
+def result_operator(name):
+    """Return the operator of a result file name such as labelDetection.json or labelDetection.json.gz."""
+    for extension in RESULT_EXTENSIONS:
+        if name.endswith(extension) and len(name) > len(extension):
+            return name[:-len(extension)]
+    return None
+
+
+def plan_asset(objects, asset_prefix):
+    """Return the uploaded media object and the latest result of each operator of an asset.
+
+    Each result is a dict with the Operator, Workflow and Key of the stored object.
+    """
+    media = None
+    results = {}
+    for obj in objects:
+        parts = obj['Key'][len(asset_prefix):].split('/')
+        if len(parts) == 2 and parts[0] == 'input' and parts[1]:
+            if media is None or obj['LastModified'] < media['LastModified']:
+                media = obj
+        elif len(parts) == 3 and parts[0] == 'workflows' and result_operator(parts[2]):
+            operator = result_operator(parts[2])
+            latest = results.get(operator.lower())
+            if latest is None or obj['LastModified'] > latest['LastModified']:
+                results[operator.lower()] = {
+                    "Operator": operator,
+                    "Workflow": parts[1],
+                    "Key": obj['Key'],
+                    "LastModified": obj['LastModified']
+                }
+    return media, sorted(results.values(), key=lambda result: result['Key'])
+
+
+def throttled_items(body, response):
+    """Return the bulk body of the items that were throttled, and the number of other failures."""
+    lines = body.split('\n')
+    retry_lines = []
+    failures = 0
+    for position, item in enumerate(response.get('items', [])):
+        status = next(iter(item.values())).get('status', 200)
+        if status == THROTTLED_STATUS:
+            retry_lines.extend(lines[position * 2:position * 2 + 2])
+        elif status >= 300:
+            failures += 1
+    return '\n'.join(retry_lines), failures
+
+
+class ConcurrentSender:
+    """Stands in for the Elasticsearch client of the consumer and sends requests from a thread pool.
+
+    bulk and index calls return as soon as the request is queued, so the caller can read and
+    transform the next result while earlier payloads are in flight. Updates of the derived
+    indices are the exception: they are sent right away and their response is returned. At most twice as many
+    requests as there are senders are queued at a time, so a slow domain slows the caller down
+    instead of letting payloads pile up in memory. Throttled requests and throttled bulk items
+    are retried with exponential backoff. Everything else that fails is collected and returned
+    by `flush`.
+    """
+
+    def __init__(self, es_client, senders=DEFAULT_SENDERS, max_retries=MAX_RETRIES, retry_delay=RETRY_BASE_DELAY):
+        self._es = es_client
+        self._executor = ThreadPoolExecutor(max_workers=senders)
+        self._slots = threading.BoundedSemaphore(senders * 2)
+        self._lock = threading.Lock()
+        self._futures = []
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def bulk(self, body, index=None, **kwargs):
+        if index in derived_index.INDICES:
+            # Observers of the derived indices save their state for the updates that succeeded
+            # (see derived_index.py), so these updates are sent before bulk returns.
+            return self._es.bulk(body=body, index=index, **kwargs)
+        self._submit(self._send_bulk, body, index, kwargs)
+        return {}
+
+    def index(self, index, body, **kwargs):
+        self._submit(self._send_index, body, index, kwargs)
+        return {}
+
+    def delete_by_query(self, **kwargs):
+        # Deletes must finish before the documents that replace them are sent.
+        return self._es.delete_by_query(**kwargs)
+
+    def __getattr__(self, name):
+        # Everything else, such as the indices client and the update by query that clears a
+        # derived index before its updates, is sent right away with the client of the worker.
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._es, name)
+
+    def _submit(self, send, body, index, kwargs):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(send, body, index, kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _future: self._slots.release())
+        with self._lock:
+            self._futures.append(future)
+
+    def _backoff(self, attempt):
+        time.sleep(self.retry_delay * 2 ** attempt)
+
+    def _send_bulk(self, body, index, kwargs):
+        failures = 0
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._es.bulk(body=body, index=index, **kwargs)
+            except Exception as e:
+                if getattr(e, 'status_code', None) != THROTTLED_STATUS or attempt == self.max_retries:
+                    raise
+            else:
+                if not response.get('errors'):
+                    break
+                body, item_failures = throttled_items(body, response)
+                failures += item_failures
+                if not body:
+                    break
+                if attempt == self.max_retries:
+                    failures += body.count('\n') // 2 + 1
+                    break
+            self._backoff(attempt)
+        if failures:
+            raise RuntimeError("{count} documents were not indexed in {index}".format(count=failures, index=index))
+
+    def _send_index(self, body, index, kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._es.index(index=index, body=body, **kwargs)
+            except Exception as e:
+                if getattr(e, 'status_code', None) != THROTTLED_STATUS or attempt == self.max_retries:
+                    raise
+            self._backoff(attempt)
+
+    def flush(self):
+        """Wait for all queued requests and return the errors of the ones that failed."""
+        with self._lock:
+            futures, self._futures = self._futures, []
+        errors = []
+        for future in futures:
+            error = future.exception()
+            if error is not None:
+                errors.append(str(error))
+        return errors
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class Worker:
+    """Indexes one asset at a time with the transforms of the consumer."""
+
+    def __init__(self, consumer, es_client, senders=DEFAULT_SENDERS, delete_existing=True):
+        self.consumer = consumer
+        self.sender = ConcurrentSender(es_client, senders)
+        self.delete_existing = delete_existing
+        # The consumer connects to the domain in every transform. Hand all of them the same
+        # sender so the connection pool is reused and requests are sent in the background.
+        consumer.connect_es = lambda endpoint: self.sender
+
+    def backfill_asset(self, asset_id):
+        start = time.perf_counter()
+        consumer = self.consumer
+        asset_prefix = '{prefix}{asset}/'.format(prefix=ASSETS_PREFIX, asset=asset_id)
+        result = {"AssetId": asset_id, "Operators": 0, "Skipped": 0, "Errors": []}
+        try:
+            media, operator_results = plan_asset(
+                list_asset_objects(consumer.s3, consumer.dataplane_bucket, asset_prefix), asset_prefix)
+        except Exception as e:
+            result["Errors"].append(str(e))
+            operator_results = []
+            media = None
+        with consumer.pointer_cache.track_failures() as failures:
+            if self.delete_existing and (media is not None or operator_results):
+                # Deletes the documents of the derived indices and the suggestion counts of the asset too.
+                consumer.delete_asset_all_indices(self.sender, asset_id)
+            if media is not None:
+                consumer.handle_insert(asset_id, {
+                    "S3Key": media['Key'],
+                    "Created": str(media['LastModified'].timestamp())
+                })
+        if failures["Failures"]:
+            result["Errors"].append("{count} requests to delete or initialize the asset failed".format(
+                count=failures["Failures"]))
+        for operator_result in operator_results:
+            operator = operator_result['Operator']
+            if not consumer.is_supported_operator(operator):
+                result["Skipped"] += 1
+                continue
+            metadata = consumer.read_json_from_s3(
+                operator_result['Key'], streamable=operator.lower() in consumer.STREAMABLE_OPERATORS)
+            if metadata["Status"] != "Success":
+                result["Errors"].append("{key}: {error}".format(key=operator_result['Key'], error=metadata["Error"]))
+                continue
+            try:
+                if self.delete_existing and consumer.diff_index.diff_enabled():
+                    # The documents of the manifest were deleted with the rest of the asset.
+                    consumer.diff_manifests.reset(asset_id, operator)
+                with consumer.pointer_cache.track_failures() as failures:
+                    consumer.process_modify_metadata(asset_id, operator_result['Workflow'], operator, metadata)
+            except Exception as e:
+                result["Errors"].append("{key}: {error}".format(key=operator_result['Key'], error=e))
+            else:
+                if failures["Failures"]:
+                    # Such as an update of a derived index. The requests sent by the sender are
+                    # reported by flush.
+                    result["Errors"].append("{key}: {count} requests failed".format(
+                        key=operator_result['Key'], count=failures["Failures"]))
+                else:
+                    result["Operators"] += 1
+        result["Errors"].extend(self.sender.flush())
+        result["Status"] = "Failed" if result["Errors"] else "Done"
+        result["Seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+
+class Checkpoint:
+    """Append-only record of the assets that were backfilled, one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self.completed = set()
+        self._file = None
+        if os.path.exists(path):
+            with open(path) as checkpoint:
+                for line in checkpoint:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line may be incomplete if the previous run was killed.
+                        continue
+                    if entry.get("Status") == "Done":
+                        self.completed.add(entry["AssetId"])
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+        self._file = None
+
+    def record(self, result):
+        self._file.write(json.dumps(result) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        if result.get("Status") == "Done":
+            self.completed.add(result["AssetId"])
+
+
+_worker = None
+
+
+def init_worker(senders, delete_existing):
+    global _worker
+    import lambda_handler
+    _worker = Worker(lambda_handler, lambda_handler.connect_es(lambda_handler.es_endpoint), senders, delete_existing)
+
+
+def backfill_asset(asset_id):
+    return _worker.backfill_asset(asset_id)
+
+
+def run(asset_ids, checkpoint, workers, senders, delete_existing=True, report=print):
+    """Backfill the assets that are not in the checkpoint yet and return the (done, failed) counts."""
+    pending = (asset_id for asset_id in asset_ids if asset_id not in checkpoint.completed)
+    pool = None
+    if workers > 1:
+        # spawn rather than fork, so every worker creates its own boto3 and HTTP clients.
+        pool = multiprocessing.get_context('spawn').Pool(
+            workers, initializer=init_worker, initargs=(senders, delete_existing))
+        results = pool.imap_unordered(backfill_asset, pending)
+    else:
+        init_worker(senders, delete_existing)
+        results = map(backfill_asset, pending)
+    done = failed = 0
+    start = time.perf_counter()
+    try:
+        for result in results:
+            checkpoint.record(result)
+            if result["Status"] == "Done":
+                done += 1
+            else:
+                failed += 1
+                report("Failed to backfill asset {asset}: {errors}".format(
+                    asset=result["AssetId"], errors="; ".join(result["Errors"])))
+            if (done + failed) % PROGRESS_INTERVAL == 0:
+                report("{count} assets backfilled, {rate:.1f} assets/s".format(
+                    count=done + failed, rate=(done + failed) / (time.perf_counter() - start)))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        elif _worker is not None:
+            _worker.sender.close()
+    return done, failed
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Rebuild the search indices from the dataplane bucket.")
+    parser.add_argument('--bucket', default=os.environ.get('DataplaneBucket'), help="dataplane bucket name")
+    parser.add_argument('--endpoint', default=os.environ.get('EsEndpoint'), help="search domain endpoint")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument('--senders', type=int, default=DEFAULT_SENDERS,
+                        help="number of concurrent bulk requests per worker")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="file that records the finished assets")
+    parser.add_argument('--asset', action='append', help="backfill only this asset, may be repeated")
+    parser.add_argument('--keep-existing', action='store_true',
+                        help="do not delete the existing documents of an asset before indexing it")
+    parser.add_argument('--log-level', default='WARNING', help="log level of the consumer transforms")
+    parser.add_argument('--document-keys', action='store_true',
+                        help="only give the documents that have no DocumentKey one")
+    args = parser.parse_args(argv)
+    if not args.bucket or not args.endpoint:
+        parser.error("--bucket and --endpoint are required")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The consumer reads its configuration from the environment when it is imported, in this
+    # process and in the worker processes.
+    os.environ['DataplaneBucket'] = args.bucket
+    os.environ['EsEndpoint'] = args.endpoint
+    os.environ.setdefault('botoConfig', '{}')
+    os.environ['LogLevel'] = args.log_level
+    if args.document_keys:
+        import asset_generation
+        import lambda_handler
+        updated = asset_generation.backfill_document_keys(lambda_handler.connect_es(args.endpoint))
+        print("Gave {updated} documents a key".format(updated=updated))
+        return 0
+    import boto3
+    asset_ids = args.asset or list_assets(boto3.client('s3'), args.bucket)
+    with Checkpoint(args.checkpoint) as checkpoint:
+        if checkpoint.completed:
+            print("Resuming, {count} assets were already backfilled".format(count=len(checkpoint.completed)))
+        start = time.perf_counter()
+        done, failed = run(asset_ids, checkpoint, args.workers, args.senders, not args.keep_existing)
+    print("Backfilled {done} assets in {seconds:.0f}s, {failed} failed".format(
+        done=done, seconds=time.perf_counter() - start, failed=failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
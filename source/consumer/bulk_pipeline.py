@@ -0,0 +1,185 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Bounded queue between encoding bulk payloads and sending them.
+#
+# bulk_index encodes documents into NDJSON chunks and puts them on a BulkPipeline. A sender
+# thread takes the chunks off in order and sends them, so the next chunk is encoded while the
+# previous one is on the wire. Chunks wait in memory up to BulkQueueBytes. Past that they are
+# written to a memory-mapped spill file in /tmp of up to BulkSpillBytes, and when the spill file
+# is full as well the producer blocks until the domain catches up. Memory use of a slow domain
+# is therefore bounded by the budget instead of growing until Lambda stops the container.
+#
+# Only the encoded chunks are bounded. The transforms yield their documents into bulk_index,
+# which encodes each one as it comes, but the documents are built in place in the pages the
+# transform was given: a batch of about STREAMING_BATCH_BYTES of pages for results that are
+# streamed, the whole result otherwise.
+#
+# A call that produces a single chunk is sent from the calling thread without starting a sender.
+
+import collections
+import contextvars
+import mmap
+import os
+import tempfile
+import threading
+
+import structured_logger
+
+QUEUE_BYTES = int(os.environ.get('BulkQueueBytes', 10000000))
+SPILL_BYTES = int(os.environ.get('BulkSpillBytes', 100000000))
+
+logger = structured_logger.get_logger()
+
+
+class SpillFile:
+    """Fixed size memory-mapped file that chunks are appended to and read back from.
+
+    The write position goes back to the start of the file once every chunk written to it
+    has been read.
+    """
+
+    def __init__(self, capacity, directory=None):
+        self.capacity = capacity
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._file.truncate(capacity)
+        self._map = mmap.mmap(self._file.fileno(), capacity)
+        self._position = 0
+        self._unread = 0
+
+    def has_room(self, size):
+        return self._position + size <= self.capacity
+
+    def write(self, data):
+        offset = self._position
+        self._map[offset:offset + len(data)] = data
+        self._position += len(data)
+        self._unread += 1
+        return offset, len(data)
+
+    def read(self, offset, size):
+        data = self._map[offset:offset + size]
+        self._unread -= 1
+        if self._unread == 0:
+            self._position = 0
+        return data
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class BulkPipeline:
+    """Sends NDJSON chunks in order with `send`, buffering at most `queue_bytes` of them in memory.
+
+    `send` is called with one chunk at a time and is expected to handle its own errors.
+    """
+
+    def __init__(self, send, queue_bytes=None, spill_bytes=None, spill_directory=None):
+        self._send = send
+        self.queue_bytes = QUEUE_BYTES if queue_bytes is None else queue_bytes
+        self.spill_bytes = SPILL_BYTES if spill_bytes is None else spill_bytes
+        self._spill_directory = spill_directory
+        self._spill = None
+        # Chunks in order. Each entry is the chunk text, or the (offset, size) of a spilled chunk.
+        self._entries = collections.deque()
+        # Size of the chunks in memory, including the one being sent.
+        self._memory_bytes = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._sender = None
+        self._pending = None
+        self.stats = {"Chunks": 0, "Spilled": 0, "Blocked": 0}
+
+    def put(self, chunk):
+        """Queue a chunk for sending. Blocks while both the memory budget and the spill file are full."""
+        self.stats["Chunks"] += 1
+        if self._sender is None:
+            if self._pending is None:
+                # Hold the first chunk back, a call with a single chunk needs no sender.
+                self._pending = chunk
+                return
+            self._start_sender()
+        with self._condition:
+            while True:
+                if self._memory_bytes + len(chunk) <= self.queue_bytes or self._memory_bytes == 0:
+                    self._entries.append(chunk)
+                    self._memory_bytes += len(chunk)
+                    break
+                if self.spill_bytes > 0:
+                    data = chunk.encode('utf-8')
+                    if self._spill is None and len(data) <= self.spill_bytes:
+                        self._spill = SpillFile(self.spill_bytes, self._spill_directory)
+                        logger.info("bulk_pipeline", "Bulk queue is full, spilling chunks to disk",
+                                    queue_bytes=self.queue_bytes, spill_bytes=self.spill_bytes)
+                    if self._spill is not None and self._spill.has_room(len(data)):
+                        self._entries.append(self._spill.write(data))
+                        self.stats["Spilled"] += 1
+                        break
+                self.stats["Blocked"] += 1
+                self._condition.wait()
+            self._condition.notify_all()
+
+    def close(self):
+        """Send the remaining chunks and wait for them. Returns the stats of the pipeline."""
+        if self._sender is None:
+            if self._pending is not None:
+                self._send(self._pending)
+                self._pending = None
+            return self.stats
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._sender.join()
+        self._sender = None
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        return self.stats
+
+    def _start_sender(self):
+        self._entries.append(self._pending)
+        self._memory_bytes += len(self._pending)
+        self._pending = None
+        # Run with a copy of the caller's context so the sender logs with the record's context.
+        context = contextvars.copy_context()
+        self._sender = threading.Thread(target=context.run, args=(self._run,), daemon=True)
+        self._sender.start()
+
+    def _next_chunk(self):
+        with self._condition:
+            while not self._entries and not self._closed:
+                self._condition.wait()
+            if not self._entries:
+                return None, 0
+            entry = self._entries.popleft()
+            if isinstance(entry, tuple):
+                chunk = self._spill.read(*entry).decode('utf-8')
+                # The producer may have been waiting for the spill file to empty.
+                self._condition.notify_all()
+                return chunk, 0
+            return entry, len(entry)
+
+    def _run(self):
+        while True:
+            chunk, memory_bytes = self._next_chunk()
+            if chunk is None:
+                return
+            try:
+                self._send(chunk)
+            except Exception as e:
+                logger.error("bulk_pipeline", "Unable to send bulk chunk", error=e)
+            finally:
+                with self._condition:
+                    self._memory_bytes -= memory_bytes
+                    self._condition.notify_all()
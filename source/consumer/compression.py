@@ -0,0 +1,98 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Compressed operator results.
+#
+# Operator results may be stored gzip or zstd compressed. The encoding is taken from the
+# object's Content-Encoding, then from the extension of its key, then from the first bytes of
+# the body. The body is decompressed as it is read, so the parser gets decompressed chunks
+# without the whole decompressed result being held in memory.
+#
+# zstandard has a compiled extension and is only imported when a zstd result is read, so a
+# package built without it can still index uncompressed and gzip results.
+
+import gzip
+import os
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+EXTENSIONS = {
+    '.gz': GZIP,
+    '.gzip': GZIP,
+    '.zst': ZSTD,
+    '.zstd': ZSTD,
+}
+# The decompressed size of a result is not known before it is read. JSON results compress well,
+# so size decisions such as whether to stream assume this ratio.
+ESTIMATED_RATIO = 8
+
+
+def detect_encoding(key, content_encoding=None, head=b''):
+    """Return GZIP, ZSTD or None for an object."""
+    for encoding in (content_encoding or '').lower().split(','):
+        encoding = encoding.strip()
+        if encoding in ('gzip', 'x-gzip'):
+            return GZIP
+        if encoding in ('zstd', 'zstandard'):
+            return ZSTD
+    extension = os.path.splitext(key or '')[1].lower()
+    if extension in EXTENSIONS:
+        return EXTENSIONS[extension]
+    if head.startswith(GZIP_MAGIC):
+        return GZIP
+    if head.startswith(ZSTD_MAGIC):
+        return ZSTD
+    return None
+
+
+class _PeekedStream:
+    """Replays the bytes read ahead from a stream before reading the rest of it."""
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def read(self, size=-1):
+        if not self._head:
+            return self._stream.read(size) if size is not None and size >= 0 else self._stream.read()
+        if size is None or size < 0:
+            data = self._head + self._stream.read()
+            self._head = b''
+            return data
+        data = self._head[:size]
+        self._head = self._head[size:]
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+    def close(self):
+        self._stream.close()
+
+
+def open_stream(body, key=None, content_encoding=None):
+    """Return a binary stream of the decompressed body and the encoding that was detected."""
+    head = body.read(len(ZSTD_MAGIC))
+    stream = _PeekedStream(head, body)
+    encoding = detect_encoding(key, content_encoding, head)
+    if encoding == GZIP:
+        return gzip.GzipFile(fileobj=stream, mode='rb'), encoding
+    if encoding == ZSTD:
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True), encoding
+    return stream, None
+
+
+def estimated_size(content_length, encoding):
+    return content_length * ESTIMATED_RATIO if encoding else content_length
@@ -0,0 +1,210 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Hidden indices derived from the indexed results.
+#
+# Besides the mie{index} indices the UI searches, the consumer can maintain indices that
+# summarize what it indexed, such as the per-asset manifests of asset_manifest.py. Each is
+# enabled by its own environment variable. They are created hidden, so the searches across all
+# indices the UI runs do not return their documents, and they are read by name. They are
+# written to directly rather than through the index aliases, and reindex.py leaves them alone.
+# Their documents are derived from the operator results, so an index can be deleted and
+# rebuilt with backfill.py. Requests to them that fail are counted by pointer_cache, like the
+# requests to the mie{index} indices, so the result is not remembered as indexed and backfill.py
+# marks the asset as failed.
+#
+# While a result is indexed, the observers of the enabled indices see every document that is
+# written for it. Afterwards each observer returns scripted upserts for its index. An observer
+# has these methods:
+#
+#   add(es_index, document)   called for every document written
+#   state()                   what was observed, as plain data
+#   merge(state)              adds the state of an observer that ran in a worker process
+#   empty()                   a new observer for the same result
+#   clear_query(asset_id, resume)
+#                             body of an update by query to run before the updates, or None
+#   make_updates(asset_id, workflow, status, resume)
+#                             list of (document id, update body) for the index, where status
+#                             is INDEXED, INCOMPLETE or DEFERRED and resume is true for the
+#                             slice of a deferred result that resumes it
+#   updates_sent(asset_id, failed_ids)
+#                             called once the updates were sent, with the set of document ids
+#                             whose update failed
+#
+# Observers that write their output somewhere else, such as the bundles of
+# analysis_bundles.py, write it in make_updates and return no updates. Observers that keep what
+# their updates were computed from, such as the stored terms of suggestions.py, save it in
+# updates_sent, and only for the updates that succeeded, so it is neither ahead of nor behind
+# the index.
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+
+from elasticsearch.exceptions import RequestError
+
+import pointer_cache
+import structured_logger
+
+ASSET_MANIFEST_INDEX = 'mieassetmanifest'
+ASSET_CATALOG_INDEX = 'mieassetcatalog'
+TIMELINE_INDEX = 'mietimeline'
+SCENES_INDEX = 'miescenes'
+SUGGESTIONS_INDEX = 'miesuggestions'
+NOTIFICATIONS_INDEX = 'mienotifications'
+# Index name to the environment variable that enables it.
+INDICES = {
+    ASSET_MANIFEST_INDEX: 'AssetManifest',
+    ASSET_CATALOG_INDEX: 'AssetCatalog',
+    TIMELINE_INDEX: 'Timeline',
+    SCENES_INDEX: 'Scenes',
+    SUGGESTIONS_INDEX: 'Suggestions',
+    NOTIFICATIONS_INDEX: 'SavedSearches',
+}
+# The saved searches of percolator.py are hidden too, but they are written by users and cannot
+# be rebuilt.
+SAVED_SEARCHES_INDEX = 'miesavedsearches'
+# Status of the result the updates are made for.
+INDEXED = "Indexed"
+INCOMPLETE = "Incomplete"
+DEFERRED = "Deferred"
+# Upserts sent per bulk request.
+UPDATE_BATCH_SIZE = 1000
+# Results of one asset can update the same documents at the same time from different functions.
+RETRY_ON_CONFLICT = 5
+
+logger = structured_logger.get_logger()
+
+# Indices this container has created or found to exist, and the lock that makes one thread
+# create an index while the others wait for it.
+_ensured = set()
+_ensure_lock = threading.Lock()
+# The observers of the result being indexed.
+_observers = contextvars.ContextVar('derived_index_observers', default=())
+
+
+def index_enabled(index):
+    return os.environ.get(INDICES[index], 'false').lower() == 'true'
+
+
+def enabled_indices():
+    return sorted(index for index in INDICES if index_enabled(index))
+
+
+def current_observers():
+    return _observers.get()
+
+
+@contextlib.contextmanager
+def observe(observers):
+    observers = tuple(observers)
+    token = _observers.set(observers)
+    try:
+        yield observers
+    finally:
+        _observers.reset(token)
+
+
+def notify(observers, es_index, document):
+    for observer in observers:
+        observer.add(es_index, document)
+
+
+def ensure_index(es_object, index, mappings):
+    """Create a hidden index with `mappings` unless this container already did. Returns False if it could not."""
+    if index in _ensured:
+        return True
+    with _ensure_lock:
+        if index in _ensured:
+            return True
+        body = {"settings": {"index.hidden": True}, "mappings": mappings}
+        try:
+            es_object.indices.create(index=index, body=body)
+        except RequestError as e:
+            if e.error != 'resource_already_exists_exception':
+                logger.error("derived_index", "Unable to create {index}".format(index=index), error=e)
+                return False
+        except Exception as e:
+            logger.error("derived_index", "Unable to create {index}".format(index=index), error=e)
+            return False
+        else:
+            logger.info("derived_index", "Created {index}".format(index=index))
+        _ensured.add(index)
+    return True
+
+
+def clear_documents(es_object, index, mappings, body):
+    """Run an update by query on a derived index, creating it first. Returns False if it failed."""
+    if not ensure_index(es_object, index, mappings):
+        pointer_cache.record_failure()
+        return False
+    try:
+        es_object.update_by_query(index=index, body=body, conflicts='proceed')
+    except Exception as e:
+        logger.error("derived_index", "Unable to clear documents of {index}".format(index=index), error=e)
+        pointer_cache.record_failure()
+        return False
+    return True
+
+
+def make_update_actions(index, updates):
+    """Return the bulk lines of (document id, update body) pairs."""
+    lines = []
+    for doc_id, body in updates:
+        lines.append(json.dumps({"update": {"_index": index, "_id": doc_id, "retry_on_conflict": RETRY_ON_CONFLICT}}))
+        lines.append(json.dumps(body))
+    return lines
+
+
+def failed_items(response):
+    """Return the ids of the items of a bulk response that failed."""
+    failed = set()
+    for item in response.get("items", []):
+        result = next(iter(item.values()))
+        if result.get("status", 200) >= 300:
+            failed.add(result.get("_id"))
+    return failed
+
+
+def send_updates(es_object, index, mappings, updates, failed_ids=None):
+    """Send (document id, update body) pairs to a derived index, creating it first. Returns False if any failed.
+
+    The ids of the updates that failed are added to the set `failed_ids`, if one is given.
+    """
+    if failed_ids is None:
+        failed_ids = set()
+    if not updates:
+        return True
+    if not ensure_index(es_object, index, mappings):
+        pointer_cache.record_failure()
+        failed_ids.update(doc_id for doc_id, _body in updates)
+        return False
+    succeeded = True
+    for start in range(0, len(updates), UPDATE_BATCH_SIZE):
+        batch = updates[start:start + UPDATE_BATCH_SIZE]
+        try:
+            response = es_object.bulk(index=index, body='\n'.join(make_update_actions(index, batch)))
+        except Exception as e:
+            logger.error("derived_index", "Unable to update {index}".format(index=index), error=e)
+            pointer_cache.record_failure()
+            failed_ids.update(doc_id for doc_id, _body in batch)
+            succeeded = False
+            continue
+        if isinstance(response, dict) and response.get("errors"):
+            logger.error("derived_index", "Some updates of {index} failed".format(index=index))
+            pointer_cache.record_failure()
+            failed_ids.update(failed_items(response))
+            succeeded = False
+    return succeeded
@@ -0,0 +1,158 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Incremental indexing of reprocessed results.
+#
+# With DiffIndexing set to true, every document the consumer writes for a result gets an id
+# derived from its content, and the ids written for each asset and operator are kept in a
+# manifest in the dataplane bucket:
+#
+#   private/assets/{asset}/search/{operator}.json
+#
+# The operator is the full lower-cased operator name, such as webcaptions_en, so results that
+# are processed by the same transform but written to different indices have separate manifests.
+#
+# When the operator's result is indexed again, for example after captions were edited and the
+# workflow ran again, documents whose id is in the manifest are already in the index and are not
+# sent. Only new or changed documents are written, and the ids that are no longer produced are
+# deleted. The manifest is only replaced when every request succeeded, and since the ids do not
+# change, sending a document twice overwrites it rather than duplicating it.
+#
+# Every document names the workflow that produced it, which is different on each run. The
+# workflow id is left out of the content id, so a document that only differs in its workflow is
+# not written again and keeps the workflow of the run that first wrote it.
+#
+# Results that are streamed or transformed in worker processes are not diffed. Before they are
+# written in full, the documents listed in their manifest are deleted and the manifest is reset.
+
+import collections
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+
+from botocore.exceptions import ClientError
+
+import structured_logger
+
+MANIFEST_KEY = 'private/assets/{asset}/search/{operator}.json'
+MANIFEST_VERSION = 1
+
+logger = structured_logger.get_logger()
+
+# The diff of the result being indexed, if it is diffed.
+_session = contextvars.ContextVar('diff_session', default=None)
+
+
+def diff_enabled():
+    return os.environ.get('DiffIndexing', 'false').lower() == 'true'
+
+
+class DiffSession:
+    """Ids of the documents written for one result, compared with the ids in its previous manifest."""
+
+    def __init__(self, previous=None, workflow=None):
+        self.previous = {index: set(ids) for index, ids in (previous or {}).items()}
+        self.workflow = workflow
+        self.documents = {}
+        self.unchanged = 0
+        self._occurrences = collections.Counter()
+
+    def document_id(self, es_index, document):
+        """Return the id of a document from its JSON text.
+
+        Identical documents in one result, such as two detections of the same label at the same
+        time, get ids with an occurrence number so they stay separate documents.
+        """
+        if self.workflow:
+            document = document.replace(self.workflow, '')
+        digest = hashlib.blake2b(document.encode('utf-8'), digest_size=16).hexdigest()
+        occurrence = self._occurrences[(es_index, digest)]
+        self._occurrences[(es_index, digest)] += 1
+        doc_id = digest if occurrence == 0 else '{digest}-{occurrence}'.format(digest=digest, occurrence=occurrence)
+        self.documents.setdefault(es_index, []).append(doc_id)
+        return doc_id
+
+    def is_indexed(self, es_index, doc_id):
+        if doc_id in self.previous.get(es_index, ()):
+            self.unchanged += 1
+            return True
+        return False
+
+    def removed(self):
+        """Return the ids of the previous manifest that were not produced again, by index."""
+        removed = {}
+        for index, ids in self.previous.items():
+            missing = ids.difference(self.documents.get(index, ()))
+            if missing:
+                removed[index] = sorted(missing)
+        return removed
+
+    def manifest(self):
+        return {"Version": MANIFEST_VERSION, "Documents": self.documents}
+
+
+def current_session():
+    return _session.get()
+
+
+@contextlib.contextmanager
+def diff_session(previous, workflow=None):
+    session = DiffSession(previous, workflow)
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
+
+
+class ManifestStore:
+    """Reads and writes the manifests in the dataplane bucket."""
+
+    def __init__(self, s3_client, bucket):
+        self.s3_client = s3_client
+        self.bucket = bucket
+
+    @staticmethod
+    def key(asset_id, operator):
+        return MANIFEST_KEY.format(asset=asset_id, operator=operator.lower())
+
+    def load(self, asset_id, operator):
+        """Return the documents of the manifest by index, or an empty dict if there is none."""
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket, Key=self.key(asset_id, operator))
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey':
+                return {}
+            raise
+        manifest = json.loads(obj['Body'].read())
+        if manifest.get("Version") != MANIFEST_VERSION:
+            return {}
+        return manifest["Documents"]
+
+    def save(self, asset_id, operator, manifest):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self.key(asset_id, operator),
+            Body=json.dumps(manifest, separators=(',', ':')).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+    def reset(self, asset_id, operator):
+        self.save(asset_id, operator, DiffSession().manifest())
+
+
+def make_delete_actions(write_indices, doc_ids):
+    return [json.dumps({"delete": {"_index": write_index, "_type": "_doc", "_id": doc_id}})
+            for doc_id in doc_ids for write_index in write_indices]
@@ -0,0 +1,168 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Index generations behind read and write aliases.
+#
+# Each mie* index is a series of concrete generations named mie{index}-000001, mie{index}-000002
+# and so on. Two aliases point to the current generation:
+#
+#   mie{index}         read alias, the name the UI filters on
+#   mie{index}-write   write alias, the only name the consumer writes to
+#
+# While reindex.py builds the next generation it is created hidden, so searches across all
+# indices do not return its documents twice, and it gets a third alias:
+#
+#   mie{index}-next    the generation being built
+#
+# The consumer writes every document to the write alias and to the next generation with the
+# same document id, so documents that arrive while the old generation is copied are not lost
+# or duplicated. Deployments that still have a concrete mie{index} index keep writing to it
+# until reindex.py replaces it with the first generation.
+
+import os
+import threading
+import time
+import uuid
+
+from elasticsearch.exceptions import NotFoundError, RequestError
+
+import structured_logger
+
+INDEX_PATTERN = 'mie*'
+FIRST_GENERATION = 1
+
+logger = structured_logger.get_logger()
+
+
+def write_alias(es_index):
+    return es_index + '-write'
+
+
+def next_alias(es_index):
+    return es_index + '-next'
+
+
+def generation_name(es_index, generation):
+    return '{index}-{generation:06d}'.format(index=es_index, generation=generation)
+
+
+def parse_generation(es_index, name):
+    """Return the generation number of a concrete index name, or None for other names."""
+    prefix = es_index + '-'
+    suffix = name[len(prefix):]
+    if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+        return int(suffix)
+    return None
+
+
+def aliases_enabled():
+    return os.environ.get('IndexAliases', 'false').lower() == 'true'
+
+
+def get_aliases(es_object):
+    """Return a dict of alias name to the list of concrete indices it points to, and the set of concrete indices."""
+    try:
+        response = es_object.indices.get_alias(index=INDEX_PATTERN, expand_wildcards='all')
+    except NotFoundError:
+        response = {}
+    aliases = {}
+    for concrete_index, details in response.items():
+        for alias in details.get('aliases', {}):
+            aliases.setdefault(alias, []).append(concrete_index)
+    return aliases, set(response)
+
+
+def create_first_generation(es_object, es_index):
+    body = {
+        "aliases": {
+            es_index: {},
+            write_alias(es_index): {"is_write_index": True}
+        }
+    }
+    try:
+        es_object.indices.create(index=generation_name(es_index, FIRST_GENERATION), body=body)
+    except RequestError as e:
+        # Another consumer created it first.
+        if e.error != 'resource_already_exists_exception':
+            raise
+    else:
+        logger.info("index_aliases", "Created the first generation of {index}".format(index=es_index))
+
+
+def make_document_id():
+    return uuid.uuid4().hex
+
+
+class AliasResolver:
+    """Resolves the indices the consumer writes to, caching the aliases for `refresh_seconds`.
+
+    The transforms of the async handler share it from several threads. The cache is loaded and
+    an index is created by one thread at a time.
+    """
+
+    def __init__(self, refresh_seconds=None):
+        if refresh_seconds is None:
+            refresh_seconds = int(os.environ.get('AliasRefreshSeconds', 30))
+        self.refresh_seconds = refresh_seconds
+        self._aliases = {}
+        self._indices = set()
+        self._loaded_at = None
+        self._lock = threading.RLock()
+
+    def refresh(self, es_object):
+        with self._lock:
+            self._aliases, self._indices = get_aliases(es_object)
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self, es_object):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_seconds:
+                self.refresh(es_object)
+            return self._aliases
+
+    def write_indices(self, es_object, es_index):
+        """Return the names to write a document of `es_index` to.
+
+        The first name is the write alias, or the concrete index of a deployment that has not
+        been migrated to generations yet. A second name is returned while the next generation
+        of the index is being built.
+        """
+        try:
+            with self._lock:
+                aliases = self.ensure_loaded(es_object)
+                if write_alias(es_index) not in aliases and es_index not in self._indices:
+                    create_first_generation(es_object, es_index)
+                    self.refresh(es_object)
+                    aliases = self._aliases
+        except Exception as e:
+            logger.error("index_aliases", "Unable to resolve the aliases of {index}".format(index=es_index), error=e)
+            return [es_index]
+        targets = [write_alias(es_index) if write_alias(es_index) in aliases else es_index]
+        # Write to the concrete index of the next generation rather than its alias. If this
+        # cache is stale after the aliases were swapped, the write still lands in an index
+        # that exists instead of creating one named after the removed alias.
+        targets.extend(aliases.get(next_alias(es_index), []))
+        return targets
+
+    def next_indices(self, es_object):
+        """Return the concrete indices of all generations that are being built."""
+        try:
+            aliases = self.ensure_loaded(es_object)
+        except Exception as e:
+            logger.error("index_aliases", "Unable to resolve the aliases", error=e)
+            return []
+        return sorted(
+            concrete_index
+            for alias, concrete_indices in aliases.items() if alias.endswith('-next')
+            for concrete_index in concrete_indices
+        )
@@ -0,0 +1,239 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Incremental parsing of paged operator results.
+#
+# Paged Rekognition results are stored as a JSON array of pages. Parsing a large result with
+# json.loads needs the whole body and the whole decoded object tree in memory at once. The
+# functions below read the body in chunks and decode one page at a time instead, so memory
+# use is bounded by the size of a batch of pages rather than the size of the object. When the
+# pages are decoded elsewhere, iter_json_array_raw only splits them by scanning for brackets.
+
+import codecs
+import json
+import re
+
+READ_CHUNK_SIZE = 1024 * 1024
+WHITESPACE = ' \t\n\r'
+# A complete JSON string.
+STRING = re.compile(r'"[^"\\]*+(?:\\.[^"\\]*+)*+"', re.DOTALL)
+# Containers nested up to this deep are skipped by a single regular expression match.
+SKIP_DEPTH = 6
+
+
+def _skip_pattern(depth):
+    text = STRING.pattern + r'|[^"\[\]{}]++'
+    level = text
+    for _ in range(depth):
+        level = r'%s|[\[{](?:%s)*+[\]}]' % (text, level)
+    return re.compile(r'(?:%s)*+' % level, re.DOTALL)
+
+
+# Text, strings and complete containers up to the next bracket that is not part of one. Stops at
+# the bracket that closes the current container, at a container that is nested too deep or not
+# complete yet, at the quote of a string that is not complete yet, or at the end of the buffer.
+SKIP_TO_BRACKET = _skip_pattern(SKIP_DEPTH)
+# A number, true, false or null.
+SCALAR = re.compile(r'[^,\]\s]+')
+
+
+def skip_whitespace(buffer, position):
+    while position < len(buffer) and buffer[position] in WHITESPACE:
+        position += 1
+    return position
+
+
+class _TextReader:
+    """Reads a binary stream as text in chunks."""
+
+    def __init__(self, stream, chunk_size):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.eof = False
+
+    def read(self, size=None):
+        if self.eof:
+            return ''
+        data = self._stream.read(size or self._chunk_size)
+        if not data:
+            self.eof = True
+            return self._decoder.decode(b'', final=True)
+        return self._decoder.decode(data)
+
+
+def iter_json_array(stream, chunk_size=READ_CHUNK_SIZE):
+    """Yield the elements of a JSON array read from a binary stream one at a time.
+
+    If the document is not an array it is read in full and yielded as a single element, so
+    callers can treat single page and paged results the same way.
+    """
+    for element, _size in iter_json_array_with_sizes(stream, chunk_size):
+        yield element
+
+
+def iter_json_array_with_sizes(stream, chunk_size=READ_CHUNK_SIZE):
+    """Like `iter_json_array`, but yields (element, encoded length) tuples."""
+    for element, text in iter_json_array_with_text(stream, chunk_size):
+        yield element, len(text)
+
+
+def iter_json_array_raw(stream, chunk_size=READ_CHUNK_SIZE):
+    """Like `iter_json_array`, but yields the JSON text of each element without decoding it.
+
+    Elements are split by tracking brackets and strings only, which is several times faster
+    than decoding them. The text is not validated, malformed elements fail where they are decoded.
+    """
+    reader = _TextReader(stream, chunk_size)
+    buffer, position = _start_document(reader)
+    if buffer[position] != '[':
+        yield _read_remaining(reader, buffer, position)
+        return
+
+    position += 1
+    read_size = chunk_size
+    # Where the scan of the current element has got to and how deep it is, so the element is
+    # not scanned again from its start when more of it is read.
+    scan = None
+    depth = 0
+    while True:
+        if scan is None:
+            position = skip_whitespace(buffer, position)
+            if position < len(buffer):
+                if buffer[position] == ']':
+                    return
+                if buffer[position] == ',':
+                    position += 1
+                    continue
+                scan = position
+                depth = 0
+        if scan is not None:
+            end, scan, depth = _scan_element(buffer, position, scan, depth, reader.eof)
+            if end is not None:
+                yield buffer[position:end]
+                position = end
+                scan = None
+                read_size = chunk_size
+                continue
+        if reader.eof:
+            raise ValueError("Unterminated JSON array")
+        buffer = buffer[position:] + reader.read(read_size)
+        if scan is not None:
+            scan -= position
+        position = 0
+        read_size *= 2
+
+
+def _scan_element(buffer, start, scan, depth, eof):
+    """Continue scanning the element that starts at `start` from `scan` at bracket depth `depth`.
+
+    Returns (end of the element or None if the buffer ends first, position reached, depth).
+    """
+    if buffer[start] not in '[{':
+        match = (STRING if buffer[start] == '"' else SCALAR).match(buffer, start)
+        # A number that ends at the end of the buffer may continue in the next chunk.
+        if match is None or (match.end() == len(buffer) and not eof):
+            return None, start, 0
+        return match.end(), match.end(), 0
+    if scan == start:
+        # Step into the element, so the scan stops at its closing bracket instead of skipping it.
+        scan, depth = start + 1, 1
+    while True:
+        scan = SKIP_TO_BRACKET.match(buffer, scan).end()
+        if scan == len(buffer) or buffer[scan] == '"':
+            return None, scan, depth
+        depth += 1 if buffer[scan] in '[{' else -1
+        scan += 1
+        if depth == 0:
+            return scan, scan, 0
+
+
+def _start_document(reader):
+    """Read up to the first character of the document. Returns the buffer and its position."""
+    buffer = ''
+    position = 0
+    while True:
+        position = skip_whitespace(buffer, position)
+        if position < len(buffer) or reader.eof:
+            break
+        buffer += reader.read()
+    if position >= len(buffer):
+        raise ValueError("Empty JSON document")
+    return buffer, position
+
+
+def _read_remaining(reader, buffer, position):
+    remaining = [buffer[position:]]
+    while not reader.eof:
+        remaining.append(reader.read())
+    return ''.join(remaining)
+
+
+def iter_json_array_with_text(stream, chunk_size=READ_CHUNK_SIZE):
+    """Like `iter_json_array`, but yields (element, JSON text of the element) tuples."""
+    reader = _TextReader(stream, chunk_size)
+    decoder = json.JSONDecoder()
+    buffer, position = _start_document(reader)
+    if buffer[position] != '[':
+        # Not a paged result. Fall back to decoding the whole document.
+        document = _read_remaining(reader, buffer, position)
+        yield json.loads(document), document
+        return
+
+    position += 1
+    expect_value = True
+    read_size = chunk_size
+    while True:
+        position = skip_whitespace(buffer, position)
+        if position < len(buffer):
+            if buffer[position] == ']':
+                return
+            if buffer[position] == ',' and not expect_value:
+                position += 1
+                expect_value = True
+                continue
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if reader.eof:
+                    raise
+            else:
+                # A number that ends at the end of the buffer may continue in the next chunk.
+                if end < len(buffer) or reader.eof:
+                    yield element, buffer[position:end]
+                    position = end
+                    expect_value = False
+                    read_size = chunk_size
+                    continue
+        elif reader.eof:
+            raise ValueError("Unterminated JSON array")
+        # The next element is incomplete. Grow the read size geometrically so that large
+        # elements are not re-decoded once per chunk.
+        buffer = buffer[position:] + reader.read(read_size)
+        position = 0
+        read_size *= 2
+
+
+def iter_json_array_batches(stream, batch_size, chunk_size=READ_CHUNK_SIZE):
+    """Group the elements of a JSON array into lists of roughly `batch_size` encoded bytes."""
+    batch = []
+    batch_bytes = 0
+    for element, size in iter_json_array_with_sizes(stream, chunk_size):
+        batch.append(element)
+        batch_bytes += size
+        if batch_bytes >= batch_size:
+            yield batch
+            batch = []
+            batch_bytes = 0
+    if batch:
+        yield batch
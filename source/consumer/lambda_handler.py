@@ -13,20 +13,64 @@
 
 from elasticsearch import Elasticsearch, RequestsHttpConnection
 import base64
+import contextvars
+import functools
+import itertools
 import json
 import os
 from botocore import config
 import boto3
 from requests_aws4auth import AWS4Auth
+import analysis_bundles
+import asset_catalog
+import asset_generation
+import asset_manifest
+import bulk_pipeline
+import compression
+import derived_index
+import diff_index
+import index_aliases
+import json_stream
+import memory_tracker
+import overflow
+import percolator
+import pointer_cache
+import profiler
+import scenes
+import structured_logger
+import suggestions
+import time_axis
+import timeline
+import transform_pool
 
 mie_config = json.loads(os.environ['botoConfig'])
 config = config.Config(**mie_config)
 
 MAX_BULK_INDEX_PAYLOAD_SIZE = 5000000
+# Paged results larger than this are parsed a batch of pages at a time instead of all at once.
+STREAMING_THRESHOLD_BYTES = int(os.environ.get('StreamingThresholdBytes', 50000000))
+STREAMING_BATCH_BYTES = 10000000
+# Number of documents deleted per bulk request when a reprocessed result no longer produces them.
+DELETE_BATCH_SIZE = 10000
 es_endpoint = os.environ['EsEndpoint']
 dataplane_bucket = os.environ['DataplaneBucket']
 
 s3 = boto3.client('s3', config=config)
+overflow_queue = overflow.get_queue(config)
+indexed_pointers = pointer_cache.PointerCache()
+diff_manifests = diff_index.ManifestStore(s3, dataplane_bucket)
+scene_sources = scenes.SceneSources(s3, dataplane_bucket)
+bundle_store = analysis_bundles.BundleStore(s3, dataplane_bucket)
+suggestion_terms = suggestions.TermStore(s3, dataplane_bucket)
+asset_generations = asset_generation.GenerationStore(s3, dataplane_bucket)
+logger = structured_logger.get_logger()
+alias_resolver = index_aliases.AliasResolver()
+# The async handler runs the transforms in worker threads and sets this to a client that sends
+# their requests on its event loop.
+es_client_override = contextvars.ContextVar('es_client_override', default=None)
+# Transform workers cannot refresh the alias cache or create indices, so they write to the
+# indices their parent resolved before forking them. See index_result.
+write_indices_override = contextvars.ContextVar('write_indices_override', default=None)
 
 
 def normalize_confidence(confidence_value):
@@ -39,20 +83,43 @@ def convert_to_milliseconds(time_value):
     return str(converted)
 
 
+def load_results(results):
+    # Results are normally the JSON string read from S3. In streaming mode they are
+    # a batch of pages that have already been decoded.
+    if isinstance(results, (str, bytes)):
+        return json.loads(results)
+    return results
+
+
 def print_key_error(e: KeyError, item: dict):
-    print("KeyError: " + str(e))
-    print("Item: " + json.dumps(item))
+    logger.warning("key_error", "KeyError: " + str(e))
+    logger.debug("key_error_item", "Item", item=item)
 
 
 def print_unable_to_load_data_into_es(e: Exception, data: dict):
-    print('Unable to load data into es:', e)
-    print("Data: ", data)
+    logger.error("index_error", "Unable to load data into es", error=e)
+    pointer_cache.record_failure()
+    logger.debug("index_error_data", "Data", data=data)
+
+
+def indexes_documents(index):
+    """Make a transform that yields the documents of a result index them in mie{index}.
+
+    The documents go to bulk_index as they are yielded, so they are encoded and sent without
+    first being collected in a list.
+    """
+    def decorator(transform):
+        @functools.wraps(transform)
+        def process(asset, workflow, results, *args):
+            es = connect_es(es_endpoint)
+            bulk_index(es, asset, index, transform(asset, workflow, results, *args))
+        return process
+    return decorator
 
 
+@indexes_documents("textDetection")
 def process_text_detection(asset, workflow, results):
-    metadata = json.loads(results)
-    es = connect_es(es_endpoint)
-    extracted_items = []
+    metadata = load_results(results)
     # We can tell if json results are paged by checking to see if the json results are an instance of the list type.
     if not isinstance(metadata, list):
         # Make it a single page list
@@ -65,6 +132,7 @@ def process_text_detection(asset, workflow, results):
             if "TextDetection" in item:
                 text_detection = item["TextDetection"]
                 text_detection["Timestamp"] = item["Timestamp"]
+                time_axis.set_range(text_detection, item["Timestamp"])
                 # Flatten the bbox Label array
                 text_detection["BoundingBox"] = text_detection["Geometry"]["BoundingBox"]
                 del text_detection["Geometry"]
@@ -74,17 +142,15 @@ def process_text_detection(asset, workflow, results):
 
             text_detection["Operator"] = "textDetection"
             text_detection["Workflow"] = workflow
-            print(text_detection)
-            extracted_items.append(text_detection)
+            logger.debug("text_detection_item", "Text detection", item=text_detection)
+            yield text_detection
         except KeyError as e:
             print_key_error(e, item)
-    bulk_index(es, asset, "textDetection", extracted_items)
 
 
+@indexes_documents("celebrity_detection")
 def process_celebrity_detection(asset, workflow, results):
-    metadata = json.loads(results)
-    es = connect_es(es_endpoint)
-    extracted_items = []
+    metadata = load_results(results)
     if not isinstance(metadata, list):
         # Make it a single page list
         metadata = [metadata]
@@ -93,6 +159,7 @@ def process_celebrity_detection(asset, workflow, results):
         try:
             item["Operator"] = "celebrity_detection"
             item["Workflow"] = workflow
+            time_axis.set_range(item, item.get("Timestamp"))
 
             # Parse schema for videos:
             # https://docs.aws.amazon.com/rekognition/latest/dg/celebrities-video-sqs.html
@@ -119,16 +186,14 @@ def process_celebrity_detection(asset, workflow, results):
                 # delete flattened array
                 del item["Face"]
 
-            extracted_items.append(item)
+            yield item
         except KeyError as e:
             print_key_error(e, item)
-    bulk_index(es, asset, "celebrity_detection", extracted_items)
 
 
+@indexes_documents("content_moderation")
 def process_content_moderation(asset, workflow, results):
-    metadata = json.loads(results)
-    es = connect_es(es_endpoint)
-    extracted_items = []
+    metadata = load_results(results)
     if not isinstance(metadata, list):
         # Make it a single page list
         metadata = [metadata]
@@ -138,6 +203,7 @@ def process_content_moderation(asset, workflow, results):
             try:
                 item["Operator"] = "content_moderation"
                 item["Workflow"] = workflow
+                time_axis.set_range(item, item.get("Timestamp"))
                 if "ModerationLabel" in item:
                     # flatten the inner ModerationLabel array
                     item["Name"] = item["ModerationLabel"]["Name"]
@@ -145,17 +211,14 @@ def process_content_moderation(asset, workflow, results):
                     item["Confidence"] = item["ModerationLabel"].get("Confidence", '')
                     # Delete the flattened array
                     del item["ModerationLabel"]
-                extracted_items.append(item)
+                yield item
             except KeyError as e:
                 print_key_error(e, item)
-    bulk_index(es, asset, "content_moderation", extracted_items)
 
 
+@indexes_documents("face_search")
 def process_face_search(asset, workflow, results):
-    metadata = json.loads(results)
-    es = connect_es(es_endpoint)
-
-    extracted_items = []
+    metadata = load_results(results)
     if not isinstance(metadata, list):
         # Make it a single page list
         metadata = [metadata]
@@ -163,6 +226,7 @@ def process_face_search(asset, workflow, results):
     for item in (item for page in metadata for item in page.get("Persons", [])):
         item["Operator"] = "face_search"
         item["Workflow"] = workflow
+        time_axis.set_range(item, item.get("Timestamp"))
         # flatten person key
         item["PersonIndex"] = item["Person"]["Index"]
         if "BoundingBox" in item["Person"]:
@@ -189,15 +253,12 @@ def process_face_search(asset, workflow, results):
             item["ContainsKnownFace"] = False
         del item["Person"]
 
-        extracted_items.append(item)
-
-    bulk_index(es, asset, "face_search", extracted_items)
+        yield item
 
 
+@indexes_documents("face_detection")
 def process_face_detection(asset, workflow, results):
-    metadata = json.loads(results)
-    es = connect_es(es_endpoint)
-    extracted_items = []
+    metadata = load_results(results)
     if not isinstance(metadata, list):
         # Make it a single page list
         metadata = [metadata]
@@ -208,6 +269,7 @@ def process_face_detection(asset, workflow, results):
             try:
                 item["Operator"] = "face_detection"
                 item["Workflow"] = workflow
+                time_axis.set_range(item, item.get("Timestamp"))
                 if "Face" in item:
                     # flatten the inner Face array
                     item["BoundingBox"] = item["Face"]["BoundingBox"]
@@ -224,36 +286,32 @@ def process_face_detection(asset, workflow, results):
                     item["Confidence"] = item["Face"]["Confidence"]
                     # Delete the flattened array
                     del item["Face"]
-                extracted_items.append(item)
+                yield item
             except KeyError as e:
                 print_key_error(e, item)
         # Parse schema for images:
         for item in page.get("FaceDetails", []):
             item["Operator"] = "face_detection"
             item["Workflow"] = workflow
-            extracted_items.append(item)
-    bulk_index(es, asset, "face_detection", extracted_items)
+            yield item
 
 
+@indexes_documents("mediainfo")
 def process_mediainfo(asset, workflow, results):
     # This function puts mediainfo data in Elasticsearch.
     metadata = json.loads(results)
-    es = connect_es(es_endpoint)
-    extracted_items = []
     # Objects in arrays are not well supported by Elastic, so we flatten the tracks array here.
     if isinstance(metadata['tracks'], list):
         for item in metadata['tracks']:
             item["Operator"] = "mediainfo"
             item["Workflow"] = workflow
-            extracted_items.append(item)
-    bulk_index(es, asset, "mediainfo", extracted_items)
+            yield item
 
 
+@indexes_documents("labels")
 def process_generic_data(asset, workflow, results):
     # This function puts generic data in Elasticsearch.
-    metadata = json.loads(results)
-    es = connect_es(es_endpoint)
-    extracted_items = []
+    metadata = load_results(results)
     # We can tell if json results are paged by checking to see if the json results are an instance of the list type.
     if not isinstance(metadata, list):
         # Make it a single page list
@@ -264,6 +322,7 @@ def process_generic_data(asset, workflow, results):
         try:
             item["Operator"] = "generic_data_lookup"
             item["Workflow"] = workflow
+            time_axis.set_range(item, item.get("Timestamp"))
             if "Label" in item:
                 # Flatten the inner Label array
                 item["Confidence"] = float(item["Label"]["Confidence"]) * 100
@@ -280,17 +339,15 @@ def process_generic_data(asset, workflow, results):
                 item["Parents"] = item["Label"].get("Parents", '')
                 # Delete the flattened array
                 del item["Label"]
-            extracted_items.append(item)
+            yield item
         except KeyError as e:
             print_key_error(e, item)
-    bulk_index(es, asset, "labels", extracted_items)
 
 
+@indexes_documents("labels")
 def process_label_detection(asset, workflow, results):
     # Rekognition label detection puts labels on an inner array in its JSON result, but for ease of search in Elasticsearch we need those results as a top level json array. So this function does that.
-    metadata = json.loads(results)
-    es = connect_es(es_endpoint)
-    extracted_items = []
+    metadata = load_results(results)
     # We can tell if json results are paged by checking to see if the json results are an instance of the list type.
     if not isinstance(metadata, list):
         # Make it a single page list
@@ -301,6 +358,7 @@ def process_label_detection(asset, workflow, results):
         try:
             item["Operator"] = "label_detection"
             item["Workflow"] = workflow
+            time_axis.set_range(item, item.get("Timestamp"))
             if "Label" in item:
                 # Flatten the inner Label array
                 item["Confidence"] = item["Label"]["Confidence"]
@@ -309,16 +367,14 @@ def process_label_detection(asset, workflow, results):
                 item["Parents"] = item["Label"].get("Parents", '')
                 # Delete the flattened array
                 del item["Label"]
-            extracted_items.append(item)
+            yield item
         except KeyError as e:
             print_key_error(e, item)
-    bulk_index(es, asset, "labels", extracted_items)
 
 
+@indexes_documents("technical_cues")
 def process_technical_cue_detection(asset, workflow, results):
-    metadata = json.loads(results)
-    es = connect_es(es_endpoint)
-    extracted_items = []
+    metadata = load_results(results)
     # We can tell if json results are paged by checking to see if the json results are an instance of the list type.
     if not isinstance(metadata, list):
         # Make it a single page list
@@ -340,16 +396,15 @@ def process_technical_cue_detection(asset, workflow, results):
 
                 del item["StartTimestampMillis"]
                 del item["EndTimestampMillis"]
-            extracted_items.append(item)
+            time_axis.set_range(item, item.get("StartTimestamp"), item.get("EndTimestamp"))
+            yield item
         except KeyError as e:
             print_key_error(e, item)
-    bulk_index(es, asset, "technical_cues", extracted_items)
 
 
+@indexes_documents("shots")
 def process_shot_detection(asset, workflow, results):
-    metadata = json.loads(results)
-    es = connect_es(es_endpoint)
-    extracted_items = []
+    metadata = load_results(results)
     # We can tell if json results are paged by checking to see if the json results are an instance of the list type.
     if not isinstance(metadata, list):
         # Make it a single page list
@@ -371,10 +426,10 @@ def process_shot_detection(asset, workflow, results):
 
                 del item["StartTimestampMillis"]
                 del item["EndTimestampMillis"]
-            extracted_items.append(item)
+            time_axis.set_range(item, item.get("StartTimestamp"), item.get("EndTimestamp"))
+            yield item
         except KeyError as e:
             print_key_error(e, item)
-    bulk_index(es, asset, "shots", extracted_items)
 
 
 def process_translate(asset, workflow, results):
@@ -407,9 +462,11 @@ def process_transcribe(asset, workflow, results, media_type):
     index_name = media_type + "transcript"
     es = connect_es(es_endpoint)
     index_document(es, asset, index_name, transcript)
+    bulk_index(es, asset, index_name, transcribe_items(workflow, transcript_time))
 
-    transcribe_items = []
 
+def transcribe_items(workflow, transcript_time):
+    """Yield a document for each word and punctuation mark of a transcript."""
     for item in transcript_time:
         content = item["alternatives"][0]["content"]
         confidence = normalize_confidence(item["alternatives"][0]["confidence"])
@@ -418,6 +475,7 @@ def process_transcribe(asset, workflow, results, media_type):
             end_time = convert_to_milliseconds(item["end_time"])
             item["start_time"] = start_time
             item["end_time"] = end_time
+            time_axis.set_range(item, start_time, end_time)
 
         del item["alternatives"]
 
@@ -426,20 +484,15 @@ def process_transcribe(asset, workflow, results, media_type):
         item["Workflow"] = workflow
         item["Operator"] = "transcribe"
 
-        transcribe_items.append(item)
-
-    bulk_index(es, asset, index_name, transcribe_items)
+        yield item
 
 
+@indexes_documents("entities")
 def process_entities(asset, workflow, results):
     metadata = json.loads(results)
     entity_metadata = json.loads(metadata["Results"][0])
     entities = entity_metadata["Entities"]
 
-    es = connect_es(es_endpoint)
-
-    formatted_entities = []
-
     for entity in entities:
         entity["EntityType"] = entity["Type"]
         entity["EntityText"] = entity["Text"]
@@ -454,20 +507,15 @@ def process_entities(asset, workflow, results):
         del entity["Text"]
         del entity["Score"]
 
-        formatted_entities.append(entity)
-
-    bulk_index(es, asset, "entities", formatted_entities)
+        yield entity
 
 
+@indexes_documents("key_phrases")
 def process_keyphrases(asset, workflow, results):
     metadata = json.loads(results)
     phrases_metadata = json.loads(metadata["Results"][0])
     phrases = phrases_metadata["KeyPhrases"]
 
-    es = connect_es(es_endpoint)
-
-    formatted_phrases = []
-
     for phrase in phrases:
         phrase["PhraseText"] = phrase["Text"]
 
@@ -480,9 +528,7 @@ def process_keyphrases(asset, workflow, results):
         del phrase["Text"]
         del phrase["Score"]
 
-        formatted_phrases.append(phrase)
-
-    bulk_index(es, asset, "key_phrases", formatted_phrases)
+        yield phrase
 
 
 def process_initialization(asset, results):
@@ -491,13 +537,17 @@ def process_initialization(asset, results):
 
 
 def connect_es(endpoint):
+    override = es_client_override.get()
+    if override is not None:
+        return override
+
     # Handle aws auth for es# Create a config
 
     session = boto3.Session()
     credentials = session.get_credentials()
     awsauth = AWS4Auth(credentials.access_key, credentials.secret_key, session.region_name, 'es',
                        session_token=credentials.token)
-    print('Connecting to the ES Endpoint: {endpoint}'.format(endpoint=endpoint))
+    logger.debug("connect_es", 'Connecting to the ES Endpoint: {endpoint}'.format(endpoint=endpoint))
     try:
         es_client = Elasticsearch(
             hosts=[{'host': endpoint, 'port': 443}],
@@ -506,9 +556,9 @@ def connect_es(endpoint):
             http_auth=awsauth,
             connection_class=RequestsHttpConnection)
     except Exception as e:
-        print("Unable to connect to {endpoint}:".format(endpoint=endpoint), e)
+        logger.error("connect_es", "Unable to connect to {endpoint}".format(endpoint=endpoint), error=e)
     else:
-        print('Connected to elasticsearch')
+        logger.debug("connect_es", 'Connected to elasticsearch')
         return es_client
 
 
@@ -521,84 +571,172 @@ def delete_asset_all_indices(es_object, asset_id):
         }
     }
 
-    try:
-        delete_request = es_object.delete_by_query(
-            index="_all",
-            body=delete_query
-        )
-    except Exception as e:
-        print("Unable to delete from elasticsearch: {es}:".format(es=e)) # nosec - not a SQL statement
-    else:
-        print(delete_request)
-        print("Deleted asset: {asset} from elasticsearch".format(asset=asset_id))
+    # _all does not include the hidden generations that are being built by a reindex.
+    indices = ["_all"]
+    if index_aliases.aliases_enabled():
+        next_indices = alias_resolver.next_indices(es_object)
+        if next_indices:
+            indices.append(",".join(next_indices))
+
+    for index in indices:
+        try:
+            delete_request = es_object.delete_by_query(
+                index=index,
+                body=delete_query
+            )
+        except Exception as e:
+            logger.error("delete_asset", "Unable to delete from elasticsearch", error=e) # nosec - not a SQL statement
+            pointer_cache.record_failure()
+        else:
+            logger.debug("delete_asset", "Delete by query response", response=delete_request)
+            logger.info("delete_asset", "Deleted asset: {asset} from elasticsearch".format(asset=asset_id), index=index)
+
+    derived_indices = derived_index.enabled_indices()
+    if derived_indices:
+        # _all does not include the hidden derived indices either.
+        try:
+            es_object.delete_by_query(index=",".join(derived_indices), body=delete_query, ignore_unavailable=True)
+        except Exception as e:
+            logger.error("delete_asset", "Unable to delete from the derived indices", error=e)
+            pointer_cache.record_failure()
+        else:
+            logger.info("delete_asset", "Deleted asset: {asset} from the derived indices".format(asset=asset_id),
+                        index=",".join(derived_indices))
+    if suggestions.suggestions_enabled():
+        # Suggestions are shared by the assets, so the asset's terms are counted down instead.
+        suggestions.remove_asset(es_object, suggestion_terms, asset_id)
+
+
+def get_write_indices(es_object, es_index):
+    resolved = write_indices_override.get()
+    if resolved is not None and es_index in resolved:
+        return resolved[es_index]
+    # The template must exist before the indices it maps are created.
+    time_axis.ensure_template(es_object)
+    if index_aliases.aliases_enabled():
+        return alias_resolver.write_indices(es_object, es_index)
+    return [es_index]
+
+
+def make_bulk_actions(write_indices, doc_id=None):
+    if len(write_indices) == 1 and doc_id is None:
+        return [json.dumps({"index": {"_index": write_indices[0], "_type": "_doc"}})]
+    # Use the same id in every generation so the copy made by the reindex does not duplicate it.
+    doc_id = doc_id or index_aliases.make_document_id()
+    return [json.dumps({"index": {"_index": write_index, "_type": "_doc", "_id": doc_id}}) for write_index in write_indices]
 
 
 def bulk_index(es_object, asset, index, data):
-    if len(data) == 0:
-        print("Data is empty. Skipping insert to Elasticsearch.")
+    """Index the documents `data` of an asset in mie{index}. `data` may be any iterable.
+
+    Documents are encoded as they are read from `data` and the payloads go through a
+    BulkPipeline, so a transform that yields its documents is not held up by the domain.
+    """
+    data = iter(data)
+    first = next(data, None)
+    if first is None:
+        logger.info("bulk_index", "Data is empty. Skipping insert to Elasticsearch.")
         return
+    data = itertools.chain([first], data)
     es_index = "mie{index}".format(index=index).lower()
-    actions_to_send = []
+    write_indices = get_write_indices(es_object, es_index)
+
+    def send(payload):
+        logger.debug("bulk_payload", "bulk insert payload", payload_size=len(payload))
+        try:
+            response = es_object.bulk(
+                index=write_indices[0],
+                body=payload
+            )
+        except Exception as e:
+            print_unable_to_load_data_into_es(e, payload)
+        else:
+            logger.info("bulk_index", "Successfully stored data in elasticsearch", index=es_index)
+            # Documents rejected individually do not raise, but the result must not be cached as indexed.
+            if isinstance(response, dict) and response.get("errors"):
+                pointer_cache.record_failure()
+
     # Elasticsearch will respond with an error like, "Request size exceeded 10485760 bytes"
     # if the bulk insert exceeds a maximum payload size. To avoid that, we use a max payload
     # size that is well below the "Maximum Size of HTTP Request Payloads" for the smallest AWS
     # Elasticsearch instance type (10MB). See service limits here:
     # https://docs.aws.amazon.com/elasticsearch-service/latest/developerguide/aes-limits.html
     max_payload_size = MAX_BULK_INDEX_PAYLOAD_SIZE
-    for item in data:
-        item["AssetId"] = asset
-        action = json.dumps({"index": {"_index": es_index, "_type": "_doc"}})
-        doc = json.dumps(item)
-        if ((len('\n'.join(actions_to_send)) + len(action) + len(doc)) < max_payload_size):
-            actions_to_send.append(action)
-            actions_to_send.append(doc)
-        else:
-            # send and reset payload before appending the current item
-            actions = '\n'.join(actions_to_send)
-            print("bulk insert payload size: " + str(len(actions)))
-            try:
-                es_object.bulk(
-                    index=es_index,
-                    body=actions
-                )
-            except Exception as e:
-                print_unable_to_load_data_into_es(e, item)
-            else:
-                print("Successfully stored data in elasticsearch for asset: ", asset)
-            # now reset the payload and append the current item
-            actions_to_send = []
-            actions_to_send.append(action)
-            actions_to_send.append(doc)
-    # finally send the last item
-    print("sending final bulk insert")
-    actions = '\n'.join(actions_to_send)
+    pipeline = bulk_pipeline.BulkPipeline(send)
+    session = diff_index.current_session()
+    observers = derived_index.current_observers()
+    # The search service sorts the hits of an asset on their key, see asset_generation.py.
+    keyed = asset_generation.generations_enabled()
+    actions_to_send = []
+    # Length of '\n'.join(actions_to_send), kept up to date instead of joining for every item.
+    payload_size = 0
     try:
-        es_object.bulk(
-            index=es_index,
-            body=actions
-        )
-    except Exception as e:
-        print_unable_to_load_data_into_es(e, data)
-    else:
-        print("Successfully stored data in elasticsearch for asset: ", asset)
+        for item in data:
+            item["AssetId"] = asset
+            derived_index.notify(observers, es_index, item)
+            doc = json.dumps(item)
+            doc_id = None
+            if session is not None:
+                doc_id = session.document_id(es_index, doc)
+                if session.is_indexed(es_index, doc_id):
+                    continue
+                item_actions = make_bulk_actions(write_indices, doc_id)
+            else:
+                item_actions = make_bulk_actions(write_indices)
+            if keyed:
+                # The content id is the key, so an unchanged document keeps its place in the pages.
+                item[asset_generation.DOCUMENT_KEY] = doc_id or index_aliases.make_document_id()
+                doc = json.dumps(item)
+            if actions_to_send and payload_size + sum(len(action) + len(doc) for action in item_actions) >= max_payload_size:
+                # hand off the payload and reset it before appending the current item
+                pipeline.put('\n'.join(actions_to_send))
+                actions_to_send = []
+                payload_size = 0
+            for action in item_actions:
+                for line in (action, doc):
+                    payload_size += len(line) + (1 if actions_to_send else 0)
+                    actions_to_send.append(line)
+        # finally send the last items
+        if actions_to_send:
+            pipeline.put('\n'.join(actions_to_send))
+    finally:
+        stats = pipeline.close()
+    if stats["Spilled"] or stats["Blocked"]:
+        logger.info("bulk_pipeline", "Domain is slower than the transform", index=es_index, **stats)
 
 
 def index_document(es_object, asset, index, data):
     es_index = "mie{index}".format(index=index).lower()
     data["AssetId"] = asset
-    try:
-        es_object.index(
-            index=es_index,
-            body=data,
-            request_timeout=30
-        )
-    except Exception as e:
-        print_unable_to_load_data_into_es(e, data)
+    write_indices = get_write_indices(es_object, es_index)
+    observers = derived_index.current_observers()
+    derived_index.notify(observers, es_index, data)
+    session = diff_index.current_session()
+    if session is not None:
+        doc_id = session.document_id(es_index, json.dumps(data))
+        if session.is_indexed(es_index, doc_id):
+            return
+        id_args = {"id": doc_id}
     else:
-        print("Successfully stored data in elasticsearch for:", asset)
+        # Use the same id in every generation so the copy made by the reindex does not duplicate it.
+        id_args = {"id": index_aliases.make_document_id()} if len(write_indices) > 1 else {}
+    if asset_generation.generations_enabled():
+        data[asset_generation.DOCUMENT_KEY] = id_args.get("id") or index_aliases.make_document_id()
+    for write_index in write_indices:
+        try:
+            es_object.index(
+                index=write_index,
+                body=data,
+                request_timeout=30,
+                **id_args
+            )
+        except Exception as e:
+            print_unable_to_load_data_into_es(e, data)
+        else:
+            logger.info("index_document", "Successfully stored data in elasticsearch", index=write_index)
 
 
-def read_json_from_s3(key):
+def read_json_from_s3(key, streamable=False):
     bucket = dataplane_bucket
     try:
         obj = s3.get_object(
@@ -608,41 +746,152 @@ def read_json_from_s3(key):
     except Exception as e:
         return {"Status": "Error", "Error": e}
     else:
-        results = obj['Body'].read().decode('utf-8')
-        return {"Status": "Success", "Results": results}
-
+        content_length = obj.get('ContentLength', 0)
+        try:
+            body, encoding = compression.open_stream(obj['Body'], key, obj.get('ContentEncoding'))
+        except Exception as e:
+            return {"Status": "Error", "Error": e}
+        # Sizes are compared as if the result were not compressed.
+        result_size = compression.estimated_size(content_length, encoding)
+        if encoding:
+            logger.info("compression", "Reading {encoding} compressed result".format(encoding=encoding),
+                        object_size=content_length)
+        if streamable and transform_pool.should_use_pool(result_size):
+            # The pages are transformed in worker processes, the handler only splits them up.
+            logger.info("transform_pool", "Object size exceeds threshold, transforming in worker processes",
+                        object_size=content_length, workers=transform_pool.get_worker_count())
+            raw_pages = json_stream.iter_json_array_raw(body)
+            return {"Status": "Success", "RawPages": raw_pages, "ContentLength": content_length, "ETag": obj.get('ETag')}
+        # Decide before parsing whether the result is large enough to risk a memory spike.
+        if streamable and result_size > STREAMING_THRESHOLD_BYTES:
+            logger.info("streaming", "Object size exceeds threshold, parsing in streaming mode",
+                        object_size=content_length, threshold=STREAMING_THRESHOLD_BYTES)
+            pages = json_stream.iter_json_array_batches(body, STREAMING_BATCH_BYTES)
+            return {"Status": "Success", "Pages": pages, "ContentLength": content_length, "ETag": obj.get('ETag')}
+        try:
+            results = body.read().decode('utf-8')
+        except Exception as e:
+            return {"Status": "Error", "Error": e}
+        return {"Status": "Success", "Results": results, "ContentLength": content_length, "ETag": obj.get('ETag')}
 
-def lambda_handler(event, _context):
-    print("Received event:", event)
 
+def decode_record(record):
+    """Return the asset id, payload and action of a Kinesis record, or None for the parts that cannot be decoded."""
     action = None
     asset_id = None
     payload = None
 
-    for record in event['Records']:
-        # Kinesis data is base64 encoded so decode here
+    # Kinesis data is base64 encoded so decode here
+    try:
+        asset_id = record['kinesis']['partitionKey']
+        payload = json.loads(base64.b64decode(record["kinesis"]["data"]))
+    except Exception as e:
+        logger.error("decode", "Error decoding kinesis event", error=e)
+    else:
+        logger.debug("decode", "Decoded payload for asset", asset_id=asset_id)
         try:
-            asset_id = record['kinesis']['partitionKey']
-            payload = json.loads(base64.b64decode(record["kinesis"]["data"]))
-        except Exception as e:
-            print("Error decoding kinesis event", e)
+            action = payload['Action']
+        except KeyError as e:
+            logger.error("decode", "Missing action type from kinesis record", error=e)
         else:
-            print("Decoded payload for asset:", asset_id)
-            try:
-                action = payload['Action']
-            except KeyError as e:
-                print("Missing action type from kinesis record:", e)
-            else:
-                print("Attempting the following action:", action)
+            logger.info("action", "Attempting the following action: {}".format(action), asset_id=asset_id)
+    return asset_id, payload, action
 
+
+def dispatch_record(asset_id, payload, action, cursor=0):
+    with structured_logger.log_context(asset_id=asset_id):
         if action is None:
-            print("Unable to determine action type")
-        elif action == "INSERT":
-            handle_insert(asset_id, payload)
-        elif action == "MODIFY":
-            handle_modify(asset_id, payload)
-        elif action == "REMOVE":
-            handle_remove(asset_id, payload)
+            logger.error("decode", "Unable to determine action type")
+            return
+        try:
+            if action == "INSERT":
+                handle_insert(asset_id, payload)
+            elif action == "MODIFY":
+                handle_modify(asset_id, payload, cursor)
+            elif action == "REMOVE":
+                handle_remove(asset_id, payload)
+        finally:
+            bump_generation(asset_id)
+
+
+def bump_generation(asset_id):
+    # A deferred record wrote some of its documents too, so cached searches of the asset are stale.
+    if asset_generation.generations_enabled():
+        asset_generations.bump(asset_id)
+
+
+# Operators whose latest result replaces the earlier ones, such as captions that were edited and
+# saved again. Only the latest record of such an operator in a batch is processed.
+OVERWRITE_OPERATORS = {
+    "webcaptions",
+    "translate",
+    "mediainfo",
+}
+
+
+def coalesce_records(kinesis_records, decoded_records):
+    """Return the decoded records of a batch without the MODIFY records a later record makes redundant.
+
+    A MODIFY record is dropped when a later record of the batch has the same asset, operator
+    and pointer, since both would read the same S3 object, or when it is for an operator in
+    OVERWRITE_OPERATORS and a later record has the same asset and operator. Every dropped
+    record is logged with the sequence number of the record that replaces it.
+    """
+    latest = {}
+    coalesced = []
+    for record, decoded in reversed(list(zip(kinesis_records, decoded_records))):
+        asset_id, payload, action = decoded
+        sequence_number = record.get('kinesis', {}).get('sequenceNumber')
+        keys = []
+        if action == "MODIFY" and isinstance(payload.get('Operator'), str) and 'Pointer' in payload:
+            operator = payload['Operator'].lower()
+            keys.append((asset_id, operator, payload['Pointer']))
+            if parse_operator(operator)[0] in OVERWRITE_OPERATORS:
+                keys.append((asset_id, operator))
+        superseded_by = next((latest[key] for key in keys if key in latest), None)
+        if superseded_by is not None:
+            logger.info("coalesce", "Skipping record, a later record of the batch replaces it", asset_id=asset_id,
+                        operator=payload['Operator'], sequence_number=sequence_number, superseded_by=superseded_by)
+            continue
+        for key in keys:
+            latest[key] = sequence_number
+        coalesced.append(decoded)
+    coalesced.reverse()
+    if len(coalesced) < len(decoded_records):
+        logger.info("coalesce", "Coalesced redundant records", records=len(decoded_records),
+                    processed=len(coalesced))
+    return coalesced
+
+
+def process_records(records, deadline, queue, deferrals=0):
+    """Dispatch (asset_id, payload, action, cursor) records in order.
+
+    With an overflow queue, the records that would not finish before `deadline` are sent to
+    the queue instead, starting at the page the record being processed had reached.
+    """
+    token = overflow.current_deadline.set(deadline if queue is not None else None)
+    try:
+        for position, (asset_id, payload, action, cursor) in enumerate(records):
+            if queue is not None and deadline.expired():
+                overflow.defer(queue, records[position:], deferrals)
+                return
+            try:
+                dispatch_record(asset_id, payload, action, cursor)
+            except overflow.DeadlineExceeded as e:
+                logger.warning("overflow", "Deadline reached, deferring the rest of the batch", asset_id=asset_id,
+                               cursor=e.cursor)
+                overflow.defer(queue, [(asset_id, payload, action, e.cursor)] + records[position + 1:], deferrals)
+                return
+    finally:
+        overflow.current_deadline.reset(token)
+
+
+def lambda_handler(event, context):
+    logger.debug("event", "Received event", event=event)
+
+    decoded_records = [decode_record(record) for record in event['Records']]
+    records = [decoded + (0,) for decoded in coalesce_records(event['Records'], decoded_records)]
+    process_records(records, overflow.Deadline(context), overflow_queue)
 
 
 def handle_insert(asset_id, payload):
@@ -659,35 +908,66 @@ def handle_insert(asset_id, payload):
         extracted_items.append(metadata)
         # Save the filename and timestamp to Elasticsearch
         process_initialization(asset_id, metadata)
+        if asset_catalog.catalog_enabled():
+            derived_index.send_updates(connect_es(es_endpoint), asset_catalog.INDEX, asset_catalog.MAPPINGS,
+                                       asset_catalog.make_initialization_update(asset_id, filename, created))
     except KeyError as e:
-        print("Missing required keys in kinesis payload:", e)
+        logger.error("payload", "Missing required keys in kinesis payload", error=e)
+
 
+# Operators whose results are a JSON array of pages that can be indexed a batch of pages at a
+# time, and the index their documents are written to.
+STREAMABLE_OPERATORS = {
+    "genericdatalookup": "mielabels",
+    "labeldetection": "mielabels",
+    "celebrityrecognition": "miecelebrity_detection",
+    "contentmoderation": "miecontent_moderation",
+    "facedetection": "mieface_detection",
+    "face_search": "mieface_search",
+    "textdetection": "mietextdetection",
+    "shotdetection": "mieshots",
+    "technicalcuedetection": "mietechnical_cues",
+}
 
-def handle_modify(asset_id, payload):
+
+def handle_modify(asset_id, payload, cursor=0):
     try:
         operator = payload['Operator']
         s3_pointer = payload['Pointer']
         workflow = payload['Workflow']
     except KeyError as e:
-        print("Missing required keys in kinesis payload:", e)
+        logger.error("payload", "Missing required keys in kinesis payload", error=e)
     else:
-        # Read in json metadata from s3
-        metadata = read_json_from_s3(s3_pointer)
-        if metadata["Status"] == "Success":
-            process_modify_metadata(asset_id, workflow, operator, metadata)
-        else:
-            print("Unable to read metadata from s3: {e}".format(e=metadata["Error"]))
+        if indexed_pointers.is_indexed(s3_pointer, s3, dataplane_bucket):
+            logger.info("pointer_cache", "Skipping {operator} result, it was already indexed".format(operator=operator),
+                        asset_id=asset_id, pointer=s3_pointer)
+            return
+        with structured_logger.log_context(operator=operator), \
+                profiler.profile_invocation(asset_id, operator, s3_client=s3, bucket=dataplane_bucket), \
+                memory_tracker.track_memory(asset_id, operator) as memory_usage:
+            # Read in json metadata from s3
+            metadata = read_json_from_s3(s3_pointer, streamable=operator.lower() in STREAMABLE_OPERATORS)
+            if metadata["Status"] == "Success":
+                memory_usage["ObjectSize"] = metadata["ContentLength"]
+                memory_usage["Streaming"] = "Pages" in metadata or "RawPages" in metadata
+                with pointer_cache.track_failures() as failures:
+                    process_modify_metadata(asset_id, workflow, operator, metadata, cursor)
+                # Remember results that were indexed without errors so redeliveries can be skipped.
+                if not failures["Failures"]:
+                    indexed_pointers.put(s3_pointer, asset_id, metadata["ETag"])
+            else:
+                logger.error("read_s3", "Unable to read metadata from s3", error=metadata["Error"])
 
 
-def process_modify_metadata(asset_id, workflow, operator, metadata):
-    print("Retrieved {operator} metadata from s3, inserting into Elasticsearch".format(operator=operator))
+def parse_operator(operator):
+    """Return the processing function key and the additional arguments for an operator name."""
     operator = operator.lower()
     additional_arg = []
 
     # webcaptions operators are processed the same, but they have a language extension
     # in the operator name.  Strip that off now.  Any language is supported for search
     if operator.startswith("webcaptions_"):
-        print("Got webcaptions operator {}".format(operator))
+        logger.debug("modify", "Got webcaptions operator {}".format(operator))
         (operator, language_code) = operator.split("_")
         additional_arg = [language_code]
 
@@ -697,12 +977,13 @@ def process_modify_metadata(asset_id, workflow, operator, metadata):
     elif operator == "transcribeaudio":
         additional_arg = ["audio"]
 
+    return operator, additional_arg
+
+
+def get_processing_functions():
     # Route event to process method based on the operator type in the event.
     # These names are the lowercase version of OPERATOR_NAME defined in /source/operators/operator-library.yaml
-    def process_unsupported(*args):
-        print("We do not store {operator} results".format(operator=operator))
-
-    processing_functions = {
+    return {
         "transcribevideo": process_transcribe,
         "transcribeaudio": process_transcribe,
         "translate": process_translate,
@@ -721,15 +1002,201 @@ def process_modify_metadata(asset_id, workflow, operator, metadata):
         "technicalcuedetection": process_technical_cue_detection,
     }
 
-    process_function = processing_functions.get(operator, process_unsupported)
-    process_function(asset_id, workflow, metadata["Results"], *additional_arg)
+
+def is_supported_operator(operator):
+    return parse_operator(operator)[0] in get_processing_functions()
+
+
+def process_modify_metadata(asset_id, workflow, operator, metadata, cursor=0):
+    """Transform and index a result read by read_json_from_s3, and update the derived indices.
+
+    Paged results are indexed from page `cursor` on. Between batches of pages the deadline of
+    the record is checked, see overflow.py.
+    """
+    observers = make_observers(operator) if is_supported_operator(operator) else []
+    if not observers:
+        index_result(asset_id, workflow, operator, metadata, cursor)
+        return
+    with pointer_cache.track_failures() as failures, derived_index.observe(observers):
+        try:
+            index_result(asset_id, workflow, operator, metadata, cursor)
+        except overflow.DeadlineExceeded:
+            # The slice that resumes the result adds its documents to these.
+            update_derived_indices(asset_id, workflow, observers, derived_index.DEFERRED, resume=cursor > 0)
+            raise
+    status = derived_index.INCOMPLETE if failures["Failures"] else derived_index.INDEXED
+    update_derived_indices(asset_id, workflow, observers, status, resume=cursor > 0)
+
+
+def make_observers(operator):
+    """Return the observers of the derived indices that are enabled, for a result of `operator`."""
+    processing_key, additional_arg = parse_operator(operator)
+    # Captions do not name their language, the operator does.
+    languages = additional_arg if processing_key == "webcaptions" else []
+    observers = []
+    if asset_manifest.manifest_enabled():
+        observers.append(asset_manifest.OperatorSummary(operator.lower(), languages))
+    if asset_catalog.catalog_enabled():
+        observers.append(asset_catalog.CatalogTerms(processing_key, languages))
+    if timeline.timeline_enabled():
+        observers.append(timeline.TimelineBuckets(processing_key))
+    if scenes.scenes_enabled():
+        observers.append(scenes.SceneItems(processing_key, languages, scene_sources))
+    if analysis_bundles.bundles_enabled():
+        observers.append(analysis_bundles.AnalysisBundle(operator.lower(), bundle_store))
+    if suggestions.suggestions_enabled():
+        observers.append(suggestions.SuggestionTerms(processing_key, suggestion_terms))
+    if percolator.saved_searches_enabled():
+        observers.append(percolator.ResultTerms(processing_key, lambda: connect_es(es_endpoint)))
+    return observers
+
+
+def index_result(asset_id, workflow, operator, metadata, cursor=0):
+    logger.info("modify", "Retrieved {operator} metadata from s3, inserting into Elasticsearch".format(operator=operator))
+    # Manifests are kept per result, so each caption language has its own.
+    result_name = operator.lower()
+    operator, additional_arg = parse_operator(operator)
+
+    def process_unsupported(*args):
+        logger.info("modify", "We do not store {operator} results".format(operator=operator))
+
+    process_function = get_processing_functions().get(operator, process_unsupported)
+    if diff_index.diff_enabled() and "Results" not in metadata and cursor == 0:
+        # Large results are written in full, see diff_index.py.
+        drop_indexed_documents(asset_id, result_name)
+    if "RawPages" in metadata:
+        es = connect_es(es_endpoint)
+        es_index = STREAMABLE_OPERATORS.get(operator)
+        write_indices = {es_index: get_write_indices(es, es_index)} if es_index else {}
+
+        observers = derived_index.current_observers()
+
+        def transform(results):
+            write_indices_override.set(write_indices)
+            if not observers:
+                process_function(asset_id, workflow, results, *additional_arg)
+                return None
+            # Each batch is observed in its worker and merged into the observers of the result here.
+            with derived_index.observe(observer.empty() for observer in observers) as batch_observers:
+                process_function(asset_id, workflow, results, *additional_arg)
+            return [observer.state() for observer in batch_observers]
+
+        def merge(states):
+            for observer, state in zip(observers, states):
+                observer.merge(state)
+
+        # Pages are handed to the workers by a thread that does not see this context.
+        deadline = overflow.current_deadline.get()
+        stopped_at = []
+
+        def pages_before_deadline():
+            for position, page in enumerate(metadata["RawPages"]):
+                if position < cursor:
+                    continue
+                if deadline is not None and deadline.expired():
+                    stopped_at.append(position)
+                    return
+                yield page
+
+        stats = transform_pool.transform_in_workers(pages_before_deadline(), transform, es, es_client_override,
+                                                    on_result=merge)
+        logger.info("transform_pool", "Transformed {operator} in worker processes".format(operator=operator), **stats)
+        if stats["Errors"]:
+            pointer_cache.record_failure()
+        if stopped_at:
+            raise overflow.DeadlineExceeded(stopped_at[0])
+    elif "Pages" in metadata:
+        # Streaming mode: process and index one batch of pages at a time.
+        position = 0
+        for pages in metadata["Pages"]:
+            overflow.check_deadline(max(position, cursor))
+            start = min(max(cursor - position, 0), len(pages))
+            position += len(pages)
+            if start < len(pages):
+                process_function(asset_id, workflow, pages[start:], *additional_arg)
+    elif diff_index.diff_enabled():
+        index_changes(asset_id, workflow, result_name,
+                      lambda: process_function(asset_id, workflow, metadata["Results"], *additional_arg))
+    else:
+        process_function(asset_id, workflow, metadata["Results"], *additional_arg)
+
+
+def delete_documents(es_object, documents):
+    """Delete documents by id from the indices they were written to. Returns False if a request failed."""
+    succeeded = True
+    for es_index, doc_ids in documents.items():
+        write_indices = get_write_indices(es_object, es_index)
+        for start in range(0, len(doc_ids), DELETE_BATCH_SIZE):
+            actions = diff_index.make_delete_actions(write_indices, doc_ids[start:start + DELETE_BATCH_SIZE])
+            try:
+                es_object.bulk(index=write_indices[0], body='\n'.join(actions))
+            except Exception as e:
+                logger.error("diff_index", "Unable to delete documents", index=es_index, error=e)
+                succeeded = False
+    return succeeded
+
+
+def index_changes(asset_id, workflow, operator, index_result):
+    """Run `index_result` so that only documents that are not in the manifest of the operator are written."""
+    es = connect_es(es_endpoint)
+    try:
+        previous = diff_manifests.load(asset_id, operator)
+    except Exception as e:
+        # Without the manifest every document is written. Documents keep their ids, so the
+        # unchanged ones are overwritten rather than duplicated.
+        logger.error("diff_index", "Unable to read the manifest, writing every document", error=e)
+        previous = {}
+    with pointer_cache.track_failures() as failures, diff_index.diff_session(previous, workflow) as session:
+        index_result()
+    if failures["Failures"]:
+        logger.warning("diff_index", "Not updating the manifest, some documents were not written")
+        return
+    removed = session.removed()
+    if not delete_documents(es, removed):
+        return
+    try:
+        diff_manifests.save(asset_id, operator, session.manifest())
+    except Exception as e:
+        logger.error("diff_index", "Unable to save the manifest", error=e)
+        return
+    documents = sum(len(doc_ids) for doc_ids in session.documents.values())
+    logger.info("diff_index", "Indexed the changes of {operator}".format(operator=operator), documents=documents,
+                unchanged=session.unchanged, deleted=sum(len(doc_ids) for doc_ids in removed.values()))
+
+
+def drop_indexed_documents(asset_id, operator):
+    """Delete the documents in the manifest of the operator and reset the manifest."""
+    try:
+        previous = diff_manifests.load(asset_id, operator)
+        if any(previous.values()):
+            if delete_documents(connect_es(es_endpoint), previous):
+                diff_manifests.reset(asset_id, operator)
+    except Exception as e:
+        logger.error("diff_index", "Unable to delete the documents of the manifest", error=e)
+
+
+def update_derived_indices(asset_id, workflow, observers, status, resume=False):
+    """Send the updates of each observer of an operator's result to its derived index."""
+    es = connect_es(es_endpoint)
+    for observer in observers:
+        clear = observer.clear_query(asset_id, resume)
+        if clear is not None and not derived_index.clear_documents(es, observer.index, observer.mappings, clear):
+            # Writing the new documents would mix them with the ones that were not cleared.
+            continue
+        updates = observer.make_updates(asset_id, workflow, status, resume)
+        failed_ids = set()
+        if derived_index.send_updates(es, observer.index, observer.mappings, updates, failed_ids) and updates:
+            logger.info("derived_index", "Updated {index}".format(index=observer.index), status=status,
+                        documents=len(updates))
+        observer.updates_sent(asset_id, failed_ids)
 
 
 def handle_remove(asset_id, payload):
     if 'Operator' not in payload:
-        print("Operator type not present in payload, this must be a request to delete the entire asset")
+        logger.info("remove", "Operator type not present in payload, this must be a request to delete the entire asset")
         es = connect_es(es_endpoint)
         delete_asset_all_indices(es, asset_id)
+        indexed_pointers.discard_asset(asset_id)
     else:
-        print(payload)
-        print('Not allowing deletion of specific metadata from ES as that is not exposed in the UI')
+        logger.debug("remove", "Remove payload", payload=payload)
+        logger.info("remove", 'Not allowing deletion of specific metadata from ES as that is not exposed in the UI')
@@ -0,0 +1,148 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Peak memory accounting for the consumer.
+#
+# Every tracked record reports its memory high-water mark, the size of the S3 object it read
+# and whether it was parsed in streaming mode. The report is printed in CloudWatch embedded
+# metric format, so it shows up as PeakMemory and ObjectSize metrics per operator without any
+# extra API calls.
+#
+# The high-water mark is measured with the process RSS. On Linux the peak RSS (VmHWM) is reset
+# before each record so the value belongs to that record alone. When the reset is not possible
+# the peak is that of the whole process so far. It is then reported as LifetimePeakMemory, which
+# is not a metric, and the record has no PeakMemory. Setting MemoryTracingSampleRate
+# additionally traces Python allocations with tracemalloc for a sample of records, which is
+# slower but attributes the peak to Python objects only.
+#
+# The RSS and tracemalloc belong to the process, so records that are tracked at the same time,
+# such as those of async_handler, cannot tell their memory use apart. Only a record that was
+# tracked alone from start to end resets the peak, traces allocations and reports memory. The
+# others report Concurrent instead, with their ObjectSize.
+
+import contextlib
+import json
+import os
+import random
+import resource
+import threading
+import time
+import tracemalloc
+
+METRICS_NAMESPACE = 'ContentLocalization/Consumer'
+
+_lock = threading.Lock()
+# State of each block being tracked, see track_memory.
+_tracked = []
+
+
+def read_status_bytes(field):
+    # /proc/self/status reports memory fields in kB.
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def current_rss():
+    rss = read_status_bytes('VmRSS')
+    if rss is None:
+        # ru_maxrss is in kB on Linux
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return rss
+
+
+def peak_rss():
+    peak = read_status_bytes('VmHWM')
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return peak
+
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux 4.0+).
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def should_trace():
+    try:
+        sample_rate = float(os.environ.get('MemoryTracingSampleRate', '0'))
+    except ValueError:
+        return False
+    return sample_rate > 0 and random.random() < sample_rate  # nosec - sampling, not used for security
+
+
+def format_metrics(usage):
+    metrics = [{"Name": name, "Unit": "Bytes"} for name in ("PeakMemory", "ObjectSize", "TracedPeakMemory")
+               if name in usage]
+    report = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["Operator"]],
+                "Metrics": metrics
+            }]
+        }
+    }
+    report.update(usage)
+    return json.dumps(report)
+
+
+@contextlib.contextmanager
+def track_memory(asset_id, operator):
+    """Measure the memory high-water mark of the enclosed block.
+
+    Yields a dict that the caller can add fields to, such as ObjectSize and Streaming. The
+    dict is printed as an embedded metric format record when the block exits.
+    """
+    usage = {"AssetId": asset_id, "Operator": operator, "ObjectSize": 0}
+    state = {"Concurrent": False, "PeakIsReset": False, "Tracing": False}
+    with _lock:
+        if _tracked:
+            for other in _tracked + [state]:
+                other["Concurrent"] = True
+        else:
+            state["PeakIsReset"] = reset_peak_rss()
+            state["Tracing"] = should_trace() and not tracemalloc.is_tracing()
+            if state["Tracing"]:
+                tracemalloc.start()
+        _tracked.append(state)
+    start_rss = current_rss()
+    try:
+        yield usage
+    finally:
+        with _lock:
+            _tracked.remove(state)
+            if state["Tracing"]:
+                traced_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            if state["Concurrent"]:
+                usage["Concurrent"] = True
+            else:
+                if state["Tracing"]:
+                    usage["TracedPeakMemory"] = traced_peak
+                usage["PeakMemory" if state["PeakIsReset"] else "LifetimePeakMemory"] = peak_rss()
+                usage["RssDelta"] = current_rss() - start_rss
+        # Embedded metric format records must be written to stdout as they are, not wrapped
+        # by the structured logger.
+        print(format_metrics(usage))
@@ -0,0 +1,109 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Similar assets by MinHash signatures of their terms.
+#
+# With SimilarAssets and AssetCatalog set to true, each catalog update of labels, celebrities,
+# entities or key phrases carries the MinHash signature of the result's terms. The catalog keeps
+# a signature per field in Signatures. The signature of the asset is the minimum of the field
+# signatures at each position, which is the signature of the union of their terms. It is split
+# into BANDS bands of ROWS values, and each band is stored in Bands as a keyword term of its
+# position and hash:
+#
+#   "Bands": ["0-1f3a9c2e", "1-77b0d41a", ...]
+#
+# Two assets share a band with a probability that grows steeply with the Jaccard similarity of
+# their terms, about 56% at a similarity of 0.4 and 99% at 0.6. similar_assets() finds the
+# assets that share a band with one terms query and ranks them by their exact similarity.
+
+import hashlib
+import os
+import random
+
+import derived_index
+import structured_logger
+
+# Catalog fields whose terms make up the signature of an asset.
+FIELDS = ("Labels", "Celebrities", "Entities", "KeyPhrases")
+NUM_PERMUTATIONS = 128
+BANDS = 32
+ROWS = NUM_PERMUTATIONS // BANDS
+MERSENNE_PRIME = (1 << 61) - 1
+# The permutations must be the same for every signature ever stored.
+SEED = 20240501
+# Assets sharing a band that are ranked by their exact similarity.
+MAX_CANDIDATES = 200
+
+logger = structured_logger.get_logger()
+
+_random = random.Random(SEED)
+PERMUTATIONS = [(_random.randrange(1, MERSENNE_PRIME), _random.randrange(0, MERSENNE_PRIME))
+                for _permutation in range(NUM_PERMUTATIONS)]
+
+
+def similarity_enabled():
+    return os.environ.get('SimilarAssets', 'false').lower() == 'true'
+
+
+def element(field, term):
+    return "{field}\n{term}".format(field=field, term=term.strip().lower())
+
+
+def elements(document):
+    """Return the elements of the terms of a catalog document."""
+    return {element(field, term) for field in FIELDS for term in document.get(field) or []}
+
+
+def signature(field, terms):
+    """Return the MinHash signature of the terms of a field, or None if there are none."""
+    hashes = [int.from_bytes(hashlib.blake2b(element(field, term).encode('utf-8'), digest_size=8).digest(), 'big')
+              for term in terms]
+    if not hashes:
+        return None
+    return [min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in PERMUTATIONS]
+
+
+def jaccard(first, second):
+    if not first and not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def similar_assets(es_object, asset_id, size=10, min_similarity=0.0):
+    """Return up to `size` (asset id, similarity) of the assets most similar to an asset, most similar first."""
+    index = derived_index.ASSET_CATALOG_INDEX
+    source = ["AssetId", "Bands"] + list(FIELDS)
+    try:
+        document = es_object.get(index=index, id=asset_id, _source=source)['_source']
+    except Exception as e:
+        logger.error("minhash", "Unable to read the catalog document of the asset", asset_id=asset_id, error=e)
+        return []
+    if not document.get("Bands"):
+        return []
+    body = {
+        "size": MAX_CANDIDATES,
+        "_source": ["AssetId"] + list(FIELDS),
+        "query": {"bool": {
+            "filter": [{"terms": {"Bands": document["Bands"]}}],
+            "must_not": [{"ids": {"values": [asset_id]}}]
+        }}
+    }
+    response = es_object.search(index=index, body=body)
+    terms = elements(document)
+    ranked = []
+    for hit in response["hits"]["hits"]:
+        similarity = jaccard(terms, elements(hit["_source"]))
+        if similarity >= min_similarity:
+            ranked.append((hit["_source"].get("AssetId", hit["_id"]), similarity))
+    ranked.sort(key=lambda candidate: (-candidate[1], candidate[0]))
+    return ranked[:size]
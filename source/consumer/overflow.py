@@ -0,0 +1,204 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Deferring records that do not finish before the Lambda deadline.
+#
+# A record with a very large result can take longer than the function timeout. Lambda would stop
+# the invocation mid-bulk, Kinesis would retry the whole batch and the same record would time out
+# again, blocking the shard. When an overflow queue is configured, the consumer stops
+# DeadlineReserveSeconds before the deadline instead and sends the work it has not done to the
+# queue, so the batch completes and the shard moves on.
+#
+# Only paged results that are read a batch of pages at a time can be split across invocations:
+# results larger than StreamingThresholdBytes, and those transformed in worker processes. They
+# are checked between batches of pages, and the number of pages that were indexed is stored
+# with the record as its cursor. Every other result, such as transcripts, captions, translations
+# and paged results below the threshold, is indexed in one go, so its record is deferred whole
+# if the deadline passes before it starts and is not stopped once it has. The deferred records
+# of each asset are sent as one message, in order, and overflow_handler.py processes them from
+# the cursor on, deferring again up to MaxDeferrals times. A message deferred more often than
+# that is not processed again, see overflow_handler.py. Records of the asset that arrive on the
+# stream later are not held back and may be indexed before the deferred ones.
+#
+# OverflowQueueUrl selects an SQS queue. OverflowQueueDirectory selects LocalQueue, a stand-in
+# that keeps messages as files, for local runs. Without either the consumer runs records to the
+# end as before.
+
+import contextvars
+import json
+import os
+import time
+import uuid
+
+import boto3
+
+import structured_logger
+
+DEADLINE_RESERVE_SECONDS = int(os.environ.get('DeadlineReserveSeconds', 120))
+MAX_DEFERRALS = int(os.environ.get('MaxDeferrals', 20))
+
+logger = structured_logger.get_logger()
+
+# The deadline of the record being processed, set only while deferring is possible.
+current_deadline = contextvars.ContextVar('current_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised to stop processing a record that would not finish before the deadline."""
+
+    def __init__(self, cursor):
+        super().__init__("Deadline reached after {cursor} pages".format(cursor=cursor))
+        self.cursor = cursor
+
+
+class DeferralLimitReached(Exception):
+    """Raised for a message that was deferred more than MAX_DEFERRALS times."""
+
+    def __init__(self, deferrals):
+        super().__init__("Deferred {deferrals} times".format(deferrals=deferrals))
+        self.deferrals = deferrals
+
+
+class Deadline:
+    """The time left in a Lambda invocation, less a reserve for finishing up."""
+
+    def __init__(self, context, reserve_seconds=None):
+        self._context = context
+        self.reserve_ms = 1000 * (DEADLINE_RESERVE_SECONDS if reserve_seconds is None else reserve_seconds)
+
+    def expired(self):
+        # Without a Lambda context, as in tests and local runs, there is no deadline.
+        if self._context is None:
+            return False
+        return self._context.get_remaining_time_in_millis() <= self.reserve_ms
+
+
+def check_deadline(cursor, deadline=None):
+    """Raise DeadlineExceeded with `cursor` if the record being processed is out of time."""
+    deadline = deadline or current_deadline.get()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded(cursor)
+
+
+class Message:
+    def __init__(self, receipt, body):
+        self.receipt = receipt
+        self.body = body
+
+
+class SqsQueue:
+    """Overflow queue backed by Amazon SQS."""
+
+    def __init__(self, queue_url, client=None, client_config=None):
+        self.queue_url = queue_url
+        self._client = client or boto3.client('sqs', config=client_config)
+
+    def send(self, body):
+        self._client.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(body))
+
+    def receive(self, max_messages=1, wait_seconds=0):
+        response = self._client.receive_message(
+            QueueUrl=self.queue_url, MaxNumberOfMessages=max_messages, WaitTimeSeconds=wait_seconds)
+        return [Message(message['ReceiptHandle'], json.loads(message['Body']))
+                for message in response.get('Messages', [])]
+
+    def delete(self, receipt):
+        self._client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+
+class LocalQueue:
+    """Overflow queue that keeps each message as a JSON file in `directory`.
+
+    Received messages are renamed so no other reader gets them, and are removed when deleted.
+    Messages are received oldest first.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, body):
+        name = '{time:020d}-{id}.json'.format(time=time.time_ns(), id=uuid.uuid4().hex)
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(body, f)
+        os.replace(path + '.tmp', path)
+
+    def receive(self, max_messages=1, wait_seconds=0):
+        messages = []
+        for name in sorted(os.listdir(self.directory)):
+            if len(messages) == max_messages:
+                break
+            if not name.endswith('.json'):
+                continue
+            receipt = os.path.join(self.directory, name + '.received')
+            try:
+                os.rename(os.path.join(self.directory, name), receipt)
+            except FileNotFoundError:
+                # Another reader got it first.
+                continue
+            with open(receipt) as f:
+                messages.append(Message(receipt, json.load(f)))
+        return messages
+
+    def delete(self, receipt):
+        os.remove(receipt)
+
+
+def get_queue(client_config=None):
+    """Return the configured overflow queue, or None if records are not deferred."""
+    queue_url = os.environ.get('OverflowQueueUrl')
+    if queue_url:
+        return SqsQueue(queue_url, client_config=client_config)
+    directory = os.environ.get('OverflowQueueDirectory')
+    if directory:
+        return LocalQueue(directory)
+    return None
+
+
+def make_message(records, deferrals):
+    return {
+        "Records": [
+            {"AssetId": asset_id, "Action": action, "Payload": payload, "Cursor": cursor}
+            for asset_id, payload, action, cursor in records
+        ],
+        "Deferrals": deferrals
+    }
+
+
+def read_message(body):
+    """Return the (asset_id, payload, action, cursor) records and the deferral count of a message."""
+    records = [(record["AssetId"], record["Payload"], record["Action"], record.get("Cursor", 0))
+               for record in body["Records"]]
+    return records, body.get("Deferrals", 0)
+
+
+def check_deferrals(deferrals):
+    """Raise DeferralLimitReached if a message deferred `deferrals` times must not be processed again."""
+    if deferrals > MAX_DEFERRALS:
+        raise DeferralLimitReached(deferrals)
+
+
+def defer(queue, records, deferrals=0):
+    """Send (asset_id, payload, action, cursor) records to the overflow queue, one message per asset."""
+    records_by_asset = {}
+    for record in records:
+        asset_id, _payload, action, _cursor = record
+        if asset_id is None or action is None:
+            # Records that cannot be decoded are only logged, there is nothing to defer.
+            continue
+        records_by_asset.setdefault(asset_id, []).append(record)
+    for asset_id, asset_records in records_by_asset.items():
+        queue.send(make_message(asset_records, deferrals + 1))
+        logger.info("overflow", "Deferred records to the overflow queue", asset_id=asset_id,
+                    records=len(asset_records), cursor=asset_records[0][3], deferrals=deferrals + 1)
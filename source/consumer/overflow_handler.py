@@ -0,0 +1,73 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Entry point for records deferred to the overflow queue: overflow_handler.lambda_handler.
+#
+# The function is subscribed to the SQS overflow queue. Each message holds the deferred records
+# of one asset and the page each one starts at. They are processed like stream records, and
+# whatever does not finish before this invocation's deadline is sent back to the queue with the
+# new cursor, so a result of any size is indexed in slices of one invocation each.
+#
+# A message that was deferred more than MaxDeferrals times, such as a record whose first batch
+# of pages never finishes within one invocation, fails without being processed. SQS retries it
+# and then moves it to the dead-letter queue with its records and cursor intact.
+#
+# drain() reads messages from a queue directly, for the local stand-in queue. It logs and drops
+# the messages that reached the limit, since that queue has no dead-letter queue.
+
+import json
+
+import lambda_handler as consumer
+import overflow
+import structured_logger
+
+logger = structured_logger.get_logger()
+
+
+def process_message(body, deadline, queue):
+    records, deferrals = overflow.read_message(body)
+    try:
+        overflow.check_deferrals(deferrals)
+    except overflow.DeferralLimitReached:
+        logger.error("overflow", "Deferred too often, not processing the records again", records=len(records),
+                     asset_id=records[0][0] if records else None, cursor=records[0][3] if records else 0,
+                     deferrals=deferrals)
+        raise
+    logger.info("overflow", "Processing deferred records", records=len(records), cursor=records[0][3] if records else 0,
+                deferrals=deferrals)
+    consumer.process_records(records, deadline, queue, deferrals)
+
+
+def drain(queue, context=None):
+    """Process messages from `queue` until it is empty or the deadline is reached. Returns the message count."""
+    deadline = overflow.Deadline(context)
+    processed = 0
+    while not deadline.expired():
+        messages = queue.receive(max_messages=1)
+        if not messages:
+            break
+        try:
+            process_message(messages[0].body, deadline, queue)
+        except overflow.DeferralLimitReached:
+            # Logged by process_message. There is no dead-letter queue to move it to.
+            pass
+        queue.delete(messages[0].receipt)
+        processed += 1
+    return processed
+
+
+def lambda_handler(event, context):
+    logger.debug("event", "Received event", event=event)
+    deadline = overflow.Deadline(context)
+    for record in event['Records']:
+        process_message(json.loads(record['body']), deadline, consumer.overflow_queue)
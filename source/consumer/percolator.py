@@ -0,0 +1,220 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Saved searches that are matched as results are indexed.
+#
+# Saved searches are stored in the hidden miesavedsearches index, whose Query field is a
+# percolator. Each query is written against the terms of a result, one document per distinct
+# term of an operator with its highest confidence:
+#
+#   {
+#     "AssetId": "...",
+#     "Operator": "contentmoderation",
+#     "Name": "Violence",
+#     "ParentName": "",
+#     "EntityType": null,
+#     "Confidence": 93.2
+#   }
+#
+# Operator is the lower case operator name without a language, such as celebrityrecognition,
+# labeldetection or key_phrases. Name is the label, celebrity, moderation label, line of text,
+# entity, key phrase or transcript word. For example, "moderation label Violence above 90" is:
+#
+#   PUT miesavedsearches/_doc/violence
+#   {
+#     "Name": "Violence above 90",
+#     "Query": {"bool": {"filter": [
+#       {"term": {"Operator": "contentmoderation"}},
+#       {"term": {"Name.keyword": "Violence"}},
+#       {"range": {"Confidence": {"gte": 90}}}
+#     ]}}
+#   }
+#
+# With SavedSearches set to true, the consumer percolates the terms of each result it indexes
+# and writes one notification per saved search and asset to the hidden mienotifications index:
+#
+#   {
+#     "SearchId": "violence",
+#     "SearchName": "Violence above 90",
+#     "AssetId": "...",
+#     "Operator": "contentmoderation",
+#     "Workflow": "...",
+#     "Matches": ["Violence"],
+#     "NotifiedAt": "2024-05-01T12:00:00+00:00"
+#   }
+#
+# A result that matches again, such as a result that is indexed again, updates the notification
+# with its matches and time. Notifications are read by searching for the ones notified after the
+# last one seen, so alerting costs a percolation per result instead of a search of the whole
+# collection per saved search and poll.
+
+import collections
+import datetime
+
+import derived_index
+import pointer_cache
+import structured_logger
+
+INDEX = derived_index.NOTIFICATIONS_INDEX
+SAVED_SEARCHES_INDEX = derived_index.SAVED_SEARCHES_INDEX
+TERM_MAPPING = {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+# Mappings of the saved searches, which include the fields of the percolated documents.
+SAVED_SEARCH_MAPPINGS = {
+    "properties": {
+        "Query": {"type": "percolator"},
+        "Name": TERM_MAPPING,
+        "AssetId": {"type": "keyword"},
+        "Operator": {"type": "keyword"},
+        "ParentName": TERM_MAPPING,
+        "EntityType": {"type": "keyword"},
+        "Confidence": {"type": "float"},
+    }
+}
+MAPPINGS = {
+    "properties": {
+        "SearchId": {"type": "keyword"},
+        "SearchName": {"type": "keyword"},
+        "AssetId": {"type": "keyword"},
+        "Operator": {"type": "keyword"},
+        "Workflow": {"type": "keyword"},
+        "Matches": {"type": "keyword"},
+        "NotifiedAt": {"type": "date"},
+    }
+}
+NAME_FIELDS = ('Name', 'DetectedText', 'EntityText', 'PhraseText', 'content')
+# Distinct terms of a result that are percolated, and how many are sent per request.
+MAX_DOCUMENTS = 10000
+PERCOLATE_BATCH_SIZE = 500
+MAX_SAVED_SEARCHES = 10000
+# Matched terms listed in a notification.
+MAX_MATCHES = 20
+
+logger = structured_logger.get_logger()
+
+
+def saved_searches_enabled():
+    return derived_index.index_enabled(INDEX)
+
+
+def _confidence(document):
+    for field in ('Confidence', 'confidence'):
+        try:
+            return float(document[field])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+def register_search(es_object, search_id, query, name=None):
+    """Save a search, creating the index of saved searches first. Raises if the query is not valid."""
+    if not derived_index.ensure_index(es_object, SAVED_SEARCHES_INDEX, SAVED_SEARCH_MAPPINGS):
+        raise RuntimeError("Unable to create {index}".format(index=SAVED_SEARCHES_INDEX))
+    es_object.index(index=SAVED_SEARCHES_INDEX, id=search_id, body={"Name": name or search_id, "Query": query})
+
+
+def delete_search(es_object, search_id):
+    es_object.delete(index=SAVED_SEARCHES_INDEX, id=search_id, ignore=[404])
+
+
+class ResultTerms:
+    """Distinct terms of the documents written for one result, and the notifications of the searches they match."""
+
+    index = INDEX
+    mappings = MAPPINGS
+
+    def __init__(self, operator, connect):
+        self.operator = operator
+        self.connect = connect
+        # (name, parent name, entity type) to the highest confidence.
+        self.terms = {}
+
+    def add(self, es_index, document):
+        # Lines of detected text are enough, their words are in them.
+        if document.get("Type") == "WORD":
+            return
+        name = next((document[field] for field in NAME_FIELDS if isinstance(document.get(field), str)), None)
+        key = (name.strip() if name else None, document.get("ParentName") or None, document.get("EntityType"))
+        self._keep(key, _confidence(document))
+
+    def _keep(self, key, confidence):
+        if key not in self.terms:
+            if len(self.terms) < MAX_DOCUMENTS:
+                self.terms[key] = confidence
+        elif confidence is not None and (self.terms[key] is None or confidence > self.terms[key]):
+            self.terms[key] = confidence
+
+    def empty(self):
+        return ResultTerms(self.operator, self.connect)
+
+    def state(self):
+        return [list(key) + [confidence] for key, confidence in self.terms.items()]
+
+    def merge(self, state):
+        for name, parent_name, entity_type, confidence in state:
+            self._keep((name, parent_name, entity_type), confidence)
+
+    def clear_query(self, asset_id, resume=False):
+        return None
+
+    def updates_sent(self, asset_id, failed_ids):
+        pass
+
+    def documents(self, asset_id):
+        return [{"AssetId": asset_id, "Operator": self.operator, "Name": name, "ParentName": parent_name,
+                 "EntityType": entity_type, "Confidence": confidence}
+                for (name, parent_name, entity_type), confidence in sorted(self.terms.items(), key=str)]
+
+    def percolate(self, es_object, documents):
+        """Return the saved searches the documents match, as search id to (search name, matched names)."""
+        matches = collections.OrderedDict()
+        for start in range(0, len(documents), PERCOLATE_BATCH_SIZE):
+            batch = documents[start:start + PERCOLATE_BATCH_SIZE]
+            body = {
+                "size": MAX_SAVED_SEARCHES,
+                "_source": ["Name"],
+                "query": {"percolate": {"field": "Query", "documents": batch}}
+            }
+            response = es_object.search(index=SAVED_SEARCHES_INDEX, body=body, ignore_unavailable=True)
+            for hit in response["hits"]["hits"]:
+                _name, names = matches.setdefault(hit["_id"], (hit.get("_source", {}).get("Name"), set()))
+                slots = hit.get("fields", {}).get("_percolator_document_slot", [])
+                names.update(batch[slot]["Name"] for slot in slots if batch[slot]["Name"])
+        return matches
+
+    def make_updates(self, asset_id, workflow, status, resume=False):
+        """Return the upserts of the notifications of the saved searches this result matches."""
+        if not self.terms:
+            return []
+        try:
+            matches = self.percolate(self.connect(), self.documents(asset_id))
+        except Exception as e:
+            logger.error("percolator", "Unable to match the result with the saved searches", error=e)
+            pointer_cache.record_failure()
+            return []
+        notified_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        updates = []
+        for search_id, (search_name, names) in matches.items():
+            notification = {
+                "SearchId": search_id,
+                "SearchName": search_name,
+                "AssetId": asset_id,
+                "Operator": self.operator,
+                "Workflow": workflow,
+                "Matches": sorted(names)[:MAX_MATCHES],
+                "NotifiedAt": notified_at,
+            }
+            doc_id = '{search}-{asset}'.format(search=search_id, asset=asset_id)
+            updates.append((doc_id, {"doc": notification, "doc_as_upsert": True}))
+        if updates:
+            logger.info("percolator", "Result matched saved searches", searches=len(updates))
+        return updates
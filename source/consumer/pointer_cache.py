@@ -0,0 +1,125 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Cache of the S3 results this container has already indexed.
+#
+# Kinesis delivers records at least once and retries whole batches, so the same MODIFY record
+# often arrives again a few minutes later on the same warm container. The consumer remembers
+# the pointer and ETag of every result it indexed without errors. When the pointer comes again
+# within PointerCacheTtlSeconds, a HEAD request checks that the object still has that ETag and
+# the record is skipped instead of being read, parsed and indexed a second time.
+#
+# PointerCacheSize is the number of pointers to remember, least recently used first out. The
+# cache is disabled when it is 0.
+
+import collections
+import contextlib
+import contextvars
+import os
+import threading
+import time
+
+import structured_logger
+
+logger = structured_logger.get_logger()
+
+# Counts the requests that failed while the current record is indexed.
+_failures = contextvars.ContextVar('pointer_cache_failures', default=None)
+
+
+class PointerCache:
+    """LRU cache of pointer to (asset id, ETag, time indexed). It can be shared by threads."""
+
+    def __init__(self, max_entries=None, ttl_seconds=None):
+        if max_entries is None:
+            max_entries = int(os.environ.get('PointerCacheSize', 0))
+        if ttl_seconds is None:
+            ttl_seconds = int(os.environ.get('PointerCacheTtlSeconds', 600))
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, pointer):
+        """Return the ETag the pointer was indexed with, or None if it is unknown or expired."""
+        with self._lock:
+            entry = self._entries.get(pointer)
+            if entry is None:
+                return None
+            _asset_id, etag, indexed_at = entry
+            if time.monotonic() - indexed_at > self.ttl_seconds:
+                del self._entries[pointer]
+                return None
+            self._entries.move_to_end(pointer)
+            return etag
+
+    def put(self, pointer, asset_id, etag):
+        if not self.enabled or not etag:
+            return
+        with self._lock:
+            self._entries[pointer] = (asset_id, etag, time.monotonic())
+            self._entries.move_to_end(pointer)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard_asset(self, asset_id):
+        with self._lock:
+            for pointer in [pointer for pointer, entry in self._entries.items() if entry[0] == asset_id]:
+                del self._entries[pointer]
+
+    def is_indexed(self, pointer, s3_client, bucket):
+        """Return True if the object at `pointer` was indexed and has not changed since."""
+        if not self.enabled or self.get(pointer) is None:
+            return False
+        try:
+            current_etag = s3_client.head_object(Bucket=bucket, Key=pointer).get('ETag')
+        except Exception as e:
+            logger.warning("pointer_cache", "Unable to check the ETag of a cached pointer", error=e)
+            return False
+        return self.confirm(pointer, current_etag)
+
+    def confirm(self, pointer, current_etag):
+        """Return True if `current_etag` is the ETag the pointer was indexed with, and forget the pointer if not."""
+        with self._lock:
+            etag = self.get(pointer)
+            if etag is None:
+                return False
+            if current_etag != etag:
+                del self._entries[pointer]
+                return False
+            return True
+
+
+@contextlib.contextmanager
+def track_failures():
+    """Count the failed requests of the enclosed block. Yields a dict with the count in "Failures"."""
+    # The dict is shared with contexts copied from this one, such as the bulk sender's.
+    failures = {"Failures": 0}
+    parent = _failures.get()
+    token = _failures.set(failures)
+    try:
+        yield failures
+    finally:
+        _failures.reset(token)
+        if parent is not None:
+            parent["Failures"] += failures["Failures"]
+
+
+def record_failure():
+    failures = _failures.get()
+    if failures is not None:
+        failures["Failures"] += 1
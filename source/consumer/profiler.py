@@ -0,0 +1,108 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# On-demand CPU profiling for the consumer.
+#
+# Profiling is off unless the ProfilingSampleRate environment variable is set to a value
+# greater than 0. A rate of 1 profiles every record, 0.01 profiles roughly one record in a
+# hundred. ProfilingOperators optionally restricts profiling to a comma separated list of
+# operator names (for example "labelDetection,face_search"). The aggregated stats are always
+# written to the log. When ProfilingS3Prefix is set, the raw stats are also written to the
+# dataplane bucket under that prefix and can be loaded with pstats.Stats(<downloaded file>).
+
+import contextlib
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import time
+
+import structured_logger
+
+PROFILE_STATS_LINES = 25
+
+logger = structured_logger.get_logger()
+
+
+def get_sample_rate():
+    try:
+        return float(os.environ.get('ProfilingSampleRate', '0'))
+    except ValueError:
+        logger.warning("profile", "Invalid ProfilingSampleRate, profiling is disabled")
+        return 0.0
+
+
+def get_profiled_operators():
+    operators = os.environ.get('ProfilingOperators', '')
+    return {operator.strip().lower() for operator in operators.split(',') if operator.strip()}
+
+
+def should_profile(operator):
+    sample_rate = get_sample_rate()
+    if sample_rate <= 0:
+        return False
+    profiled_operators = get_profiled_operators()
+    if profiled_operators and str(operator).lower() not in profiled_operators:
+        return False
+    return random.random() < sample_rate  # nosec - sampling, not used for security
+
+
+def format_stats(profile):
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_STATS_LINES)
+    return stream.getvalue()
+
+
+def profile_s3_key(prefix, asset_id, operator):
+    return "{prefix}/{asset}/{operator}/{timestamp}.prof".format(
+        prefix=prefix.rstrip('/'), asset=asset_id, operator=operator, timestamp=int(time.time() * 1000))
+
+
+def upload_stats(profile, s3_client, bucket, key):
+    # This is the same format that pstats.Stats.dump_stats writes.
+    profile.create_stats()
+    try:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=marshal.dumps(profile.stats))
+    except Exception as e:
+        logger.error("profile", "Unable to write profile to s3://{bucket}/{key}".format(bucket=bucket, key=key), error=e)
+    else:
+        logger.info("profile", "Wrote profile to s3://{bucket}/{key}".format(bucket=bucket, key=key))
+
+
+@contextlib.contextmanager
+def profile_invocation(asset_id, operator, s3_client=None, bucket=None):
+    """Profile the enclosed block when this record is sampled for profiling.
+
+    The stats are tagged with the asset id and operator so pathological results can be
+    traced back to the record that produced them.
+    """
+    if not should_profile(operator):
+        yield
+        return
+
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        elapsed = time.perf_counter() - start
+        logger.info("profile", "Profile for asset: {asset} operator: {operator}".format(asset=asset_id, operator=operator),
+                    elapsed=round(elapsed, 3), stats=format_stats(profile))
+        prefix = os.environ.get('ProfilingS3Prefix', '')
+        if prefix and s3_client is not None and bucket:
+            upload_stats(profile, s3_client, bucket, profile_s3_key(prefix, asset_id, operator))
@@ -0,0 +1,238 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Blue/green reindex of a mie* index without a search outage.
+#
+# For each index the script:
+#
+#   1. creates the next generation, hidden and with the -next alias, using the settings and
+#      mappings from --body if given,
+#   2. waits until every consumer has refreshed its alias cache and writes to both generations,
+#   3. copies the current generation into the new one, skipping documents the consumer has
+#      already written there,
+#   4. deletes the assets that were removed while the copy was running,
+#   5. moves the read and write aliases to the new generation in one atomic update, then makes
+#      the new generation visible and hides the old one.
+#
+# An index that is still a concrete mie{index} index from before generations were introduced is
+# replaced by its first generation; the swap in step 5 deletes the old index. If the script is
+# interrupted, running it again continues with the generation it already created.
+#
+# The consumer must run with IndexAliases set to true.
+#
+# Usage:
+#   python3 reindex.py --endpoint <search domain endpoint> --index labels [--index ...] \
+#       [--body new-index.json] [--delete-old]
+#   python3 reindex.py --endpoint <search domain endpoint> --all
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import derived_index
+import index_aliases
+
+DEFAULT_SETTLE_SECONDS = 60
+TASK_POLL_SECONDS = 10
+DELETE_BATCH_SIZE = 1000
+COMPOSITE_PAGE_SIZE = 1000
+
+
+class ReindexError(Exception):
+    pass
+
+
+def describe_index(es_object, es_index):
+    """Return the current and next concrete index of `es_index` and whether the current one is a legacy index."""
+    aliases, indices = index_aliases.get_aliases(es_object)
+    legacy = es_index in indices
+    if legacy:
+        current = es_index
+    else:
+        current = next(iter(aliases.get(index_aliases.write_alias(es_index), [])), None)
+    next_index = next(iter(aliases.get(index_aliases.next_alias(es_index), [])), None)
+    generations = [index_aliases.parse_generation(es_index, name) for name in indices]
+    latest = max([generation for generation in generations if generation is not None], default=0)
+    return {"Current": current, "Next": next_index, "Legacy": legacy, "LatestGeneration": latest}
+
+
+def list_indices(es_object):
+    """Return the names of all mie* indices that can be reindexed."""
+    aliases, indices = index_aliases.get_aliases(es_object)
+    names = {alias[:-len('-write')] for alias in aliases if alias.endswith('-write')}
+    # Concrete indices that are not generations are legacy indices.
+    names.update(name for name in indices if not name.rsplit('-', 1)[-1].isdigit())
+    # Derived indices are rebuilt rather than reindexed, see derived_index.py.
+    return sorted(names.difference(derived_index.INDICES, [derived_index.SAVED_SEARCHES_INDEX]))
+
+
+def start_generation(es_object, es_index, generation, body=None):
+    body = json.loads(json.dumps(body or {}))
+    body.setdefault("settings", {})["index.hidden"] = True
+    body["aliases"] = {index_aliases.next_alias(es_index): {}}
+    name = index_aliases.generation_name(es_index, generation)
+    es_object.indices.create(index=name, body=body)
+    return name
+
+
+def copy_documents(es_object, source, dest, poll_seconds=TASK_POLL_SECONDS):
+    body = {
+        "conflicts": "proceed",
+        "source": {"index": source},
+        # Documents that the consumer already wrote to the new generation have the same id
+        # and are newer, so do not overwrite them.
+        "dest": {"index": dest, "op_type": "create"}
+    }
+    task = es_object.reindex(body=body, wait_for_completion=False, slices='auto', refresh=True)['task']
+    while True:
+        status = es_object.tasks.get(task_id=task)
+        if status.get('completed'):
+            break
+        time.sleep(poll_seconds)
+    if 'error' in status:
+        raise ReindexError("Reindex of {source} failed: {error}".format(source=source, error=status['error']))
+    response = status.get('response', {})
+    # Version conflicts are the documents that were already written by the consumer.
+    failures = [failure for failure in response.get('failures', []) if failure.get('status') != 409]
+    if failures:
+        raise ReindexError("Reindex of {source} failed for {count} documents: {first}".format(
+            source=source, count=len(failures), first=failures[0]))
+    return response
+
+
+def asset_id_field(es_object, index):
+    # Dynamically mapped indices have a keyword sub field, explicit mappings may map AssetId as keyword.
+    mapping = es_object.indices.get_field_mapping(fields='AssetId', index=index)
+    for details in mapping.values():
+        field = details.get('mappings', {}).get('AssetId', {}).get('mapping', {}).get('AssetId', {})
+        if field.get('type') == 'keyword':
+            return 'AssetId'
+    return 'AssetId.keyword'
+
+
+def list_asset_ids(es_object, index):
+    field = asset_id_field(es_object, index)
+    body = {
+        "size": 0,
+        "aggs": {"assets": {"composite": {"size": COMPOSITE_PAGE_SIZE, "sources": [{"AssetId": {"terms": {"field": field}}}]}}}
+    }
+    asset_ids = set()
+    while True:
+        aggregation = es_object.search(index=index, body=body)['aggregations']['assets']
+        asset_ids.update(bucket['key']['AssetId'] for bucket in aggregation['buckets'])
+        if 'after_key' not in aggregation or not aggregation['buckets']:
+            return asset_ids
+        body["aggs"]["assets"]["composite"]["after"] = aggregation['after_key']
+
+
+def remove_deleted_assets(es_object, source, dest):
+    """Delete the assets that were removed from `source` after the copy to `dest` read them."""
+    deleted = sorted(list_asset_ids(es_object, dest) - list_asset_ids(es_object, source))
+    field = asset_id_field(es_object, dest)
+    for start in range(0, len(deleted), DELETE_BATCH_SIZE):
+        es_object.delete_by_query(
+            index=dest,
+            body={"query": {"terms": {field: deleted[start:start + DELETE_BATCH_SIZE]}}},
+            refresh=True
+        )
+    return len(deleted)
+
+
+def swap_aliases(es_object, es_index, current, new, legacy):
+    write_alias = index_aliases.write_alias(es_index)
+    actions = [
+        {"remove": {"index": new, "alias": index_aliases.next_alias(es_index)}},
+        {"add": {"index": new, "alias": write_alias, "is_write_index": True}},
+    ]
+    if legacy:
+        # The read alias takes over the name of the legacy index, which has to go in the same update.
+        actions.append({"remove_index": {"index": current}})
+    else:
+        actions.append({"remove": {"index": current, "alias": es_index}})
+        actions.append({"remove": {"index": current, "alias": write_alias}})
+    actions.append({"add": {"index": new, "alias": es_index}})
+    es_object.indices.update_aliases(body={"actions": actions})
+    # Hidden is an index setting, not part of the alias update. Show the new generation first
+    # so searches across all indices never come back empty.
+    es_object.indices.put_settings(index=new, body={"index.hidden": False})
+    if not legacy:
+        es_object.indices.put_settings(index=current, body={"index.hidden": True})
+
+
+def reindex(es_object, es_index, body=None, settle_seconds=DEFAULT_SETTLE_SECONDS, delete_old=False, report=print):
+    state = describe_index(es_object, es_index)
+    current = state["Current"]
+    if current is None:
+        report("{index} has no current generation, the consumer creates it on the first write".format(index=es_index))
+        return None
+    new = state["Next"]
+    if new is None:
+        new = start_generation(es_object, es_index, state["LatestGeneration"] + 1, body)
+        report("Created {new}, waiting {seconds}s for the consumers to write to it".format(new=new, seconds=settle_seconds))
+        time.sleep(settle_seconds)
+    else:
+        report("Continuing with {new}".format(new=new))
+    response = copy_documents(es_object, current, new)
+    report("Copied {count} documents from {current} to {new}".format(
+        count=response.get('created', 0), current=current, new=new))
+    deleted = remove_deleted_assets(es_object, current, new)
+    if deleted:
+        report("Removed {count} assets that were deleted during the copy".format(count=deleted))
+    swap_aliases(es_object, es_index, current, new, state["Legacy"])
+    report("{index} now points to {new}".format(index=es_index, new=new))
+    if delete_old and not state["Legacy"]:
+        es_object.indices.delete(index=current)
+        report("Deleted {current}".format(current=current))
+    return new
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Reindex mie* indices into a new generation without downtime.")
+    parser.add_argument('--endpoint', default=os.environ.get('EsEndpoint'), help="search domain endpoint")
+    parser.add_argument('--index', action='append', default=[], help="index to reindex, for example labels or mielabels")
+    parser.add_argument('--all', action='store_true', help="reindex every mie* index")
+    parser.add_argument('--body', help="JSON file with the settings and mappings of the new generation")
+    parser.add_argument('--settle-seconds', type=int, default=DEFAULT_SETTLE_SECONDS,
+                        help="time for the consumers to start writing to the new generation, "
+                             "longer than their AliasRefreshSeconds")
+    parser.add_argument('--delete-old', action='store_true', help="delete the old generation after the swap")
+    args = parser.parse_args(argv)
+    if not args.endpoint:
+        parser.error("--endpoint is required")
+    if not args.index and not args.all:
+        parser.error("--index or --all is required")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ['EsEndpoint'] = args.endpoint
+    os.environ.setdefault('DataplaneBucket', '')
+    os.environ.setdefault('botoConfig', '{}')
+    import lambda_handler
+    es_object = lambda_handler.connect_es(args.endpoint)
+    body = None
+    if args.body:
+        with open(args.body) as body_file:
+            body = json.load(body_file)
+    names = list_indices(es_object) if args.all else [
+        name.lower() if name.lower().startswith('mie') else 'mie' + name.lower() for name in args.index]
+    for es_index in names:
+        reindex(es_object, es_index, body, args.settle_seconds, args.delete_old)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Scene documents that join the results of an asset by shot.
+#
+# With Scenes set to true, the consumer keeps one document per shot of a video in the hidden
+# miescenes index, with what was detected, said and captioned during the shot:
+#
+#   {
+#     "AssetId": "...",
+#     "Shot": 12,
+#     "Start": 41000,
+#     "End": 45500,
+#     "Labels": ["Car", "Road"],
+#     "Celebrities": [],
+#     "Text": ["EXIT"],
+#     "ModerationLabels": [],
+#     "Faces": 2,
+#     "Transcript": "we are ready for the launch",
+#     "Captions": {"en": "We are ready for the launch.", "es": "..."}
+#   }
+#
+# Faces is the largest number of faces detected at one time during the shot. A search for
+# scenes with a car where someone says "launch" is one query on this index.
+#
+# Results arrive in any order, so the timed items of every result, such as label names with
+# their timestamp or transcript words with their start and end, are kept in the dataplane
+# bucket:
+#
+#   private/assets/{asset}/search/scenes/{source}.json
+#
+# When shots are indexed, every scene is built from the items stored for the asset. When
+# another result is indexed after the shots, its items are assigned to the shots that overlap
+# them and its field of every scene is replaced.
+
+import bisect
+import collections
+import json
+
+from botocore.exceptions import ClientError
+
+import derived_index
+import pointer_cache
+import structured_logger
+
+INDEX = derived_index.SCENES_INDEX
+SOURCE_KEY = 'private/assets/{asset}/search/scenes/{source}.json'
+SOURCE_PREFIX = 'private/assets/{asset}/search/scenes/'
+SHOTS = 'shots'
+TERMS = 'terms'
+COUNT = 'count'
+TEXT = 'text'
+# Operator to the scene field, the kind of value it has and the document field the value is
+# read from. Captions are added per language.
+OPERATOR_FIELDS = {
+    "labeldetection": ("Labels", TERMS, "Name"),
+    "celebrityrecognition": ("Celebrities", TERMS, "Name"),
+    "textdetection": ("Text", TERMS, "DetectedText"),
+    "contentmoderation": ("ModerationLabels", TERMS, "Name"),
+    "facedetection": ("Faces", COUNT, None),
+    "transcribevideo": ("Transcript", TEXT, "content"),
+}
+CAPTIONS = "Captions"
+TERM_MAPPING = {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+MAPPINGS = {
+    "dynamic_templates": [
+        {
+            "captions": {
+                "path_match": CAPTIONS + ".*",
+                "mapping": {"type": "text"}
+            }
+        }
+    ],
+    "properties": {
+        "AssetId": {"type": "keyword"},
+        "Shot": {"type": "integer"},
+        "Start": {"type": "long"},
+        "End": {"type": "long"},
+        "Labels": TERM_MAPPING,
+        "Celebrities": TERM_MAPPING,
+        "Text": TERM_MAPPING,
+        "ModerationLabels": TERM_MAPPING,
+        "Faces": {"type": "integer"},
+        "Transcript": {"type": "text"},
+        CAPTIONS: {"type": "object"}
+    }
+}
+DELETE_SCRIPT = "ctx.op = 'delete'"
+
+logger = structured_logger.get_logger()
+
+
+def scenes_enabled():
+    return derived_index.index_enabled(INDEX)
+
+
+def source_name(operator, languages=()):
+    """Return the name the items of an operator's result are stored under, or None if scenes do not use it."""
+    if operator == "shotdetection":
+        return SHOTS
+    if operator == "webcaptions" and languages:
+        return "webcaptions_" + languages[0]
+    if operator in OPERATOR_FIELDS:
+        return operator
+    return None
+
+
+def source_field(source):
+    """Return the scene field and kind of value of a stored source."""
+    if source.startswith("webcaptions_"):
+        return CAPTIONS + "." + source[len("webcaptions_"):], TEXT
+    field, kind, _document_field = OPERATOR_FIELDS[source]
+    return field, kind
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ShotIndex:
+    """Interval index over the shots of an asset, sorted by start time."""
+
+    def __init__(self, shots):
+        # Shots are [start, end, index] items.
+        self.shots = sorted(shots, key=lambda shot: (shot[0], shot[1]))
+        self.starts = [shot[0] for shot in self.shots]
+
+    def overlapping(self, start, end):
+        """Return the positions of the shots that overlap the time range. A range with start == end is a point."""
+        position = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        found = []
+        while position < len(self.shots) and self.starts[position] <= end:
+            shot_start, shot_end, _index = self.shots[position]
+            if start == end:
+                last = position == len(self.shots) - 1
+                if shot_start <= start < shot_end or (last and start == shot_end):
+                    found.append(position)
+            elif shot_start < end and shot_end > start:
+                found.append(position)
+            position += 1
+        return found
+
+    def assign(self, items, kind):
+        """Return the value of a field for every shot from [start, end, value] items."""
+        if kind == TERMS:
+            terms = [set() for _shot in self.shots]
+            for start, end, value in items:
+                for position in self.overlapping(start, end):
+                    terms[position].add(value)
+            return [sorted(values) for values in terms]
+        if kind == COUNT:
+            counts = [collections.Counter() for _shot in self.shots]
+            for start, end, _value in items:
+                for position in self.overlapping(start, end):
+                    counts[position][start] += 1
+            return [max(counter.values(), default=0) for counter in counts]
+        words = [[] for _shot in self.shots]
+        for start, end, value in sorted(items, key=lambda item: item[0]):
+            for position in self.overlapping(start, end):
+                words[position].append(value)
+        return [' '.join(values) for values in words]
+
+
+class SceneSources:
+    """Reads and writes the timed items of each result in the dataplane bucket."""
+
+    def __init__(self, s3_client, bucket):
+        self.s3_client = s3_client
+        self.bucket = bucket
+
+    def load(self, asset_id, source):
+        """Return the stored items of a source, or None if there are none."""
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket, Key=SOURCE_KEY.format(asset=asset_id, source=source))
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey':
+                return None
+            raise
+        return json.loads(obj['Body'].read())
+
+    def save(self, asset_id, source, items):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=SOURCE_KEY.format(asset=asset_id, source=source),
+            Body=json.dumps(items, separators=(',', ':')).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+    def load_all(self, asset_id):
+        """Return the items of every stored source of the asset by source name."""
+        prefix = SOURCE_PREFIX.format(asset=asset_id)
+        sources = {}
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                source = obj['Key'][len(prefix):-len('.json')]
+                sources[source] = self.load(asset_id, source) or []
+        return sources
+
+
+class SceneItems:
+    """Timed items of the documents written for one result, and the scene updates they make."""
+
+    index = INDEX
+    mappings = MAPPINGS
+
+    def __init__(self, operator, languages, store):
+        self.operator = operator
+        self.languages = tuple(languages)
+        self.store = store
+        self.source = source_name(operator, self.languages)
+        self.items = []
+
+    def add(self, es_index, document):
+        if self.source is None:
+            return
+        if self.source == SHOTS:
+            start, end = _number(document.get("StartTimestamp")), _number(document.get("EndTimestamp"))
+            if start is not None and end is not None:
+                self.items.append([start, end, document.get("Index")])
+        elif self.source.startswith("webcaptions_"):
+            for caption in document.get("WebCaptions", []):
+                start, end = _number(caption.get("start")), _number(caption.get("end"))
+                if start is not None and end is not None and caption.get("caption"):
+                    self.items.append([start * 1000, end * 1000, caption["caption"]])
+        elif self.operator == "transcribevideo":
+            start, end = _number(document.get("start_time")), _number(document.get("end_time"))
+            if start is not None and end is not None and document.get("content"):
+                self.items.append([start, end, document["content"]])
+        else:
+            _field, kind, document_field = OPERATOR_FIELDS[self.operator]
+            timestamp = _number(document.get("Timestamp"))
+            if timestamp is None or document.get("Type") == "WORD":
+                return
+            value = None if kind == COUNT else document.get(document_field)
+            if kind == COUNT or (isinstance(value, str) and value.strip()):
+                self.items.append([timestamp, timestamp, value.strip() if value else None])
+
+    def empty(self):
+        return SceneItems(self.operator, self.languages, self.store)
+
+    def state(self):
+        return self.items
+
+    def merge(self, state):
+        self.items.extend(state)
+
+    def clear_query(self, asset_id, resume=False):
+        """Return the update by query that deletes the scenes of the asset before its shots are written again."""
+        if self.source != SHOTS or resume:
+            return None
+        return {
+            "query": {"term": {"AssetId": asset_id}},
+            "script": {"lang": "painless", "source": DELETE_SCRIPT}
+        }
+
+    def updates_sent(self, asset_id, failed_ids):
+        pass
+
+    def make_updates(self, asset_id, workflow, status, resume=False):
+        """Store the items of this result and return the upserts of the scenes they change."""
+        if self.source is None:
+            return []
+        try:
+            items = self.items
+            if resume:
+                items = (self.store.load(asset_id, self.source) or []) + items
+            self.store.save(asset_id, self.source, items)
+            if self.source == SHOTS:
+                shots = items
+                sources = self.store.load_all(asset_id)
+                sources.pop(SHOTS, None)
+            else:
+                shots = self.store.load(asset_id, SHOTS)
+                sources = {self.source: items}
+        except Exception as e:
+            logger.error("scenes", "Unable to read or write the scene sources", error=e)
+            pointer_cache.record_failure()
+            return []
+        if not shots:
+            # The scenes are built when the shots are indexed.
+            return []
+        shot_index = ShotIndex(shots)
+        documents = []
+        for position, (start, end, index) in enumerate(shot_index.shots):
+            shot = index if index is not None else position
+            documents.append({"AssetId": asset_id, "Shot": shot, "Start": start, "End": end})
+        if self.source == SHOTS:
+            # The fields of results that were not indexed yet are empty.
+            for document in documents:
+                for field, kind, _document_field in OPERATOR_FIELDS.values():
+                    document[field] = {TERMS: [], COUNT: 0, TEXT: ""}[kind]
+                document[CAPTIONS] = {}
+        for source, source_items in sources.items():
+            try:
+                field, kind = source_field(source)
+            except KeyError:
+                continue
+            for document, value in zip(documents, shot_index.assign(source_items, kind)):
+                if field.startswith(CAPTIONS + "."):
+                    document.setdefault(CAPTIONS, {})[field[len(CAPTIONS) + 1:]] = value
+                else:
+                    document[field] = value
+        return [('{asset}-{shot}'.format(asset=asset_id, shot=document["Shot"]), {"doc": document, "doc_as_upsert": True})
+                for document in documents]
@@ -0,0 +1,178 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Structured logging for the consumer.
+#
+# Every message is written as one line of compact JSON with a "kind" that identifies the type
+# of message, plus the asset id and operator of the record being processed. The output is
+# controlled with these environment variables:
+#
+#   LogLevel        Minimum level that is logged (DEBUG, INFO, WARNING, ERROR). Default INFO.
+#                   Full event and payload dumps are only logged at DEBUG.
+#   LogSampleRates  Comma separated kind=rate pairs, for example "bulk_index=0.1,action=0.5".
+#                   DEBUG and INFO messages of that kind are logged with the given probability.
+#                   Warnings and errors are never sampled.
+#   LogRateLimit    Maximum number of DEBUG and INFO messages per kind per second. Default 50.
+#                   Messages over the limit are dropped and counted; the count is added to the
+#                   next message of that kind that is logged. Warnings and errors are always
+#                   logged and do not count toward the limit.
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+DEFAULT_RATE_LIMIT = 50
+
+_context = contextvars.ContextVar('log_context', default={})
+
+
+def parse_sample_rates(value):
+    sample_rates = {}
+    for pair in value.split(','):
+        kind, _, rate = pair.partition('=')
+        try:
+            sample_rates[kind.strip()] = float(rate)
+        except ValueError:
+            continue
+    return sample_rates
+
+
+class SamplingFilter(logging.Filter):
+    """Drops messages by kind according to sample rates and a per-second rate limit."""
+
+    def __init__(self, sample_rates=None, rate_limit=DEFAULT_RATE_LIMIT):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.rate_limit = rate_limit
+        self._windows = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        kind = getattr(record, 'kind', 'general')
+        sample_rate = self.sample_rates.get(kind, 1.0)
+        if sample_rate < 1.0 and random.random() >= sample_rate:  # nosec - sampling, not used for security
+            return False
+        if self.rate_limit <= 0:
+            return True
+        window_start, count, suppressed = self._windows.get(kind, (0, 0, 0))
+        now = int(time.monotonic())
+        if now != window_start:
+            window_start, count = now, 0
+        if count >= self.rate_limit:
+            self._windows[kind] = (window_start, count, suppressed + 1)
+            return False
+        self._windows[kind] = (window_start, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one line of compact JSON."""
+
+    def format(self, record):
+        message = {
+            "level": record.levelname,
+            "kind": getattr(record, 'kind', 'general'),
+            "message": record.getMessage(),
+        }
+        message.update(_context.get())
+        message.update(getattr(record, 'fields', {}))
+        if getattr(record, 'suppressed', 0):
+            message["suppressed"] = record.suppressed
+        if record.exc_info:
+            message["exception"] = self.formatException(record.exc_info)
+        return json.dumps(message, separators=(',', ':'), default=str)
+
+
+class StdoutHandler(logging.StreamHandler):
+    """Writes to the current sys.stdout, which the Lambda runtime and tests may replace."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class StructuredLogger:
+    """Thin wrapper around a logging.Logger that takes a kind and keyword fields."""
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    def is_enabled_for(self, level):
+        return self.logger.isEnabledFor(level)
+
+    def log(self, level, kind, message, exc_info=None, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, exc_info=exc_info, extra={"kind": kind, "fields": fields})
+
+    def debug(self, kind, message, **fields):
+        self.log(logging.DEBUG, kind, message, **fields)
+
+    def info(self, kind, message, **fields):
+        self.log(logging.INFO, kind, message, **fields)
+
+    def warning(self, kind, message, **fields):
+        self.log(logging.WARNING, kind, message, **fields)
+
+    def error(self, kind, message, **fields):
+        self.log(logging.ERROR, kind, message, **fields)
+
+
+def configure(name='consumer', stream=None):
+    logger = logging.getLogger(name)
+    try:
+        logger.setLevel(os.environ.get('LogLevel', 'INFO').upper())
+    except ValueError:
+        logger.setLevel(logging.INFO)
+    # Lambda adds its own handler to the root logger. Do not propagate to it so each
+    # message is written once, in JSON.
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream) if stream else StdoutHandler()
+    handler.setFormatter(JsonFormatter())
+    try:
+        rate_limit = int(os.environ.get('LogRateLimit', DEFAULT_RATE_LIMIT))
+    except ValueError:
+        rate_limit = DEFAULT_RATE_LIMIT
+    handler.addFilter(SamplingFilter(parse_sample_rates(os.environ.get('LogSampleRates', '')), rate_limit))
+    logger.addHandler(handler)
+    return StructuredLogger(logger)
+
+
+def get_logger(name='consumer'):
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        return configure(name)
+    return StructuredLogger(logger)
+
+
+@contextlib.contextmanager
+def log_context(**fields):
+    """Add fields, such as asset_id and operator, to every message logged in the block."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
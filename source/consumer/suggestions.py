@@ -0,0 +1,258 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Type-ahead suggestions of the terms found in the results.
+#
+# With Suggestions set to true, the consumer keeps one document per distinct label, celebrity,
+# entity, key phrase and line of on-screen text in the hidden miesuggestions index:
+#
+#   {
+#     "Field": "Celebrities",
+#     "Term": "Jane Doe",
+#     "Assets": 12,
+#     "Suggest": {"input": ["Jane Doe", "Doe"], "weight": 12}
+#   }
+#
+# Assets is the number of assets the term was found in. Suggest is a completion field, so a
+# completion suggester on it returns the terms that start with a prefix, most common first,
+# without aggregating over the detection indices. Each word of a term starts an input, so
+# "doe" suggests "Jane Doe" too. The Field of a term is a context of the completion field, so
+# suggestions can be limited to one field.
+#
+# The terms each asset added are kept in the dataplane bucket:
+#
+#   private/assets/{asset}/search/suggestions.json
+#
+# When a result is indexed, its terms are compared with the ones stored for the asset. The count
+# of new terms goes up by one and the count of terms the result no longer has goes down by one.
+# A term is deleted when no asset has it anymore. The updates are not idempotent, so the stored
+# terms only take the changes whose updates succeeded, and the next result of the operator sends
+# the ones that failed again.
+
+import collections
+import hashlib
+import json
+
+from botocore.exceptions import ClientError
+
+import asset_catalog
+import derived_index
+import pointer_cache
+import structured_logger
+
+INDEX = derived_index.SUGGESTIONS_INDEX
+TERMS_KEY = 'private/assets/{asset}/search/suggestions.json'
+MAPPINGS = {
+    "properties": {
+        "Field": {"type": "keyword"},
+        "Term": {"type": "keyword"},
+        "Assets": {"type": "integer"},
+        "Suggest": {
+            "type": "completion",
+            "contexts": [{"name": "field", "type": "category", "path": "Field"}]
+        }
+    }
+}
+# Terms of an operator that are kept for each asset, most frequent first.
+MAX_TERMS = asset_catalog.MAX_TERMS
+# Inputs of a term, starting at its first words.
+MAX_INPUTS = 5
+
+# Adds params.delta to the number of assets with the term, and deletes the term when none is left.
+UPDATE_SCRIPT = """
+boolean created = ctx._source.Assets == null;
+if (created) {
+  ctx._source.Field = params.field;
+  ctx._source.Term = params.term;
+  ctx._source.Assets = 0;
+}
+ctx._source.Assets += params.delta;
+if (ctx._source.Assets <= 0) {
+  ctx.op = created ? 'none' : 'delete';
+} else {
+  ctx._source.Suggest = ['input': params.inputs, 'weight': ctx._source.Assets];
+}
+"""
+
+logger = structured_logger.get_logger()
+
+
+def suggestions_enabled():
+    return derived_index.index_enabled(INDEX)
+
+
+def make_inputs(term):
+    words = term.split()
+    return [" ".join(words[position:]) for position in range(min(len(words), MAX_INPUTS))]
+
+
+def make_update(field, term, delta):
+    """Return the (document id, scripted upsert) that adds `delta` to the number of assets with a term."""
+    doc_id = hashlib.md5("{field}\n{term}".format(field=field, term=term).encode('utf-8')).hexdigest()  # nosec - an id, not for security
+    body = {
+        "scripted_upsert": True,
+        "script": {
+            "lang": "painless",
+            "source": UPDATE_SCRIPT,
+            "params": {"field": field, "term": term, "delta": delta, "inputs": make_inputs(term)}
+        },
+        "upsert": {}
+    }
+    return doc_id, body
+
+
+class TermStore:
+    """Reads and writes the terms of each asset in the dataplane bucket."""
+
+    def __init__(self, s3_client, bucket):
+        self.s3_client = s3_client
+        self.bucket = bucket
+
+    def load(self, asset_id):
+        """Return the stored terms of the asset by field."""
+        try:
+            obj = self.s3_client.get_object(Bucket=self.bucket, Key=TERMS_KEY.format(asset=asset_id))
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey':
+                return {}
+            raise
+        return json.loads(obj['Body'].read())
+
+    def save(self, asset_id, terms):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=TERMS_KEY.format(asset=asset_id),
+            Body=json.dumps(terms, separators=(',', ':')).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+    def delete(self, asset_id):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=TERMS_KEY.format(asset=asset_id))
+
+
+class SuggestionTerms:
+    """Distinct terms of the documents written for one result, and the suggestion counts they change."""
+
+    index = INDEX
+    mappings = MAPPINGS
+
+    def __init__(self, operator, store):
+        self.operator = operator
+        self.store = store
+        self.field, self.source = asset_catalog.OPERATOR_FIELDS.get(operator, (None, None))
+        self.terms = collections.Counter()
+        # The stored terms of the asset, and the term and delta of each update of this result.
+        self.stored = None
+        self.changes = {}
+
+    def add(self, es_index, document):
+        if self.field is None:
+            return
+        # Lines of detected text are enough, their words are in them.
+        if document.get("Type") == "WORD":
+            return
+        term = document.get(self.source)
+        if isinstance(term, str) and term.strip():
+            self.terms[term.strip()] += 1
+
+    def empty(self):
+        return SuggestionTerms(self.operator, self.store)
+
+    def state(self):
+        return dict(self.terms)
+
+    def merge(self, state):
+        self.terms.update(state)
+
+    def clear_query(self, asset_id, resume=False):
+        return None
+
+    def make_updates(self, asset_id, workflow, status, resume=False):
+        """Return the updates of the terms that were added or removed since the terms stored for the asset."""
+        if self.field is None:
+            return []
+        terms = set(term for term, _count in self.terms.most_common(MAX_TERMS))
+        try:
+            self.stored = self.store.load(asset_id)
+        except Exception as e:
+            logger.error("suggestions", "Unable to read the terms of the asset", error=e)
+            pointer_cache.record_failure()
+            return []
+        previous = set(self.stored.get(self.field, []))
+        if resume:
+            terms.update(previous)
+        updates = []
+        for term, delta in [(term, 1) for term in sorted(terms - previous)] + \
+                [(term, -1) for term in sorted(previous - terms)]:
+            doc_id, body = make_update(self.field, term, delta)
+            self.changes[doc_id] = (term, delta)
+            updates.append((doc_id, body))
+        return updates
+
+    def updates_sent(self, asset_id, failed_ids):
+        """Store the terms of the asset with the changes whose updates succeeded.
+
+        The updates add or take away one asset, so an update must be sent again exactly when it
+        did not reach the index.
+        """
+        if self.stored is None:
+            return
+        previous = set(self.stored.get(self.field, []))
+        terms = set(previous)
+        for doc_id, (term, delta) in self.changes.items():
+            if doc_id in failed_ids:
+                continue
+            if delta > 0:
+                terms.add(term)
+            else:
+                terms.discard(term)
+        if terms == previous:
+            return
+        self.stored[self.field] = sorted(terms)
+        try:
+            self.store.save(asset_id, self.stored)
+        except Exception as e:
+            # The counts of the changed terms are off by one until the result is indexed again.
+            logger.error("suggestions", "Unable to write the terms of the asset", error=e)
+            pointer_cache.record_failure()
+
+
+def remove_asset(es_object, store, asset_id):
+    """Take the terms of a deleted asset out of the suggestion counts."""
+    try:
+        stored = store.load(asset_id)
+    except Exception as e:
+        logger.error("suggestions", "Unable to read the terms of the asset", error=e)
+        return
+    if not stored:
+        return
+    updates = []
+    terms_by_id = {}
+    for field, terms in sorted(stored.items()):
+        for term in terms:
+            doc_id, body = make_update(field, term, -1)
+            terms_by_id[doc_id] = (field, term)
+            updates.append((doc_id, body))
+    failed_ids = set()
+    try:
+        if derived_index.send_updates(es_object, INDEX, MAPPINGS, updates, failed_ids):
+            store.delete(asset_id)
+        else:
+            # Keep the terms that were not counted down, so deleting the asset again takes them out.
+            remaining = collections.defaultdict(list)
+            for field, term in sorted(terms_by_id[doc_id] for doc_id in failed_ids if doc_id in terms_by_id):
+                remaining[field].append(term)
+            store.save(asset_id, dict(remaining))
+    except Exception as e:
+        logger.error("suggestions", "Unable to write the terms of the asset", error=e)
+        pointer_cache.record_failure()
@@ -0,0 +1,98 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Common time axis of the operator indices.
+#
+# Operators store time under different names and types: Timestamp for detections at one point in
+# time, StartTimestamp and EndTimestamp for shots and technical cues, and start_time and end_time
+# strings for transcript words. With TimeAxis set to true, the transforms also give every
+# document that is anchored in time a start_ms and end_ms in milliseconds, equal for detections
+# at one point in time, and the consumer installs an index template that maps them as long in
+# every mie* index it creates afterwards.
+#
+# One range query over all the indices then finds everything in a time window of an asset:
+#
+#   GET mie*/_search
+#   {"query": {"bool": {"filter": [
+#     {"term": {"AssetId.keyword": "..."}},
+#     {"range": {"start_ms": {"lte": 1800000}}},
+#     {"range": {"end_ms": {"gte": 600000}}}
+#   ]}}}
+#
+# Caption, translation, entity and key phrase documents have no time of their own and get no
+# range. The scene documents of scenes.py have the captions of each shot.
+
+import os
+import threading
+
+import structured_logger
+
+TEMPLATE_NAME = 'mie-time-axis'
+TEMPLATE = {
+    "index_patterns": ["mie*"],
+    "order": 0,
+    "mappings": {
+        "properties": {
+            "start_ms": {"type": "long"},
+            "end_ms": {"type": "long"},
+        }
+    }
+}
+
+logger = structured_logger.get_logger()
+
+# Whether this container installed the template, and the lock that makes one thread install it.
+_installed = False
+_install_lock = threading.Lock()
+
+
+def time_axis_enabled():
+    return os.environ.get('TimeAxis', 'false').lower() == 'true'
+
+
+def set_range(item, start, end=None):
+    """Set the start_ms and end_ms of a document from times in milliseconds, if they are numbers."""
+    if not time_axis_enabled():
+        return
+    try:
+        start_ms = int(round(float(start)))
+        end_ms = start_ms if end is None else int(round(float(end)))
+    except (TypeError, ValueError):
+        return
+    item["start_ms"] = start_ms
+    item["end_ms"] = end_ms
+
+
+def ensure_template(es_object):
+    """Install the index template unless this container already did."""
+    global _installed
+    if _installed or not time_axis_enabled():
+        return
+    with _install_lock:
+        if _installed:
+            return
+        try:
+            es_object.indices.put_template(name=TEMPLATE_NAME, body=TEMPLATE)
+        except Exception as e:
+            logger.error("time_axis", "Unable to install the index template", error=e)
+            return
+        _installed = True
+
+
+def window_query(asset_id, start_ms, end_ms):
+    """Return the query of the documents of an asset that overlap a time window."""
+    return {"bool": {"filter": [
+        {"term": {"AssetId.keyword": asset_id}},
+        {"range": {"start_ms": {"lte": end_ms}}},
+        {"range": {"end_ms": {"gte": start_ms}}},
+    ]}}
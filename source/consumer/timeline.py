@@ -0,0 +1,193 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Time-bucketed timeline of what is on screen.
+#
+# With Timeline set to true, the consumer keeps one document per asset and time bucket of
+# TimelineBucketSeconds in the hidden mietimeline index. Each bucket lists the labels,
+# celebrities, lines of text, faces and moderation labels detected in it, with their highest
+# confidence and the number of detections:
+#
+#   {
+#     "AssetId": "...",
+#     "Start": 5000,
+#     "End": 10000,
+#     "Labels": [{"Name": "Car", "Confidence": 99.1, "Count": 12}],
+#     "Celebrities": [...],
+#     "Text": [...],
+#     "Faces": [{"Name": "Face", "Confidence": 99.9, "Count": 25}],
+#     "ModerationLabels": [...]
+#   }
+#
+# Start and End are in milliseconds. Drawing markers or finding what is on screen at a time is
+# a query for the buckets of the asset in a time range, instead of fetching every detection.
+# Only detections with a Timestamp, that is results of videos, are bucketed.
+#
+# When a result is indexed again, its field is removed from every bucket of the asset before
+# the new buckets are written. Changing TimelineBucketSeconds only applies to results indexed
+# afterwards; rebuild the index with backfill.py.
+
+import collections
+import os
+
+import derived_index
+
+INDEX = derived_index.TIMELINE_INDEX
+ENTRY_MAPPING = {
+    "properties": {
+        "Name": {"type": "keyword", "ignore_above": 256},
+        "Confidence": {"type": "float"},
+        "Count": {"type": "integer"}
+    }
+}
+# Operator to the timeline field and the document field its names are read from, or None for
+# operators whose detections are not named.
+OPERATOR_FIELDS = {
+    "labeldetection": ("Labels", "Name"),
+    "celebrityrecognition": ("Celebrities", "Name"),
+    "textdetection": ("Text", "DetectedText"),
+    "facedetection": ("Faces", None),
+    "contentmoderation": ("ModerationLabels", "Name"),
+}
+FACE = "Face"
+MAPPINGS = {
+    "properties": dict(
+        {
+            "AssetId": {"type": "keyword"},
+            "Start": {"type": "long"},
+            "End": {"type": "long"},
+        },
+        **{field: ENTRY_MAPPING for field, _source in OPERATOR_FIELDS.values()}
+    )
+}
+
+# Replaces the entries of params.field in the bucket, or adds to them when a deferred result is
+# resumed.
+UPDATE_SCRIPT = """
+ctx._source.AssetId = params.asset_id;
+ctx._source.Start = params.start;
+ctx._source.End = params.end;
+List entries = params.entries;
+if (params.resume && ctx._source[params.field] != null) {
+  Map merged = new TreeMap();
+  for (entry in ctx._source[params.field]) {
+    merged.put(entry.Name, entry);
+  }
+  for (entry in entries) {
+    def previous = merged.get(entry.Name);
+    if (previous != null) {
+      entry.Count += previous.Count;
+      if (previous.Confidence != null && (entry.Confidence == null || previous.Confidence > entry.Confidence)) {
+        entry.Confidence = previous.Confidence;
+      }
+    }
+    merged.put(entry.Name, entry);
+  }
+  entries = new ArrayList(merged.values());
+}
+ctx._source[params.field] = entries;
+"""
+CLEAR_SCRIPT = "ctx._source.remove(params.field)"
+
+
+def timeline_enabled():
+    return derived_index.index_enabled(INDEX)
+
+
+def get_bucket_ms():
+    return int(float(os.environ.get('TimelineBucketSeconds', 5)) * 1000)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TimelineBuckets:
+    """Named detections of one result by time bucket."""
+
+    index = INDEX
+    mappings = MAPPINGS
+
+    def __init__(self, operator, bucket_ms=None):
+        self.operator = operator
+        self.bucket_ms = bucket_ms or get_bucket_ms()
+        self.field, self.source = OPERATOR_FIELDS.get(operator, (None, None))
+        # Bucket start to name to [count, highest confidence].
+        self.buckets = collections.defaultdict(dict)
+
+    def add(self, es_index, document):
+        if self.field is None or document.get("Type") == "WORD":
+            return
+        timestamp = _number(document.get("Timestamp"))
+        name = FACE if self.source is None else document.get(self.source)
+        if timestamp is None or not isinstance(name, str) or not name.strip():
+            return
+        start = int(timestamp) // self.bucket_ms * self.bucket_ms
+        self._add(start, name.strip(), 1, _number(document.get("Confidence")))
+
+    def _add(self, start, name, count, confidence):
+        entry = self.buckets[start].setdefault(name, [0, None])
+        entry[0] += count
+        if confidence is not None and (entry[1] is None or confidence > entry[1]):
+            entry[1] = confidence
+
+    def empty(self):
+        return TimelineBuckets(self.operator, self.bucket_ms)
+
+    def state(self):
+        return [[start, name, count, confidence]
+                for start, names in self.buckets.items() for name, (count, confidence) in names.items()]
+
+    def merge(self, state):
+        for start, name, count, confidence in state:
+            self._add(start, name, count, confidence)
+
+    def clear_query(self, asset_id, resume=False):
+        """Return the update by query that removes the field of the operator from the buckets of the asset."""
+        if self.field is None or resume:
+            return None
+        return {
+            "query": {"bool": {"filter": [{"term": {"AssetId": asset_id}}, {"exists": {"field": self.field}}]}},
+            "script": {"lang": "painless", "source": CLEAR_SCRIPT, "params": {"field": self.field}}
+        }
+
+    def updates_sent(self, asset_id, failed_ids):
+        pass
+
+    def make_updates(self, asset_id, workflow, status, resume=False):
+        """Return a scripted upsert for every bucket with detections."""
+        updates = []
+        for start in sorted(self.buckets):
+            entries = [{"Name": name, "Confidence": confidence, "Count": count}
+                       for name, (count, confidence) in sorted(self.buckets[start].items())]
+            body = {
+                "scripted_upsert": True,
+                "script": {
+                    "lang": "painless",
+                    "source": UPDATE_SCRIPT,
+                    "params": {
+                        "asset_id": asset_id,
+                        "start": start,
+                        "end": start + self.bucket_ms,
+                        "field": self.field,
+                        "entries": entries,
+                        "resume": resume,
+                    }
+                },
+                "upsert": {}
+            }
+            updates.append(('{asset}-{start}'.format(asset=asset_id, start=start), body))
+        return updates
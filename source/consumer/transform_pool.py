@@ -0,0 +1,228 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Transform large paged results in worker processes.
+#
+# Lambda functions with more than 1769 MB of memory get more than one vCPU, but the transforms
+# run in a single Python thread. With TransformWorkers set to a number of processes, or to
+# "auto" for one per vCPU, paged results larger than TransformPoolThresholdBytes are split into
+# batches of pages and transformed by forked worker processes.
+#
+# Workers run the regular transforms with a client that does not send anything. Every bulk
+# payload the transform builds is encoded and passed back to the parent as NDJSON bytes, so no
+# Python objects are pickled on the way back. The parent only reads the S3 object, splits it into
+# raw page text without decoding it, hands out batches of pages and sends the payloads to the
+# domain. The indices the workers write to are resolved by the parent before it forks them.
+#
+# Lambda has no /dev/shm, so multiprocessing.Pool and Queue cannot be used. Each worker is a
+# Process with one Pipe for batches and one for results. Batches are handed out by a feeder
+# thread, so the parent never blocks writing a batch while a worker waits for it to read results.
+
+import json
+import multiprocessing
+import os
+import queue
+import threading
+from multiprocessing.connection import wait
+
+import structured_logger
+
+BATCH_BYTES = 10000000
+
+logger = structured_logger.get_logger()
+
+
+def get_worker_count():
+    workers = os.environ.get('TransformWorkers', '0').strip().lower()
+    if workers == 'auto':
+        return os.cpu_count() or 1
+    try:
+        return int(workers)
+    except ValueError:
+        logger.warning("transform_pool", "Invalid TransformWorkers, transforms run in the handler process")
+        return 0
+
+
+def get_threshold():
+    return int(os.environ.get('TransformPoolThresholdBytes', 50000000))
+
+
+def should_use_pool(content_length):
+    return get_worker_count() > 1 and content_length > get_threshold()
+
+
+class ChunkCollector:
+    """Stands in for the Elasticsearch client in a worker and passes each request back as NDJSON bytes."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def bulk(self, body, index=None, **kwargs):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self._connection.send(("chunk", index, body))
+        return {}
+
+    def index(self, index, body, id=None, **kwargs):
+        action = {"_index": index, "_type": "_doc"}
+        if id is not None:
+            action["_id"] = id
+        payload = json.dumps({"index": action}) + '\n' + json.dumps(body)
+        return self.bulk(payload, index=index)
+
+
+def run_worker(transform, client_override, tasks, results):
+    client_override.set(ChunkCollector(results))
+    while True:
+        batch = tasks.recv_bytes()
+        if not batch:
+            break
+        try:
+            result = transform(batch.decode('utf-8'))
+        except Exception as e:
+            results.send(("error", None, str(e)))
+        else:
+            if result is not None:
+                results.send(("result", None, result))
+        results.send(("done", None, None))
+    results.send(("exit", None, None))
+
+
+def iter_batches(raw_pages, batch_bytes):
+    """Join raw page text into JSON arrays of roughly `batch_bytes` each."""
+    batch = []
+    size = 0
+    for page in raw_pages:
+        batch.append(page)
+        size += len(page)
+        if size >= batch_bytes:
+            yield ('[' + ','.join(batch) + ']').encode('utf-8')
+            batch = []
+            size = 0
+    if batch:
+        yield ('[' + ','.join(batch) + ']').encode('utf-8')
+
+
+def send_chunk(es_object, index, body):
+    """Send one bulk payload. Returns False if it could not be sent or some of its documents were rejected."""
+    try:
+        response = es_object.bulk(index=index, body=body)
+    except Exception as e:
+        logger.error("transform_pool", "Unable to load data into elasticsearch", index=index, error=e)
+        return False
+    if isinstance(response, dict) and response.get("errors"):
+        logger.error("transform_pool", "Some documents were not indexed", index=index)
+        return False
+    logger.info("bulk_index", "Successfully stored data in elasticsearch", index=index)
+    return True
+
+
+def transform_in_workers(raw_pages, transform, es_object, client_override, workers=None, batch_bytes=None,
+                         on_result=None):
+    """Run `transform` on batches of `raw_pages` in worker processes and send the results with `es_object`.
+
+    `transform` is called in a worker with a JSON array of pages, and `client_override` is the
+    context variable that makes connect_es return the worker's collector. A value other than
+    None returned by `transform` is passed to `on_result` in this process. Returns the number
+    of batches and of payloads that were sent.
+    """
+    workers = workers or get_worker_count()
+    batch_bytes = batch_bytes or BATCH_BYTES
+    context = multiprocessing.get_context('fork')
+    processes = []
+    task_connections = []
+    result_connections = []
+    for _ in range(workers):
+        task_reader, task_writer = context.Pipe(duplex=False)
+        result_reader, result_writer = context.Pipe(duplex=False)
+        process = context.Process(target=run_worker, args=(transform, client_override, task_reader, result_writer),
+                                  daemon=True)
+        process.start()
+        task_reader.close()
+        result_writer.close()
+        processes.append(process)
+        task_connections.append(task_writer)
+        result_connections.append(result_reader)
+
+    # Workers that are ready for a batch. Each worker has one batch at a time.
+    idle = queue.Queue()
+    for worker in range(workers):
+        idle.put(worker)
+    stats = {"Batches": 0, "Chunks": 0, "Errors": 0}
+    feeder_error = []
+
+    def feed():
+        try:
+            for batch in iter_batches(raw_pages, batch_bytes):
+                while True:
+                    worker = idle.get()
+                    if worker is None:
+                        return
+                    try:
+                        task_connections[worker].send_bytes(batch)
+                    except OSError:
+                        # The worker is gone, the main loop logs it. Try the next one.
+                        continue
+                    stats["Batches"] += 1
+                    break
+        except Exception as e:
+            feeder_error.append(e)
+        finally:
+            for connection in task_connections:
+                try:
+                    connection.send_bytes(b'')
+                except OSError:
+                    pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    running = {connection: worker for worker, connection in enumerate(result_connections)}
+    try:
+        while running:
+            for connection in wait(list(running)):
+                worker = running[connection]
+                try:
+                    kind, index, body = connection.recv()
+                except EOFError:
+                    logger.error("transform_pool", "Transform worker exited unexpectedly", worker=worker)
+                    stats["Errors"] += 1
+                    del running[connection]
+                    if not running:
+                        idle.put(None)
+                    continue
+                if kind == "chunk":
+                    if not send_chunk(es_object, index, body):
+                        stats["Errors"] += 1
+                    stats["Chunks"] += 1
+                elif kind == "result":
+                    if on_result is not None:
+                        on_result(body)
+                elif kind == "error":
+                    logger.error("transform_pool", "Transform failed in worker", worker=worker, error=body)
+                    stats["Errors"] += 1
+                elif kind == "done":
+                    idle.put(worker)
+                elif kind == "exit":
+                    del running[connection]
+    finally:
+        idle.put(None)
+        feeder.join()
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+        for connection in task_connections + result_connections:
+            connection.close()
+    if feeder_error:
+        raise feeder_error[0]
+    return stats
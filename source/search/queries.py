@@ -0,0 +1,212 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Typed queries of the search service.
+#
+# Asset queries return the documents of one kind of result for one asset, such as its labels or
+# its shots, from the index the consumer writes them to. Collection queries search the asset
+# catalog for the assets whose filename or terms match.
+#
+# Suggestion queries return the labels, celebrities, entities, key phrases and lines of text that
+# start with a prefix, from the completion field of the suggestion index.
+#
+# Asset and collection queries return at most `size` hits sorted in a fixed order, with a `Next` token when there may be
+# more. Passing the token back as `after` returns the following page. The token holds the sort
+# values of the last hit and the page is read with search_after, so there is no limit on the
+# number of hits that can be paged through. Only the fields of the query's kind are returned
+# from _source. Ties in the sort order of asset queries are broken on the DocumentKey the
+# consumer gives every document while SearchGenerations is on, see
+# source/consumer/asset_generation.py. Documents without one are sorted last, and can repeat
+# across pages until `backfill.py --document-keys` gives them one.
+
+import base64
+import binascii
+import collections
+import json
+
+DEFAULT_SIZE = 1000
+MAX_SIZE = 10000
+
+AssetQuery = collections.namedtuple('AssetQuery', ['index', 'time_field', 'fields'])
+
+# Kind of result to the indices, the field the hits are sorted on and the fields returned.
+ASSET_QUERIES = {
+    "labels": AssetQuery("mielabels", "Timestamp",
+                         ("Name", "Confidence", "Timestamp", "Instances", "Parents", "Operator")),
+    "celebrities": AssetQuery("miecelebrity_detection", "Timestamp",
+                              ("Name", "Confidence", "Timestamp", "BoundingBox", "URL")),
+    "moderation": AssetQuery("miecontent_moderation", "Timestamp",
+                             ("Name", "ParentName", "Confidence", "Timestamp")),
+    "faces": AssetQuery("mieface_detection", "Timestamp",
+                        ("Confidence", "Timestamp", "BoundingBox", "AgeRange", "Gender", "Emotions")),
+    "text": AssetQuery("mietextdetection", "Timestamp",
+                       ("DetectedText", "Type", "Confidence", "Timestamp", "BoundingBox")),
+    "shots": AssetQuery("mieshots", "StartTimestamp",
+                        ("Index", "Confidence", "StartTimestamp", "EndTimestamp")),
+    "cues": AssetQuery("mietechnical_cues", "StartTimestamp",
+                       ("Type", "Confidence", "StartTimestamp", "EndTimestamp")),
+    "entities": AssetQuery("mieentities", "BeginOffset",
+                           ("EntityText", "EntityType", "Confidence", "BeginOffset", "EndOffset")),
+    "keyphrases": AssetQuery("miekey_phrases", "BeginOffset",
+                             ("PhraseText", "Confidence", "BeginOffset", "EndOffset")),
+    # Transcripts of videos and of audio files are kept in different indices. The transcript
+    # times are stored as strings, so its words are not sorted by time.
+    "transcript": AssetQuery("mievideotranscript,mieaudiotranscript", None,
+                             ("content", "confidence", "start_time", "end_time", "type", "transcript")),
+}
+# Unique keyword of every document, must match DOCUMENT_KEY in source/consumer/asset_generation.py.
+DOCUMENT_KEY = "DocumentKey.keyword"
+CATALOG_INDEX = 'mieassetcatalog'
+# Fields of the catalog that a collection query matches and the fields it returns by default.
+CATALOG_SEARCH_FIELDS = ("Filename", "Labels", "Celebrities", "Entities", "KeyPhrases", "Text")
+CATALOG_FIELDS = ("AssetId", "Filename", "Created", "CaptionLanguages") + CATALOG_SEARCH_FIELDS[1:]
+CATALOG_DEFAULT_FIELDS = ("AssetId", "Filename", "Created")
+SUGGESTIONS_INDEX = 'miesuggestions'
+SUGGESTION_FIELDS = CATALOG_SEARCH_FIELDS[1:]
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 100
+
+
+class QueryError(ValueError):
+    """The parameters of a query are not valid."""
+
+
+def encode_token(sort_values):
+    return base64.urlsafe_b64encode(json.dumps(sort_values, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_token(token):
+    try:
+        sort_values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, binascii.Error):
+        raise QueryError("Invalid page token")
+    if not isinstance(sort_values, list):
+        raise QueryError("Invalid page token")
+    return sort_values
+
+
+def parse_size(params, default=DEFAULT_SIZE, maximum=MAX_SIZE):
+    try:
+        size = int(params.get('size', default))
+    except ValueError:
+        raise QueryError("size must be a number")
+    if not 0 < size <= maximum:
+        raise QueryError("size must be between 1 and {max}".format(max=maximum))
+    return size
+
+
+def parse_number(params, name):
+    if params.get(name) in (None, ''):
+        return None
+    try:
+        return float(params[name])
+    except ValueError:
+        raise QueryError("{name} must be a number".format(name=name))
+
+
+def parse_fields(params, allowed, default=None):
+    """Return the fields listed in the comma separated `fields` parameter, or the default fields."""
+    if not params.get('fields'):
+        return list(default or allowed)
+    fields = [field.strip() for field in params['fields'].split(',') if field.strip()]
+    unknown = sorted(set(fields).difference(allowed))
+    if unknown:
+        raise QueryError("Unknown fields: {fields}".format(fields=", ".join(unknown)))
+    return fields
+
+
+def page_body(body, size, params):
+    body["size"] = size
+    body["track_total_hits"] = True
+    if params.get('after'):
+        body["search_after"] = decode_token(params['after'])
+    return body
+
+
+def asset_search(asset_id, kind, params):
+    """Return the (index, body) of an asset query."""
+    query = ASSET_QUERIES.get(kind)
+    if query is None:
+        raise QueryError("Unknown kind of result: {kind}".format(kind=kind))
+    filters = [{"term": {"AssetId.keyword": asset_id}}]
+    min_confidence = parse_number(params, 'min_confidence')
+    if min_confidence is not None:
+        filters.append({"range": {"Confidence": {"gte": min_confidence}}})
+    start, end = parse_number(params, 'start'), parse_number(params, 'end')
+    if query.time_field is not None and (start is not None or end is not None):
+        time_range = {key: value for key, value in (("gte", start), ("lte", end)) if value is not None}
+        filters.append({"range": {query.time_field: time_range}})
+    if params.get('operator'):
+        filters.append({"match": {"Operator": params['operator']}})
+    sort = [{DOCUMENT_KEY: {"order": "asc", "missing": "_last", "unmapped_type": "keyword"}}]
+    if query.time_field is not None:
+        sort.insert(0, {query.time_field: {"order": "asc", "missing": "_first", "unmapped_type": "long"}})
+    body = {
+        "query": {"bool": {"filter": filters}},
+        "sort": sort,
+        "_source": parse_fields(params, query.fields),
+    }
+    return query.index, page_body(body, parse_size(params), params)
+
+
+def collection_search(params):
+    """Return the (index, body) of a collection query."""
+    filters = []
+    for param, field in (("label", "Labels.keyword"), ("celebrity", "Celebrities.keyword"),
+                         ("language", "CaptionLanguages")):
+        if params.get(param):
+            filters.append({"term": {field: params[param]}})
+    if params.get('q'):
+        must = [{"multi_match": {"query": params['q'], "fields": list(CATALOG_SEARCH_FIELDS)}}]
+        sort = [{"_score": "desc"}, {"AssetId": "asc"}]
+    else:
+        must = [{"match_all": {}}]
+        sort = [{"AssetId": "asc"}]
+    body = {
+        "query": {"bool": {"must": must, "filter": filters}},
+        "sort": sort,
+        "_source": parse_fields(params, CATALOG_FIELDS, CATALOG_DEFAULT_FIELDS),
+    }
+    return CATALOG_INDEX, page_body(body, parse_size(params), params)
+
+
+def make_response(response, size):
+    """Return the hits of a search response, with the token of the next page if there may be one."""
+    hits = response["hits"]["hits"]
+    total = response["hits"].get("total", {})
+    return {
+        "Hits": [hit.get("_source", {}) for hit in hits],
+        "Total": total.get("value") if isinstance(total, dict) else total,
+        "Next": encode_token(hits[-1]["sort"]) if len(hits) == size else None,
+    }
+
+
+def suggestion_search(params):
+    """Return the (index, body) of a suggestion query."""
+    prefix = params.get('prefix', '').strip()
+    if not prefix:
+        raise QueryError("prefix is required")
+    completion = {"field": "Suggest", "size": parse_size(params, DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS)}
+    if params.get('field'):
+        completion["contexts"] = {"field": parse_fields({"fields": params['field']}, SUGGESTION_FIELDS)}
+    body = {
+        "_source": ["Field", "Term", "Assets"],
+        "suggest": {"terms": {"prefix": prefix, "completion": completion}},
+    }
+    return SUGGESTIONS_INDEX, body
+
+
+def make_suggestions(response):
+    """Return the terms of a suggestion response, most common first."""
+    options = response["suggest"]["terms"][0]["options"]
+    return {"Suggestions": [option["_source"] for option in options]}
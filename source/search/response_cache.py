@@ -0,0 +1,107 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Cache of search responses.
+#
+# A response for an asset is cached with the generation the asset had when it was searched. The
+# consumer starts a new generation of the asset after every record it processes for it, see
+# source/consumer/asset_generation.py, and the cached response is only used while the asset
+# is still at that generation. An asset without a generation, because it was last written before
+# the consumer wrote generations, is searched every time.
+#
+# Collection responses depend on every asset, so they are cached for CollectionCacheSeconds
+# instead. Both are kept in memory on the warm container, least recently used first out, up to
+# SearchCacheBytes of response bodies and for at most SearchCacheTtlSeconds. The cache is
+# disabled when SearchCacheBytes is 0.
+
+import collections
+import logging
+import os
+import time
+
+# Must match GENERATION_KEY in source/consumer/asset_generation.py.
+GENERATION_KEY = 'private/assets/{asset}/search/generation'
+
+logger = logging.getLogger()
+
+
+class ResponseCache:
+    """LRU cache of request key to (generation, response body, time cached)."""
+
+    def __init__(self, max_bytes=None, ttl_seconds=None):
+        if max_bytes is None:
+            max_bytes = int(os.environ.get('SearchCacheBytes', 100000000))
+        if ttl_seconds is None:
+            ttl_seconds = int(os.environ.get('SearchCacheTtlSeconds', 3600))
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size = 0
+        self._entries = collections.OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key, generation):
+        """Return the body cached for the key at the generation, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        cached_generation, body, cached_at = entry
+        if cached_generation != generation or time.monotonic() - cached_at > self.ttl_seconds:
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return body
+
+    def put(self, key, generation, body):
+        if not self.enabled or generation is None or len(body) > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = (generation, body, time.monotonic())
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _key, (_generation, evicted, _cached_at) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+class GenerationReader:
+    """Reads the generation of each asset from the dataplane bucket."""
+
+    def __init__(self, s3_client, bucket):
+        self.s3_client = s3_client
+        self.bucket = bucket
+
+    def current(self, asset_id):
+        """Return the ETag of the asset's generation object, or None if it cannot be read."""
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket, Key=GENERATION_KEY.format(asset=asset_id))['ETag']
+        except Exception as e:
+            # Missing objects are reported as 403 without s3:ListBucket.
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') not in ('403', '404', 'NoSuchKey'):
+                logger.warning("Unable to read the generation of asset %s: %s", asset_id, e)
+            return None
+
+
+def collection_generation(ttl_seconds=None):
+    """Return the generation of the collection, which changes every CollectionCacheSeconds."""
+    if ttl_seconds is None:
+        ttl_seconds = int(os.environ.get('CollectionCacheSeconds', 30))
+    if ttl_seconds <= 0:
+        return None
+    return int(time.time() // ttl_seconds)
@@ -0,0 +1,176 @@
+######################################################################################################################
+#  Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.                                                #
+#                                                                                                                    #
+#  Licensed under the Apache License, Version 2.0 (the "License"). You may not use this file except in compliance    #
+#  with the License. A copy of the License is located at                                                             #
+#                                                                                                                    #
+#      http://www.apache.org/licenses/LICENSE-2.0                                                                    #
+#                                                                                                                    #
+#  or in the 'license' file accompanying this file. This file is distributed on an 'AS IS' BASIS, WITHOUT WARRANTIES #
+#  OR CONDITIONS OF ANY KIND, express or implied. See the License for the specific language governing permissions    #
+#  and limitations under the License.                                                                                #
+######################################################################################################################
+
+# Search service of the web application.
+#
+# Answers typed queries instead of passing free form query strings to the domain:
+#
+#   GET /assets/{asset_id}/{kind}  results of one kind for an asset, see queries.ASSET_QUERIES
+#                                  parameters: size, after, fields, min_confidence, start, end, operator
+#   GET /search                    assets of the collection, from the asset catalog
+#                                  parameters: q, label, celebrity, language, size, after, fields
+#   GET /suggest                   terms that start with a prefix, for type-ahead
+#                                  parameters: prefix, field, size
+#
+# Asset and collection responses are {"Hits": [...], "Total": n, "Next": token}. Pass Next back
+# as `after` to read the following page. Suggestion responses are {"Suggestions": [...]}. Repeated queries are answered from response_cache until the consumer writes to
+# the asset again.
+#
+# The handler accepts API Gateway and Lambda function URL events. To run the service locally
+# against a domain, with the same environment variables as the function:
+#
+#   EsEndpoint=... DataplaneBucket=... python3 search_service.py --port 8080
+
+import argparse
+import functools
+import json
+import logging
+import os
+import re
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import boto3
+from botocore import config
+from elasticsearch import Elasticsearch, RequestsHttpConnection
+from requests_aws4auth import AWS4Auth
+
+import queries
+import response_cache
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+es_endpoint = os.environ['EsEndpoint']
+dataplane_bucket = os.environ['DataplaneBucket']
+config = config.Config(**json.loads(os.environ.get('botoConfig', '{}')))
+
+s3 = boto3.client('s3', config=config)
+responses = response_cache.ResponseCache()
+generations = response_cache.GenerationReader(s3, dataplane_bucket)
+es_client = None
+
+ASSET_PATH = re.compile(r'^/assets/([0-9A-Za-z-]+)/([a-z]+)/?$')
+SEARCH_PATH = re.compile(r'^/search/?$')
+SUGGEST_PATH = re.compile(r'^/suggest/?$')
+HEADERS = {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*",
+    "Cache-Control": "no-cache",
+}
+
+
+class NotFound(Exception):
+    """The path does not name a query."""
+
+
+def connect_es(endpoint):
+    """Return the client of the domain, connecting on first use."""
+    global es_client
+    if es_client is None:
+        session = boto3.Session()
+        credentials = session.get_credentials()
+        awsauth = AWS4Auth(credentials.access_key, credentials.secret_key, session.region_name, 'es',
+                           session_token=credentials.token)
+        es_client = Elasticsearch(
+            hosts=[{'host': endpoint, 'port': 443}],
+            use_ssl=True,
+            verify_certs=True,
+            http_auth=awsauth,
+            connection_class=RequestsHttpConnection)
+    return es_client
+
+
+def plan(path, params):
+    """Return the (cache key, generation, index, body, search options, response maker) of the query a request names."""
+    options = {}
+    match = ASSET_PATH.match(path)
+    if match:
+        asset_id, kind = match.groups()
+        index, body = queries.asset_search(asset_id, kind, params)
+        generation = generations.current(asset_id) if responses.enabled else None
+        # An asset has the results of some operators only, such as a video or an audio transcript.
+        options["ignore_unavailable"] = True
+    elif SEARCH_PATH.match(path):
+        index, body = queries.collection_search(params)
+        generation = response_cache.collection_generation()
+    elif SUGGEST_PATH.match(path):
+        index, body = queries.suggestion_search(params)
+        generation = response_cache.collection_generation()
+    else:
+        raise NotFound(path)
+    key = json.dumps([path.rstrip('/'), sorted(params.items())])
+    if "suggest" in body:
+        return key, generation, index, body, options, queries.make_suggestions
+    return key, generation, index, body, options, functools.partial(queries.make_response, size=body["size"])
+
+
+def search(path, params):
+    """Return the (status code, body, cache status) of a request."""
+    try:
+        key, generation, index, body, options, make_response = plan(path, params)
+    except NotFound:
+        return 404, json.dumps({"Error": "Not found"}), None
+    except queries.QueryError as e:
+        return 400, json.dumps({"Error": str(e)}), None
+    cached = responses.get(key, generation) if generation is not None else None
+    if cached is not None:
+        return 200, cached, "Hit"
+    try:
+        response = connect_es(es_endpoint).search(index=index, body=body, **options)
+    except Exception as e:
+        logger.error("Search of %s failed: %s", index, e)
+        return 502, json.dumps({"Error": "Search failed"}), None
+    result = json.dumps(make_response(response), separators=(',', ':'))
+    responses.put(key, generation, result)
+    return 200, result, "Miss"
+
+
+def lambda_handler(event, context):
+    path = event.get('rawPath') or event.get('path') or '/'
+    params = event.get('queryStringParameters') or {}
+    status, body, cache_status = search(path, params)
+    headers = dict(HEADERS)
+    if cache_status is not None:
+        headers["X-Cache"] = cache_status
+    return {"statusCode": status, "headers": headers, "body": body}
+
+
+class LocalHandler(BaseHTTPRequestHandler):
+    """Serves the Lambda handler over HTTP."""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        response = lambda_handler({"rawPath": url.path, "queryStringParameters": dict(parse_qsl(url.query))}, None)
+        body = response["body"].encode('utf-8')
+        self.send_response(response["statusCode"])
+        for name, value in response["headers"].items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the search service locally.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    logging.basicConfig()
+    server = HTTPServer((args.host, args.port), LocalHandler)
+    logger.info("Serving on http://%s:%d", args.host, args.port)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Offline micro-benchmarks for the consumer's operator transforms.
+
+Each operator result is generated synthetically (see synthetic_results.py), then run through
+process_modify_metadata with OpenSearch replaced by an in-memory sink. For every operator and
+media duration the benchmark reports:
+
+  * time_ms    - median wall-clock time of the transform and bulk payload encoding
+  * peak_kib   - peak memory traced by tracemalloc while the transform runs
+  * blocks     - allocated memory blocks still alive when a bulk payload is sent, which is
+                 roughly the number of Python objects the transform has materialized
+  * docs       - number of documents sent to the sink
+  * sent_kib   - size of the payloads sent to the sink
+
+Results are compared with baselines.json so regressions show up as numbers in a local run. A metric
+only counts as a regression when it is both more than --tolerance above the baseline and more than
+an absolute floor above it (--min-delta-ms for time, MIN_DELTAS for the rest), so sub-millisecond
+cases do not get flagged for scheduler noise.
+
+Usage:
+    python benchmark_transforms.py [--operator labelDetection ...] [--duration 60 600 ...]
+                                   [--repeat 5] [--min-delta-ms 5] [--update-baselines]
+                                   [--fail-on-regression]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import synthetic_results
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+BASELINES_FILE = os.path.join(BENCHMARK_DIR, 'baselines.json')
+CONSUMER_DIR = os.path.realpath(os.path.join(BENCHMARK_DIR, '..', '..', '..', 'source', 'consumer'))
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+WORKFLOW_ID = '11111111-2222-3333-4444-555555555555'
+METRICS = ['time_ms', 'peak_kib', 'blocks']
+# Smallest absolute increase over the baseline that can count as a regression
+MIN_DELTAS = {'time_ms': 5, 'peak_kib': 64, 'blocks': 500}
+
+
+class InMemorySink:
+    """Stands in for the Elasticsearch client. Counts what would be sent and discards it."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.docs = 0
+        self.bytes_sent = 0
+        self.peak_blocks = 0
+
+    def _record(self, body):
+        self.peak_blocks = max(self.peak_blocks, sys.getallocatedblocks())
+        if isinstance(body, (str, bytes)):
+            self.bytes_sent += len(body)
+            self.docs += body.count('\n' if isinstance(body, str) else b'\n') // 2 + 1
+        else:
+            self.bytes_sent += len(json.dumps(body))
+            self.docs += 1
+
+    def bulk(self, body, index=None, **kwargs):
+        self._record(body)
+        return {"errors": False, "items": []}
+
+    def index(self, index, body, **kwargs):
+        self._record(body)
+        return {"result": "created"}
+
+
+def load_consumer():
+    os.environ.setdefault('botoConfig', '{}')
+    os.environ.setdefault('EsEndpoint', 'benchmark')
+    os.environ.setdefault('DataplaneBucket', 'benchmark')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('LogLevel', 'WARNING')
+    sys.path.insert(0, CONSUMER_DIR)
+    import lambda_handler
+    return lambda_handler
+
+
+def run_once(consumer, operator, results):
+    metadata = {"Status": "Success", "Results": results, "ContentLength": len(results)}
+    consumer.process_modify_metadata(ASSET_ID, WORKFLOW_ID, operator, metadata)
+
+
+def benchmark(consumer, sink, operator, duration, repeat):
+    results = synthetic_results.generate(operator, duration)
+
+    times = []
+    for _ in range(repeat):
+        sink.reset()
+        start = time.perf_counter()
+        run_once(consumer, operator, results)
+        times.append((time.perf_counter() - start) * 1000)
+
+    sink.reset()
+    baseline_blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    run_once(consumer, operator, results)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "input_kib": round(len(results) / 1024, 1),
+        "time_ms": round(statistics.median(times), 2),
+        "peak_kib": round(peak / 1024, 1),
+        "blocks": max(sink.peak_blocks - baseline_blocks, 0),
+        "docs": sink.docs,
+        "sent_kib": round(sink.bytes_sent / 1024, 1),
+    }
+
+
+def compare(name, result, baseline, tolerance, min_deltas=MIN_DELTAS):
+    """Return the formatted row and the list of metrics that regressed.
+
+    A metric regresses when it grew by more than tolerance relative to the baseline and by more
+    than its absolute floor in min_deltas.
+    """
+    regressions = []
+    cells = []
+    for metric in METRICS:
+        value = result[metric]
+        if baseline and baseline.get(metric):
+            delta = value - baseline[metric]
+            change = delta / baseline[metric]
+            flag = ' !' if change > tolerance and delta > min_deltas.get(metric, 0) else ''
+            if flag:
+                regressions.append(metric)
+            cells.append('{:>12} {:>+7.1%}{:2}'.format(value, change, flag))
+        else:
+            cells.append('{:>12} {:>7}  '.format(value, 'new'))
+    if baseline and (baseline.get('docs'), baseline.get('sent_kib')) != (result['docs'], result['sent_kib']):
+        cells.append('output changed')
+    return '{:<32}{:>10}{:>8}'.format(name, result['input_kib'], result['docs']) + ''.join(cells), regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operator', nargs='+', choices=sorted(synthetic_results.GENERATORS),
+                        default=sorted(synthetic_results.GENERATORS), help='operators to benchmark')
+    parser.add_argument('--duration', nargs='+', type=int, default=[60, 600],
+                        help='media durations in seconds to generate results for')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per case, the median is reported')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative increase over the baseline that counts as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=MIN_DELTAS['time_ms'],
+                        help='time increases smaller than this many milliseconds are never regressions')
+    parser.add_argument('--update-baselines', action='store_true', help='store these results as the new baselines')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 on regressions')
+    args = parser.parse_args(argv)
+
+    consumer = load_consumer()
+    sink = InMemorySink()
+    consumer.connect_es = lambda endpoint: sink
+
+    baselines = {}
+    if os.path.exists(BASELINES_FILE):
+        with open(BASELINES_FILE) as f:
+            baselines = json.load(f)
+
+    min_deltas = dict(MIN_DELTAS, time_ms=args.min_delta_ms)
+    header = '{:<32}{:>10}{:>8}'.format('case', 'input_kib', 'docs') + ''.join(
+        '{:>12} {:>7}  '.format(metric, 'change') for metric in METRICS)
+    print(header)
+    print('-' * len(header))
+    results = {}
+    regressed = []
+    for operator in args.operator:
+        for duration in args.duration:
+            name = '{}@{}s'.format(operator, duration)
+            results[name] = benchmark(consumer, sink, operator, duration, args.repeat)
+            row, regressions = compare(name, results[name], baselines.get(name), args.tolerance, min_deltas)
+            print(row)
+            regressed.extend('{} {}'.format(name, metric) for metric in regressions)
+
+    if regressed:
+        print('\nRegressions over {:.0%} (and {} ms):'.format(args.tolerance, args.min_delta_ms))
+        for regression in regressed:
+            print('  ' + regression)
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(BASELINES_FILE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('\nUpdated ' + BASELINES_FILE)
+
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Generate synthetic operator results that look like the ones stored in the dataplane bucket.
+
+The generators mimic the shape of Rekognition, Transcribe and Comprehend results as Media
+Insights on AWS stores them: paged Rekognition results are a list of pages with up to 1000
+items each, and numbers are serialized as strings. The amount of data scales with the media
+duration, using densities measured on real results (see test/unit/consumer/operators).
+"""
+
+import json
+import random
+
+PAGE_SIZE = 1000
+VIDEO_METADATA = {
+    "Codec": "h264", "DurationMillis": 0, "Format": "QuickTime / MOV", "FrameRate": "30.0",
+    "FrameHeight": 540, "FrameWidth": 960, "ColorRange": "LIMITED"
+}
+LABEL_NAMES = [
+    "Person", "Human", "Car", "Vehicle", "Tree", "Plant", "Food", "Table", "Furniture", "Building",
+    "City", "Road", "Sky", "Outdoors", "Water", "Dog", "Animal", "Pet", "Clothing", "Apparel", "Text",
+    "Electronics", "Computer", "Screen", "Monitor", "Chair", "Kitchen", "Indoors", "Room", "Sign"
+]
+CELEBRITY_NAMES = ["Jane Roe", "John Doe", "Laura Dotson", "Max Mustermann", "Erika Musterfrau"]
+WORDS = [
+    "welcome", "back", "to", "the", "show", "about", "everything", "local", "from", "farm", "table",
+    "today", "we", "are", "talking", "with", "chef", "market", "fresh", "season", "launch", "city"
+]
+EMOTIONS = ["HAPPY", "SAD", "ANGRY", "CONFUSED", "DISGUSTED", "SURPRISED", "CALM", "FEAR"]
+LANDMARKS = ["eyeLeft", "eyeRight", "mouthLeft", "mouthRight", "nose"]
+MODERATION_LABELS = [("Suggestive", ""), ("Revealing Clothes", "Suggestive"), ("Violence", ""),
+                     ("Weapons", "Violence"), ("Alcohol", "Drugs & Tobacco")]
+ENTITY_TYPES = ["PERSON", "LOCATION", "ORGANIZATION", "DATE", "QUANTITY", "EVENT", "TITLE"]
+
+
+def num(rng, low=0.0, high=1.0):
+    return str(rng.uniform(low, high))
+
+
+def bounding_box(rng):
+    return {"Width": num(rng, 0.02, 0.4), "Height": num(rng, 0.02, 0.4),
+            "Left": num(rng, 0, 0.6), "Top": num(rng, 0, 0.6)}
+
+
+def face_details(rng):
+    return {
+        "BoundingBox": bounding_box(rng),
+        "Landmarks": [{"Type": t, "X": num(rng), "Y": num(rng)} for t in LANDMARKS],
+        "Pose": {"Roll": num(rng, -30, 30), "Yaw": num(rng, -30, 30), "Pitch": num(rng, -30, 30)},
+        "Quality": {"Brightness": num(rng, 20, 90), "Sharpness": num(rng, 20, 90)},
+        "Confidence": num(rng, 80, 100)
+    }
+
+
+def timestamps(rng, duration, per_second):
+    """Yield sorted timestamps in milliseconds at an average rate of `per_second`."""
+    count = int(duration * per_second)
+    for i in range(count):
+        yield int(i * 1000 / per_second) + rng.randint(0, 10)
+
+
+def paginate(key, items, duration):
+    metadata = dict(VIDEO_METADATA, DurationMillis=int(duration * 1000))
+    pages = [
+        {"JobStatus": "SUCCEEDED", "VideoMetadata": metadata, key: items[i:i + PAGE_SIZE]}
+        for i in range(0, len(items), PAGE_SIZE)
+    ]
+    return pages or [{"JobStatus": "SUCCEEDED", "VideoMetadata": metadata, key: []}]
+
+
+def label_detection(rng, duration):
+    items = []
+    for timestamp in timestamps(rng, duration, 55):
+        name = rng.choice(LABEL_NAMES)
+        instances = [{"BoundingBox": bounding_box(rng), "Confidence": num(rng, 50, 100)}
+                     for _ in range(rng.choice([0, 0, 1, 2]))]
+        items.append({"Timestamp": timestamp, "Label": {
+            "Name": name, "Confidence": num(rng, 50, 100), "Instances": instances,
+            "Parents": [{"Name": rng.choice(LABEL_NAMES)} for _ in range(rng.randint(0, 2))]}})
+    return paginate("Labels", items, duration)
+
+
+def face_detection(rng, duration):
+    items = []
+    for timestamp in timestamps(rng, duration, 3):
+        face = face_details(rng)
+        face.update({
+            "AgeRange": {"Low": rng.randint(10, 40), "High": rng.randint(41, 70)},
+            "Smile": {"Value": rng.random() > 0.5, "Confidence": num(rng, 50, 100)},
+            "Eyeglasses": {"Value": rng.random() > 0.8, "Confidence": num(rng, 50, 100)},
+            "Sunglasses": {"Value": rng.random() > 0.9, "Confidence": num(rng, 50, 100)},
+            "Gender": {"Value": rng.choice(["Male", "Female"]), "Confidence": num(rng, 50, 100)},
+            "Beard": {"Value": rng.random() > 0.7, "Confidence": num(rng, 50, 100)},
+            "Mustache": {"Value": rng.random() > 0.8, "Confidence": num(rng, 50, 100)},
+            "EyesOpen": {"Value": rng.random() > 0.2, "Confidence": num(rng, 50, 100)},
+            "MouthOpen": {"Value": rng.random() > 0.5, "Confidence": num(rng, 50, 100)},
+            "Emotions": [{"Type": t, "Confidence": num(rng, 0, 100)} for t in EMOTIONS],
+        })
+        items.append({"Timestamp": timestamp, "Face": face})
+    return paginate("Faces", items, duration)
+
+
+def celebrity_recognition(rng, duration):
+    items = []
+    for timestamp in timestamps(rng, duration, 0.5):
+        name = rng.choice(CELEBRITY_NAMES)
+        items.append({"Timestamp": timestamp, "Celebrity": {
+            "Urls": ["www.wikidata.org/wiki/Q{}".format(rng.randint(1000, 99999))], "Name": name,
+            "Id": "id{}".format(CELEBRITY_NAMES.index(name)), "Confidence": num(rng, 60, 100),
+            "Face": face_details(rng), "KnownGender": {"Type": rng.choice(["Female", "Male"])}}})
+    return paginate("Celebrities", items, duration)
+
+
+def text_detection(rng, duration):
+    items = []
+    for index, timestamp in enumerate(timestamps(rng, duration, 4)):
+        box = bounding_box(rng)
+        items.append({"Timestamp": timestamp, "TextDetection": {
+            "DetectedText": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))),
+            "Type": rng.choice(["LINE", "WORD"]), "Id": index % 50, "Confidence": num(rng, 80, 100),
+            "Geometry": {"BoundingBox": box, "Polygon": [{"X": num(rng), "Y": num(rng)} for _ in range(4)]}}})
+    return paginate("TextDetections", items, duration)
+
+
+def content_moderation(rng, duration):
+    items = []
+    for timestamp in timestamps(rng, duration, 0.5):
+        name, parent = rng.choice(MODERATION_LABELS)
+        items.append({"Timestamp": timestamp, "ModerationLabel": {
+            "Confidence": num(rng, 50, 100), "Name": name, "ParentName": parent}})
+    return paginate("ModerationLabels", items, duration)
+
+
+def face_search(rng, duration):
+    items = []
+    for timestamp in timestamps(rng, duration, 2):
+        person = {"Index": rng.randint(0, 20), "BoundingBox": bounding_box(rng), "Face": face_details(rng)}
+        item = {"Timestamp": timestamp, "Person": person}
+        if rng.random() > 0.7:
+            item["FaceMatches"] = [{"Similarity": num(rng, 80, 100), "Face": {
+                "FaceId": "face-{}".format(rng.randint(0, 10)), "BoundingBox": bounding_box(rng),
+                "ImageId": "image-{}".format(rng.randint(0, 10)), "Confidence": num(rng, 90, 100)}}]
+        items.append(item)
+    return paginate("Persons", items, duration)
+
+
+def segments(rng, duration, segment_type):
+    items = []
+    start = 0
+    index = 0
+    end_of_media = int(duration * 1000)
+    while start < end_of_media:
+        end = min(start + rng.randint(1000, 8000), end_of_media)
+        segment = {"Type": segment_type, "StartTimestampMillis": start, "EndTimestampMillis": end,
+                   "DurationMillis": end - start, "StartFrameNumber": start * 30 // 1000,
+                   "EndFrameNumber": end * 30 // 1000, "DurationFrames": (end - start) * 30 // 1000}
+        if segment_type == "SHOT":
+            segment["ShotSegment"] = {"Index": index, "Confidence": num(rng, 90, 100)}
+        else:
+            segment["TechnicalCueSegment"] = {"Type": rng.choice(["Content", "BlackFrames", "ColorBars"]),
+                                              "Confidence": num(rng, 90, 100)}
+        items.append(segment)
+        start = end
+        index += 1
+    return paginate("Segments", items, duration)
+
+
+def shot_detection(rng, duration):
+    return segments(rng, duration, "SHOT")
+
+
+def technical_cue_detection(rng, duration):
+    return segments(rng, duration, "TECHNICAL_CUE")
+
+
+def transcribe(rng, duration):
+    items = []
+    words = []
+    for timestamp in timestamps(rng, duration, 2.5):
+        word = rng.choice(WORDS)
+        words.append(word)
+        items.append({"start_time": str(timestamp / 1000), "end_time": str(timestamp / 1000 + 0.3),
+                      "alternatives": [{"confidence": num(rng, 0.5, 1), "content": word}], "type": "pronunciation"})
+        if rng.random() > 0.9:
+            items.append({"alternatives": [{"confidence": "0.0", "content": "."}], "type": "punctuation"})
+    return {"jobName": "transcribe-synthetic", "status": "COMPLETED",
+            "results": {"transcripts": [{"transcript": " ".join(words)}], "items": items}}
+
+
+def comprehend_entities(rng, duration):
+    entities = []
+    offset = 0
+    for _ in timestamps(rng, duration, 0.3):
+        text = rng.choice(CELEBRITY_NAMES + WORDS)
+        entities.append({"BeginOffset": offset, "EndOffset": offset + len(text), "Score": rng.random(),
+                         "Text": text, "Type": rng.choice(ENTITY_TYPES)})
+        offset += len(text) + rng.randint(5, 50)
+    return {"LanguageCode": "en", "Results": [json.dumps({"Entities": entities, "File": "transcript.txt"})]}
+
+
+def comprehend_key_phrases(rng, duration):
+    phrases = []
+    offset = 0
+    for _ in timestamps(rng, duration, 0.8):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        phrases.append({"BeginOffset": offset, "EndOffset": offset + len(text), "Score": rng.random(), "Text": text})
+        offset += len(text) + rng.randint(5, 50)
+    return {"LanguageCode": "en", "Results": [json.dumps({"KeyPhrases": phrases, "File": "transcript.txt"})]}
+
+
+# Maps the operator name that appears in the Kinesis record to its generator.
+GENERATORS = {
+    "labelDetection": label_detection,
+    "faceDetection": face_detection,
+    "celebrityRecognition": celebrity_recognition,
+    "textDetection": text_detection,
+    "contentModeration": content_moderation,
+    "face_search": face_search,
+    "shotDetection": shot_detection,
+    "technicalCueDetection": technical_cue_detection,
+    "TranscribeVideo": transcribe,
+    "entities": comprehend_entities,
+    "key_phrases": comprehend_key_phrases,
+}
+
+
+def generate(operator, duration, seed=0):
+    """Return the operator result for media of `duration` seconds as a JSON string."""
+    rng = random.Random(seed)
+    return json.dumps(GENERATORS[operator](rng, duration))
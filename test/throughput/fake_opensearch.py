@@ -0,0 +1,240 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""A lightweight HTTP server that implements enough of the OpenSearch API for the consumer.
+
+Supported requests:
+
+  * GET  /                                   cluster info
+  * POST /_bulk, /{index}/_bulk              index, create, update and delete actions
+  * POST /{index}/_doc, PUT /{index}/_doc/ID index a single document
+  * GET  /{index}/_doc/ID                    get a single document
+  * POST /{index}/_delete_by_query           match or term query on one field
+
+Behavior can be tuned to mimic a slow or overloaded domain:
+
+  * latency_ms, latency_ms_per_mb  fixed and size-proportional delay added to every request
+  * reject_rate                    fraction of bulk requests answered with 429 Too Many Requests
+  * max_request_bytes              requests larger than this are answered with 413
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class FakeOpenSearchStats:
+    """Thread-safe counters for the requests the server has handled."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bulk_requests = 0
+        self.docs = 0
+        self.bytes_received = 0
+        self.rejected = 0
+        self.too_large = 0
+        self.latencies = []
+
+    def record(self, size, latency, bulk=False, docs=0, rejected=False, too_large=False):
+        with self._lock:
+            self.requests += 1
+            self.bulk_requests += int(bulk)
+            self.docs += docs
+            self.bytes_received += size
+            self.rejected += int(rejected)
+            self.too_large += int(too_large)
+            self.latencies.append(latency)
+
+
+class FakeOpenSearch:
+    """In-memory document store behind a ThreadingHTTPServer."""
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0.0, latency_ms_per_mb=0.0, reject_rate=0.0,
+                 max_request_bytes=10485760, keep_documents=True):
+        self.latency_ms = latency_ms
+        self.latency_ms_per_mb = latency_ms_per_mb
+        self.reject_rate = reject_rate
+        self.max_request_bytes = max_request_bytes
+        self.keep_documents = keep_documents
+        self.stats = FakeOpenSearchStats()
+        self.indices = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.stop()
+
+    def count(self, index=None):
+        with self._lock:
+            if index is None:
+                return sum(len(docs) for docs in self.indices.values())
+            return len(self.indices.get(index, {}))
+
+    # Document store ##########################################################
+
+    def _put(self, index, doc_id, source):
+        with self._lock:
+            docs = self.indices.setdefault(index, {})
+            result = 'updated' if doc_id in docs else 'created'
+            docs[doc_id] = source if self.keep_documents else None
+        return result
+
+    def _get(self, index, doc_id):
+        with self._lock:
+            return self.indices.get(index, {}).get(doc_id)
+
+    def _delete(self, index, doc_id):
+        with self._lock:
+            return self.indices.get(index, {}).pop(doc_id, False) is not False
+
+    def _delete_by_query(self, index, query):
+        clause = query.get('query', {})
+        clause = clause.get('match') or clause.get('term') or {}
+        field, value = next(iter(clause.items()), (None, None))
+        if isinstance(value, dict):
+            value = value.get('query', value.get('value'))
+        deleted = 0
+        with self._lock:
+            names = list(self.indices) if index in ('_all', '*') else [index]
+            for name in names:
+                docs = self.indices.get(name, {})
+                for doc_id in [i for i, d in docs.items() if d is not None and d.get(field) == value]:
+                    del docs[doc_id]
+                    deleted += 1
+        return deleted
+
+    def _bulk(self, default_index, body):
+        lines = iter(line for line in body.split(b'\n') if line.strip())
+        items = []
+        for line in lines:
+            action = json.loads(line)
+            op_type, meta = next(iter(action.items()))
+            index = meta.get('_index', default_index)
+            doc_id = meta.get('_id') or uuid.uuid4().hex
+            if op_type == 'delete':
+                found = self._delete(index, doc_id)
+                items.append({op_type: {"_index": index, "_id": doc_id, "status": 200 if found else 404,
+                                        "result": "deleted" if found else "not_found"}})
+                continue
+            source = json.loads(next(lines))
+            if op_type == 'create' and self._get(index, doc_id) is not None:
+                items.append({op_type: {"_index": index, "_id": doc_id, "status": 409,
+                                        "error": {"type": "version_conflict_engine_exception"}}})
+                continue
+            if op_type == 'update':
+                current = self._get(index, doc_id)
+                if current is None:
+                    if 'upsert' in source or source.get('doc_as_upsert'):
+                        current = source.get('upsert', source.get('doc', {}))
+                    else:
+                        items.append({op_type: {"_index": index, "_id": doc_id, "status": 404,
+                                                "error": {"type": "document_missing_exception"}}})
+                        continue
+                else:
+                    current = dict(current, **source.get('doc', {}))
+                source = current
+            result = self._put(index, doc_id, source)
+            items.append({op_type: {"_index": index, "_id": doc_id, "result": result,
+                                    "status": 201 if result == 'created' else 200}})
+        errors = any('error' in next(iter(item.values())) for item in items)
+        return {"took": 1, "errors": errors, "items": items}
+
+    # HTTP ####################################################################
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body):
+                payload = json.dumps(body).encode('utf-8') if self.command != 'HEAD' else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _handle(self):
+                start = time.perf_counter()
+                size = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(size) if size else b''
+                parts = [p for p in urlparse(self.path).path.split('/') if p]
+                is_bulk = bool(parts) and parts[-1] == '_bulk'
+
+                delay = fake.latency_ms + fake.latency_ms_per_mb * size / 1048576
+                if delay:
+                    time.sleep(delay / 1000)
+
+                if size > fake.max_request_bytes:
+                    fake.stats.record(size, time.perf_counter() - start, bulk=is_bulk, too_large=True)
+                    return self._send(413, {"error": "Request size exceeded {} bytes".format(fake.max_request_bytes)})
+                if is_bulk and fake.reject_rate and random.random() < fake.reject_rate:  # nosec - test server
+                    fake.stats.record(size, time.perf_counter() - start, bulk=True, rejected=True)
+                    return self._send(429, {"error": {"type": "es_rejected_execution_exception"}, "status": 429})
+
+                status, response, docs = self._route(self.command, parts, body)
+                fake.stats.record(size, time.perf_counter() - start, bulk=is_bulk, docs=docs)
+                self._send(status, response)
+
+            def _route(self, method, parts, body):
+                if method == 'HEAD':
+                    with fake._lock:
+                        exists = not parts or parts[0] in fake.indices
+                    return (200 if exists else 404), {}, 0
+                if not parts:
+                    return 200, {"version": {"number": "7.10.2", "distribution": "opensearch"},
+                                 "tagline": "The OpenSearch Project: https://opensearch.org/"}, 0
+                if parts[-1] == '_bulk':
+                    response = fake._bulk(parts[0] if len(parts) > 1 else None, body)
+                    return 200, response, sum(1 for item in response['items'] if 'error' not in next(iter(item.values())))
+                if parts[-1] == '_delete_by_query':
+                    return 200, {"deleted": fake._delete_by_query(parts[0], json.loads(body or b'{}'))}, 0
+                if len(parts) >= 2 and parts[1] == '_doc':
+                    index = parts[0]
+                    if method == 'GET':
+                        source = fake._get(index, parts[2])
+                        if source is None:
+                            return 404, {"_index": index, "_id": parts[2], "found": False}, 0
+                        return 200, {"_index": index, "_id": parts[2], "found": True, "_source": source}, 0
+                    if method == 'DELETE':
+                        found = fake._delete(index, parts[2])
+                        return (200 if found else 404), {"result": "deleted" if found else "not_found"}, 0
+                    doc_id = parts[2] if len(parts) > 2 else uuid.uuid4().hex
+                    result = fake._put(index, doc_id, json.loads(body))
+                    return (201 if result == 'created' else 200), {"_index": index, "_id": doc_id, "result": result}, 1
+                return 400, {"error": "Unsupported request: {} /{}".format(method, '/'.join(parts))}, 0
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+        return Handler
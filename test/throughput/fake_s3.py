@@ -0,0 +1,93 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""An in-process stand-in for the parts of the S3 client the consumer uses."""
+
+import hashlib
+import threading
+import time
+from io import BytesIO
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+
+class FakeS3:
+    """Keeps objects in memory and answers get_object, head_object, put_object and list_objects_v2.
+
+    latency_ms is added to every call to mimic the time to first byte of S3.
+    """
+
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self.objects = {}
+        self.get_requests = 0
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def _lookup(self, operation, bucket, key):
+        try:
+            return self.objects[(bucket, key)]
+        except KeyError:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."}},
+                              operation)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        elif hasattr(Body, 'read'):
+            Body = Body.read()
+        metadata = {k: v for k, v in kwargs.items() if k in ('ContentEncoding', 'ContentType', 'Metadata')}
+        etag = '"{}"'.format(hashlib.md5(Body, usedforsecurity=False).hexdigest())
+        with self._lock:
+            self.objects[(Bucket, Key)] = (Body, etag, metadata)
+        return {"ETag": etag}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._wait()
+        body, etag, metadata = self._lookup('HeadObject', Bucket, Key)
+        return dict(metadata, ContentLength=len(body), ETag=etag)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._wait()
+        body, etag, metadata = self._lookup('GetObject', Bucket, Key)
+        with self._lock:
+            self.get_requests += 1
+            self.bytes_read += len(body)
+        return dict(metadata, Body=StreamingBody(BytesIO(body), len(body)), ContentLength=len(body), ETag=etag)
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None, MaxKeys=1000, **kwargs):
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + MaxKeys]
+        response = {
+            "KeyCount": len(page),
+            "Contents": [{"Key": key, "Size": len(self.objects[(Bucket, key)][0]),
+                          "ETag": self.objects[(Bucket, key)][1]} for key in page],
+            "IsTruncated": start + MaxKeys < len(keys),
+        }
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + MaxKeys)
+        return response
+
+    def get_paginator(self, operation_name):
+        return _ListObjectsV2Paginator(self)
+
+
+class _ListObjectsV2Paginator:
+
+    def __init__(self, client):
+        self._client = client
+
+    def paginate(self, Bucket, Prefix='', **kwargs):
+        token = None
+        while True:
+            page = self._client.list_objects_v2(Bucket=Bucket, Prefix=Prefix, ContinuationToken=token, **kwargs)
+            yield page
+            if not page["IsTruncated"]:
+                return
+            token = page["NextContinuationToken"]
@@ -0,0 +1,170 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+"""Local end-to-end throughput harness for the OpenSearch consumer.
+
+Generates synthetic operator results for a number of assets, stores them in an in-process S3
+stand-in, and feeds lambda_handler Kinesis batches of INSERT and MODIFY records. The consumer
+talks to a local fake OpenSearch server over HTTP with the real Elasticsearch client, so the
+bulk payloads, serialization and connection handling are the same as in production. Batch
+size, concurrent invocations, bulk payload size and the behavior of the fake domain (latency,
+429 rejections, request size limit) can be varied to tune the consumer on a laptop.
+
+Usage:
+    python run_throughput.py [--assets 20] [--duration 300] [--batch-size 100] [--concurrency 2]
+                             [--bulk-size 5000000] [--latency-ms 20] [--reject-rate 0.05] ...
+"""
+
+import argparse
+import base64
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_opensearch import FakeOpenSearch
+from fake_s3 import FakeS3
+
+THROUGHPUT_DIR = os.path.dirname(os.path.realpath(__file__))
+CONSUMER_DIR = os.path.realpath(os.path.join(THROUGHPUT_DIR, '..', '..', 'source', 'consumer'))
+BENCHMARK_DIR = os.path.realpath(os.path.join(THROUGHPUT_DIR, '..', 'benchmark', 'consumer'))
+BUCKET = 'throughput-dataplane'
+
+# The synthetic operator results are shared with the transform benchmarks.
+sys.path.insert(0, BENCHMARK_DIR)
+import synthetic_results  # noqa: E402
+
+
+class FakeContext:
+    """Minimal Lambda context with a fixed deadline."""
+
+    def __init__(self, timeout_ms=900000):
+        self._deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return int((self._deadline - time.monotonic()) * 1000)
+
+
+def load_consumer(s3_client, endpoint, bulk_size):
+    os.environ.setdefault('botoConfig', '{}')
+    os.environ['EsEndpoint'] = endpoint
+    os.environ['DataplaneBucket'] = BUCKET
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('LogLevel', 'WARNING')
+    sys.path.insert(0, CONSUMER_DIR)
+    import lambda_handler
+    from elasticsearch import Elasticsearch, RequestsHttpConnection
+
+    host, port = endpoint.split(':')
+    lambda_handler.s3 = s3_client
+    lambda_handler.MAX_BULK_INDEX_PAYLOAD_SIZE = bulk_size
+    lambda_handler.connect_es = lambda _endpoint: Elasticsearch(
+        hosts=[{'host': host, 'port': int(port)}], connection_class=RequestsHttpConnection, timeout=120)
+    return lambda_handler
+
+
+def kinesis_record(asset_id, data, sequence_number):
+    return {
+        'kinesis': {
+            'kinesisSchemaVersion': '1.0',
+            'partitionKey': asset_id,
+            'sequenceNumber': str(sequence_number),
+            'data': base64.b64encode(json.dumps(data).encode('utf-8')).decode('utf-8'),
+            'approximateArrivalTimestamp': time.time()
+        },
+        'eventSource': 'aws:kinesis',
+        'eventID': 'shardId-000000000000:{}'.format(sequence_number),
+    }
+
+
+def make_records(s3_client, operators, assets, duration):
+    """Store generated results in the fake S3 and return the Kinesis records that point to them."""
+    records = []
+    for asset_number in range(assets):
+        asset_id = str(uuid.UUID(int=asset_number))
+        workflow_id = str(uuid.UUID(int=asset_number + 10 ** 6))
+        records.append(kinesis_record(asset_id, {
+            'Action': 'INSERT', 'S3Bucket': BUCKET, 'S3Key': 'upload/asset-{}.mp4'.format(asset_number),
+            'MediaType': 'Video', 'Created': str(time.time())}, len(records)))
+        for operator in operators:
+            key = 'private/assets/{}/workflows/{}/{}.json'.format(asset_id, workflow_id, operator)
+            s3_client.put_object(Bucket=BUCKET, Key=key,
+                                 Body=synthetic_results.generate(operator, duration, seed=asset_number))
+            records.append(kinesis_record(asset_id, {
+                'Action': 'MODIFY', 'Operator': operator, 'Pointer': key, 'Workflow': workflow_id}, len(records)))
+    return records
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def run(args):
+    operators = args.operator or sorted(synthetic_results.GENERATORS)
+    s3_client = FakeS3(latency_ms=args.s3_latency_ms)
+    with FakeOpenSearch(latency_ms=args.latency_ms, latency_ms_per_mb=args.latency_ms_per_mb,
+                        reject_rate=args.reject_rate, max_request_bytes=args.max_request_bytes,
+                        keep_documents=False) as server:
+        consumer = load_consumer(s3_client, '{}:{}'.format(server.host, server.port), args.bulk_size)
+        records = make_records(s3_client, operators, args.assets, args.duration)
+        batches = [records[i:i + args.batch_size] for i in range(0, len(records), args.batch_size)]
+
+        def invoke(batch):
+            start = time.perf_counter()
+            consumer.lambda_handler({'Records': batch}, FakeContext())
+            return time.perf_counter() - start
+
+        with open(args.consumer_log, 'w') as consumer_log, contextlib.redirect_stdout(consumer_log):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                invocation_latencies = list(executor.map(invoke, batches))
+            elapsed = time.perf_counter() - start
+        stats = server.stats
+        request_latencies = stats.latencies
+
+    print('records            {:>12}'.format(len(records)))
+    print('batches            {:>12}  (batch size {}, concurrency {})'.format(
+        len(batches), args.batch_size, args.concurrency))
+    print('elapsed s          {:>12.2f}'.format(elapsed))
+    print('records/s          {:>12.1f}'.format(len(records) / elapsed))
+    print('docs indexed       {:>12}'.format(stats.docs))
+    print('docs/s             {:>12.1f}'.format(stats.docs / elapsed))
+    print('bytes sent         {:>12}  ({:.1f} MB/s)'.format(stats.bytes_received, stats.bytes_received / elapsed / 1e6))
+    print('bytes read from s3 {:>12}'.format(s3_client.bytes_read))
+    print('requests           {:>12}  ({} bulk, {} rejected with 429, {} rejected with 413)'.format(
+        stats.requests, stats.bulk_requests, stats.rejected, stats.too_large))
+    print('invocation ms      p50 {:>8.1f}  p90 {:>8.1f}  p99 {:>8.1f}  max {:>8.1f}'.format(
+        *(1000 * percentile(invocation_latencies, f) for f in (0.5, 0.9, 0.99, 1.0))))
+    print('request ms         p50 {:>8.1f}  p90 {:>8.1f}  p99 {:>8.1f}  max {:>8.1f}'.format(
+        *(1000 * percentile(request_latencies, f) for f in (0.5, 0.9, 0.99, 1.0))))
+    if request_latencies:
+        print('request ms mean    {:>12.1f}'.format(1000 * statistics.mean(request_latencies)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--assets', type=int, default=20, help='number of assets to generate')
+    parser.add_argument('--operator', nargs='+', help='operators to generate results for (default: all)')
+    parser.add_argument('--duration', type=int, default=300, help='media duration in seconds for each asset')
+    parser.add_argument('--batch-size', type=int, default=100, help='Kinesis records per invocation')
+    parser.add_argument('--concurrency', type=int, default=1, help='concurrent invocations')
+    parser.add_argument('--bulk-size', type=int, default=5000000, help='maximum bulk payload size in bytes')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='fixed latency of every OpenSearch request')
+    parser.add_argument('--latency-ms-per-mb', type=float, default=0.0, help='additional latency per MB of request')
+    parser.add_argument('--reject-rate', type=float, default=0.0, help='fraction of bulk requests rejected with 429')
+    parser.add_argument('--max-request-bytes', type=int, default=10485760,
+                        help='requests larger than this are rejected with 413')
+    parser.add_argument('--s3-latency-ms', type=float, default=0.0, help='latency of every S3 request')
+    parser.add_argument('--consumer-log', default=os.devnull, help='file to write the consumer log to')
+    run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
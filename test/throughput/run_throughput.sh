@@ -0,0 +1,43 @@
+#!/bin/bash
+
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+###############################################################################
+# PURPOSE: This script runs the local end-to-end throughput harness for the
+#  OpenSearch consumer against a fake OpenSearch domain and S3 bucket.
+#
+# USAGE:
+#  ./run_throughput.sh [OPTIONS...]
+#
+#   where OPTIONS are passed on to run_throughput.py, for example
+#   --assets 50, --batch-size 100, --concurrency 4, --bulk-size 5000000,
+#   --latency-ms 20 or --reject-rate 0.05. Run with --help for the full list.
+#
+###############################################################################
+
+# Make sure working directory is the directory containing this script
+cd "$(dirname "${BASH_SOURCE[0]}")"
+
+source_dir=`cd ../../source; pwd`
+
+if [ -n "${VIRTUAL_ENV:-}" ]; then
+    echo "ERROR: Do not run this script inside Virtualenv. Type \`deactivate\` and run again.";
+    exit 1;
+fi
+if ! command -v python3 &>/dev/null; then
+    echo "ERROR: install Python3 before running this script"
+    exit 1
+fi
+
+VENV="$(mktemp -d)"
+trap 'deactivate &>/dev/null; rm -rf "$VENV"' EXIT
+
+python3 -m venv "$VENV" || exit $?
+source "$VENV/bin/activate" || exit $?
+pip install -q -r ../unit/requirements.txt -r "$source_dir/consumer/requirements.txt" || {
+    echo "ERROR: Failed to install required Python libraries"
+    exit 1
+}
+
+python3 run_throughput.py "$@"
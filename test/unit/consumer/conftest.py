@@ -3,8 +3,12 @@
 
 import pytest
 import glob
+import hashlib
+import json
 import os
-from unittest.mock import create_autospec, patch
+from io import BytesIO
+from unittest.mock import MagicMock, create_autospec, patch
+from botocore.exceptions import ClientError
 from botocore.stub import Stubber
 
 
@@ -12,6 +16,7 @@ from botocore.stub import Stubber
 def mock_env_variables(monkeypatch):
     """Mock up environment variables that the testing target depends on"""
     monkeypatch.syspath_prepend('../../source/')
+    monkeypatch.syspath_prepend('../../source/consumer/')
     monkeypatch.setenv("DataplaneBucket", 'testDataplaneBucket')
     monkeypatch.setenv("EsEndpoint", 'testSearchEndpoint')
     monkeypatch.setenv("botoConfig", '{"user_agent_extra": "AwsSolution/SO0164/2.0.4"}')
@@ -56,6 +61,158 @@ def elasticsearch_stub(mock_env_variables):
         app.MAX_BULK_INDEX_PAYLOAD_SIZE = bulk_size
 
 
+class FakeS3:
+    """In-memory stand-in for the boto3 S3 client.
+
+    Objects are kept as bytes in `objects` and their user metadata in `metadata`, by key. Other
+    put_object arguments, such as CacheControl, are kept in `put_args`. ETags change with the
+    content but are not its MD5, as with SSE-KMS.
+    """
+
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+        self.metadata = {}
+        self.content_encodings = {}
+        self.put_args = {}
+        self.gets = 0
+        self.heads = 0
+        self.puts = 0
+
+    def _head(self, Key, operation):
+        if Key not in self.objects:
+            code = 'NoSuchKey' if operation == 'GetObject' else '404'
+            raise ClientError({'Error': {'Code': code}}, operation)
+        body = self.objects[Key]
+        response = {'ContentLength': len(body), 'ETag': '"{}"'.format(hashlib.sha256(body).hexdigest()[:32]),
+                    'Metadata': dict(self.metadata.get(Key, {}))}
+        if Key in self.content_encodings:
+            response['ContentEncoding'] = self.content_encodings[Key]
+        return response
+
+    def get_object(self, Bucket, Key):
+        self.gets += 1
+        response = self._head(Key, 'GetObject')
+        response['Body'] = BytesIO(self.objects[Key])
+        return response
+
+    def head_object(self, Bucket, Key):
+        self.heads += 1
+        return self._head(Key, 'HeadObject')
+
+    def put_object(self, Bucket, Key, Body, ContentEncoding=None, Metadata=None, **kwargs):
+        self.puts += 1
+        self.objects[Key] = Body.encode('utf-8') if isinstance(Body, str) else Body
+        self.metadata[Key] = dict(Metadata or {})
+        self.put_args[Key] = kwargs
+        if ContentEncoding:
+            self.content_encodings[Key] = ContentEncoding
+        else:
+            self.content_encodings.pop(Key, None)
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+        self.metadata.pop(Key, None)
+        self.content_encodings.pop(Key, None)
+        self.put_args.pop(Key, None)
+
+    def get_paginator(self, operation):
+        assert operation == 'list_objects_v2'
+        return self
+
+    def paginate(self, Bucket, Prefix=''):
+        contents = [{'Key': key, 'Size': len(body)} for key, body in sorted(self.objects.items())
+                    if key.startswith(Prefix)]
+        yield {'Contents': contents} if contents else {}
+
+
+class FakeAsyncBody:
+    """aiobotocore streaming body over bytes."""
+
+    def __init__(self, data):
+        self._data = data
+        self._position = 0
+        self.closed = False
+
+    async def read(self, amt=None):
+        end = len(self._data) if amt is None else self._position + amt
+        chunk = self._data[self._position:end]
+        self._position += len(chunk)
+        return chunk
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncS3:
+    """aiobotocore stand-in that serves the objects of a FakeS3."""
+
+    def __init__(self, s3):
+        self.s3 = s3
+
+    async def get_object(self, Bucket, Key):
+        response = self.s3.get_object(Bucket, Key)
+        response['Body'] = FakeAsyncBody(response['Body'].read())
+        return response
+
+    async def head_object(self, Bucket, Key):
+        return self.s3.head_object(Bucket, Key)
+
+
+@pytest.fixture
+def s3():
+    """In-memory S3 client, see `FakeS3`."""
+    return FakeS3()
+
+
+@pytest.fixture
+def async_s3(s3):
+    """Async S3 client that serves the objects of the `s3` fixture."""
+    return FakeAsyncS3(s3)
+
+
+class RecordingElasticsearch(MagicMock):
+    """Mock of the Elasticsearch client that can read back the updates sent to the derived indices."""
+
+    def derived_updates(self, index):
+        """Return the (action, body) of every update sent to `index` in a bulk request."""
+        updates = []
+        for c in self.bulk.call_args_list:
+            body = c.kwargs['body']
+            lines = (body.decode('utf-8') if isinstance(body, bytes) else body).split('\n')
+            for position, line in enumerate(lines):
+                action = json.loads(line)
+                if 'update' in action and action['update']['_index'] == index:
+                    updates.append((action['update'], json.loads(lines[position + 1])))
+        return updates
+
+
+@pytest.fixture
+def es():
+    """Elasticsearch client that `consumer` connects to, see `RecordingElasticsearch`."""
+    return RecordingElasticsearch()
+
+
+@pytest.fixture
+def consumer(monkeypatch, es):
+    """lambda_handler connected to `es`, before it created any derived index.
+
+    Test modules override it to turn on the features they test.
+    """
+    import derived_index
+    import lambda_handler
+
+    monkeypatch.setattr(derived_index, '_ensured', set())
+    # Workers get their client from the override, like connect_es does.
+    monkeypatch.setattr(lambda_handler, 'connect_es', lambda endpoint: lambda_handler.es_client_override.get() or es)
+    return lambda_handler
+
+
 @pytest.fixture
 def index_document_stub():
     """Patch the `index_document` function by replacing it with an auto-spec Mock."""
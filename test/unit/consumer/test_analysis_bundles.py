@@ -0,0 +1,119 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import gzip
+import json
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+LABELS_KEY = 'private/assets/{}/analysis/labeldetection.json'.format(ASSET_ID)
+OPERATORS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators')
+
+
+def label_page(*labelled):
+    return [{"Labels": [
+        {"Timestamp": timestamp,
+         "Label": {"Name": name, "Confidence": confidence,
+                   "Instances": [{"BoundingBox": {"Left": 0.1, "Top": 0.2, "Width": 0.3, "Height": 0.4},
+                                  "Confidence": confidence}]}}
+        for timestamp, name, confidence in labelled]}]
+
+
+def labels(*labelled):
+    return {"Pages": iter([label_page(*labelled)])}
+
+
+def read_bundle(s3, key=LABELS_KEY):
+    return json.loads(gzip.decompress(s3.objects[key]))
+
+
+@pytest.fixture
+def consumer(monkeypatch, s3):
+    import analysis_bundles
+    import lambda_handler
+
+    monkeypatch.setenv('AnalysisBundles', 'true')
+    monkeypatch.setattr(lambda_handler, 'connect_es', lambda endpoint: MagicMock())
+    monkeypatch.setattr(lambda_handler, 'bundle_store', analysis_bundles.BundleStore(s3, 'bucket'))
+    return lambda_handler
+
+
+class TestAnalysisBundles:
+    """Tests for writing analysis bundles as results are indexed."""
+
+    def test_labels(self, consumer, s3):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection',
+                                         labels((1000, 'Car', 90.0), (0, 'Car', 95.0), (0, 'Tree', 80.0)))
+
+        assert s3.content_encodings[LABELS_KEY] == 'gzip'
+        assert s3.put_args[LABELS_KEY]['CacheControl'] == 'no-cache'
+        bundle = read_bundle(s3)
+        assert bundle["Markers"] == [[0, None, 'Car', 95.0], [0, None, 'Tree', 80.0], [1000, None, 'Car', 90.0]]
+        assert bundle["Boxes"][0] == [0, 'Car', 0.1, 0.2, 0.3, 0.4]
+        assert bundle["Summary"] == [['Car', 2, 95.0], ['Tree', 1, 80.0]]
+
+    def test_unchanged_bundle_is_not_written_again(self, consumer, s3):
+        for workflow in ('workflow-1', 'workflow-2'):
+            consumer.process_modify_metadata(ASSET_ID, workflow, 'labelDetection', labels((0, 'Car', 95.0)))
+
+        assert s3.puts == 1
+
+    def test_bundle_of_another_writer_is_replaced(self, consumer, s3):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', labels((0, 'Car', 95.0)))
+        # Such as a bundle written before its hash was kept in the metadata.
+        s3.metadata[LABELS_KEY] = {}
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', labels((0, 'Car', 95.0)))
+
+        assert s3.puts == 2
+        assert s3.metadata[LABELS_KEY]['content-sha256']
+
+    def test_failed_write_is_counted(self, monkeypatch, consumer, s3):
+        import pointer_cache
+
+        def put_object(**kwargs):
+            raise Exception("access denied")
+
+        monkeypatch.setattr(s3, 'put_object', put_object)
+        with pointer_cache.track_failures() as failures:
+            consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', labels((0, 'Car', 95.0)))
+
+        assert LABELS_KEY not in s3.objects
+        assert failures["Failures"] == 1
+
+    def test_faces(self, consumer, s3):
+        with open(os.path.join(OPERATORS_DIR, 'faceDetection.json')) as f:
+            result = f.read()
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'faceDetection', {"Results": result})
+
+        bundle = read_bundle(s3, 'private/assets/{}/analysis/facedetection.json'.format(ASSET_ID))
+        assert bundle["Markers"]
+        assert {marker[2] for marker in bundle["Markers"]} == {'Face'}
+        assert len(bundle["Boxes"]) == len(bundle["Markers"])
+        assert bundle["Summary"][0][:2] == ['Face', len(bundle["Markers"])]
+
+    def test_resumed_result_adds_to_the_bundle(self, consumer, s3):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', labels((0, 'Car', 95.0)))
+
+        pages = [label_page((0, 'Car', 95.0)), label_page((500, 'Tree', 80.0))]
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', {"Pages": iter(pages)}, cursor=1)
+
+        assert [marker[2] for marker in read_bundle(s3)["Markers"]] == ['Car', 'Tree']
+
+    def test_captions(self, consumer, s3):
+        captions = {"WebCaptions": [{"start": "0.5", "end": "1.5", "caption": "Hola"}]}
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'WebCaptions_es', {"Results": json.dumps(captions)})
+
+        bundle = read_bundle(s3, 'private/assets/{}/analysis/webcaptions_es.json'.format(ASSET_ID))
+        assert bundle["Markers"] == [[500.0, 1500.0, 'Hola', None]]
+
+    def test_mediainfo_has_no_bundle(self, consumer, s3):
+        with open(os.path.join(OPERATORS_DIR, 'Mediainfo.json')) as f:
+            consumer.process_modify_metadata(ASSET_ID, 'workflow', 'Mediainfo', {"Results": f.read()})
+
+        assert not s3.objects
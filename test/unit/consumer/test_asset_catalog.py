@@ -0,0 +1,98 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+
+
+def catalog_updates(es):
+    """Return the body of every update sent to the catalog."""
+    updates = es.derived_updates('mieassetcatalog')
+    assert all(action['_id'] == ASSET_ID for action, _body in updates)
+    return [body for _action, body in updates]
+
+
+@pytest.fixture
+def consumer(monkeypatch, consumer):
+    monkeypatch.setenv('AssetCatalog', 'true')
+    return consumer
+
+
+class TestCatalogTerms:
+    """Tests for `CatalogTerms`."""
+
+    def test_terms_are_distinct(self):
+        import asset_catalog
+
+        terms = asset_catalog.CatalogTerms('textdetection')
+        for document in [{"DetectedText": "EXIT", "Type": "LINE"}, {"DetectedText": "EXIT", "Type": "WORD"},
+                         {"DetectedText": " EXIT ", "Type": "LINE"}, {"DetectedText": "OPEN", "Type": "LINE"}]:
+            terms.add('mietextdetection', document)
+
+        [(_doc_id, body)] = terms.make_updates(ASSET_ID, 'workflow', 'Indexed')
+
+        assert body['script']['params']['fields'] == {"Text": ["EXIT", "OPEN"]}
+
+    def test_most_frequent_terms_are_kept(self, monkeypatch):
+        import asset_catalog
+
+        monkeypatch.setattr(asset_catalog, 'MAX_TERMS', 2)
+        terms = asset_catalog.CatalogTerms('labeldetection')
+        for name in ['Car', 'Car', 'Tree', 'Person', 'Person', 'Person']:
+            terms.add('mielabels', {"Name": name})
+
+        [(_doc_id, body)] = terms.make_updates(ASSET_ID, 'workflow', 'Indexed')
+
+        assert body['script']['params']['fields'] == {"Labels": ["Car", "Person"]}
+
+    def test_operator_without_terms(self):
+        import asset_catalog
+
+        terms = asset_catalog.CatalogTerms('mediainfo')
+        terms.add('miemediainfo', {"Name": "video"})
+
+        assert terms.make_updates(ASSET_ID, 'workflow', 'Indexed') == []
+
+
+class TestAssetCatalog:
+    """Tests for updating the catalog as results are indexed."""
+
+    def test_labels(self, consumer, es):
+        pages = [{"Labels": [{"Timestamp": t, "Label": {"Name": name, "Confidence": 90.0}}
+                             for t, name in enumerate(['Car', 'Person', 'Car'])]}]
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', {"Pages": iter([pages])})
+
+        [body] = catalog_updates(es)
+        params = body['script']['params']
+        assert params['fields'] == {"Labels": ["Car", "Person"]}
+        assert (params['languages'], params['resume']) == ([], False)
+        assert es.indices.create.call_args.kwargs['index'] == 'mieassetcatalog'
+
+    def test_key_phrases(self, consumer, es):
+        phrases = [{"BeginOffset": 0, "EndOffset": 1, "Score": 0.9, "Text": "a show"}]
+        results = json.dumps({"LanguageCode": "en", "Results": [json.dumps({"KeyPhrases": phrases})]})
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'key_phrases', {"Results": results})
+
+        [body] = catalog_updates(es)
+        assert body['script']['params']['fields'] == {"KeyPhrases": ["a show"]}
+
+    def test_caption_language(self, consumer, es):
+        captions = json.dumps({"WebCaptions": [{"start": 0, "end": 1, "caption": "Hola"}]})
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'WebCaptions_es', {"Results": captions})
+
+        [body] = catalog_updates(es)
+        assert body['script']['params']['fields'] == {}
+        assert body['script']['params']['languages'] == ['es']
+
+    def test_insert_records_the_filename(self, consumer, es):
+        consumer.handle_insert(ASSET_ID, {"S3Key": "upload/video.mp4", "Created": "1620000000"})
+
+        [body] = catalog_updates(es)
+        assert body == {"doc": {"AssetId": ASSET_ID, "Filename": "video.mp4", "Created": "1620000000"},
+                        "doc_as_upsert": True}
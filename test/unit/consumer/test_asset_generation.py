@@ -0,0 +1,79 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from unittest.mock import MagicMock
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+GENERATION_KEY = 'private/assets/{}/search/generation'.format(ASSET_ID)
+
+
+@pytest.fixture
+def consumer(monkeypatch, s3):
+    import asset_generation
+    import lambda_handler
+
+    monkeypatch.setenv('SearchGenerations', 'true')
+    monkeypatch.setattr(lambda_handler, 'connect_es', lambda endpoint: MagicMock())
+    monkeypatch.setattr(lambda_handler, 'asset_generations', asset_generation.GenerationStore(s3, 'bucket'))
+    return lambda_handler
+
+
+class TestAssetGeneration:
+    """Tests for starting a new generation of an asset when it is written."""
+
+    def test_every_write_starts_a_generation(self, consumer, s3):
+        generations = []
+        consumer.dispatch_record(ASSET_ID, {"S3Key": "upload/video.mp4", "Created": "1620000000"}, "INSERT")
+        generations.append(s3.objects[GENERATION_KEY])
+        consumer.dispatch_record(ASSET_ID, {}, "REMOVE")
+        generations.append(s3.objects[GENERATION_KEY])
+
+        assert s3.puts == 2
+        assert generations[0] != generations[1]
+
+    def test_disabled_by_default(self, monkeypatch, consumer, s3):
+        monkeypatch.delenv('SearchGenerations')
+
+        consumer.dispatch_record(ASSET_ID, {}, "REMOVE")
+
+        assert not s3.objects
+
+    def test_failed_write_is_not_raised(self, consumer, s3):
+        import asset_generation
+
+        s3.put_object = MagicMock(side_effect=Exception("denied"))
+
+        assert not asset_generation.GenerationStore(s3, 'bucket').bump(ASSET_ID)
+
+    def test_documents_get_a_key(self, consumer):
+        import json
+
+        es = MagicMock()
+        consumer.bulk_index(es, ASSET_ID, "labels", [{"Name": "Car"}, {"Name": "Tree"}])
+        consumer.index_document(es, ASSET_ID, "mediainfo", {"Format": "MPEG-4"})
+
+        lines = es.bulk.call_args.kwargs['body'].split('\n')
+        keys = [json.loads(line)["DocumentKey"] for line in lines[1::2]]
+        keys.append(es.index.call_args.kwargs['body']["DocumentKey"])
+        assert len(set(keys)) == 3
+
+    def test_documents_have_no_key_by_default(self, monkeypatch, consumer):
+        monkeypatch.delenv('SearchGenerations')
+
+        es = MagicMock()
+        consumer.bulk_index(es, ASSET_ID, "labels", [{"Name": "Car"}])
+
+        assert "DocumentKey" not in es.bulk.call_args.kwargs['body']
+
+    def test_backfill_document_keys(self):
+        import asset_generation
+
+        es = MagicMock()
+        es.update_by_query.return_value = {"updated": 12}
+
+        assert asset_generation.backfill_document_keys(es) == 12
+        body = es.update_by_query.call_args.kwargs['body']
+        assert body["query"] == {"bool": {"must_not": {"exists": {"field": "DocumentKey"}}}}
+        assert body["script"]["source"] == "ctx._source.DocumentKey = ctx._id"
@@ -0,0 +1,193 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import gzip
+import json
+import os
+from io import BytesIO
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+OPERATORS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators')
+
+
+def read_labels():
+    with gzip.open(os.path.join(OPERATORS_DIR, 'labelDetection.json.gz')) as f:
+        return f.read()
+
+
+def labels(*labelled):
+    return [{"Labels": [{"Timestamp": timestamp, "Label": {"Name": "Car", "Confidence": confidence}}
+                        for timestamp, confidence in labelled]}]
+
+
+class ExpiresAfter:
+    """Deadline that expires after it was checked `checks` times."""
+
+    def __init__(self, checks):
+        self.checks = checks
+
+    def expired(self):
+        self.checks -= 1
+        return self.checks < 0
+
+
+@pytest.fixture
+def consumer(monkeypatch, consumer):
+    monkeypatch.setenv('AssetManifest', 'true')
+    return consumer
+
+
+def manifest_updates(es):
+    """Return the params of every manifest update."""
+    return [body['script']['params'] for _action, body in es.derived_updates('mieassetmanifest')]
+
+
+class TestOperatorSummary:
+    """Tests for `OperatorSummary`."""
+
+    def test_entry(self):
+        import asset_manifest
+
+        summary = asset_manifest.OperatorSummary('transcribevideo')
+        summary.add('mievideotranscript', {"transcript": "hello", "language_code": "en-US"})
+        summary.add('mievideotranscript', {"content": "hello", "confidence": "98.0",
+                                           "start_time": "120.0", "end_time": "480.0"})
+        summary.add('mievideotranscript', {"content": ",", "confidence": "100.0"})
+
+        entry = summary.entry('workflow', 'Indexed', '2024-05-01T12:00:00+00:00')
+
+        assert entry == {
+            "Status": "Indexed",
+            "Workflow": "workflow",
+            "Documents": 3,
+            "Indices": {"mievideotranscript": 3},
+            "Languages": ["en-US"],
+            "IndexedAt": "2024-05-01T12:00:00+00:00",
+            "MinConfidence": 98.0,
+            "MaxConfidence": 100.0,
+            "StartTime": 120.0,
+            "EndTime": 480.0,
+        }
+
+    def test_merge(self):
+        import asset_manifest
+
+        summary = asset_manifest.OperatorSummary('labeldetection')
+        summary.add('mielabels', {"Timestamp": 1000, "Confidence": 90.0})
+        batch = asset_manifest.OperatorSummary('labeldetection')
+        batch.add('mielabels', {"Timestamp": 0, "Confidence": 99.0})
+        batch.add('mielabels', {"Timestamp": 2000, "Confidence": ""})
+
+        summary.merge(json.loads(json.dumps(batch.state())))
+
+        entry = summary.entry('workflow', 'Indexed', None)
+        assert entry["Documents"] == 3
+        assert (entry["MinConfidence"], entry["MaxConfidence"]) == (90.0, 99.0)
+        assert (entry["StartTime"], entry["EndTime"]) == (0, 2000)
+
+
+class TestAssetManifest:
+    """Tests for updating the manifest of an asset as results are indexed."""
+
+    def test_disabled_by_default(self, monkeypatch, consumer, es):
+        monkeypatch.delenv('AssetManifest')
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', {"Pages": iter([labels((0, 99.0))])})
+
+        assert not manifest_updates(es)
+        assert not es.indices.create.called
+
+    def test_result_is_recorded(self, consumer, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection',
+                                         {"Pages": iter([labels((0, 99.0), (500, 80.5))])})
+
+        create = es.indices.create.call_args.kwargs
+        assert create['index'] == 'mieassetmanifest'
+        assert create['body']['settings'] == {"index.hidden": True}
+        [(action, body)] = es.derived_updates('mieassetmanifest')
+        assert action['_id'] == ASSET_ID
+        assert body['scripted_upsert']
+        params = body['script']['params']
+        assert (params['operator'], params['resume']) == ('labeldetection', False)
+        summary = params['summary']
+        assert (summary['Status'], summary['Workflow'], summary['Documents']) == ('Indexed', 'workflow', 2)
+        assert (summary['MinConfidence'], summary['MaxConfidence']) == (80.5, 99.0)
+        assert (summary['StartTime'], summary['EndTime']) == (0, 500)
+
+    def test_index_is_created_once(self, consumer, es):
+        for workflow in ('workflow-1', 'workflow-2'):
+            consumer.process_modify_metadata(ASSET_ID, workflow, 'labelDetection', {"Pages": iter([labels((0, 99.0))])})
+
+        assert es.indices.create.call_count == 1
+        assert len(manifest_updates(es)) == 2
+
+    def test_caption_language_comes_from_the_operator(self, consumer, es):
+        captions = json.dumps({"WebCaptions": [{"start": 0, "end": 1, "caption": "Hola"}]})
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'WebCaptions_es', {"Results": captions})
+
+        [params] = manifest_updates(es)
+        assert params['operator'] == 'webcaptions_es'
+        assert params['summary']['Languages'] == ['es']
+        assert params['summary']['Indices'] == {'miewebcaptions_es': 1}
+
+    def test_failed_request_marks_the_result_incomplete(self, consumer, es):
+        responses = [Exception("rejected"), {}]
+
+        def bulk(**kwargs):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        es.bulk.side_effect = bulk
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', {"Pages": iter([labels((0, 99.0))])})
+
+        [params] = manifest_updates(es)
+        assert params['summary']['Status'] == 'Incomplete'
+
+    def test_unsupported_operator_is_not_recorded(self, consumer, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'thumbnail', {"Results": "{}"})
+
+        assert not es.bulk.called
+
+    def test_deferred_result_is_resumed(self, consumer, es):
+        import overflow
+
+        pages = [labels((0, 99.0)), labels((1000, 50.0))]
+        token = overflow.current_deadline.set(ExpiresAfter(1))
+        try:
+            with pytest.raises(overflow.DeadlineExceeded) as raised:
+                consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', {"Pages": iter(pages)})
+        finally:
+            overflow.current_deadline.reset(token)
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', {"Pages": iter(pages)},
+                                         cursor=raised.value.cursor)
+
+        deferred, resumed = manifest_updates(es)
+        assert (deferred['summary']['Status'], deferred['summary']['Documents'], deferred['resume']) == \
+            ('Deferred', 1, False)
+        assert (resumed['summary']['Status'], resumed['summary']['Documents'], resumed['resume']) == \
+            ('Indexed', 1, True)
+
+    def test_pool_batches_are_summarized(self, monkeypatch, consumer, es):
+        import json_stream
+
+        monkeypatch.setenv('TransformWorkers', '2')
+        monkeypatch.setattr(consumer.transform_pool, 'BATCH_BYTES', 500000)
+        body = read_labels()
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection',
+                                         {"RawPages": json_stream.iter_json_array_raw(BytesIO(body))})
+
+        [params] = manifest_updates(es)
+        assert params['summary']['Documents'] == sum(len(page['Labels']) for page in json.loads(body))
+
+    def test_remove_deletes_the_manifest(self, consumer, es):
+        consumer.handle_remove(ASSET_ID, {"Action": "REMOVE"})
+
+        indices = [c.kwargs['index'] for c in es.delete_by_query.call_args_list]
+        assert indices == ['_all', 'mieassetmanifest']
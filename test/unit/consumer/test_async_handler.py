@@ -0,0 +1,250 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import base64
+import gzip
+import json
+import os
+from unittest.mock import AsyncMock
+
+from botocore.credentials import Credentials
+
+OPERATORS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators')
+WORKFLOW_ID = '11111111-2222-3333-4444-555555555555'
+
+
+def make_record(asset_id, data):
+    return {"kinesis": {"partitionKey": asset_id, "data": base64.b64encode(json.dumps(data).encode('utf-8'))}}
+
+
+def make_modify_record(asset_id, operator):
+    return make_record(asset_id, {
+        "Action": "MODIFY",
+        "Operator": operator,
+        "Workflow": WORKFLOW_ID,
+        "Pointer": 'private/assets/{}/workflows/{}/{}.json'.format(asset_id, WORKFLOW_ID, operator)
+    })
+
+
+def read_operator(name):
+    path = os.path.join(OPERATORS_DIR, name)
+    opener = gzip.open if name.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        return f.read()
+
+
+class FakeOpenSearch:
+    """Records requests in order and how many were in flight at the same time."""
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _request(self, method, index, body):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        self.requests.append((method, index, body))
+        return {}
+
+    async def bulk(self, body, index=None, **kwargs):
+        return await self._request('bulk', index, body)
+
+    async def index(self, index, body, **kwargs):
+        return await self._request('index', index, body)
+
+    async def delete_by_query(self, index, body, **kwargs):
+        return await self._request('delete_by_query', index, body)
+
+
+class FakeContext:
+    """Lambda context with plenty of time for the first `calls` checks and none after that."""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def get_remaining_time_in_millis(self):
+        self.calls -= 1
+        return 900000 if self.calls >= 0 else 1000
+
+
+def run_batch(records, async_s3, es, concurrency=4, queue=None, context=None):
+    import async_handler
+    import overflow
+
+    consumer = async_handler.AsyncConsumer(async_s3, es, concurrency=concurrency, queue=queue)
+    asyncio.run(consumer.handle_batch({"Records": records}, overflow.Deadline(context)))
+    return consumer
+
+
+class TestAsyncConsumer:
+    """Tests for `AsyncConsumer`."""
+
+    def test_records_of_an_asset_are_processed_in_order(self, s3, async_s3):
+        asset_id = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+        records = [
+            make_record(asset_id, {"Action": "INSERT", "S3Key": "private/assets/a/input/video.mp4", "Created": "1"}),
+            make_modify_record(asset_id, 'Mediainfo'),
+            make_record(asset_id, {"Action": "REMOVE"}),
+        ]
+        s3.objects['private/assets/{}/workflows/{}/Mediainfo.json'.format(asset_id, WORKFLOW_ID)] = read_operator('Mediainfo.json')
+        es = FakeOpenSearch(delay=0.01)
+
+        run_batch(records, async_s3, es)
+
+        assert [(method, index) for method, index, _body in es.requests] == [
+            ('bulk', 'mieinitialization'), ('bulk', 'miemediainfo'), ('delete_by_query', '_all')]
+
+    def test_assets_are_processed_concurrently(self, async_s3):
+        asset_ids = ['asset-{}'.format(i) for i in range(4)]
+        records = [make_record(asset_id, {"Action": "INSERT", "S3Key": "input/video.mp4", "Created": "1"})
+                   for asset_id in asset_ids]
+        es = FakeOpenSearch(delay=0.05)
+
+        run_batch(records, async_s3, es, concurrency=4)
+
+        assert len(es.requests) == 4
+        assert es.max_in_flight > 1
+
+    def test_missing_object(self, async_s3):
+        es = FakeOpenSearch()
+
+        run_batch([make_modify_record('asset', 'labelDetection')], async_s3, es)
+
+        assert es.requests == []
+
+    def test_large_result_is_streamed(self, monkeypatch, s3, async_s3):
+        import lambda_handler
+
+        monkeypatch.setattr(lambda_handler, 'STREAMING_THRESHOLD_BYTES', 1000)
+        monkeypatch.setattr(lambda_handler, 'STREAMING_BATCH_BYTES', 500000)
+        body = read_operator('labelDetection.json.gz')
+        key = 'private/assets/asset/workflows/{}/labelDetection.json'.format(WORKFLOW_ID)
+        s3.objects[key] = body
+        es = FakeOpenSearch()
+
+        run_batch([make_modify_record('asset', 'labelDetection')], async_s3, es)
+
+        indexed = sum(len(body.split('\n')) // 2 for method, index, body in es.requests if index == 'mielabels')
+        assert indexed == sum(len(page['Labels']) for page in json.loads(body))
+
+    def test_records_are_deferred_at_the_deadline(self, monkeypatch, tmp_path, s3, async_s3):
+        import lambda_handler
+        import overflow
+
+        monkeypatch.setattr(lambda_handler, 'STREAMING_THRESHOLD_BYTES', 1000)
+        monkeypatch.setattr(lambda_handler, 'STREAMING_BATCH_BYTES', 200000)
+        body = read_operator('labelDetection.json.gz')
+        key = 'private/assets/asset/workflows/{}/labelDetection.json'.format(WORKFLOW_ID)
+        s3.objects[key] = body
+        queue = overflow.LocalQueue(str(tmp_path))
+        es = FakeOpenSearch()
+        records = [make_modify_record('asset', 'labelDetection'), make_record('asset', {"Action": "REMOVE"})]
+
+        # One check before the record and two before its first batches of pages.
+        run_batch(records, async_s3, es, queue=queue, context=FakeContext(3))
+
+        indexed = sum(len(body.split('\n')) // 2 for method, index, body in es.requests if index == 'mielabels')
+        assert 0 < indexed < sum(len(page['Labels']) for page in json.loads(body))
+        [message] = queue.receive()
+        assert [record["Action"] for record in message.body["Records"]] == ["MODIFY", "REMOVE"]
+        assert message.body["Records"][0]["Cursor"] > 0
+        assert message.body["Deferrals"] == 1
+        assert 'delete_by_query' not in [method for method, _index, _body in es.requests]
+
+    def test_redelivered_record_is_skipped(self, monkeypatch, s3, async_s3):
+        import lambda_handler
+        import pointer_cache
+
+        monkeypatch.setattr(lambda_handler, 'indexed_pointers', pointer_cache.PointerCache(10, 600))
+        asset_id = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+        s3.objects['private/assets/{}/workflows/{}/Mediainfo.json'.format(asset_id, WORKFLOW_ID)] = read_operator('Mediainfo.json')
+        es = FakeOpenSearch()
+
+        run_batch([make_modify_record(asset_id, 'Mediainfo')], async_s3, es)
+        run_batch([make_modify_record(asset_id, 'Mediainfo')], async_s3, es)
+
+        assert (s3.gets, s3.heads) == (1, 1)
+        assert [(method, index) for method, index, _body in es.requests] == [('bulk', 'miemediainfo')]
+
+    def test_generation_is_bumped(self, monkeypatch, s3, async_s3):
+        import lambda_handler
+
+        monkeypatch.setenv('SearchGenerations', 'true')
+        monkeypatch.setattr(lambda_handler.asset_generations, 's3_client', s3)
+        asset_id = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+        s3.objects['private/assets/{}/workflows/{}/Mediainfo.json'.format(asset_id, WORKFLOW_ID)] = read_operator('Mediainfo.json')
+
+        run_batch([make_modify_record(asset_id, 'Mediainfo')], async_s3, FakeOpenSearch())
+        first = s3.objects[lambda_handler.asset_generations.key(asset_id)]
+        run_batch([make_modify_record(asset_id, 'Mediainfo'), make_record(asset_id, {"Action": "REMOVE"})],
+                  async_s3, FakeOpenSearch())
+
+        assert s3.objects[lambda_handler.asset_generations.key(asset_id)] != first
+        assert s3.puts == 3
+
+    def test_failed_record_fails_the_batch(self, monkeypatch, async_s3):
+        import pytest
+
+        import lambda_handler
+
+        handle_insert = lambda_handler.handle_insert
+
+        def fail_on_broken_asset(asset_id, payload):
+            if asset_id == 'broken':
+                raise ValueError("boom")
+            handle_insert(asset_id, payload)
+
+        monkeypatch.setattr(lambda_handler, 'handle_insert', fail_on_broken_asset)
+        insert = {"Action": "INSERT", "S3Key": "input/video.mp4", "Created": "1"}
+        records = [make_record('broken', insert), make_record('broken', {"Action": "REMOVE"}),
+                   make_record('asset', insert)]
+        es = FakeOpenSearch()
+
+        with pytest.raises(ValueError):
+            run_batch(records, async_s3, es)
+
+        # The other asset is processed, the records after the failed one are not.
+        assert [(method, index) for method, index, _body in es.requests] == [('bulk', 'mieinitialization')]
+
+    def test_records_are_profiled_and_tracked(self, monkeypatch, capsys, s3, async_s3):
+        monkeypatch.setenv('ProfilingSampleRate', '1')
+        asset_id = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+        body = read_operator('Mediainfo.json')
+        s3.objects['private/assets/{}/workflows/{}/Mediainfo.json'.format(asset_id, WORKFLOW_ID)] = body
+
+        run_batch([make_modify_record(asset_id, 'Mediainfo')], async_s3, FakeOpenSearch())
+
+        out = capsys.readouterr().out
+        [report] = [json.loads(line) for line in out.splitlines() if line.startswith('{"_aws"')]
+        assert (report["Operator"], report["ObjectSize"]) == ('Mediainfo', len(body))
+        assert 'Profile for asset: {}'.format(asset_id) in out
+
+
+class TestSignedConnection:
+    """Tests for `SignedAIOHttpConnection`."""
+
+    def test_request_is_signed(self, monkeypatch):
+        import async_handler
+
+        send = AsyncMock(return_value=(200, {}, '{}'))
+        monkeypatch.setattr(async_handler.AIOHttpConnection, 'perform_request', send)
+        connection = async_handler.SignedAIOHttpConnection(
+            host='search.example.com', port=443, use_ssl=True,
+            aws_credentials=Credentials('AKIDEXAMPLE', 'secret', 'token'), aws_region='us-west-2')
+
+        asyncio.run(connection.perform_request('POST', '/mielabels/_bulk', params={'refresh': 'true'}, body='{"a": 1}'))
+
+        kwargs = send.call_args.kwargs
+        assert kwargs['body'] == b'{"a": 1}'
+        headers = kwargs['headers']
+        assert headers['Authorization'].startswith('AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/')
+        assert '/us-west-2/es/aws4_request' in headers['Authorization']
+        assert headers['X-Amz-Security-Token'] == 'token'
+        assert 'X-Amz-Date' in headers
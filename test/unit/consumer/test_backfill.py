@@ -0,0 +1,268 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import io
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+ASSET_PREFIX = 'private/assets/{}/'.format(ASSET_ID)
+OPERATORS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators')
+NOW = datetime(2023, 3, 3, 12, 0, tzinfo=timezone.utc)
+
+
+def s3_object(key, minutes=0):
+    return {'Key': key, 'LastModified': NOW + timedelta(minutes=minutes), 'Size': 1}
+
+
+def fake_s3(objects, bodies):
+    s3 = MagicMock()
+    s3.get_paginator.return_value.paginate.return_value = [{'Contents': objects}]
+
+    def get_object(Bucket, Key):
+        body = bodies[Key]
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+
+    s3.get_object.side_effect = get_object
+    return s3
+
+
+class TestPlanAsset:
+    """Tests for `plan_asset`."""
+
+    def test_latest_result_of_each_operator(self):
+        import backfill
+
+        objects = [
+            s3_object(ASSET_PREFIX + 'input/video.mp4'),
+            s3_object(ASSET_PREFIX + 'workflows/wf-1/labelDetection.json', 1),
+            s3_object(ASSET_PREFIX + 'workflows/wf-2/labelDetection.json', 5),
+            s3_object(ASSET_PREFIX + 'workflows/wf-1/Mediainfo.json', 1),
+            s3_object(ASSET_PREFIX + 'workflows/wf-1/transcode/video.mp4', 1),
+        ]
+        media, results = backfill.plan_asset(objects, ASSET_PREFIX)
+
+        assert media['Key'].endswith('input/video.mp4')
+        assert [(result['Operator'], result['Workflow']) for result in results] == [
+            ('Mediainfo', 'wf-1'), ('labelDetection', 'wf-2')]
+
+    def test_compressed_results(self):
+        import backfill
+
+        objects = [
+            s3_object(ASSET_PREFIX + 'workflows/wf-1/labelDetection.json.gz', 1),
+            s3_object(ASSET_PREFIX + 'workflows/wf-1/faceDetection.json.zst', 1),
+            s3_object(ASSET_PREFIX + 'workflows/wf-1/.json', 1),
+        ]
+        _media, results = backfill.plan_asset(objects, ASSET_PREFIX)
+
+        assert [result['Operator'] for result in results] == ['faceDetection', 'labelDetection']
+
+    def test_list_assets(self):
+        import backfill
+
+        s3 = MagicMock()
+        s3.get_paginator.return_value.paginate.return_value = [
+            {'CommonPrefixes': [{'Prefix': 'private/assets/a/'}, {'Prefix': 'private/assets/b/'}]},
+            {'CommonPrefixes': [{'Prefix': 'private/assets/c/'}]},
+        ]
+        assert list(backfill.list_assets(s3, 'bucket')) == ['a', 'b', 'c']
+        s3.get_paginator.return_value.paginate.assert_called_once_with(
+            Bucket='bucket', Prefix='private/assets/', Delimiter='/')
+
+
+class TestConcurrentSender:
+    """Tests for `ConcurrentSender`."""
+
+    def test_throttled_items_are_retried(self):
+        import backfill
+
+        es = MagicMock()
+        es.bulk.side_effect = [
+            {'errors': True, 'items': [{'index': {'status': 201}}, {'index': {'status': 429}}]},
+            {'errors': False, 'items': [{'index': {'status': 201}}]},
+        ]
+        sender = backfill.ConcurrentSender(es, senders=2, retry_delay=0)
+        sender.bulk(index='mielabels', body='{"index":{}}\n{"a":1}\n{"index":{}}\n{"a":2}')
+
+        assert sender.flush() == []
+        assert es.bulk.call_args.kwargs['body'] == '{"index":{}}\n{"a":2}'
+        sender.close()
+
+    def test_failures_are_reported(self):
+        import backfill
+
+        es = MagicMock()
+        es.bulk.return_value = {'errors': True, 'items': [{'index': {'status': 400}}]}
+        es.index.side_effect = ValueError('rejected')
+        sender = backfill.ConcurrentSender(es, senders=2, retry_delay=0)
+        sender.bulk(index='mielabels', body='{"index":{}}\n{"a":1}')
+        sender.index(index='miemediainfo', body={})
+
+        errors = sender.flush()
+        assert len(errors) == 2
+        assert '1 documents were not indexed in mielabels' in errors
+        assert 'rejected' in errors
+        sender.close()
+
+
+    def test_derived_index_updates_are_sent_right_away(self):
+        import backfill
+
+        es = MagicMock()
+        es.bulk.return_value = {'errors': True, 'items': [{'update': {'_id': 'a', 'status': 429}}]}
+        sender = backfill.ConcurrentSender(es, senders=1)
+
+        assert sender.bulk(index='miesuggestions', body='{}') == es.bulk.return_value
+        assert sender.flush() == []
+        sender.close()
+
+    def test_other_calls_go_to_the_client(self):
+        import backfill
+
+        es = MagicMock()
+        sender = backfill.ConcurrentSender(es, senders=1)
+        sender.indices.create(index='mietimeline', body={})
+        sender.update_by_query(index='mietimeline', body={})
+
+        es.indices.create.assert_called_once_with(index='mietimeline', body={})
+        es.update_by_query.assert_called_once()
+        with pytest.raises(AttributeError):
+            sender._missing
+        sender.close()
+
+
+class TestCheckpoint:
+    """Tests for `Checkpoint`."""
+
+    def test_resume(self, tmp_path):
+        import backfill
+
+        path = str(tmp_path / 'checkpoint.jsonl')
+        with backfill.Checkpoint(path) as checkpoint:
+            checkpoint.record({'AssetId': 'a', 'Status': 'Done'})
+            checkpoint.record({'AssetId': 'b', 'Status': 'Failed'})
+        with open(path, 'a') as checkpoint_file:
+            checkpoint_file.write('{"AssetId": "c", "Sta')
+
+        assert backfill.Checkpoint(path).completed == {'a'}
+
+    def test_run_skips_completed_assets(self, tmp_path, monkeypatch):
+        import backfill
+
+        worker = MagicMock()
+        worker.backfill_asset.side_effect = lambda asset_id: {'AssetId': asset_id, 'Status': 'Done', 'Errors': []}
+        monkeypatch.setattr(backfill, 'init_worker', lambda *args: setattr(backfill, '_worker', worker))
+        path = str(tmp_path / 'checkpoint.jsonl')
+        with backfill.Checkpoint(path) as checkpoint:
+            checkpoint.record({'AssetId': 'a', 'Status': 'Done'})
+            assert backfill.run(['a', 'b', 'c'], checkpoint, workers=1, senders=1, report=lambda _: None) == (2, 0)
+
+        assert [c.args[0] for c in worker.backfill_asset.call_args_list] == ['b', 'c']
+        assert backfill.Checkpoint(path).completed == {'a', 'b', 'c'}
+
+
+class TestBackfillAsset:
+    """Tests for `Worker.backfill_asset`."""
+
+    def test_asset_is_indexed(self, monkeypatch):
+        import backfill
+        import lambda_handler
+
+        with open(os.path.join(OPERATORS_DIR, 'Mediainfo.json'), 'rb') as f:
+            mediainfo = f.read()
+        objects = [
+            s3_object(ASSET_PREFIX + 'input/video.mp4'),
+            s3_object(ASSET_PREFIX + 'workflows/wf-1/Mediainfo.json', 1),
+            s3_object(ASSET_PREFIX + 'workflows/wf-1/Thumbnail.json', 1),
+        ]
+        monkeypatch.setattr(lambda_handler, 's3', fake_s3(objects, {objects[1]['Key']: mediainfo}))
+        monkeypatch.setattr(lambda_handler, 'connect_es', lambda_handler.connect_es)
+        es = MagicMock()
+        es.bulk.return_value = {'errors': False, 'items': []}
+        worker = backfill.Worker(lambda_handler, es, senders=2)
+
+        result = worker.backfill_asset(ASSET_ID)
+        worker.sender.close()
+
+        assert result['Status'] == 'Done'
+        assert result['Operators'] == 1
+        assert result['Skipped'] == 1
+        es.delete_by_query.assert_called_once()
+        # Requests are sent from a thread pool, so they can arrive in any order.
+        bodies = {c.kwargs['index']: c.kwargs['body'] for c in es.bulk.call_args_list}
+        assert set(bodies) == {'mieinitialization', 'miemediainfo'}
+        assert json.loads(bodies['mieinitialization'].split('\n')[1])['filename'] == 'video.mp4'
+
+    def test_derived_indices_are_rebuilt(self, monkeypatch):
+        import backfill
+        import derived_index
+        import lambda_handler
+
+        monkeypatch.setenv('AssetCatalog', 'true')
+        monkeypatch.setattr(derived_index, '_ensured', set())
+        objects = [s3_object(ASSET_PREFIX + 'input/video.mp4')]
+        monkeypatch.setattr(lambda_handler, 's3', fake_s3(objects, {}))
+        monkeypatch.setattr(lambda_handler, 'connect_es', lambda_handler.connect_es)
+        es = MagicMock()
+        es.bulk.return_value = {'errors': False, 'items': []}
+        worker = backfill.Worker(lambda_handler, es, senders=1)
+
+        result = worker.backfill_asset(ASSET_ID)
+        worker.sender.close()
+
+        assert result['Status'] == 'Done'
+        # _all does not include the hidden derived indices.
+        assert [c.kwargs['index'] for c in es.delete_by_query.call_args_list] == ['_all', 'mieassetcatalog']
+        es.indices.create.assert_called_once()
+        assert es.indices.create.call_args.kwargs['index'] == 'mieassetcatalog'
+        bodies = {c.kwargs['index']: c.kwargs['body'] for c in es.bulk.call_args_list}
+        assert json.loads(bodies['mieassetcatalog'].split('\n')[1])['doc']['Filename'] == 'video.mp4'
+
+    def test_failed_derived_update_fails_asset(self, monkeypatch):
+        import backfill
+        import derived_index
+        import lambda_handler
+
+        monkeypatch.setenv('AssetCatalog', 'true')
+        monkeypatch.setattr(derived_index, '_ensured', set())
+        objects = [s3_object(ASSET_PREFIX + 'input/video.mp4')]
+        monkeypatch.setattr(lambda_handler, 's3', fake_s3(objects, {}))
+        monkeypatch.setattr(lambda_handler, 'connect_es', lambda_handler.connect_es)
+        es = MagicMock()
+        es.bulk.return_value = {'errors': False, 'items': []}
+        es.indices.create.side_effect = ValueError('forbidden')
+        worker = backfill.Worker(lambda_handler, es, senders=1)
+
+        result = worker.backfill_asset(ASSET_ID)
+        worker.sender.close()
+
+        assert result['Status'] == 'Failed'
+        assert result['Errors'] == ['1 requests to delete or initialize the asset failed']
+
+    def test_missing_object_fails_asset(self, monkeypatch):
+        import backfill
+        import lambda_handler
+
+        objects = [s3_object(ASSET_PREFIX + 'workflows/wf-1/labelDetection.json')]
+        s3 = fake_s3(objects, {})
+        monkeypatch.setattr(lambda_handler, 's3', s3)
+        monkeypatch.setattr(lambda_handler, 'connect_es', lambda_handler.connect_es)
+        worker = backfill.Worker(lambda_handler, MagicMock(), senders=1)
+
+        result = worker.backfill_asset(ASSET_ID)
+        worker.sender.close()
+
+        assert result['Status'] == 'Failed'
+        assert 'labelDetection.json' in result['Errors'][0]
+
+
+@pytest.fixture(autouse=True)
+def reset_worker():
+    yield
+    import backfill
+    backfill._worker = None
@@ -0,0 +1,149 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import threading
+import time
+
+
+class SlowDomain:
+    """Records chunks in order, waiting until `release` is set before accepting the first one."""
+
+    def __init__(self):
+        self.chunks = []
+        self.release = threading.Event()
+
+    def send(self, chunk):
+        self.release.wait(5)
+        self.chunks.append(chunk)
+
+
+class TestBulkPipeline:
+    """Tests for `BulkPipeline`."""
+
+    def test_single_chunk_is_sent_inline(self):
+        import bulk_pipeline
+
+        sent = []
+        pipeline = bulk_pipeline.BulkPipeline(lambda chunk: sent.append((chunk, threading.current_thread())))
+
+        pipeline.put('{"index": {}}\n{"a": 1}')
+        stats = pipeline.close()
+
+        assert sent == [('{"index": {}}\n{"a": 1}', threading.current_thread())]
+        assert stats == {"Chunks": 1, "Spilled": 0, "Blocked": 0}
+
+    def test_chunks_are_sent_in_order(self):
+        import bulk_pipeline
+
+        sent = []
+        pipeline = bulk_pipeline.BulkPipeline(sent.append, queue_bytes=1000)
+        chunks = ['chunk {}'.format(i) for i in range(50)]
+
+        for chunk in chunks:
+            pipeline.put(chunk)
+        pipeline.close()
+
+        assert sent == chunks
+
+    def test_chunks_spill_to_disk_when_the_queue_is_full(self, tmp_path):
+        import bulk_pipeline
+
+        domain = SlowDomain()
+        pipeline = bulk_pipeline.BulkPipeline(domain.send, queue_bytes=20, spill_bytes=1000,
+                                              spill_directory=str(tmp_path))
+        chunks = ['café {:05d}'.format(i) for i in range(10)]
+
+        for chunk in chunks:
+            pipeline.put(chunk)
+        domain.release.set()
+        stats = pipeline.close()
+
+        assert domain.chunks == chunks
+        assert stats["Spilled"] > 0
+        assert stats["Blocked"] == 0
+
+    def test_producer_blocks_when_the_spill_file_is_full(self):
+        import bulk_pipeline
+
+        domain = SlowDomain()
+        pipeline = bulk_pipeline.BulkPipeline(domain.send, queue_bytes=10, spill_bytes=25)
+        chunks = ['chunk {:03d}'.format(i) for i in range(10)]
+        done = threading.Event()
+
+        def produce():
+            for chunk in chunks:
+                pipeline.put(chunk)
+            done.set()
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        time.sleep(0.2)
+        assert not done.is_set()
+
+        domain.release.set()
+        producer.join(5)
+        stats = pipeline.close()
+
+        assert domain.chunks == chunks
+        assert stats["Blocked"] > 0
+
+    def test_send_error_does_not_stop_the_pipeline(self):
+        import bulk_pipeline
+
+        sent = []
+
+        def send(chunk):
+            if chunk == 'bad':
+                raise ValueError(chunk)
+            sent.append(chunk)
+
+        pipeline = bulk_pipeline.BulkPipeline(send)
+        for chunk in ['a', 'bad', 'b']:
+            pipeline.put(chunk)
+        pipeline.close()
+
+        assert sent == ['a', 'b']
+
+
+class TestBulkIndex:
+    """Tests for `bulk_index` with the documents a transform yields."""
+
+    def test_yielded_documents_are_indexed(self):
+        import json
+        from unittest.mock import MagicMock
+
+        import lambda_handler
+
+        es = MagicMock()
+        lambda_handler.bulk_index(es, 'asset', 'labels', ({"Name": name} for name in ['Car', 'Tree']))
+
+        lines = es.bulk.call_args.kwargs['body'].split('\n')
+        assert [json.loads(line)["Name"] for line in lines[1::2]] == ['Car', 'Tree']
+
+    def test_nothing_is_sent_when_nothing_is_yielded(self):
+        from unittest.mock import MagicMock
+
+        import lambda_handler
+
+        es = MagicMock()
+        lambda_handler.bulk_index(es, 'asset', 'labels', iter([]))
+
+        assert not es.method_calls
+
+
+class TestSpillFile:
+    """Tests for `SpillFile`."""
+
+    def test_position_is_reset_when_drained(self, tmp_path):
+        import bulk_pipeline
+
+        spill = bulk_pipeline.SpillFile(10, str(tmp_path))
+        first = spill.write(b'12345')
+        second = spill.write(b'678')
+
+        assert not spill.has_room(3)
+        assert spill.read(*first) == b'12345'
+        assert not spill.has_room(3)
+        assert spill.read(*second) == b'678'
+        assert spill.has_room(10)
+        spill.close()
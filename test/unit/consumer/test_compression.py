@@ -0,0 +1,141 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import gzip
+import json
+import os
+from io import BytesIO
+from unittest.mock import MagicMock
+
+import pytest
+import zstandard
+
+OPERATORS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators')
+POINTER = 'private/assets/asset/workflows/11111111-2222-3333-4444-555555555555/labelDetection.json'
+
+
+def read_labels():
+    with gzip.open(os.path.join(OPERATORS_DIR, 'labelDetection.json.gz')) as f:
+        return f.read()
+
+
+COMPRESSORS = {
+    'gzip': gzip.compress,
+    'zstd': lambda data: zstandard.ZstdCompressor().compress(data),
+}
+
+
+class TestDetectEncoding:
+    """Tests for `detect_encoding`."""
+
+    @pytest.mark.parametrize("key, content_encoding, head, expected", [
+        ('result.json', None, b'[{"a', None),
+        ('result.json', 'gzip', b'[{"a', 'gzip'),
+        ('result.json', 'zstd', b'[{"a', 'zstd'),
+        ('result.json.gz', None, b'', 'gzip'),
+        ('result.json.zst', None, b'', 'zstd'),
+        ('result.json', None, b'\x1f\x8b\x08\x00', 'gzip'),
+        ('result.json', None, b'\x28\xb5\x2f\xfd', 'zstd'),
+        ('result.json', 'identity', b'[{"a', None),
+    ])
+    def test_detect(self, key, content_encoding, head, expected):
+        import compression
+
+        assert compression.detect_encoding(key, content_encoding, head) == expected
+
+
+class TestOpenStream:
+    """Tests for `open_stream`."""
+
+    @pytest.mark.parametrize("encoding", sorted(COMPRESSORS))
+    def test_decompresses_in_chunks(self, encoding):
+        import compression
+        import json_stream
+
+        data = read_labels()
+        stream, detected = compression.open_stream(BytesIO(COMPRESSORS[encoding](data)), 'result.json')
+
+        assert detected == encoding
+        assert list(json_stream.iter_json_array(stream, 1024)) == json.loads(data)
+
+    def test_uncompressed_body_is_unchanged(self):
+        import compression
+
+        stream, detected = compression.open_stream(BytesIO(b'{"a": 1}'), 'result.json')
+
+        assert detected is None
+        assert stream.read(2) + stream.read() == b'{"a": 1}'
+
+
+    def test_zstandard_is_only_needed_for_zstd(self, monkeypatch):
+        import sys
+        import compression
+
+        # Importing a module that is None in sys.modules raises ImportError.
+        monkeypatch.setitem(sys.modules, 'zstandard', None)
+
+        stream, detected = compression.open_stream(BytesIO(gzip.compress(b'{"a": 1}')), 'result.json')
+
+        assert detected == 'gzip'
+        assert stream.read() == b'{"a": 1}'
+        with pytest.raises(ImportError):
+            compression.open_stream(BytesIO(COMPRESSORS['zstd'](b'{"a": 1}')), 'result.json')
+
+
+class TestReadJsonFromS3:
+    """Tests for reading compressed results in `read_json_from_s3`."""
+
+    @pytest.mark.parametrize("encoding", sorted(COMPRESSORS))
+    def test_small_result(self, monkeypatch, s3, encoding):
+        import lambda_handler
+
+        data = b'{"Labels": []}'
+        s3.objects[POINTER] = COMPRESSORS[encoding](data)
+        s3.content_encodings[POINTER] = encoding
+        monkeypatch.setattr(lambda_handler, 's3', s3)
+
+        metadata = lambda_handler.read_json_from_s3(POINTER, streamable=True)
+
+        assert metadata["Results"] == data.decode('utf-8')
+
+    @pytest.mark.parametrize("encoding", sorted(COMPRESSORS))
+    def test_large_result_is_streamed(self, monkeypatch, s3, encoding):
+        import lambda_handler
+
+        data = read_labels()
+        body = COMPRESSORS[encoding](data)
+        es = MagicMock()
+        s3.objects[POINTER] = body
+        monkeypatch.setattr(lambda_handler, 's3', s3)
+        monkeypatch.setattr(lambda_handler, 'connect_es', lambda endpoint: es)
+        # Only the decompressed result is over the threshold.
+        monkeypatch.setattr(lambda_handler, 'STREAMING_THRESHOLD_BYTES', len(body) + 1)
+
+        metadata = lambda_handler.read_json_from_s3(POINTER, streamable=True)
+        lambda_handler.process_modify_metadata('asset', 'workflow', 'labelDetection', metadata)
+
+        assert "Pages" in metadata
+        indexed = sum(len(c.kwargs['body'].split('\n')) // 2 for c in es.bulk.call_args_list)
+        assert indexed == sum(len(page['Labels']) for page in json.loads(data))
+
+    @pytest.mark.parametrize("encoding", sorted(COMPRESSORS))
+    def test_small_result_async(self, s3, async_s3, encoding):
+        import asyncio
+        import async_handler
+
+        data = b'{"Labels": []}'
+        s3.objects[POINTER] = COMPRESSORS[encoding](data)
+
+        metadata = asyncio.run(async_handler.read_json_from_s3(async_s3, POINTER, streamable=True))
+
+        assert metadata["Results"] == data.decode('utf-8')
+
+    def test_corrupt_result(self, monkeypatch, s3):
+        import lambda_handler
+
+        s3.objects[POINTER] = b'\x1f\x8b\x08\x00not gzip'
+        monkeypatch.setattr(lambda_handler, 's3', s3)
+
+        metadata = lambda_handler.read_json_from_s3(POINTER)
+
+        assert metadata["Status"] == "Error"
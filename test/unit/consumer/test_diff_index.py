@@ -0,0 +1,134 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+MANIFEST_KEY = 'private/assets/{}/search/key_phrases.json'.format(ASSET_ID)
+
+
+def key_phrases(*texts):
+    phrases = [{"BeginOffset": i, "EndOffset": i + 1, "Score": 0.9, "Text": text} for i, text in enumerate(texts)]
+    return json.dumps({"LanguageCode": "en", "Results": [json.dumps({"KeyPhrases": phrases})]})
+
+
+def bulk_lines(es):
+    """Return the action and document lines of every bulk request, as (action, document or None) tuples."""
+    lines = []
+    for c in es.bulk.call_args_list:
+        body = [json.loads(line) for line in c.kwargs['body'].split('\n')]
+        position = 0
+        while position < len(body):
+            action = body[position]
+            if 'delete' in action:
+                lines.append((action, None))
+                position += 1
+            else:
+                lines.append((action, body[position + 1]))
+                position += 2
+    return lines
+
+
+@pytest.fixture
+def consumer(monkeypatch, s3, es):
+    import diff_index
+    import lambda_handler
+
+    monkeypatch.setenv('DiffIndexing', 'true')
+    monkeypatch.setattr(lambda_handler, 'connect_es', lambda endpoint: es)
+    monkeypatch.setattr(lambda_handler, 'diff_manifests', diff_index.ManifestStore(s3, 'bucket'))
+    return lambda_handler
+
+
+def index_key_phrases(consumer, workflow, *texts):
+    consumer.process_modify_metadata(ASSET_ID, workflow, 'key_phrases', {"Results": key_phrases(*texts)})
+
+
+class TestDiffIndexing:
+    """Tests for indexing only the documents that changed."""
+
+    def test_first_run_writes_every_document(self, consumer, s3, es):
+        index_key_phrases(consumer, 'workflow-1', 'Boulder', 'a show', 'the farm')
+
+        lines = bulk_lines(es)
+        assert [document['PhraseText'] for _action, document in lines] == ['Boulder', 'a show', 'the farm']
+        ids = [action['index']['_id'] for action, _document in lines]
+        assert len(set(ids)) == 3
+        assert json.loads(s3.objects[MANIFEST_KEY])["Documents"] == {"miekey_phrases": ids}
+
+    def test_unchanged_rerun_writes_nothing(self, consumer, s3, es):
+        index_key_phrases(consumer, 'workflow-1', 'Boulder', 'a show')
+        es.reset_mock()
+
+        index_key_phrases(consumer, 'workflow-2', 'Boulder', 'a show')
+
+        assert not es.bulk.called
+
+    def test_edit_writes_the_change_and_deletes_the_old_document(self, consumer, s3, es):
+        index_key_phrases(consumer, 'workflow-1', 'Boulder', 'a show', 'the farm')
+        old_ids = [action['index']['_id'] for action, _document in bulk_lines(es)]
+        es.reset_mock()
+
+        index_key_phrases(consumer, 'workflow-2', 'Boulder', 'a play', 'the farm')
+
+        lines = bulk_lines(es)
+        assert [document['PhraseText'] for action, document in lines if document] == ['a play']
+        assert [action['delete']['_id'] for action, document in lines if document is None] == [old_ids[1]]
+        manifest = json.loads(s3.objects[MANIFEST_KEY])["Documents"]["miekey_phrases"]
+        assert old_ids[1] not in manifest and len(manifest) == 3
+
+    def test_manifest_is_kept_when_a_request_fails(self, consumer, s3, es):
+        index_key_phrases(consumer, 'workflow-1', 'Boulder', 'a show')
+        manifest = s3.objects[MANIFEST_KEY]
+        es.bulk.side_effect = Exception("rejected")
+
+        index_key_phrases(consumer, 'workflow-2', 'Boulder', 'a play')
+
+        assert s3.objects[MANIFEST_KEY] == manifest
+
+    def test_caption_languages_have_separate_manifests(self, consumer, s3, es):
+        for language, caption in (('en', 'Hello'), ('es', 'Hola')):
+            captions = {"WebCaptions": [{"start": "0.5", "end": "1.5", "caption": caption}]}
+            consumer.process_modify_metadata(ASSET_ID, 'workflow-1', 'WebCaptions_' + language,
+                                             {"Results": json.dumps(captions)})
+
+        # Indexing Spanish captions does not delete the English ones.
+        assert not es.bulk.called
+        assert [c.kwargs['index'] for c in es.index.call_args_list] == ['miewebcaptions_en', 'miewebcaptions_es']
+        for language in ('en', 'es'):
+            key = 'private/assets/{}/search/webcaptions_{}.json'.format(ASSET_ID, language)
+            documents = json.loads(s3.objects[key])["Documents"]
+            assert list(documents) == ['miewebcaptions_' + language]
+
+    def test_streamed_result_drops_the_manifest(self, consumer, s3, es):
+        consumer.diff_manifests.save(ASSET_ID, 'labelDetection', {"Version": 1, "Documents": {"mielabels": ["a", "b"]}})
+        pages = iter([[{"Labels": [{"Timestamp": 0, "Label": {"Name": "Car", "Confidence": 99.0}}]}]])
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow-2', 'labelDetection', {"Pages": pages})
+
+        lines = bulk_lines(es)
+        assert [action['delete']['_id'] for action, document in lines if document is None] == ['a', 'b']
+        assert [document['Name'] for action, document in lines if document] == ['Car']
+        manifest_key = 'private/assets/{}/search/labeldetection.json'.format(ASSET_ID)
+        assert json.loads(s3.objects[manifest_key])["Documents"] == {}
+
+
+class TestDiffSession:
+    """Tests for `DiffSession`."""
+
+    def test_identical_documents_get_separate_ids(self):
+        import diff_index
+
+        session = diff_index.DiffSession()
+
+        assert session.document_id('mielabels', '{"a": 1}') != session.document_id('mielabels', '{"a": 1}')
+
+    def test_workflow_is_not_part_of_the_id(self):
+        import diff_index
+
+        first = diff_index.DiffSession(workflow='workflow-1').document_id('mielabels', '{"Workflow": "workflow-1"}')
+        second = diff_index.DiffSession(workflow='workflow-2').document_id('mielabels', '{"Workflow": "workflow-2"}')
+
+        assert first == second
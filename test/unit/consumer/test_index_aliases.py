@@ -0,0 +1,165 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+from unittest.mock import MagicMock
+
+from elasticsearch.exceptions import RequestError
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+
+
+def make_es(indices):
+    """Mock client whose get_alias response is {concrete index: [aliases]}."""
+    es = MagicMock()
+    es.indices.get_alias.side_effect = lambda **kwargs: {
+        name: {"aliases": {alias: {} for alias in aliases}} for name, aliases in indices.items()}
+    return es
+
+
+class TestAliasResolver:
+    """Tests for `AliasResolver`."""
+
+    def test_write_alias(self):
+        import index_aliases
+
+        es = make_es({'mielabels-000001': ['mielabels', 'mielabels-write']})
+        resolver = index_aliases.AliasResolver(refresh_seconds=60)
+
+        assert resolver.write_indices(es, 'mielabels') == ['mielabels-write']
+        assert resolver.write_indices(es, 'mielabels') == ['mielabels-write']
+        es.indices.get_alias.assert_called_once_with(index='mie*', expand_wildcards='all')
+
+    def test_next_generation_is_written_too(self):
+        import index_aliases
+
+        es = make_es({
+            'mielabels-000001': ['mielabels', 'mielabels-write'],
+            'mielabels-000002': ['mielabels-next'],
+        })
+        resolver = index_aliases.AliasResolver(refresh_seconds=60)
+
+        assert resolver.write_indices(es, 'mielabels') == ['mielabels-write', 'mielabels-000002']
+        assert resolver.next_indices(es) == ['mielabels-000002']
+
+    def test_legacy_index(self):
+        import index_aliases
+
+        es = make_es({'mielabels': [], 'mielabels-000001': ['mielabels-next']})
+        resolver = index_aliases.AliasResolver(refresh_seconds=60)
+
+        assert resolver.write_indices(es, 'mielabels') == ['mielabels', 'mielabels-000001']
+        es.indices.create.assert_not_called()
+
+    def test_first_generation_is_created(self):
+        import index_aliases
+
+        indices = {}
+        es = make_es(indices)
+        es.indices.create.side_effect = lambda index, body: indices.update({index: list(body['aliases'])})
+        resolver = index_aliases.AliasResolver(refresh_seconds=60)
+
+        assert resolver.write_indices(es, 'mielabels') == ['mielabels-write']
+        es.indices.create.assert_called_once_with(index='mielabels-000001', body={
+            "aliases": {"mielabels": {}, "mielabels-write": {"is_write_index": True}}})
+
+    def test_concurrent_creation(self):
+        import index_aliases
+
+        indices = {}
+        es = make_es(indices)
+
+        def create(index, body):
+            indices.update({index: list(body['aliases'])})
+            raise RequestError(400, 'resource_already_exists_exception', {})
+
+        es.indices.create.side_effect = create
+        resolver = index_aliases.AliasResolver(refresh_seconds=60)
+
+        assert resolver.write_indices(es, 'mielabels') == ['mielabels-write']
+
+    def test_cache_expires(self):
+        import index_aliases
+
+        indices = {'mielabels-000001': ['mielabels', 'mielabels-write']}
+        es = make_es(indices)
+        resolver = index_aliases.AliasResolver(refresh_seconds=0)
+        assert resolver.write_indices(es, 'mielabels') == ['mielabels-write']
+
+        indices['mielabels-000002'] = ['mielabels-next']
+        assert resolver.write_indices(es, 'mielabels') == ['mielabels-write', 'mielabels-000002']
+
+    def test_error_falls_back_to_index_name(self):
+        import index_aliases
+
+        es = MagicMock()
+        es.indices.get_alias.side_effect = Exception('forbidden')
+        resolver = index_aliases.AliasResolver(refresh_seconds=60)
+
+        assert resolver.write_indices(es, 'mielabels') == ['mielabels']
+        assert resolver.next_indices(es) == []
+
+
+class TestConsumerWrites:
+    """Tests for writing through aliases from the consumer."""
+
+    def test_bulk_index_dual_write(self, monkeypatch):
+        import lambda_handler
+
+        monkeypatch.setenv('IndexAliases', 'true')
+        monkeypatch.setattr(lambda_handler, 'alias_resolver', lambda_handler.index_aliases.AliasResolver(60))
+        es = make_es({
+            'mielabels-000001': ['mielabels', 'mielabels-write'],
+            'mielabels-000002': ['mielabels-next'],
+        })
+
+        lambda_handler.bulk_index(es, ASSET_ID, 'labels', [{'Name': 'Car'}, {'Name': 'Tree'}])
+
+        es.bulk.assert_called_once()
+        assert es.bulk.call_args.kwargs['index'] == 'mielabels-write'
+        lines = es.bulk.call_args.kwargs['body'].split('\n')
+        actions = [json.loads(line)['index'] for line in lines[0::2]]
+        assert [action['_index'] for action in actions] == [
+            'mielabels-write', 'mielabels-000002', 'mielabels-write', 'mielabels-000002']
+        assert actions[0]['_id'] == actions[1]['_id']
+        assert actions[2]['_id'] == actions[3]['_id']
+        assert actions[0]['_id'] != actions[2]['_id']
+
+    def test_index_document_dual_write(self, monkeypatch):
+        import lambda_handler
+
+        monkeypatch.setenv('IndexAliases', 'true')
+        monkeypatch.setattr(lambda_handler, 'alias_resolver', lambda_handler.index_aliases.AliasResolver(60))
+        es = make_es({'mietranslation': [], 'mietranslation-000001': ['mietranslation-next']})
+
+        lambda_handler.index_document(es, ASSET_ID, 'translation', {'Text': 'Hola'})
+
+        calls = es.index.call_args_list
+        assert [c.kwargs['index'] for c in calls] == ['mietranslation', 'mietranslation-000001']
+        assert calls[0].kwargs['id'] == calls[1].kwargs['id']
+
+    def test_delete_includes_next_generation(self, monkeypatch):
+        import lambda_handler
+
+        monkeypatch.setenv('IndexAliases', 'true')
+        monkeypatch.setattr(lambda_handler, 'alias_resolver', lambda_handler.index_aliases.AliasResolver(60))
+        es = make_es({
+            'mielabels-000002': ['mielabels-next'],
+            'miefaces-000004': ['miefaces-next'],
+        })
+
+        lambda_handler.delete_asset_all_indices(es, ASSET_ID)
+
+        assert [c.kwargs['index'] for c in es.delete_by_query.call_args_list] == [
+            '_all', 'miefaces-000004,mielabels-000002']
+
+    def test_disabled_by_default(self, monkeypatch):
+        import lambda_handler
+
+        monkeypatch.delenv('IndexAliases', raising=False)
+        es = MagicMock()
+
+        lambda_handler.bulk_index(es, ASSET_ID, 'labels', [{'Name': 'Car'}])
+
+        es.indices.get_alias.assert_not_called()
+        assert es.bulk.call_args.kwargs['index'] == 'mielabels'
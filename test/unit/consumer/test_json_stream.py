@@ -0,0 +1,133 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import gzip
+import json
+import os
+import pytest
+from io import BytesIO
+
+PAGES = [
+    {"Labels": [{"Timestamp": i, "Label": {"Name": "Café {}".format(i), "Confidence": 90.5}}]}
+    for i in range(20)
+]
+
+
+class TestIterJsonArray:
+    """Tests for `iter_json_array`."""
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 1024 * 1024])
+    def test_pages(self, chunk_size):
+        import json_stream
+
+        body = BytesIO(json.dumps(PAGES, indent=2).encode('utf-8'))
+
+        assert list(json_stream.iter_json_array(body, chunk_size)) == PAGES
+
+    @pytest.mark.parametrize("chunk_size", [1, 3, 1024])
+    def test_scalars(self, chunk_size):
+        import json_stream
+
+        data = [12345, 1.5e10, "text", None, True, [1, [2]], {}]
+        body = BytesIO(json.dumps(data).encode('utf-8'))
+
+        assert list(json_stream.iter_json_array(body, chunk_size)) == data
+
+    def test_single_page(self):
+        import json_stream
+
+        body = BytesIO(json.dumps(PAGES[0]).encode('utf-8'))
+
+        assert list(json_stream.iter_json_array(body, 4)) == [PAGES[0]]
+
+    def test_empty_array(self):
+        import json_stream
+
+        assert list(json_stream.iter_json_array(BytesIO(b' [ ] '), 1)) == []
+
+    def test_empty_document(self):
+        import json_stream
+
+        with pytest.raises(ValueError):
+            list(json_stream.iter_json_array(BytesIO(b'  '), 1))
+
+    def test_truncated_document(self):
+        import json_stream
+
+        body = BytesIO(json.dumps(PAGES).encode('utf-8')[:-20])
+
+        with pytest.raises(ValueError):
+            list(json_stream.iter_json_array(body, 16))
+
+    def test_operator_result(self):
+        import json_stream
+
+        path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators', 'labelDetection.json.gz')
+        with gzip.open(path) as f:
+            body = f.read()
+
+        assert list(json_stream.iter_json_array(BytesIO(body))) == json.loads(body)
+
+
+class TestIterJsonArrayBatches:
+    """Tests for `iter_json_array_batches`."""
+
+    def test_batches(self):
+        import json_stream
+
+        body = BytesIO(json.dumps(PAGES).encode('utf-8'))
+        page_size = len(json.dumps(PAGES[0]))
+
+        batches = list(json_stream.iter_json_array_batches(body, page_size * 3, 5))
+
+        assert [page for batch in batches for page in batch] == PAGES
+        assert all(len(batch) <= 3 for batch in batches)
+        assert len(batches) >= len(PAGES) // 3
+
+
+class TestIterJsonArrayRaw:
+    """Tests for `iter_json_array_raw`."""
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 1024 * 1024])
+    def test_pages(self, chunk_size):
+        import json_stream
+
+        body = BytesIO(json.dumps(PAGES, indent=2).encode('utf-8'))
+
+        assert [json.loads(text) for text in json_stream.iter_json_array_raw(body, chunk_size)] == PAGES
+
+    @pytest.mark.parametrize("chunk_size", [1, 3, 1024])
+    def test_brackets_in_strings_and_scalars(self, chunk_size):
+        import json_stream
+
+        data = [{"Name": "a]}\"[{", "Path": "C:\\"}, "]", 12345, -1.5e10, None, True, [], {}]
+        body = BytesIO(json.dumps(data).encode('utf-8'))
+
+        assert [json.loads(text) for text in json_stream.iter_json_array_raw(body, chunk_size)] == data
+
+    @pytest.mark.parametrize("chunk_size", [1, 5, 1024])
+    def test_deeply_nested(self, chunk_size):
+        import json_stream
+
+        element = ["leaf"]
+        for _ in range(json_stream.SKIP_DEPTH * 2):
+            element = [element, {"Child": element}]
+        data = [element, {"After": 1}]
+        body = BytesIO(json.dumps(data).encode('utf-8'))
+
+        assert [json.loads(text) for text in json_stream.iter_json_array_raw(body, chunk_size)] == data
+
+    def test_single_page(self):
+        import json_stream
+
+        text = json.dumps(PAGES[0])
+
+        assert list(json_stream.iter_json_array_raw(BytesIO(text.encode('utf-8')), 4)) == [text]
+
+    def test_truncated_document(self):
+        import json_stream
+
+        body = BytesIO(json.dumps(PAGES).encode('utf-8')[:-20])
+
+        with pytest.raises(ValueError):
+            list(json_stream.iter_json_array_raw(body, 16))
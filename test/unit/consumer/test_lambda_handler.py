@@ -244,6 +244,200 @@ class TestModify:
         assert len(elasticsearch_stub.method_calls) == bulk_call_count
         assert index_document_stub.call_count == index_doc_call_count
 
+    def test_streaming_operator(self, s3_client_stub, elasticsearch_stub, monkeypatch):
+        """Large paged results are processed and indexed a batch of pages at a time."""
+        import consumer.lambda_handler as lambda_function
+
+        monkeypatch.setattr(lambda_function, 'STREAMING_THRESHOLD_BYTES', 1000)
+        monkeypatch.setattr(lambda_function, 'STREAMING_BATCH_BYTES', 500000)
+
+        file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators', 'labelDetection.json.gz')
+        with gzip.open(file_path) as f:
+            body = f.read()
+        pages = json.loads(body)
+
+        event = make_event(make_modify_record_data('labelDetection', None, None))
+        s3_client_stub.add_response(
+            'get_object',
+            expected_params={
+                'Bucket': os.environ['DataplaneBucket'],
+                'Key': 'private/assets/{}/workflows/{}/labelDetection.json'.format(PARTITION_KEY, WORKFLOW_ID)
+            },
+            service_response={
+                'Body': StreamingBody(BytesIO(body), len(body)),
+                'ContentLength': len(body)
+            }
+        )
+
+        with ProcessOperatorStubber(lambda_function, 'labelDetection', 'process_label_detection') as op_stubber:
+            lambda_function.lambda_handler(event, make_context())
+
+            # Every call gets a batch of already decoded pages instead of the JSON string.
+            assert op_stubber.stub.call_count > 1
+            batches = [c.args[2] for c in op_stubber.stub.call_args_list]
+            assert all(isinstance(batch, list) for batch in batches)
+            assert sum(len(batch) for batch in batches) == len(pages)
+
+        bulk_calls = elasticsearch_stub.return_value.bulk.call_args_list
+        indexed = sum(len(c.kwargs['body'].split('\n')) // 2 for c in bulk_calls)
+        assert indexed == sum(len(page['Labels']) for page in pages)
+
+    def test_transform_pool_operator(self, s3_client_stub, elasticsearch_stub, monkeypatch):
+        """Large paged results are transformed in worker processes and the payloads sent by the handler."""
+        import consumer.lambda_handler as lambda_function
+
+        monkeypatch.setenv('TransformWorkers', '2')
+        monkeypatch.setenv('TransformPoolThresholdBytes', '1000')
+        monkeypatch.setattr(lambda_function.transform_pool, 'BATCH_BYTES', 500000)
+
+        file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators', 'labelDetection.json.gz')
+        with gzip.open(file_path) as f:
+            body = f.read()
+        pages = json.loads(body)
+
+        event = make_event(make_modify_record_data('labelDetection', None, None))
+        s3_client_stub.add_response(
+            'get_object',
+            expected_params={
+                'Bucket': os.environ['DataplaneBucket'],
+                'Key': 'private/assets/{}/workflows/{}/labelDetection.json'.format(PARTITION_KEY, WORKFLOW_ID)
+            },
+            service_response={
+                'Body': StreamingBody(BytesIO(body), len(body)),
+                'ContentLength': len(body)
+            }
+        )
+
+        lambda_function.lambda_handler(event, make_context())
+
+        bulk_calls = elasticsearch_stub.return_value.bulk.call_args_list
+        assert all(isinstance(c.kwargs['body'], bytes) for c in bulk_calls)
+        indexed = sum(len(c.kwargs['body'].split(b'\n')) // 2 for c in bulk_calls)
+        assert indexed == sum(len(page['Labels']) for page in pages)
+
+    def test_transform_pool_writes_to_indices_resolved_by_the_handler(self, s3_client_stub, elasticsearch_stub,
+                                                                      monkeypatch):
+        """Workers write to the indices the handler resolved, they do not look up the aliases again."""
+        import consumer.lambda_handler as lambda_function
+
+        monkeypatch.setenv('TransformWorkers', '2')
+        monkeypatch.setenv('TransformPoolThresholdBytes', '1000')
+        monkeypatch.setenv('IndexAliases', 'true')
+        monkeypatch.setattr(lambda_function.transform_pool, 'BATCH_BYTES', 500000)
+        handler_pid = os.getpid()
+
+        class Resolver:
+            def write_indices(self, es_object, es_index):
+                if os.getpid() != handler_pid:
+                    return ['resolved-in-worker']
+                return [es_index + '-write', es_index + '-000002']
+
+        monkeypatch.setattr(lambda_function, 'alias_resolver', Resolver())
+
+        file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators', 'labelDetection.json.gz')
+        with gzip.open(file_path) as f:
+            body = f.read()
+
+        event = make_event(make_modify_record_data('labelDetection', None, None))
+        s3_client_stub.add_response(
+            'get_object',
+            expected_params={
+                'Bucket': os.environ['DataplaneBucket'],
+                'Key': 'private/assets/{}/workflows/{}/labelDetection.json'.format(PARTITION_KEY, WORKFLOW_ID)
+            },
+            service_response={
+                'Body': StreamingBody(BytesIO(body), len(body)),
+                'ContentLength': len(body)
+            }
+        )
+
+        lambda_function.lambda_handler(event, make_context())
+
+        bulk_calls = elasticsearch_stub.return_value.bulk.call_args_list
+        assert bulk_calls
+        for c in bulk_calls:
+            assert b'resolved-in-worker' not in c.kwargs['body']
+            assert b'"_index": "mielabels-000002"' in c.kwargs['body']
+
+    def test_small_result_is_not_streamed(self, s3_client_stub, elasticsearch_stub, index_document_stub):
+        import consumer.lambda_handler as lambda_function
+
+        data = {"Labels": [{"Timestamp": 0, "Label": {"Name": "Car", "Confidence": 99.0}}]}
+        event = make_event(make_modify_record_data('labelDetection', None, None))
+        body = EncodedData(data).bytes
+        s3_client_stub.add_response(
+            'get_object',
+            expected_params={
+                'Bucket': os.environ['DataplaneBucket'],
+                'Key': 'private/assets/{}/workflows/{}/labelDetection.json'.format(PARTITION_KEY, WORKFLOW_ID)
+            },
+            service_response={
+                'Body': StreamingBody(BytesIO(body), len(body)),
+                'ContentLength': len(body)
+            }
+        )
+
+        with ProcessOperatorStubber(lambda_function, 'labelDetection', 'process_label_detection') as op_stubber:
+            lambda_function.lambda_handler(event, make_context())
+            op_stubber.stub.assert_called_once_with(PARTITION_KEY, WORKFLOW_ID, str(EncodedData(data)))
+
+
+class TestCoalesce:
+    """Tests for `coalesce_records`."""
+
+    @staticmethod
+    def make_batch(*data):
+        import consumer.lambda_handler as lambda_function
+
+        records = make_event(*data)['Records']
+        for sequence_number, record in enumerate(records):
+            record['kinesis']['sequenceNumber'] = str(sequence_number)
+        return records, [lambda_function.decode_record(record) for record in records]
+
+    def test_same_pointer_is_processed_once(self):
+        import consumer.lambda_handler as lambda_function
+
+        modify = make_modify_record_data('labelDetection', None, None)
+        records, decoded = self.make_batch(modify, make_insert_record_data(), modify)
+
+        coalesced = lambda_function.coalesce_records(records, decoded)
+
+        assert [action for _asset_id, _payload, action in coalesced] == ['INSERT', 'MODIFY']
+
+    def test_overwrite_operator_keeps_the_latest(self):
+        import consumer.lambda_handler as lambda_function
+
+        first = make_modify_record_data('WebCaptions_en', None, None)
+        latest = dict(first, Workflow='latest', Pointer=first['Pointer'].replace(WORKFLOW_ID, 'latest'))
+        spanish = make_modify_record_data('WebCaptions_es', None, None)
+        records, decoded = self.make_batch(first, spanish, latest)
+
+        coalesced = lambda_function.coalesce_records(records, decoded)
+
+        assert [payload for _asset_id, payload, _action in coalesced] == [spanish, latest]
+
+    def test_other_operators_keep_every_result(self):
+        import consumer.lambda_handler as lambda_function
+
+        first = make_modify_record_data('labelDetection', None, None)
+        second = dict(first, Pointer=first['Pointer'].replace(WORKFLOW_ID, 'second'))
+        records, decoded = self.make_batch(first, second)
+
+        assert lambda_function.coalesce_records(records, decoded) == decoded
+
+    def test_redundant_record_is_not_read(self, s3_client_stub, elasticsearch_stub, index_document_stub):
+        import consumer.lambda_handler as lambda_function
+
+        with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators', 'Mediainfo.json')) as f:
+            data = EncodedData(f.read())
+        # Only one S3 response is queued, the stubber fails on a second read.
+        event = make_event(make_modify_record_data('Mediainfo', s3_client_stub, data),
+                           make_modify_record_data('Mediainfo', None, None))
+
+        with ProcessOperatorStubber(lambda_function, 'Mediainfo', 'process_mediainfo') as op_stubber:
+            lambda_function.lambda_handler(event, make_context())
+            op_stubber.stub.assert_called_once_with(PARTITION_KEY, WORKFLOW_ID, str(data))
+
 
 ###############################################################################
 # Helper Functions ############################################################
@@ -0,0 +1,93 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+
+
+def read_report(capsys):
+    lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+    assert len(lines) == 1
+    return json.loads(lines[0])
+
+
+class TestTrackMemory:
+    """Tests for `track_memory`."""
+
+    def test_report(self, monkeypatch, capsys):
+        import memory_tracker
+
+        monkeypatch.delenv('MemoryTracingSampleRate', raising=False)
+        with memory_tracker.track_memory(ASSET_ID, 'labelDetection') as usage:
+            usage["ObjectSize"] = 1234
+            usage["Streaming"] = False
+
+        report = read_report(capsys)
+        assert report["AssetId"] == ASSET_ID
+        assert report["Operator"] == 'labelDetection'
+        assert report["ObjectSize"] == 1234
+        assert report["Streaming"] is False
+        assert report["PeakMemory"] >= 0
+        assert "TracedPeakMemory" not in report
+        metrics = report["_aws"]["CloudWatchMetrics"][0]
+        assert metrics["Dimensions"] == [["Operator"]]
+        assert [m["Name"] for m in metrics["Metrics"]] == ["PeakMemory", "ObjectSize"]
+
+    def test_traced_report(self, monkeypatch, capsys):
+        import memory_tracker
+
+        monkeypatch.setenv('MemoryTracingSampleRate', '1')
+        with memory_tracker.track_memory(ASSET_ID, 'labelDetection'):
+            data = [str(i) * 10 for i in range(100000)]
+        del data
+
+        report = read_report(capsys)
+        assert report["TracedPeakMemory"] > 1000000
+        metric_names = [m["Name"] for m in report["_aws"]["CloudWatchMetrics"][0]["Metrics"]]
+        assert "TracedPeakMemory" in metric_names
+
+    def test_report_on_exception(self, monkeypatch, capsys):
+        import memory_tracker
+
+        with pytest.raises(KeyError):
+            with memory_tracker.track_memory(ASSET_ID, 'labelDetection'):
+                raise KeyError('boom')
+
+        assert read_report(capsys)["Operator"] == 'labelDetection'
+
+    def test_peak_without_proc(self, monkeypatch, capsys):
+        import memory_tracker
+
+        monkeypatch.setattr(memory_tracker, 'reset_peak_rss', lambda: False)
+        monkeypatch.setattr(memory_tracker, 'read_status_bytes', lambda field: None)
+        with memory_tracker.track_memory(ASSET_ID, 'labelDetection'):
+            pass
+
+        report = read_report(capsys)
+        assert "PeakMemory" not in report
+        assert report["LifetimePeakMemory"] > 0
+        assert [m["Name"] for m in report["_aws"]["CloudWatchMetrics"][0]["Metrics"]] == ["ObjectSize"]
+
+    def test_overlapping_blocks_report_no_peak(self, monkeypatch, capsys):
+        import tracemalloc
+
+        import memory_tracker
+
+        monkeypatch.setenv('MemoryTracingSampleRate', '1')
+        with memory_tracker.track_memory(ASSET_ID, 'labelDetection'):
+            with memory_tracker.track_memory(ASSET_ID, 'face_search'):
+                pass
+        with memory_tracker.track_memory(ASSET_ID, 'textDetection'):
+            pass
+
+        lines = [line for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+        reports = {report["Operator"]: report for report in map(json.loads, lines)}
+        for operator in ('labelDetection', 'face_search'):
+            assert reports[operator]["Concurrent"] is True
+            assert "PeakMemory" not in reports[operator]
+            assert "TracedPeakMemory" not in reports[operator]
+        assert "Concurrent" not in reports['textDetection']
+        assert "TracedPeakMemory" in reports['textDetection']
+        assert not tracemalloc.is_tracing()
@@ -0,0 +1,104 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from unittest.mock import MagicMock
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+
+
+def catalog_params(es):
+    """Return the params of every update sent to the catalog."""
+    return [body['script']['params'] for _action, body in es.derived_updates('mieassetcatalog')]
+
+
+@pytest.fixture
+def consumer(monkeypatch, consumer):
+    monkeypatch.setenv('AssetCatalog', 'true')
+    monkeypatch.setenv('SimilarAssets', 'true')
+    return consumer
+
+
+class TestSignature:
+    """Tests for `signature`."""
+
+    def test_estimates_the_jaccard_similarity(self):
+        import minhash
+
+        first = minhash.signature("Labels", ["term-{}".format(number) for number in range(0, 100)])
+        second = minhash.signature("Labels", ["term-{}".format(number) for number in range(50, 150)])
+
+        estimate = sum(a == b for a, b in zip(first, second)) / minhash.NUM_PERMUTATIONS
+        assert len(first) == minhash.NUM_PERMUTATIONS
+        assert abs(estimate - 50 / 150) < 0.15
+
+    def test_terms_are_compared_without_case(self):
+        import minhash
+
+        assert minhash.signature("Labels", ["Car", "Tree"]) == minhash.signature("Labels", ["tree", " car"])
+        assert minhash.signature("Labels", ["Car"]) != minhash.signature("Celebrities", ["Car"])
+        assert minhash.signature("Labels", []) is None
+
+
+class TestSimilarAssets:
+    """Tests for `similar_assets`."""
+
+    def test_candidates_are_ranked_by_their_exact_similarity(self):
+        import minhash
+
+        es = MagicMock()
+        es.get.return_value = {"_source": {"AssetId": ASSET_ID, "Bands": ["0-1", "1-2"],
+                                           "Labels": ["Car", "Road"], "Celebrities": ["Jane Doe"]}}
+        es.search.return_value = {"hits": {"hits": [
+            {"_id": "b", "_source": {"AssetId": "b", "Labels": ["Car"]}},
+            {"_id": "c", "_source": {"AssetId": "c", "Labels": ["car", "road"], "Celebrities": ["Jane Doe"]}},
+            {"_id": "d", "_source": {"AssetId": "d", "Labels": ["Tree"]}},
+        ]}}
+
+        assert minhash.similar_assets(es, ASSET_ID, size=2, min_similarity=0.1) == [("c", 1.0), ("b", 1 / 3)]
+        query = es.search.call_args.kwargs['body']['query']['bool']
+        assert query['filter'] == [{"terms": {"Bands": ["0-1", "1-2"]}}]
+        assert query['must_not'] == [{"ids": {"values": [ASSET_ID]}}]
+
+    def test_asset_without_bands(self):
+        import minhash
+
+        es = MagicMock()
+        es.get.return_value = {"_source": {"AssetId": ASSET_ID}}
+
+        assert minhash.similar_assets(es, ASSET_ID) == []
+        assert not es.search.called
+
+
+class TestCatalogSignatures:
+    """Tests for sending signatures with the catalog updates."""
+
+    def test_labels(self, consumer, es):
+        import minhash
+
+        pages = [{"Labels": [{"Timestamp": 0, "Label": {"Name": name, "Confidence": 90.0}} for name in ['Car', 'Tree']]}]
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', {"Pages": iter([pages])})
+
+        [params] = catalog_params(es)
+        assert params['signatures'] == {"Labels": minhash.signature("Labels", ["Car", "Tree"])}
+        assert (params['bands'], params['rows']) == (minhash.BANDS, minhash.ROWS)
+
+    def test_text_has_no_signature(self, consumer, es):
+        pages = [{"TextDetections": [{"Timestamp": 0, "TextDetection": {
+            "DetectedText": "EXIT", "Type": "LINE", "Geometry": {"BoundingBox": {}}}}]}]
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'textDetection', {"Pages": iter([pages])})
+
+        [params] = catalog_params(es)
+        assert params['signatures'] == {}
+
+    def test_disabled_by_default(self, monkeypatch, consumer, es):
+        monkeypatch.delenv('SimilarAssets')
+        pages = [{"Labels": [{"Timestamp": 0, "Label": {"Name": "Car", "Confidence": 90.0}}]}]
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', {"Pages": iter([pages])})
+
+        [params] = catalog_params(es)
+        assert params['signatures'] == {}
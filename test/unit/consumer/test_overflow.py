@@ -0,0 +1,158 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import base64
+import gzip
+import json
+import os
+
+import pytest
+
+OPERATORS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators')
+WORKFLOW_ID = '11111111-2222-3333-4444-555555555555'
+
+
+class FakeContext:
+    """Lambda context with plenty of time for the first `calls` checks and none after that."""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def get_remaining_time_in_millis(self):
+        self.calls -= 1
+        return 900000 if self.calls >= 0 else 1000
+
+
+def make_record(asset_id, data):
+    return {"kinesis": {"partitionKey": asset_id, "data": base64.b64encode(json.dumps(data).encode('utf-8'))}}
+
+
+def pointer(asset_id, operator):
+    return 'private/assets/{}/workflows/{}/{}.json'.format(asset_id, WORKFLOW_ID, operator)
+
+
+def make_modify_record(asset_id, operator):
+    return make_record(asset_id, {
+        "Action": "MODIFY", "Operator": operator, "Workflow": WORKFLOW_ID, "Pointer": pointer(asset_id, operator)})
+
+
+def indexed_documents(es):
+    return sum(len(c.kwargs['body'].split('\n')) // 2 for c in es.bulk.call_args_list)
+
+
+def read_labels():
+    with gzip.open(os.path.join(OPERATORS_DIR, 'labelDetection.json.gz')) as f:
+        return f.read()
+
+
+LABEL_COUNT = sum(len(page['Labels']) for page in json.loads(read_labels()))
+
+
+@pytest.fixture
+def consumer(monkeypatch, tmp_path, s3, es):
+    import lambda_handler
+    import overflow
+
+    monkeypatch.setattr(lambda_handler, 'STREAMING_THRESHOLD_BYTES', 1000)
+    monkeypatch.setattr(lambda_handler, 'STREAMING_BATCH_BYTES', 200000)
+    s3.objects[pointer('big', 'labelDetection')] = read_labels()
+    monkeypatch.setattr(lambda_handler, 's3', s3)
+    monkeypatch.setattr(lambda_handler, 'connect_es', lambda endpoint: es)
+    monkeypatch.setattr(lambda_handler, 'overflow_queue', overflow.LocalQueue(str(tmp_path)))
+    return lambda_handler
+
+
+class TestDeadline:
+    """Tests for deferring records to the overflow queue."""
+
+    def test_record_is_deferred_with_its_cursor(self, consumer, es):
+        import overflow_handler
+
+        event = {"Records": [
+            make_modify_record('big', 'labelDetection'),
+            make_record('other', {"Action": "INSERT", "S3Key": "input/video.mp4", "Created": "1"}),
+            make_record('big', {"Action": "REMOVE"}),
+        ]}
+
+        # One check before the record and two before its first batches of pages.
+        consumer.lambda_handler(event, FakeContext(3))
+
+        indexed = indexed_documents(es)
+        assert 0 < indexed < LABEL_COUNT
+        messages = consumer.overflow_queue.receive(max_messages=10)
+        bodies = {message.body["Records"][0]["AssetId"]: message.body for message in messages}
+        assert [record["Action"] for record in bodies['big']["Records"]] == ["MODIFY", "REMOVE"]
+        assert bodies['big']["Records"][0]["Cursor"] > 0
+        assert bodies['big']["Deferrals"] == 1
+        assert [record["Action"] for record in bodies['other']["Records"]] == ["INSERT"]
+        # Put the messages back for the overflow entry point.
+        for message in messages:
+            consumer.overflow_queue.send(message.body)
+            consumer.overflow_queue.delete(message.receipt)
+
+        assert overflow_handler.drain(consumer.overflow_queue) == 2
+
+        # Every label is indexed exactly once across the two invocations.
+        label_calls = [c for c in es.bulk.call_args_list if c.kwargs['index'] == 'mielabels']
+        assert sum(len(c.kwargs['body'].split('\n')) // 2 for c in label_calls) == LABEL_COUNT
+        assert es.delete_by_query.called
+        assert consumer.overflow_queue.receive() == []
+
+    def test_overflow_handler_defers_again(self, consumer):
+        import overflow
+        import overflow_handler
+
+        body = overflow.make_message([('big', {"Action": "MODIFY", "Operator": "labelDetection", "Workflow": WORKFLOW_ID,
+                                                "Pointer": pointer('big', 'labelDetection')}, "MODIFY", 0)], 1)
+        event = {"Records": [{"body": json.dumps(body)}]}
+
+        overflow_handler.lambda_handler(event, FakeContext(2))
+
+        [message] = consumer.overflow_queue.receive()
+        assert message.body["Deferrals"] == 2
+        assert message.body["Records"][0]["Cursor"] > 0
+
+    def test_deferral_limit(self, consumer, es, monkeypatch):
+        import overflow
+        import overflow_handler
+
+        body = overflow.make_message([('big', {"Action": "MODIFY", "Operator": "labelDetection", "Workflow": WORKFLOW_ID,
+                                                "Pointer": pointer('big', 'labelDetection')}, "MODIFY", 4)],
+                                     overflow.MAX_DEFERRALS + 1)
+
+        # Fails without processing, so SQS moves the message to the dead-letter queue.
+        with pytest.raises(overflow.DeferralLimitReached):
+            overflow_handler.lambda_handler({"Records": [{"body": json.dumps(body)}]}, FakeContext(10))
+        assert not es.bulk.called
+
+        # The local queue has no dead-letter queue, the message is dropped.
+        consumer.overflow_queue.send(body)
+        assert overflow_handler.drain(consumer.overflow_queue) == 1
+        assert not es.bulk.called
+        assert consumer.overflow_queue.receive() == []
+
+    def test_no_queue_runs_to_the_end(self, consumer, es, monkeypatch):
+        monkeypatch.setattr(consumer, 'overflow_queue', None)
+
+        consumer.lambda_handler({"Records": [make_modify_record('big', 'labelDetection')]}, FakeContext(0))
+
+        assert indexed_documents(es) == LABEL_COUNT
+
+
+class TestLocalQueue:
+    """Tests for `LocalQueue`."""
+
+    def test_messages_are_received_once_in_order(self, tmp_path):
+        import overflow
+
+        queue = overflow.LocalQueue(str(tmp_path))
+        for i in range(3):
+            queue.send({"Message": i})
+
+        first = queue.receive(max_messages=2)
+        second = queue.receive(max_messages=2)
+
+        assert [message.body for message in first + second] == [{"Message": i} for i in range(3)]
+        for message in first + second:
+            queue.delete(message.receipt)
+        assert os.listdir(str(tmp_path)) == []
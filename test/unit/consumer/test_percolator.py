@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+
+
+def moderation(*labelled):
+    return {"Pages": iter([[{"ModerationLabels": [
+        {"Timestamp": timestamp, "ModerationLabel": {"Name": name, "ParentName": "", "Confidence": confidence}}
+        for timestamp, name, confidence in labelled]}]])}
+
+
+def notifications(es):
+    """Return the notifications sent, by document id."""
+    return {action['_id']: body['doc'] for action, body in es.derived_updates('mienotifications')}
+
+
+def percolate_violence(index, body, **kwargs):
+    """Match the saved search "violence" with the documents about Violence above 90."""
+    documents = body["query"]["percolate"]["documents"]
+    slots = [slot for slot, document in enumerate(documents)
+             if document["Name"] == "Violence" and document["Confidence"] >= 90]
+    hits = [{"_id": "violence", "_source": {"Name": "Violence above 90"},
+             "fields": {"_percolator_document_slot": slots}}] if slots else []
+    return {"hits": {"hits": hits}}
+
+
+@pytest.fixture
+def es(es):
+    es.search.side_effect = percolate_violence
+    return es
+
+
+@pytest.fixture
+def consumer(monkeypatch, consumer):
+    monkeypatch.setenv('SavedSearches', 'true')
+    return consumer
+
+
+class TestResultTerms:
+    """Tests for `ResultTerms`."""
+
+    def test_terms_have_their_highest_confidence(self):
+        import percolator
+
+        terms = percolator.ResultTerms('contentmoderation', None)
+        for name, confidence in [("Violence", 80.0), ("Violence", 95.0), ("Violence", ""), ("Nudity", 60.0)]:
+            terms.add('miecontent_moderation', {"Name": name, "ParentName": "", "Confidence": confidence})
+        batch = terms.empty()
+        batch.add('miecontent_moderation', {"Name": "Nudity", "ParentName": "", "Confidence": 70.0})
+        terms.merge(json.loads(json.dumps(batch.state())))
+
+        assert terms.documents(ASSET_ID) == [
+            {"AssetId": ASSET_ID, "Operator": "contentmoderation", "Name": "Nudity", "ParentName": None,
+             "EntityType": None, "Confidence": 70.0},
+            {"AssetId": ASSET_ID, "Operator": "contentmoderation", "Name": "Violence", "ParentName": None,
+             "EntityType": None, "Confidence": 95.0},
+        ]
+
+    def test_documents_are_percolated_in_batches(self, monkeypatch, es):
+        import percolator
+
+        monkeypatch.setattr(percolator, 'PERCOLATE_BATCH_SIZE', 2)
+        terms = percolator.ResultTerms('contentmoderation', lambda: es)
+        for name in ["Alcohol", "Drugs", "Violence"]:
+            terms.add('miecontent_moderation', {"Name": name, "Confidence": 99.0})
+
+        [(doc_id, body)] = terms.make_updates(ASSET_ID, 'workflow', 'Indexed')
+
+        assert es.search.call_count == 2
+        assert doc_id == 'violence-' + ASSET_ID
+        assert body['doc']['Matches'] == ['Violence']
+
+
+class TestSavedSearches:
+    """Tests for matching saved searches as results are indexed."""
+
+    def test_matching_result_is_notified(self, consumer, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'ContentModeration',
+                                         moderation((0, 'Violence', 80.0), (500, 'Violence', 93.0)))
+
+        percolate = es.search.call_args.kwargs
+        assert (percolate['index'], percolate['ignore_unavailable']) == ('miesavedsearches', True)
+        [notification] = notifications(es).values()
+        assert notification['SearchId'] == 'violence'
+        assert notification['SearchName'] == 'Violence above 90'
+        assert (notification['AssetId'], notification['Operator']) == (ASSET_ID, 'contentmoderation')
+
+    def test_other_result_is_not_notified(self, consumer, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'ContentModeration', moderation((0, 'Violence', 80.0)))
+
+        assert es.search.called
+        assert not notifications(es)
+
+    def test_failed_percolation_is_not_raised(self, consumer, es):
+        import pointer_cache
+
+        es.search.side_effect = Exception("unavailable")
+
+        with pointer_cache.track_failures() as failures:
+            consumer.process_modify_metadata(ASSET_ID, 'workflow', 'ContentModeration',
+                                             moderation((0, 'Violence', 99.0)))
+
+        assert not notifications(es)
+        # The result is not remembered as indexed, so a redelivery matches it again.
+        assert failures["Failures"] == 1
+
+    def test_register_search(self, monkeypatch, es):
+        import derived_index
+        import percolator
+
+        monkeypatch.setattr(derived_index, '_ensured', set())
+        query = {"term": {"Operator": "celebrityrecognition"}}
+
+        percolator.register_search(es, 'celebrities', query)
+
+        assert es.indices.create.call_args.kwargs['body']['mappings']['properties']['Query'] == {"type": "percolator"}
+        assert es.index.call_args.kwargs == {"index": "miesavedsearches", "id": "celebrities",
+                                             "body": {"Name": "celebrities", "Query": query}}
@@ -0,0 +1,107 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import base64
+import json
+import os
+
+import pytest
+
+OPERATORS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators')
+POINTER = 'private/assets/asset/workflows/11111111-2222-3333-4444-555555555555/Mediainfo.json'
+
+
+def make_event():
+    data = {"Action": "MODIFY", "Operator": "Mediainfo", "Workflow": "11111111-2222-3333-4444-555555555555",
+            "Pointer": POINTER}
+    return {"Records": [{"kinesis": {"partitionKey": "asset", "data": base64.b64encode(json.dumps(data).encode('utf-8'))}}]}
+
+
+@pytest.fixture
+def s3(s3):
+    with open(os.path.join(OPERATORS_DIR, 'Mediainfo.json'), 'rb') as f:
+        s3.objects[POINTER] = f.read()
+    return s3
+
+
+@pytest.fixture
+def consumer(monkeypatch, s3, es):
+    import lambda_handler
+    import pointer_cache
+
+    monkeypatch.setattr(lambda_handler, 's3', s3)
+    monkeypatch.setattr(lambda_handler, 'connect_es', lambda endpoint: es)
+    monkeypatch.setattr(lambda_handler, 'indexed_pointers', pointer_cache.PointerCache(max_entries=10, ttl_seconds=600))
+    return lambda_handler
+
+
+class TestRedelivery:
+    """Tests for skipping results that were already indexed."""
+
+    def test_redelivered_record_is_skipped(self, consumer, s3, es):
+        consumer.lambda_handler(make_event(), None)
+        consumer.lambda_handler(make_event(), None)
+
+        assert (s3.gets, s3.heads) == (1, 1)
+        assert es.bulk.call_count == 1
+
+    def test_changed_object_is_indexed_again(self, consumer, s3, es):
+        consumer.lambda_handler(make_event(), None)
+        s3.objects[POINTER] += b'\n'
+        consumer.lambda_handler(make_event(), None)
+
+        assert s3.gets == 2
+        assert es.bulk.call_count == 2
+
+    def test_failed_result_is_not_cached(self, consumer, s3, es):
+        es.bulk.side_effect = [Exception("rejected"), {}]
+
+        consumer.lambda_handler(make_event(), None)
+        consumer.lambda_handler(make_event(), None)
+
+        assert (s3.gets, s3.heads) == (2, 0)
+
+    def test_removed_asset_is_forgotten(self, consumer, s3, es):
+        consumer.lambda_handler(make_event(), None)
+        remove = {"Action": "REMOVE"}
+        consumer.lambda_handler({"Records": [{"kinesis": {
+            "partitionKey": "asset", "data": base64.b64encode(json.dumps(remove).encode('utf-8'))}}]}, None)
+        consumer.lambda_handler(make_event(), None)
+
+        assert (s3.gets, s3.heads) == (2, 0)
+
+
+class TestPointerCache:
+    """Tests for `PointerCache`."""
+
+    def test_least_recently_used_is_evicted(self):
+        import pointer_cache
+
+        cache = pointer_cache.PointerCache(max_entries=2, ttl_seconds=600)
+        cache.put('a', 'asset', 'etag-a')
+        cache.put('b', 'asset', 'etag-b')
+        cache.get('a')
+        cache.put('c', 'asset', 'etag-c')
+
+        assert (cache.get('a'), cache.get('b'), cache.get('c')) == ('etag-a', None, 'etag-c')
+
+    def test_entries_expire(self, monkeypatch):
+        import pointer_cache
+
+        now = [1000.0]
+        monkeypatch.setattr(pointer_cache.time, 'monotonic', lambda: now[0])
+        cache = pointer_cache.PointerCache(max_entries=2, ttl_seconds=60)
+        cache.put('a', 'asset', 'etag-a')
+        now[0] += 61
+
+        assert cache.get('a') is None
+
+    def test_disabled_by_default(self, monkeypatch):
+        import pointer_cache
+
+        monkeypatch.delenv('PointerCacheSize', raising=False)
+        cache = pointer_cache.PointerCache()
+        cache.put('a', 'asset', 'etag-a')
+
+        assert not cache.enabled
+        assert cache.get('a') is None
@@ -0,0 +1,85 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import marshal
+import pytest
+from unittest.mock import MagicMock
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+
+
+def busy_function():
+    return sum(i * i for i in range(1000))
+
+
+class TestProfileInvocation:
+    """Tests for `profile_invocation`."""
+
+    def test_disabled_by_default(self, monkeypatch, capsys):
+        import profiler
+
+        monkeypatch.delenv('ProfilingSampleRate', raising=False)
+        with profiler.profile_invocation(ASSET_ID, 'labelDetection'):
+            busy_function()
+
+        assert 'Profile for asset' not in capsys.readouterr().out
+
+    def test_profile_is_logged(self, monkeypatch, capsys):
+        import profiler
+
+        monkeypatch.setenv('ProfilingSampleRate', '1')
+        with profiler.profile_invocation(ASSET_ID, 'labelDetection'):
+            busy_function()
+
+        out = capsys.readouterr().out
+        assert 'Profile for asset: {} operator: labelDetection'.format(ASSET_ID) in out
+        assert 'busy_function' in out
+
+    def test_operator_filter(self, monkeypatch, capsys):
+        import profiler
+
+        monkeypatch.setenv('ProfilingSampleRate', '1')
+        monkeypatch.setenv('ProfilingOperators', 'face_search, textDetection')
+        with profiler.profile_invocation(ASSET_ID, 'labelDetection'):
+            busy_function()
+        assert 'Profile for asset' not in capsys.readouterr().out
+
+        with profiler.profile_invocation(ASSET_ID, 'TextDetection'):
+            busy_function()
+        assert 'Profile for asset' in capsys.readouterr().out
+
+    def test_invalid_sample_rate(self, monkeypatch, capsys):
+        import profiler
+
+        monkeypatch.setenv('ProfilingSampleRate', 'often')
+        with profiler.profile_invocation(ASSET_ID, 'labelDetection'):
+            busy_function()
+
+        assert 'Profile for asset' not in capsys.readouterr().out
+
+    def test_profile_written_to_s3(self, monkeypatch):
+        import profiler
+
+        monkeypatch.setenv('ProfilingSampleRate', '1')
+        monkeypatch.setenv('ProfilingS3Prefix', 'profiles/')
+        s3_client = MagicMock()
+        with profiler.profile_invocation(ASSET_ID, 'labelDetection', s3_client=s3_client, bucket='bucket'):
+            busy_function()
+
+        s3_client.put_object.assert_called_once()
+        kwargs = s3_client.put_object.call_args.kwargs
+        assert kwargs['Bucket'] == 'bucket'
+        assert kwargs['Key'].startswith('profiles/{}/labelDetection/'.format(ASSET_ID))
+        assert kwargs['Key'].endswith('.prof')
+        stats = marshal.loads(kwargs['Body'])
+        assert any(func[2] == 'busy_function' for func in stats)
+
+    def test_exception_is_propagated(self, monkeypatch, capsys):
+        import profiler
+
+        monkeypatch.setenv('ProfilingSampleRate', '1')
+        with pytest.raises(ValueError):
+            with profiler.profile_invocation(ASSET_ID, 'labelDetection'):
+                raise ValueError('boom')
+
+        assert 'Profile for asset' in capsys.readouterr().out
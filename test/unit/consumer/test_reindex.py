@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+from unittest.mock import MagicMock
+
+import pytest
+
+
+def make_es(indices, assets=None):
+    """Mock client for an index layout of {concrete index: [aliases]} and {index: [asset ids]}."""
+    assets = assets or {}
+    es = MagicMock()
+    es.indices.get_alias.side_effect = lambda **kwargs: {
+        name: {"aliases": {alias: {} for alias in aliases}} for name, aliases in indices.items()}
+
+    def create(index, body):
+        indices[index] = list(body['aliases'])
+
+    def search(index, body):
+        buckets = [{"key": {"AssetId": asset_id}} for asset_id in sorted(assets.get(index, []))]
+        if "after" in body["aggs"]["assets"]["composite"]:
+            buckets = []
+        return {"aggregations": {"assets": {"buckets": buckets, "after_key": {"AssetId": "z"}}}}
+
+    es.indices.create.side_effect = create
+    es.indices.get_field_mapping.return_value = {}
+    es.search.side_effect = search
+    es.reindex.return_value = {'task': 'node:1'}
+    es.tasks.get.return_value = {'completed': True, 'response': {'created': 10, 'failures': []}}
+    return es
+
+
+class TestReindex:
+    """Tests for `reindex`."""
+
+    def test_new_generation(self):
+        import reindex
+
+        es = make_es(
+            {'mielabels-000001': ['mielabels', 'mielabels-write']},
+            {'mielabels-000001': ['a', 'b'], 'mielabels-000002': ['a', 'b', 'c']})
+
+        new = reindex.reindex(es, 'mielabels', body={"mappings": {"properties": {"Name": {"type": "keyword"}}}},
+                              settle_seconds=0, report=lambda _: None)
+
+        assert new == 'mielabels-000002'
+        es.indices.create.assert_called_once_with(index='mielabels-000002', body={
+            "mappings": {"properties": {"Name": {"type": "keyword"}}},
+            "settings": {"index.hidden": True},
+            "aliases": {"mielabels-next": {}}
+        })
+        reindex_body = es.reindex.call_args.kwargs['body']
+        assert reindex_body['source'] == {'index': 'mielabels-000001'}
+        assert reindex_body['dest'] == {'index': 'mielabels-000002', 'op_type': 'create'}
+        # Asset c was deleted from the old generation while it was being copied.
+        es.delete_by_query.assert_called_once_with(
+            index='mielabels-000002', body={"query": {"terms": {"AssetId.keyword": ['c']}}}, refresh=True)
+        es.indices.update_aliases.assert_called_once_with(body={"actions": [
+            {"remove": {"index": 'mielabels-000002', "alias": 'mielabels-next'}},
+            {"add": {"index": 'mielabels-000002', "alias": 'mielabels-write', "is_write_index": True}},
+            {"remove": {"index": 'mielabels-000001', "alias": 'mielabels'}},
+            {"remove": {"index": 'mielabels-000001', "alias": 'mielabels-write'}},
+            {"add": {"index": 'mielabels-000002', "alias": 'mielabels'}},
+        ]})
+        assert [c.kwargs for c in es.indices.put_settings.call_args_list] == [
+            {'index': 'mielabels-000002', 'body': {'index.hidden': False}},
+            {'index': 'mielabels-000001', 'body': {'index.hidden': True}},
+        ]
+        es.indices.delete.assert_not_called()
+
+    def test_legacy_index(self):
+        import reindex
+
+        es = make_es({'mielabels': []})
+
+        assert reindex.reindex(es, 'mielabels', settle_seconds=0, delete_old=True, report=lambda _: None) == 'mielabels-000001'
+        actions = es.indices.update_aliases.call_args.kwargs['body']['actions']
+        assert {"remove_index": {"index": 'mielabels'}} in actions
+        assert actions[-1] == {"add": {"index": 'mielabels-000001', "alias": 'mielabels'}}
+        es.indices.delete.assert_not_called()
+
+    def test_resume(self):
+        import reindex
+
+        es = make_es({
+            'mielabels-000001': ['mielabels', 'mielabels-write'],
+            'mielabels-000002': ['mielabels-next'],
+        })
+
+        assert reindex.reindex(es, 'mielabels', settle_seconds=0, delete_old=True, report=lambda _: None) == 'mielabels-000002'
+        es.indices.create.assert_not_called()
+        es.indices.delete.assert_called_once_with(index='mielabels-000001')
+
+    def test_no_current_generation(self):
+        import reindex
+
+        es = make_es({})
+
+        assert reindex.reindex(es, 'mielabels', settle_seconds=0, report=lambda _: None) is None
+        es.reindex.assert_not_called()
+
+    def test_copy_failure(self):
+        import reindex
+
+        es = make_es({'mielabels-000001': ['mielabels', 'mielabels-write']})
+        es.tasks.get.return_value = {'completed': True, 'response': {'failures': [
+            {'status': 409}, {'status': 400, 'cause': 'mapper_parsing_exception'}]}}
+
+        with pytest.raises(reindex.ReindexError):
+            reindex.reindex(es, 'mielabels', settle_seconds=0, report=lambda _: None)
+        es.indices.update_aliases.assert_not_called()
+
+    def test_list_indices(self):
+        import reindex
+
+        es = make_es({
+            'mielabels-000003': ['mielabels', 'mielabels-write'],
+            'miemediainfo': [],
+            'mieassetmanifest': [],
+            'miesavedsearches': [],
+        })
+        assert reindex.list_indices(es) == ['mielabels', 'miemediainfo']
@@ -0,0 +1,129 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+
+
+def shots(*boundaries):
+    segments = [{"Type": "SHOT", "StartTimestampMillis": start, "EndTimestampMillis": end,
+                 "ShotSegment": {"Index": index, "Confidence": "99.9"}}
+                for index, (start, end) in enumerate(boundaries)]
+    return {"Pages": iter([[{"Segments": segments}]])}
+
+
+def labels(*labelled):
+    return {"Pages": iter([[{"Labels": [{"Timestamp": timestamp, "Label": {"Name": name, "Confidence": 90.0}}
+                                        for timestamp, name in labelled]}]])}
+
+
+def transcript(*words):
+    items = [{"start_time": str(start / 1000), "end_time": str(end / 1000), "type": "pronunciation",
+              "alternatives": [{"confidence": "0.99", "content": word}]} for start, end, word in words]
+    return {"Results": json.dumps({"results": {"transcripts": [{"transcript": "..."}], "items": items}})}
+
+
+def scene_updates(es):
+    """Return the scene documents of every update, by document id."""
+    return {action['_id']: body['doc'] for action, body in es.derived_updates('miescenes')}
+
+
+@pytest.fixture
+def consumer(monkeypatch, s3, consumer):
+    import scenes
+
+    monkeypatch.setenv('Scenes', 'true')
+    monkeypatch.setattr(consumer, 'scene_sources', scenes.SceneSources(s3, 'bucket'))
+    return consumer
+
+
+class TestShotIndex:
+    """Tests for `ShotIndex`."""
+
+    def test_points(self):
+        import scenes
+
+        index = scenes.ShotIndex([[1000, 2000, 1], [0, 1000, 0], [2000, 3000, 2]])
+
+        assert index.overlapping(0, 0) == [0]
+        assert index.overlapping(999, 999) == [0]
+        assert index.overlapping(1000, 1000) == [1]
+        assert index.overlapping(3000, 3000) == [2]
+        assert index.overlapping(3001, 3001) == []
+
+    def test_ranges(self):
+        import scenes
+
+        index = scenes.ShotIndex([[0, 1000, 0], [1000, 2000, 1], [2000, 3000, 2]])
+
+        assert index.overlapping(500, 1500) == [0, 1]
+        assert index.overlapping(1000, 2000) == [1]
+        assert index.overlapping(-500, 3500) == [0, 1, 2]
+
+    def test_assign(self):
+        import scenes
+
+        index = scenes.ShotIndex([[0, 1000, 0], [1000, 2000, 1]])
+        words = [[1200, 1500, 'launch'], [100, 400, 'ready'], [500, 900, 'for']]
+
+        assert index.assign(words, scenes.TEXT) == ['ready for', 'launch']
+        assert index.assign([[0, 0, None], [0, 0, None], [500, 500, None]], scenes.COUNT) == [2, 0]
+
+
+class TestScenes:
+    """Tests for building scenes from results that arrive in any order."""
+
+    def test_results_before_shots(self, consumer, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', labels((500, 'Car'), (1500, 'Road')))
+
+        assert not scene_updates(es)
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'shotDetection', shots((0, 1000), (1000, 2000)))
+
+        documents = scene_updates(es)
+        assert sorted(documents) == [ASSET_ID + '-0', ASSET_ID + '-1']
+        first = documents[ASSET_ID + '-0']
+        assert (first['Start'], first['End'], first['Labels'], first['Transcript']) == (0, 1000, ['Car'], '')
+        assert documents[ASSET_ID + '-1']['Labels'] == ['Road']
+        assert es.update_by_query.call_args.kwargs['body']['query'] == {"term": {"AssetId": ASSET_ID}}
+
+    def test_failed_store_is_counted(self, monkeypatch, consumer, s3, es):
+        import pointer_cache
+
+        def put_object(**kwargs):
+            raise Exception("access denied")
+
+        monkeypatch.setattr(s3, 'put_object', put_object)
+        with pointer_cache.track_failures() as failures:
+            consumer.process_modify_metadata(ASSET_ID, 'workflow', 'shotDetection', shots((0, 1000)))
+
+        assert not scene_updates(es)
+        assert failures["Failures"] == 1
+
+    def test_results_after_shots(self, consumer, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'shotDetection', shots((0, 1000), (1000, 2000)))
+        es.reset_mock()
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'TranscribeVideo',
+                                         transcript((100, 400, 'ready'), (1200, 1500, 'launch')))
+
+        documents = scene_updates(es)
+        assert documents[ASSET_ID + '-0'] == {"AssetId": ASSET_ID, "Shot": 0, "Start": 0, "End": 1000,
+                                              "Transcript": "ready"}
+        assert documents[ASSET_ID + '-1']['Transcript'] == 'launch'
+        assert not es.update_by_query.called
+
+    def test_captions_by_language(self, consumer, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'shotDetection', shots((0, 1000), (1000, 2000)))
+        es.reset_mock()
+        captions = {"WebCaptions": [{"start": "0.1", "end": "0.9", "caption": "Hola"},
+                                    {"start": "1.1", "end": "1.9", "caption": "Adios"}]}
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'WebCaptions_es', {"Results": json.dumps(captions)})
+
+        documents = scene_updates(es)
+        assert documents[ASSET_ID + '-0']['Captions'] == {"es": "Hola"}
+        assert documents[ASSET_ID + '-1']['Captions'] == {"es": "Adios"}
@@ -0,0 +1,118 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import io
+import json
+import pytest
+
+
+@pytest.fixture
+def log_stream(monkeypatch):
+    """Configure a test logger that writes to a StringIO and yield the (logger, stream) pair."""
+    import structured_logger
+
+    stream = io.StringIO()
+
+    def make_logger(**env):
+        for name in ['LogLevel', 'LogSampleRates', 'LogRateLimit']:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        return structured_logger.configure('test_structured_logger', stream=stream)
+
+    yield make_logger, stream
+
+
+def read_lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+class TestStructuredLogger:
+    """Tests for the structured logger."""
+
+    def test_json_output_with_context(self, log_stream):
+        import structured_logger
+
+        make_logger, stream = log_stream
+        logger = make_logger()
+        with structured_logger.log_context(asset_id='asset'):
+            with structured_logger.log_context(operator='labelDetection'):
+                logger.info("bulk_index", "stored", index="mielabels")
+            logger.warning("payload", "missing key", error=KeyError('Pointer'))
+        logger.info("action", "no context")
+
+        lines = read_lines(stream)
+        assert lines[0] == {"level": "INFO", "kind": "bulk_index", "message": "stored",
+                            "asset_id": "asset", "operator": "labelDetection", "index": "mielabels"}
+        assert lines[1]["asset_id"] == 'asset'
+        assert "operator" not in lines[1]
+        assert lines[1]["error"] == "'Pointer'"
+        assert lines[2] == {"level": "INFO", "kind": "action", "message": "no context"}
+        assert ' ' not in stream.getvalue().splitlines()[2].replace('no context', '')
+
+    def test_debug_only_at_debug_level(self, log_stream):
+        make_logger, stream = log_stream
+
+        logger = make_logger()
+        logger.debug("event", "Received event", event={"Records": []})
+        assert stream.getvalue() == ''
+
+        logger = make_logger(LogLevel='debug')
+        logger.debug("event", "Received event", event={"Records": []})
+        assert read_lines(stream)[0]["event"] == {"Records": []}
+
+    def test_invalid_level(self, log_stream):
+        make_logger, stream = log_stream
+
+        logger = make_logger(LogLevel='chatty')
+        logger.info("action", "hello")
+
+        assert len(read_lines(stream)) == 1
+
+    def test_sampling(self, log_stream):
+        make_logger, stream = log_stream
+
+        logger = make_logger(LogSampleRates='bulk_index=0,action=1,broken=x', LogRateLimit='0')
+        for _ in range(10):
+            logger.info("bulk_index", "stored")
+            logger.info("action", "MODIFY")
+            logger.error("bulk_index", "failed")
+
+        kinds = [(line["kind"], line["level"]) for line in read_lines(stream)]
+        assert kinds.count(("bulk_index", "INFO")) == 0
+        assert kinds.count(("bulk_index", "ERROR")) == 10
+        assert kinds.count(("action", "INFO")) == 10
+
+    def test_rate_limit(self, log_stream, monkeypatch):
+        import structured_logger
+
+        make_logger, stream = log_stream
+        now = [100.0]
+        monkeypatch.setattr(structured_logger.time, 'monotonic', lambda: now[0])
+
+        logger = make_logger(LogRateLimit='3')
+        for _ in range(10):
+            logger.info("text_detection_item", "item")
+        logger.info("action", "MODIFY")
+        now[0] = 101.0
+        logger.info("text_detection_item", "item")
+
+        lines = read_lines(stream)
+        items = [line for line in lines if line["kind"] == "text_detection_item"]
+        assert len(items) == 4
+        assert items[-1]["suppressed"] == 7
+        assert [line["kind"] for line in lines].count("action") == 1
+
+    def test_warnings_and_errors_are_not_rate_limited(self, log_stream):
+        make_logger, stream = log_stream
+
+        logger = make_logger(LogRateLimit='3')
+        for _ in range(10):
+            logger.warning("read_s3", "missing")
+            logger.error("bulk_index", "failed")
+        logger.info("bulk_index", "stored")
+
+        kinds = [(line["kind"], line["level"]) for line in read_lines(stream)]
+        assert kinds.count(("read_s3", "WARNING")) == 10
+        assert kinds.count(("bulk_index", "ERROR")) == 10
+        assert kinds.count(("bulk_index", "INFO")) == 1
@@ -0,0 +1,114 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+TERMS_KEY = 'private/assets/{}/search/suggestions.json'.format(ASSET_ID)
+
+
+def labels(*names):
+    return {"Pages": iter([[{"Labels": [{"Timestamp": 0, "Label": {"Name": name, "Confidence": 90.0}}
+                                        for name in names]}]])}
+
+
+def suggestion_updates(es):
+    """Return the (term, delta) of every update sent to the suggestions."""
+    params = [body['script']['params'] for _action, body in es.derived_updates('miesuggestions')]
+    return [(update['term'], update['delta']) for update in params]
+
+
+@pytest.fixture
+def consumer(monkeypatch, s3, consumer):
+    import suggestions
+
+    monkeypatch.setenv('Suggestions', 'true')
+    monkeypatch.setattr(consumer, 'suggestion_terms', suggestions.TermStore(s3, 'bucket'))
+    return consumer
+
+
+class TestSuggestionTerms:
+    """Tests for `SuggestionTerms`."""
+
+    def test_inputs(self):
+        import suggestions
+
+        assert suggestions.make_inputs("Jane  Doe") == ["Jane Doe", "Doe"]
+        assert len(suggestions.make_inputs("a b c d e f g")) == suggestions.MAX_INPUTS
+
+    def test_ids_are_per_field_and_term(self):
+        import suggestions
+
+        ids = {suggestions.make_update(field, term, 1)[0] for field, term in
+               [("Labels", "Car"), ("Labels", "Car"), ("Text", "Car"), ("Labels", "car")]}
+
+        assert len(ids) == 3
+
+
+class TestSuggestions:
+    """Tests for counting the assets of each suggestion as results are indexed."""
+
+    def test_new_terms_are_counted(self, consumer, s3, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', labels('Car', 'Tree', 'Car'))
+
+        assert suggestion_updates(es) == [('Car', 1), ('Tree', 1)]
+        assert json.loads(s3.objects[TERMS_KEY]) == {"Labels": ["Car", "Tree"]}
+        mappings = es.indices.create.call_args.kwargs['body']['mappings']
+        assert mappings['properties']['Suggest']['type'] == 'completion'
+
+    def test_result_indexed_again_only_changes_the_difference(self, consumer, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow-1', 'labelDetection', labels('Car', 'Tree'))
+        es.reset_mock()
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow-2', 'labelDetection', labels('Car', 'Road'))
+
+        assert suggestion_updates(es) == [('Road', 1), ('Tree', -1)]
+
+    def test_terms_are_not_stored_when_the_updates_fail(self, consumer, s3, es):
+        es.bulk.side_effect = ValueError('unavailable')
+        consumer.process_modify_metadata(ASSET_ID, 'workflow-1', 'labelDetection', labels('Car'))
+
+        assert TERMS_KEY not in s3.objects
+
+        es.bulk.side_effect = None
+        es.reset_mock()
+        consumer.process_modify_metadata(ASSET_ID, 'workflow-2', 'labelDetection', labels('Car'))
+
+        assert suggestion_updates(es) == [('Car', 1)]
+        assert json.loads(s3.objects[TERMS_KEY]) == {"Labels": ["Car"]}
+
+    def test_only_the_terms_whose_updates_succeeded_are_stored(self, consumer, s3, es):
+        import suggestions
+
+        tree_id = suggestions.make_update('Labels', 'Tree', 1)[0]
+        es.bulk.return_value = {"errors": True, "items": [
+            {"update": {"_id": suggestions.make_update('Labels', 'Car', 1)[0], "status": 201}},
+            {"update": {"_id": tree_id, "status": 429}}]}
+        consumer.process_modify_metadata(ASSET_ID, 'workflow-1', 'labelDetection', labels('Car', 'Tree'))
+
+        assert json.loads(s3.objects[TERMS_KEY]) == {"Labels": ["Car"]}
+
+        es.bulk.return_value = {"errors": False, "items": []}
+        es.reset_mock()
+        consumer.process_modify_metadata(ASSET_ID, 'workflow-2', 'labelDetection', labels('Car', 'Tree'))
+
+        # Car was counted the first time and is not counted again.
+        assert suggestion_updates(es) == [('Tree', 1)]
+        assert json.loads(s3.objects[TERMS_KEY]) == {"Labels": ["Car", "Tree"]}
+
+    def test_removed_asset_is_counted_down(self, consumer, s3, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', labels('Car'))
+        es.reset_mock()
+
+        consumer.handle_remove(ASSET_ID, {"Action": "REMOVE"})
+
+        assert suggestion_updates(es) == [('Car', -1)]
+        assert TERMS_KEY not in s3.objects
+
+    def test_operator_without_terms(self, consumer, s3, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'shotDetection', {"Pages": iter([[{"Segments": []}]])})
+
+        assert not suggestion_updates(es)
+        assert not s3.objects
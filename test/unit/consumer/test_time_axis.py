@@ -0,0 +1,107 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+
+
+def indexed_documents(es):
+    """Return the documents of every bulk request."""
+    documents = []
+    for c in es.bulk.call_args_list:
+        lines = c.kwargs['body'].split('\n')
+        documents.extend(json.loads(line) for line in lines[1::2])
+    return documents
+
+
+@pytest.fixture
+def consumer(monkeypatch, es):
+    import lambda_handler
+    import time_axis
+
+    monkeypatch.setenv('TimeAxis', 'true')
+    monkeypatch.setenv('IndexAliases', 'false')
+    monkeypatch.setattr(time_axis, '_installed', False)
+    monkeypatch.setattr(lambda_handler, 'connect_es', lambda endpoint: es)
+    return lambda_handler
+
+
+class TestSetRange:
+    """Tests for `set_range`."""
+
+    def test_ranges(self, monkeypatch):
+        import time_axis
+
+        monkeypatch.setenv('TimeAxis', 'true')
+        point, span, missing = {}, {}, {}
+
+        time_axis.set_range(point, 1500)
+        time_axis.set_range(span, "120.0", "480.4")
+        time_axis.set_range(missing, None)
+
+        assert point == {"start_ms": 1500, "end_ms": 1500}
+        assert span == {"start_ms": 120, "end_ms": 480}
+        assert missing == {}
+
+    def test_disabled_by_default(self):
+        import time_axis
+
+        item = {}
+        time_axis.set_range(item, 1500)
+
+        assert item == {}
+
+
+class TestTimeAxis:
+    """Tests for the time axis of the indexed documents."""
+
+    def test_labels(self, consumer, es):
+        pages = [{"Labels": [{"Timestamp": 1000, "Label": {"Name": "Car", "Confidence": 90.0}}]}]
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection', {"Pages": iter([pages])})
+
+        [document] = indexed_documents(es)
+        assert (document["start_ms"], document["end_ms"]) == (1000, 1000)
+        template = es.indices.put_template.call_args.kwargs
+        assert template['name'] == 'mie-time-axis'
+        assert template['body']['mappings']['properties']['start_ms'] == {"type": "long"}
+
+    def test_shots(self, consumer, es):
+        segments = [{"Type": "SHOT", "StartTimestampMillis": 0, "EndTimestampMillis": 2000,
+                     "ShotSegment": {"Index": 0, "Confidence": 99.9}}]
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'shotDetection', {"Pages": iter([[{"Segments": segments}]])})
+
+        [document] = indexed_documents(es)
+        assert (document["start_ms"], document["end_ms"]) == (0, 2000)
+
+    def test_transcript_words(self, consumer, es):
+        items = [{"start_time": "0.12", "end_time": "0.48", "type": "pronunciation",
+                  "alternatives": [{"confidence": "0.99", "content": "hello"}]},
+                 {"type": "punctuation", "alternatives": [{"confidence": "0.0", "content": "."}]}]
+        results = json.dumps({"results": {"transcripts": [{"transcript": "hello."}], "items": items}})
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'TranscribeVideo', {"Results": results})
+
+        word, punctuation = indexed_documents(es)
+        assert (word["start_ms"], word["end_ms"]) == (120, 480)
+        assert "start_ms" not in punctuation
+
+    def test_template_is_installed_once(self, consumer, es):
+        pages = [{"Labels": [{"Timestamp": 0, "Label": {"Name": "Car", "Confidence": 90.0}}]}]
+
+        for workflow in ('workflow-1', 'workflow-2'):
+            consumer.process_modify_metadata(ASSET_ID, workflow, 'labelDetection', {"Pages": iter([pages])})
+
+        assert es.indices.put_template.call_count == 1
+
+    def test_window_query(self):
+        import time_axis
+
+        query = time_axis.window_query(ASSET_ID, 600000, 1800000)
+
+        assert query["bool"]["filter"][1:] == [{"range": {"start_ms": {"lte": 1800000}}},
+                                               {"range": {"end_ms": {"gte": 600000}}}]
@@ -0,0 +1,117 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+
+import pytest
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+
+
+def labels(*labelled):
+    return [{"Labels": [{"Timestamp": timestamp, "Label": {"Name": name, "Confidence": confidence}}
+                        for timestamp, name, confidence in labelled]}]
+
+
+def timeline_updates(es):
+    """Return the (document id, params) of every update sent to the timeline."""
+    return [(action['_id'], body['script']['params']) for action, body in es.derived_updates('mietimeline')]
+
+
+@pytest.fixture
+def consumer(monkeypatch, consumer):
+    monkeypatch.setenv('Timeline', 'true')
+    return consumer
+
+
+class TestTimelineBuckets:
+    """Tests for `TimelineBuckets`."""
+
+    def test_buckets(self):
+        import timeline
+
+        buckets = timeline.TimelineBuckets('labeldetection', bucket_ms=5000)
+        for timestamp, name, confidence in [(0, 'Car', 90.0), (4999, 'Car', 95.5), (4999, 'Tree', 80.0),
+                                            (5000, 'Car', 70.0)]:
+            buckets.add('mielabels', {"Timestamp": timestamp, "Name": name, "Confidence": confidence})
+        buckets.add('mielabels', {"Name": "Car", "Confidence": 99.0})
+
+        updates = buckets.make_updates(ASSET_ID, 'workflow', 'Indexed')
+
+        assert [doc_id for doc_id, _body in updates] == [ASSET_ID + '-0', ASSET_ID + '-5000']
+        first = updates[0][1]['script']['params']
+        assert (first['start'], first['end'], first['field']) == (0, 5000, 'Labels')
+        assert first['entries'] == [{"Name": "Car", "Confidence": 95.5, "Count": 2},
+                                    {"Name": "Tree", "Confidence": 80.0, "Count": 1}]
+
+    def test_faces_and_text(self):
+        import timeline
+
+        faces = timeline.TimelineBuckets('facedetection', bucket_ms=1000)
+        faces.add('mieface_detection', {"Timestamp": 100, "Confidence": 99.0})
+        faces.add('mieface_detection', {"Timestamp": 200, "Confidence": 98.0})
+        text = timeline.TimelineBuckets('textdetection', bucket_ms=1000)
+        text.add('mietextdetection', {"Timestamp": 100, "DetectedText": "EXIT", "Type": "LINE"})
+        text.add('mietextdetection', {"Timestamp": 100, "DetectedText": "EXIT", "Type": "WORD"})
+
+        [(_doc_id, face_update)] = faces.make_updates(ASSET_ID, 'workflow', 'Indexed')
+        [(_doc_id, text_update)] = text.make_updates(ASSET_ID, 'workflow', 'Indexed')
+
+        assert face_update['script']['params']['entries'] == [{"Name": "Face", "Confidence": 99.0, "Count": 2}]
+        assert text_update['script']['params']['entries'] == [{"Name": "EXIT", "Confidence": None, "Count": 1}]
+
+    def test_merge(self):
+        import timeline
+
+        buckets = timeline.TimelineBuckets('labeldetection', bucket_ms=1000)
+        buckets.add('mielabels', {"Timestamp": 0, "Name": "Car", "Confidence": 90.0})
+        batch = buckets.empty()
+        batch.add('mielabels', {"Timestamp": 500, "Name": "Car", "Confidence": 95.0})
+
+        buckets.merge(json.loads(json.dumps(batch.state())))
+
+        [(_doc_id, body)] = buckets.make_updates(ASSET_ID, 'workflow', 'Indexed')
+        assert body['script']['params']['entries'] == [{"Name": "Car", "Confidence": 95.0, "Count": 2}]
+
+    def test_other_operators_have_no_timeline(self):
+        import timeline
+
+        buckets = timeline.TimelineBuckets('mediainfo', bucket_ms=1000)
+        buckets.add('miemediainfo', {"Timestamp": 0, "Name": "video"})
+
+        assert buckets.make_updates(ASSET_ID, 'workflow', 'Indexed') == []
+        assert buckets.clear_query(ASSET_ID) is None
+
+
+class TestTimeline:
+    """Tests for updating the timeline as results are indexed."""
+
+    def test_labels(self, monkeypatch, consumer, es):
+        monkeypatch.setenv('TimelineBucketSeconds', '1')
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection',
+                                         {"Pages": iter([labels((0, 'Car', 99.0), (1500, 'Car', 80.0))])})
+
+        clear = es.update_by_query.call_args.kwargs
+        assert clear['index'] == 'mietimeline'
+        assert clear['body']['script']['params'] == {"field": "Labels"}
+        updates = timeline_updates(es)
+        assert [doc_id for doc_id, _params in updates] == [ASSET_ID + '-0', ASSET_ID + '-1000']
+        assert updates[1][1]['entries'] == [{"Name": "Car", "Confidence": 80.0, "Count": 1}]
+
+    def test_resumed_result_is_not_cleared(self, consumer, es):
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection',
+                                         {"Pages": iter([labels((0, 'Car', 99.0)), labels((1000, 'Car', 80.0))])},
+                                         cursor=1)
+
+        assert not es.update_by_query.called
+        [(_doc_id, params)] = timeline_updates(es)
+        assert params['resume']
+
+    def test_failed_clear_skips_the_updates(self, consumer, es):
+        es.update_by_query.side_effect = Exception("unavailable")
+
+        consumer.process_modify_metadata(ASSET_ID, 'workflow', 'labelDetection',
+                                         {"Pages": iter([labels((0, 'Car', 99.0))])})
+
+        assert not timeline_updates(es)
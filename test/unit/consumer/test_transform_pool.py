@@ -0,0 +1,161 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import contextvars
+import gzip
+import json
+import os
+from io import BytesIO
+from unittest.mock import MagicMock
+
+import pytest
+
+OPERATORS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'operators')
+
+client_override = contextvars.ContextVar('client_override', default=None)
+
+
+def read_pages():
+    with gzip.open(os.path.join(OPERATORS_DIR, 'labelDetection.json.gz')) as f:
+        return f.read()
+
+
+def index_labels(results):
+    """Transform in the shape of the consumer's: send one bulk payload per batch."""
+    es = client_override.get()
+    actions = []
+    for page in json.loads(results):
+        for label in page.get("Labels", []):
+            actions.append(json.dumps({"index": {"_index": "mielabels", "_type": "_doc"}}))
+            actions.append(json.dumps(label))
+    es.bulk(index="mielabels", body='\n'.join(actions))
+
+
+def count_labels(results):
+    index_labels(results)
+    return sum(len(page.get("Labels", [])) for page in json.loads(results))
+
+
+def fail_on_marker(results):
+    if '"Marker"' in results:
+        raise ValueError("bad page")
+    index_labels(results)
+
+
+class TestWorkerCount:
+    """Tests for `get_worker_count` and `should_use_pool`."""
+
+    @pytest.mark.parametrize("value, expected", [("0", 0), ("4", 4), ("auto", os.cpu_count() or 1), ("many", 0)])
+    def test_worker_count(self, monkeypatch, value, expected):
+        import transform_pool
+
+        monkeypatch.setenv('TransformWorkers', value)
+
+        assert transform_pool.get_worker_count() == expected
+
+    def test_disabled_by_default(self, monkeypatch):
+        import transform_pool
+
+        monkeypatch.delenv('TransformWorkers', raising=False)
+
+        assert not transform_pool.should_use_pool(10 ** 10)
+
+    def test_threshold(self, monkeypatch):
+        import transform_pool
+
+        monkeypatch.setenv('TransformWorkers', '2')
+        monkeypatch.setenv('TransformPoolThresholdBytes', '1000')
+
+        assert not transform_pool.should_use_pool(1000)
+        assert transform_pool.should_use_pool(1001)
+
+
+class TestIterBatches:
+    """Tests for `iter_batches`."""
+
+    def test_batches(self):
+        import transform_pool
+
+        pages = [json.dumps({"Page": i}) for i in range(10)]
+
+        batches = list(transform_pool.iter_batches(iter(pages), len(pages[0]) * 3))
+
+        assert len(batches) == 4
+        assert [page for batch in batches for page in json.loads(batch)] == [{"Page": i} for i in range(10)]
+
+
+class TestChunkCollector:
+    """Tests for `ChunkCollector`."""
+
+    def test_index_is_sent_as_bulk(self):
+        import transform_pool
+
+        connection = MagicMock()
+        collector = transform_pool.ChunkCollector(connection)
+
+        collector.index(index="mieinitialization", body={"Created": "1"}, id="abc")
+
+        kind, index, body = connection.send.call_args.args[0]
+        assert (kind, index) == ("chunk", "mieinitialization")
+        action, document = body.decode('utf-8').split('\n')
+        assert json.loads(action) == {"index": {"_index": "mieinitialization", "_type": "_doc", "_id": "abc"}}
+        assert json.loads(document) == {"Created": "1"}
+
+
+class TestTransformInWorkers:
+    """Tests for `transform_in_workers`."""
+
+    def test_payloads_are_sent_by_the_parent(self):
+        import json_stream
+        import transform_pool
+
+        body = read_pages()
+        es = MagicMock()
+
+        stats = transform_pool.transform_in_workers(
+            json_stream.iter_json_array_raw(BytesIO(body)), index_labels, es, client_override,
+            workers=2, batch_bytes=200000)
+
+        bodies = [c.kwargs['body'] for c in es.bulk.call_args_list]
+        assert all(isinstance(payload, bytes) for payload in bodies)
+        assert sum(len(payload.split(b'\n')) // 2 for payload in bodies) == \
+            sum(len(page['Labels']) for page in json.loads(body))
+        assert stats["Batches"] > 1
+        assert stats["Chunks"] == len(bodies)
+        assert stats["Errors"] == 0
+
+    def test_failed_batch_does_not_stop_the_others(self):
+        import transform_pool
+
+        pages = [json.dumps({"Labels": [{"Timestamp": i}]}) for i in range(6)]
+        pages[2] = json.dumps({"Marker": True})
+        es = MagicMock()
+
+        stats = transform_pool.transform_in_workers(iter(pages), fail_on_marker, es, client_override,
+                                                    workers=2, batch_bytes=1)
+
+        assert stats == {"Batches": 6, "Chunks": 5, "Errors": 1}
+
+    def test_rejected_documents_are_errors(self):
+        import json_stream
+        import transform_pool
+
+        es = MagicMock()
+        es.bulk.return_value = {"errors": True, "items": [{"index": {"status": 400}}]}
+
+        stats = transform_pool.transform_in_workers(
+            json_stream.iter_json_array_raw(BytesIO(read_pages())), index_labels, es, client_override,
+            workers=2, batch_bytes=200000)
+
+        assert stats["Errors"] == stats["Chunks"] > 0
+
+    def test_results_are_passed_back(self):
+        import transform_pool
+
+        pages = [json.dumps({"Labels": [{"Timestamp": i}] * i}) for i in range(6)]
+        counts = []
+
+        transform_pool.transform_in_workers(iter(pages), count_labels, MagicMock(), client_override,
+                                            workers=2, batch_bytes=1, on_result=counts.append)
+
+        assert sorted(counts) == list(range(6))
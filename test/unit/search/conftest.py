@@ -0,0 +1,18 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def mock_env_variables(monkeypatch):
+    """Mock up environment variables that the testing target depends on"""
+    monkeypatch.syspath_prepend('../../source/search/')
+    monkeypatch.setenv("DataplaneBucket", 'testDataplaneBucket')
+    monkeypatch.setenv("EsEndpoint", 'testSearchEndpoint')
+    monkeypatch.setenv("botoConfig", '{"user_agent_extra": "AwsSolution/SO0164/2.0.4"}')
+    monkeypatch.setenv('AWS_REGION', 'us-west-2')
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_SESSION_TOKEN", "test")
@@ -0,0 +1,211 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+ASSET_ID = 'aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee'
+GENERATION_KEY = 'private/assets/{}/search/generation'.format(ASSET_ID)
+
+
+class FakeS3:
+    def __init__(self):
+        self.etags = {}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.etags:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        return {'ETag': self.etags[Key]}
+
+
+def hits(*names):
+    return {"hits": {"total": {"value": len(names), "relation": "eq"},
+                     "hits": [{"_source": {"Name": name}, "sort": [position, name]}
+                              for position, name in enumerate(names)]}}
+
+
+def get(service, path, **params):
+    response = service.lambda_handler({"rawPath": path, "queryStringParameters": params or None}, None)
+    return response["statusCode"], json.loads(response["body"]), response["headers"].get("X-Cache")
+
+
+@pytest.fixture
+def s3():
+    return FakeS3()
+
+
+@pytest.fixture
+def es():
+    return MagicMock()
+
+
+@pytest.fixture
+def service(monkeypatch, s3, es):
+    import response_cache
+    import search_service
+
+    monkeypatch.setattr(search_service, 'responses', response_cache.ResponseCache(max_bytes=1000000, ttl_seconds=60))
+    monkeypatch.setattr(search_service, 'generations', response_cache.GenerationReader(s3, 'bucket'))
+    monkeypatch.setattr(search_service, 'es_client', es)
+    return search_service
+
+
+class TestQueries:
+    """Tests for `queries`."""
+
+    def test_asset_search(self):
+        import queries
+
+        index, body = queries.asset_search(ASSET_ID, 'labels', {"min_confidence": "80", "start": "1000",
+                                                                "fields": "Name,Timestamp"})
+
+        assert index == 'mielabels'
+        assert body["query"]["bool"]["filter"] == [
+            {"term": {"AssetId.keyword": ASSET_ID}},
+            {"range": {"Confidence": {"gte": 80.0}}},
+            {"range": {"Timestamp": {"gte": 1000.0}}},
+        ]
+        assert [list(field)[0] for field in body["sort"]] == ['Timestamp', 'DocumentKey.keyword']
+        assert body["_source"] == ['Name', 'Timestamp']
+        assert (body["size"], "search_after" in body) == (queries.DEFAULT_SIZE, False)
+
+    def test_page_token(self):
+        import queries
+
+        _index, body = queries.asset_search(ASSET_ID, 'shots', {"after": queries.encode_token([2000, "id"])})
+
+        assert body["search_after"] == [2000, "id"]
+
+    @pytest.mark.parametrize('params', [{"size": "0"}, {"size": "10001"}, {"after": "not a token"},
+                                        {"fields": "Name,Secret"}, {"min_confidence": "high"}])
+    def test_invalid_parameters(self, params):
+        import queries
+
+        with pytest.raises(queries.QueryError):
+            queries.asset_search(ASSET_ID, 'labels', params)
+
+    def test_collection_search(self):
+        import queries
+
+        index, body = queries.collection_search({"q": "car", "label": "Car", "size": "20"})
+
+        assert index == 'mieassetcatalog'
+        assert body["query"]["bool"]["filter"] == [{"term": {"Labels.keyword": "Car"}}]
+        assert body["sort"] == [{"_score": "desc"}, {"AssetId": "asc"}]
+        assert body["_source"] == ['AssetId', 'Filename', 'Created']
+
+    def test_suggestion_search(self):
+        import queries
+
+        index, body = queries.suggestion_search({"prefix": " ca", "field": "Labels,Celebrities"})
+
+        assert index == 'miesuggestions'
+        assert body["suggest"]["terms"] == {"prefix": "ca", "completion": {
+            "field": "Suggest", "size": queries.DEFAULT_SUGGESTIONS, "contexts": {"field": ["Labels", "Celebrities"]}}}
+        with pytest.raises(queries.QueryError):
+            queries.suggestion_search({"prefix": "ca", "field": "Secret"})
+
+
+class TestSearchService:
+    """Tests for the search service handler."""
+
+    def test_pages(self, service, es):
+        import queries
+
+        es.search.return_value = hits('Car', 'Tree')
+
+        status, body, _cache = get(service, '/assets/{}/labels'.format(ASSET_ID), size='2')
+
+        assert status == 200
+        assert body["Hits"] == [{"Name": "Car"}, {"Name": "Tree"}]
+        assert body["Total"] == 2
+        assert queries.decode_token(body["Next"]) == [1, 'Tree']
+
+        es.search.return_value = hits('Car')
+        _status, body, _cache = get(service, '/assets/{}/labels'.format(ASSET_ID), size='2', after=body["Next"])
+
+        assert es.search.call_args.kwargs['body']['search_after'] == [1, 'Tree']
+        assert body["Next"] is None
+
+    def test_transcripts_of_videos_and_audio_files(self, service, es):
+        es.search.return_value = hits('Hello')
+
+        assert get(service, '/assets/{}/transcript'.format(ASSET_ID))[0] == 200
+        assert es.search.call_args.kwargs['index'] == 'mievideotranscript,mieaudiotranscript'
+        assert es.search.call_args.kwargs['ignore_unavailable'] is True
+
+    def test_repeated_views_are_cached_until_the_asset_changes(self, service, s3, es):
+        es.search.return_value = hits('Car')
+        s3.etags[GENERATION_KEY] = '"1"'
+        path = '/assets/{}/labels'.format(ASSET_ID)
+
+        assert [get(service, path)[2] for _view in range(3)] == ['Miss', 'Hit', 'Hit']
+        assert es.search.call_count == 1
+
+        s3.etags[GENERATION_KEY] = '"2"'
+        es.search.return_value = hits('Car', 'Tree')
+
+        _status, body, cache = get(service, path)
+        assert cache == 'Miss'
+        assert len(body["Hits"]) == 2
+
+    def test_asset_without_generation_is_not_cached(self, service, es):
+        es.search.return_value = hits('Car')
+
+        for _view in range(2):
+            get(service, '/assets/{}/labels'.format(ASSET_ID))
+
+        assert es.search.call_count == 2
+
+    def test_collection_search_is_cached(self, monkeypatch, service, es):
+        monkeypatch.setenv('CollectionCacheSeconds', '30')
+        es.search.return_value = hits('video.mp4')
+
+        assert [get(service, '/search', q='car')[2] for _view in range(2)] == ['Miss', 'Hit']
+        assert es.search.call_args.kwargs['index'] == 'mieassetcatalog'
+
+    def test_suggestions(self, service, es):
+        es.search.return_value = {"suggest": {"terms": [{"options": [
+            {"text": "Car", "_source": {"Field": "Labels", "Term": "Car", "Assets": 12}}]}]}}
+
+        status, body, _cache = get(service, '/suggest', prefix='ca')
+
+        assert status == 200
+        assert body == {"Suggestions": [{"Field": "Labels", "Term": "Car", "Assets": 12}]}
+        assert get(service, '/suggest')[0] == 400
+
+    def test_errors(self, service, es):
+        es.search.side_effect = Exception("unavailable")
+
+        assert get(service, '/assets/{}/unknown'.format(ASSET_ID))[0] == 400
+        assert get(service, '/assets/{}/labels'.format(ASSET_ID), size='none')[0] == 400
+        assert get(service, '/_search')[0] == 404
+        assert get(service, '/assets/{}/labels'.format(ASSET_ID))[0] == 502
+
+
+class TestResponseCache:
+    """Tests for `ResponseCache`."""
+
+    def test_least_recently_used_responses_are_evicted(self):
+        import response_cache
+
+        cache = response_cache.ResponseCache(max_bytes=10, ttl_seconds=60)
+        cache.put('a', 1, '12345')
+        cache.put('b', 1, '12345')
+        assert cache.get('a', 1) == '12345'
+        cache.put('c', 1, '12345')
+
+        assert (cache.get('a', 1), cache.get('b', 1), cache.get('c', 1)) == ('12345', None, '12345')
+        assert cache.size == 10
+
+    def test_other_generation_is_a_miss(self):
+        import response_cache
+
+        cache = response_cache.ResponseCache(max_bytes=10, ttl_seconds=60)
+        cache.put('a', 1, '12345')
+
+        assert cache.get('a', 2) is None
+        assert cache.size == 0